@@ -0,0 +1,98 @@
+"""Add attendee_search table
+
+Revision ID: b52e0d9c7a13
+Revises: 3f1c9b7a2d64
+Create Date: 2026-10-17 14:03:27.551920
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = 'b52e0d9c7a13'
+down_revision = '3f1c9b7a2d64'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except Exception:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+searchable_fields = ['transfer_code', 'first_name', 'last_name', 'legal_name', 'email', 'zip_code', 'address1',
+                     'address2', 'city', 'region', 'country', 'ec_name', 'ec_phone', 'onsite_contact', 'cellphone',
+                     'found_how', 'comments', 'for_review', 'admin_notes', 'regdesk_info', 'extra_merch',
+                     'badge_printed_name', 'name_in_credits', 'past_years', 'hotel_pin']
+name_fields = ['first_name', 'last_name', 'legal_name', 'badge_printed_name']
+
+
+def upgrade():
+    if not is_sqlite:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    op.create_table('attendee_search',
+    sa.Column('attendee_id', sa.Uuid(as_uuid=False), nullable=False),
+    sa.Column('document', sa.UnicodeText(), server_default='', nullable=False),
+    sa.Column('names', sa.UnicodeText(), server_default='', nullable=False),
+    sa.ForeignKeyConstraint(['attendee_id'], ['attendee.id'], name=op.f('fk_attendee_search_attendee_id_attendee'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('attendee_id', name=op.f('pk_attendee_search'))
+    )
+
+    if is_sqlite:
+        return
+
+    document = ', '.join([f'attendee.{field}' for field in searchable_fields] + ['"group".name', 'promo_code_group.name'])
+    names = ', '.join(f'attendee.{field}' for field in name_fields)
+    op.execute(f"""
+        INSERT INTO attendee_search (attendee_id, document, names)
+        SELECT attendee.id, lower(concat_ws(' ', {document})), lower(concat_ws(' ', {names}))
+        FROM attendee
+        LEFT OUTER JOIN "group" ON attendee.group_id = "group".id
+        LEFT OUTER JOIN promo_code ON attendee.promo_code_id = promo_code.id
+        LEFT OUTER JOIN promo_code_group ON promo_code.group_id = promo_code_group.id
+    """)
+
+    # Build the indexes after loading the table, which is much faster than updating them row by row
+    op.create_index('ix_attendee_search_document_trgm', 'attendee_search', ['document'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'document': 'gin_trgm_ops'})
+    op.create_index('ix_attendee_search_names_trgm', 'attendee_search', ['names'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'names': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if not is_sqlite:
+        op.drop_index('ix_attendee_search_names_trgm', table_name='attendee_search')
+        op.drop_index('ix_attendee_search_document_trgm', table_name='attendee_search')
+    op.drop_table('attendee_search')
@@ -0,0 +1,95 @@
+"""Add receipt_balance table
+
+Revision ID: c41e8b27d5f3
+Revises: a7d04e92c158
+Create Date: 2026-10-17 21:08:52.417390
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41e8b27d5f3'
+down_revision = 'a7d04e92c158'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except Exception:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+
+
+def upgrade():
+    op.create_table('receipt_balance',
+    sa.Column('receipt_id', sa.Uuid(as_uuid=False), nullable=False),
+    sa.Column('owner_id', sa.Uuid(as_uuid=False), nullable=False),
+    sa.Column('owner_model', sa.Unicode(), nullable=False),
+    sa.Column('item_total', sa.Integer(), nullable=False),
+    sa.Column('fkless_item_total', sa.Integer(), nullable=False),
+    sa.Column('discount_total', sa.Integer(), nullable=False),
+    sa.Column('payment_total', sa.Integer(), nullable=False),
+    sa.Column('refund_total', sa.Integer(), nullable=False),
+    sa.Column('balance', sa.Integer(), nullable=False),
+    sa.Column('updated', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['receipt_id'], ['model_receipt.id'], name=op.f('fk_receipt_balance_receipt_id_model_receipt'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('receipt_id', name=op.f('pk_receipt_balance'))
+    )
+    op.create_index(op.f('ix_receipt_balance_owner_id'), 'receipt_balance', ['owner_id'], unique=False)
+    op.create_index('ix_receipt_balance_owner_model_balance', 'receipt_balance', ['owner_model', 'balance'], unique=False)
+
+    # The same totals as ReceiptBalances.calculated(); afterwards the app keeps them up to date
+    op.execute("""
+        INSERT INTO receipt_balance (receipt_id, owner_id, owner_model, item_total, fkless_item_total,
+                                     discount_total, payment_total, refund_total, balance, updated)
+        SELECT totals.*, item_total - discount_total - payment_total + refund_total, CURRENT_TIMESTAMP
+        FROM (
+            SELECT model_receipt.id, model_receipt.owner_id, model_receipt.owner_model,
+                (SELECT coalesce(sum(amount * count), 0) FROM receipt_item
+                 WHERE receipt_id = model_receipt.id) AS item_total,
+                (SELECT coalesce(sum(CASE WHEN fk_id IS NULL THEN amount * count ELSE 0 END), 0) FROM receipt_item
+                 WHERE receipt_id = model_receipt.id) AS fkless_item_total,
+                (SELECT coalesce(sum(applicable_discount * 100), 0) FROM receipt_discount
+                 WHERE receipt_id = model_receipt.id) AS discount_total,
+                (SELECT coalesce(sum(CASE WHEN amount > 0 AND cancelled IS NULL AND (charge_id != '' OR intent_id = '')
+                                     THEN amount ELSE 0 END), 0) FROM receipt_transaction
+                 WHERE receipt_id = model_receipt.id) AS payment_total,
+                (SELECT coalesce(sum(CASE WHEN amount < 0 THEN amount ELSE 0 END) * -1, 0) FROM receipt_transaction
+                 WHERE receipt_id = model_receipt.id) AS refund_total
+            FROM model_receipt
+        ) AS totals
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_receipt_balance_owner_model_balance', table_name='receipt_balance')
+    op.drop_index(op.f('ix_receipt_balance_owner_id'), table_name='receipt_balance')
+    op.drop_table('receipt_balance')
@@ -0,0 +1,63 @@
+"""Add content_hash to file
+
+Revision ID: c4e8a1f63d27
+Revises: b52e0d9c7a13
+Create Date: 2026-10-17 16:22:41.308114
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a1f63d27'
+down_revision = 'b52e0d9c7a13'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except Exception:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+
+
+def upgrade():
+    # Existing files are hashed the first time their preview is viewed
+    if is_sqlite:
+        with op.batch_alter_table('file', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+            batch_op.add_column(sa.Column('content_hash', sa.Unicode(), server_default='', nullable=False))
+    else:
+        op.add_column('file', sa.Column('content_hash', sa.Unicode(), server_default='', nullable=False))
+    op.create_index(op.f('ix_file_content_hash'), 'file', ['content_hash'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_file_content_hash'), table_name='file')
+    op.drop_column('file', 'content_hash')
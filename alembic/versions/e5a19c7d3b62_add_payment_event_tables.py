@@ -0,0 +1,83 @@
+"""Add payment_event and payment_event_cursor tables
+
+Revision ID: e5a19c7d3b62
+Revises: c41e8b27d5f3
+Create Date: 2026-10-17 23:41:06.208913
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a19c7d3b62'
+down_revision = 'c41e8b27d5f3'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except Exception:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+
+
+def upgrade():
+    op.create_table('payment_event',
+    sa.Column('processor', sa.Unicode(), nullable=False),
+    sa.Column('event_id', sa.Unicode(), nullable=False),
+    sa.Column('event_type', sa.Unicode(), nullable=False),
+    sa.Column('intent_id', sa.Unicode(), nullable=False),
+    sa.Column('charge_id', sa.Unicode(), nullable=False),
+    sa.Column('status', sa.Unicode(), nullable=False),
+    sa.Column('created', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('received', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('processed', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('result', sa.Unicode(), nullable=True),
+    sa.PrimaryKeyConstraint('processor', 'event_id', name=op.f('pk_payment_event'))
+    )
+    op.create_index(op.f('ix_payment_event_intent_id'), 'payment_event', ['intent_id'], unique=False)
+    op.create_index('ix_payment_event_unprocessed', 'payment_event', ['processor', 'created'], unique=False,
+                    postgresql_where=sa.text('processed IS NULL'))
+    op.create_table('payment_event_cursor',
+    sa.Column('processor', sa.Unicode(), nullable=False),
+    sa.Column('cursor', sa.Unicode(), nullable=False),
+    sa.Column('updated', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('processor', name=op.f('pk_payment_event_cursor'))
+    )
+    op.create_index('ix_receipt_transaction_pending_intent_id', 'receipt_transaction', ['intent_id'], unique=False,
+                    postgresql_where=sa.text("charge_id = '' AND intent_id != ''"))
+
+
+def downgrade():
+    op.drop_index('ix_receipt_transaction_pending_intent_id', table_name='receipt_transaction')
+    op.drop_table('payment_event_cursor')
+    op.drop_index('ix_payment_event_unprocessed', table_name='payment_event')
+    op.drop_index(op.f('ix_payment_event_intent_id'), table_name='payment_event')
+    op.drop_table('payment_event')
@@ -0,0 +1,167 @@
+"""Add guidebook_sync table
+
+Revision ID: e9a2d5b71c30
+Revises: c4e8a1f63d27
+Create Date: 2026-10-17 18:05:12.774530
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9a2d5b71c30'
+down_revision = 'c4e8a1f63d27'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import hashlib
+import json
+from datetime import datetime
+
+from dateutil import parser as dateparser
+from pytz import UTC
+from sqlalchemy.dialects.postgresql import JSONB
+
+from uber.config import c
+
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except Exception:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+
+
+guidebook_sync_table = sa.table(
+    'guidebook_sync',
+    sa.column('fk_id', sa.Uuid(as_uuid=False)),
+    sa.column('model', sa.Unicode()),
+    sa.column('name', sa.Unicode()),
+    sa.column('data_hash', sa.Unicode()),
+    sa.column('synced', sa.DateTime(timezone=True)),
+    sa.column('deleted', sa.DateTime(timezone=True)),
+)
+
+tracking_table = sa.table(
+    'tracking',
+    sa.column('fk_id', sa.Uuid(as_uuid=False)),
+    sa.column('action', sa.Integer()),
+    sa.column('when', sa.DateTime(timezone=True)),
+    sa.column('snapshot', sa.Unicode()),
+)
+
+group_type_keys = {c.BAND: 'GuestGroup_band', c.GUEST: 'GuestGroup_guest',
+                   c.ARENA: 'GuestGroup_arena', c.SIDE_STAGE: 'GuestGroup_sidestage'}
+
+
+def _data_hash(data):
+    # Must match GuidebookSyncState.data_hash
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _item_name(model_key, data):
+    if model_key != 'schedule':
+        return data.get('guidebook_name') or data.get('name') or '???'
+    try:
+        start_day = datetime.strptime(data['start_date'], '%m/%d/%Y').strftime('%A (%-m/%-d/%Y)')
+        return f"{data['name']} on {start_day} {data['start_time']}"
+    except (KeyError, ValueError):
+        return data.get('name') or '???'
+
+
+def _sync_row(fk_id, model_key, last_synced, deleted=None):
+    data = (last_synced.get('data') or {}).get('guidebook') or {}
+    synced = dateparser.parse(json.loads(last_synced['guidebook']))
+    return {
+        'fk_id': fk_id,
+        'model': model_key,
+        'name': _item_name(model_key, data),
+        'data_hash': _data_hash(data),
+        'synced': synced if synced.tzinfo else synced.replace(tzinfo=UTC),
+        'deleted': deleted,
+    }
+
+
+def _model_key(table_name, group_type=None):
+    if table_name == 'guest_group':
+        return group_type_keys.get(group_type)
+    return {'event': 'schedule', 'mits_game': 'MITSGame', 'indie_game': 'IndieGame', 'group': 'Group_dealer'}[table_name]
+
+
+def upgrade():
+    op.create_table('guidebook_sync',
+        sa.Column('fk_id', sa.Uuid(as_uuid=False), nullable=False),
+        sa.Column('model', sa.Unicode(), server_default='', nullable=False),
+        sa.Column('name', sa.Unicode(), server_default='', nullable=False),
+        sa.Column('data_hash', sa.Unicode(), server_default='', nullable=False),
+        sa.Column('synced', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('deleted', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('fk_id', name=op.f('pk_guidebook_sync'))
+    )
+    op.create_index('ix_guidebook_sync_deleted', 'guidebook_sync', ['deleted'], unique=False,
+                    postgresql_where=sa.text('deleted IS NOT NULL'))
+
+    if is_sqlite:
+        return
+
+    # Copy what we've already synced out of each model's last_synced column, and what we've
+    # deleted out of the tracking table, so nothing shows up as new or is forgotten
+    connection = op.get_bind()
+    rows = {}
+    for table_name in ['event', 'guest_group', 'mits_game', 'indie_game', 'group']:
+        columns = [sa.column('id', sa.Uuid(as_uuid=False)), sa.column('last_synced', JSONB)]
+        if table_name == 'guest_group':
+            columns.append(sa.column('group_type', sa.Integer()))
+        table = sa.table(table_name, *columns)
+        for row in connection.execute(sa.select(table).where(table.c.last_synced.has_key('guidebook'))):
+            model_key = _model_key(table_name, getattr(row, 'group_type', None))
+            if model_key:
+                rows[row.id] = _sync_row(row.id, model_key, row.last_synced)
+
+    deleted = connection.execute(sa.select(tracking_table).where(
+        tracking_table.c.action == c.DELETED,
+        tracking_table.c.snapshot.contains('"last_synced": {"data": {"guidebook"')))
+    for tracking_entry in deleted:
+        try:
+            snapshot = json.loads(tracking_entry.snapshot)
+            table_name = {'Event': 'event', 'GuestGroup': 'guest_group', 'MITSGame': 'mits_game',
+                          'IndieGame': 'indie_game', 'Group': 'group'}[snapshot['_model']]
+            model_key = _model_key(table_name, snapshot.get('group_type'))
+            if model_key:
+                rows[tracking_entry.fk_id] = _sync_row(tracking_entry.fk_id, model_key, snapshot['last_synced'],
+                                                       deleted=tracking_entry.when)
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    if rows:
+        op.bulk_insert(guidebook_sync_table, list(rows.values()))
+
+
+def downgrade():
+    op.drop_index('ix_guidebook_sync_deleted', table_name='guidebook_sync', postgresql_where=sa.text('deleted IS NOT NULL'))
+    op.drop_table('guidebook_sync')
@@ -0,0 +1,73 @@
+"""Add match_name and match_email to attendee
+
+Revision ID: f3b81c6d0a47
+Revises: e9a2d5b71c30
+Create Date: 2026-10-17 19:05:12.482306
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b81c6d0a47'
+down_revision = 'e9a2d5b71c30'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except Exception:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+
+
+def upgrade():
+    if is_sqlite:
+        with op.batch_alter_table('attendee', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+            batch_op.add_column(sa.Column('match_name', sa.Unicode(), server_default='', nullable=False))
+            batch_op.add_column(sa.Column('match_email', sa.Unicode(), server_default='', nullable=False))
+        op.execute("UPDATE attendee SET match_name = lower(trim(first_name || ' ' || last_name)), "
+                   "match_email = lower(trim(email))")
+    else:
+        op.add_column('attendee', sa.Column('match_name', sa.Unicode(), server_default='', nullable=False))
+        op.add_column('attendee', sa.Column('match_email', sa.Unicode(), server_default='', nullable=False))
+        # The same normalization as Attendee.normalize_match_name and Attendee.normalize_match_email
+        op.execute(r"UPDATE attendee SET "
+                   r"match_name = trim(regexp_replace(lower(first_name || ' ' || last_name), '\s+', ' ', 'g')), "
+                   r"match_email = lower(trim(email))")
+    op.create_index('ix_attendee_match_name_match_email', 'attendee', ['match_name', 'match_email'], unique=False)
+    op.create_index('ix_attendee_match_email', 'attendee', ['match_email'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_attendee_match_email', table_name='attendee')
+    op.drop_index('ix_attendee_match_name_match_email', table_name='attendee')
+    op.drop_column('attendee', 'match_email')
+    op.drop_column('attendee', 'match_name')
@@ -169,21 +169,22 @@ def solve_lottery(applications, hotel_rooms):
         return None
     
     
-#for apps in range(1000, 25000, 1000):
-apps = 1000000
-num_rooms = 100000
-applications, hotel_rooms, num_groups, num_singles = generate_data(num_apps=apps, num_rooms=num_rooms)
-start = time.time()
-results = solve_lottery(applications, hotel_rooms)
-duration = time.time() - start
-print(f"{len(results)} rooms assigned out of {num_rooms} ({len(results) / num_rooms * 100:.1f}%)")
-print(f"Allocated {len(results)} room groups out of {num_groups + num_singles} ({len(results) / (num_groups + num_singles) * 100:.1f}%)")
-print(f"{len(applications)} applications and {num_rooms} hotel rooms")
-print(f"Solve took {duration:.2f}s")
-print()
+if __name__ == '__main__':
+    #for apps in range(1000, 25000, 1000):
+    apps = 1000000
+    num_rooms = 100000
+    applications, hotel_rooms, num_groups, num_singles = generate_data(num_apps=apps, num_rooms=num_rooms)
+    start = time.time()
+    results = solve_lottery(applications, hotel_rooms)
+    duration = time.time() - start
+    print(f"{len(results)} rooms assigned out of {num_rooms} ({len(results) / num_rooms * 100:.1f}%)")
+    print(f"Allocated {len(results)} room groups out of {num_groups + num_singles} ({len(results) / (num_groups + num_singles) * 100:.1f}%)")
+    print(f"{len(applications)} applications and {num_rooms} hotel rooms")
+    print(f"Solve took {duration:.2f}s")
+    print()
 
-for hotel_room in results.values():
-    hotel_room["count"] += 1
-for hotel_room in hotel_rooms:
-    #print(f"{hotel_room['id']}-{hotel_room['room_type']}: {hotel_room['count']} / {hotel_room['quantity']}")
-    assert hotel_room['count'] <= hotel_room['quantity']
\ No newline at end of file
+    for hotel_room in results.values():
+        hotel_room["count"] += 1
+    for hotel_room in hotel_rooms:
+        #print(f"{hotel_room['id']}-{hotel_room['room_type']}: {hotel_room['count']} / {hotel_room['quantity']}")
+        assert hotel_room['count'] <= hotel_room['quantity']
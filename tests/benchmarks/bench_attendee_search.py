@@ -0,0 +1,122 @@
+"""
+Compares the attendee search box with and without the trigram search index.
+
+Inserts synthetic attendees into the configured database inside a transaction,
+builds their attendee_search documents, and times session.search() for a mix of
+full names, last names, name prefixes, emails and misspelled names, first with
+c.ATTENDEE_SEARCH_INDEX off (ILIKE over the attendee table and its joins) and then
+on. Everything is rolled back at the end, but point it at a scratch database
+anyway. This needs Postgres, since the index relies on pg_trgm.
+
+    python -m tests.benchmarks.bench_attendee_search [--attendees 100000] [--queries 200]
+"""
+import argparse
+import random
+import string
+from time import monotonic
+from uuid import uuid4
+
+from sqlalchemy import insert, text
+
+from uber.config import c
+from uber.models import Attendee, Session, attendee_search_index
+
+SYLLABLES = ['al', 'an', 'ar', 'be', 'bo', 'ca', 'da', 'de', 'el', 'en', 'fa', 'ga', 'ha', 'is', 'ja', 'ka',
+             'la', 'li', 'ma', 'mi', 'na', 'ne', 'no', 'ol', 'pa', 'ra', 're', 'ri', 'sa', 'se', 'ta', 'to',
+             'va', 'vi', 'wa', 'ya', 'za']
+
+
+def make_name(rng, syllables):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(syllables)).title()
+
+
+def make_attendees(count, rng):
+    first_names = [make_name(rng, rng.randint(2, 3)) for _ in range(2000)]
+    last_names = [make_name(rng, rng.randint(2, 4)) for _ in range(20000)]
+    for i in range(count):
+        first, last = rng.choice(first_names), rng.choice(last_names)
+        yield {
+            'id': str(uuid4()),
+            'first_name': first,
+            'last_name': last,
+            'email': f'{first}.{last}{i}@example.com'.lower(),
+            'badge_printed_name': first if rng.random() < 0.3 else '',
+            'zip_code': ''.join(rng.choice(string.digits) for _ in range(5)),
+            'cellphone': ''.join(rng.choice(string.digits) for _ in range(10)),
+            'badge_status': c.COMPLETED_STATUS,
+        }
+
+
+def misspell(word, rng):
+    i = rng.randrange(1, len(word))
+    return word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+
+
+def make_queries(attendees, count, rng):
+    queries = []
+    for attendee in rng.sample(attendees, count):
+        kind = rng.randrange(5)
+        if kind == 0:
+            queries.append(f"{attendee['first_name']} {attendee['last_name']}")
+        elif kind == 1:
+            queries.append(attendee['last_name'])
+        elif kind == 2:
+            queries.append(attendee['last_name'][:4])
+        elif kind == 3:
+            queries.append(attendee['email'])
+        else:
+            queries.append(f"{attendee['first_name']} {misspell(attendee['last_name'], rng)}")
+    return queries
+
+
+def run(session, queries, use_index):
+    c.ATTENDEE_SEARCH_INDEX = use_index
+    found = 0
+    start = monotonic()
+    for query in queries:
+        # The registration page counts the results and then loads the first page of them
+        results, error = session.search(query, Attendee.badge_status == c.COMPLETED_STATUS)
+        found += bool(results.count())
+        results.limit(100).all()
+    return monotonic() - start, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--attendees', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with Session() as session:
+        if not attendee_search_index.available(session):
+            raise SystemExit('This benchmark needs a Postgres database.')
+
+        attendees = list(make_attendees(args.attendees, rng))
+        start = monotonic()
+        for i in range(0, len(attendees), 5000):
+            session.execute(insert(Attendee), attendees[i:i + 5000])
+        print('inserted {} attendees in {:.1f}s'.format(len(attendees), monotonic() - start))
+
+        start = monotonic()
+        attendee_search_index.rebuild(session)
+        session.execute(text('ANALYZE attendee'))
+        session.execute(text('ANALYZE attendee_search'))
+        print('built search documents in {:.1f}s'.format(monotonic() - start))
+
+        queries = make_queries(attendees, args.queries, rng)
+        ilike, ilike_found = run(session, queries, use_index=False)
+        indexed, indexed_found = run(session, queries, use_index=True)
+        print('ILIKE search:   {:8.1f} ms/query, {} of {} queries found someone'.format(
+            1000 * ilike / len(queries), ilike_found, len(queries)))
+        print('indexed search: {:8.1f} ms/query, {} of {} queries found someone  ({:.1f}x)'.format(
+            1000 * indexed / len(queries), indexed_found, len(queries), ilike / indexed))
+
+        # Every ILIKE match contains all of the search terms, so the index must find it too
+        assert indexed_found >= ilike_found, 'the search index missed attendees that ILIKE found'
+        session.rollback()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Stress tests badge number allocation against the configured database, which must be
+Postgres (SQLite has no row locks to skip).
+
+Creates --badges unassigned BadgeInfo rows in a scratch range well above any real badge
+number, plus one placeholder attendee for each, then has --threads threads allocate them
+all at once, --batch numbers per transaction (claim_badge_nums) or one at a time
+(get_next_badge_num). Each thread assigns what it claims and commits, retrying when it gets
+nothing until the range is used up. It checks that every number went to exactly one
+attendee, reports allocations per second, and deletes everything it created.
+
+Pass --legacy to allocate with the old unlocked ORDER BY ident LIMIT 1 query instead, to
+see the duplicates and lost updates it produced under the same load.
+
+    python -m tests.benchmarks.bench_badge_allocation [--badges 10000] [--threads 32] [--batch 1] [--legacy]
+"""
+import argparse
+import threading
+from collections import Counter
+from time import monotonic
+from uuid import uuid4
+
+from sqlalchemy import delete, insert, select
+
+from uber.config import c
+from uber.models import Attendee, BadgeInfo, Session
+
+BADGE_TYPE = 'bench_badge_allocation'
+FIRST_IDENT = 90000000
+
+
+def legacy_next_badge(session):
+    lower_bound, upper_bound = c.BADGE_RANGES[BADGE_TYPE]
+    return session.query(BadgeInfo).filter(BadgeInfo.attendee_id == None,  # noqa: E711
+                                           BadgeInfo.ident >= lower_bound,
+                                           BadgeInfo.ident <= upper_bound).order_by(BadgeInfo.ident).limit(1).first()
+
+
+def allocate(attendee_ids, batch, legacy, lock, errors):
+    while True:
+        with lock:
+            if not attendee_ids:
+                return
+            mine = [attendee_ids.pop() for _ in range(min(batch, len(attendee_ids)))]
+
+        while mine:
+            with Session() as session:
+                try:
+                    if legacy:
+                        badges = [badge for badge in [legacy_next_badge(session)] if badge]
+                    elif batch > 1:
+                        badges = session.claim_badge_nums(BADGE_TYPE, len(mine))
+                    else:
+                        badges = [badge for badge in [session.get_next_badge_num(BADGE_TYPE)] if badge]
+                    if not badges:
+                        errors.append('ran out of badge numbers with {} attendees left'.format(len(mine)))
+                        return
+                    for badge in badges:
+                        badge.assign(mine.pop())
+                    session.commit()
+                except Exception as e:
+                    errors.append(str(e))
+                    session.rollback()
+                    return
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--badges', type=int, default=10000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--legacy', action='store_true')
+    args = parser.parse_args()
+
+    assert Session.engine.dialect.name == 'postgresql', 'This needs a Postgres database'
+    c.BADGE_RANGES[BADGE_TYPE] = [FIRST_IDENT, FIRST_IDENT + args.badges - 1]
+    attendee_ids = [str(uuid4()) for _ in range(args.badges)]
+
+    with Session() as session:
+        session.execute(insert(Attendee), [{'id': id, 'first_name': 'Bench', 'last_name': str(i), 'placeholder': True}
+                                           for i, id in enumerate(attendee_ids)])
+        session.execute(insert(BadgeInfo), [{'ident': FIRST_IDENT + i} for i in range(args.badges)])
+        session.commit()
+
+    try:
+        pending, lock, errors = list(attendee_ids), threading.Lock(), []
+        threads = [threading.Thread(target=allocate, args=(pending, args.batch, args.legacy, lock, errors))
+                   for _ in range(args.threads)]
+        start = monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = monotonic() - start
+
+        with Session() as session:
+            assigned = session.execute(select(BadgeInfo.attendee_id, BadgeInfo.ident).where(
+                BadgeInfo.ident >= FIRST_IDENT, BadgeInfo.attendee_id != None)).all()  # noqa: E711
+
+        per_attendee = Counter(attendee_id for attendee_id, ident in assigned)
+        duplicates = sum(count - 1 for count in per_attendee.values() if count > 1)
+        print('{} allocation(s) from {} thread(s) in {:.2f}s ({:.0f}/s): {} badge(s) assigned, {} attendee(s) '
+              'with more than one badge, {} attendee(s) without one, {} error(s)'.format(
+                  args.badges, args.threads, seconds, args.badges / seconds, len(assigned), duplicates,
+                  args.badges - len(per_attendee), len(errors)))
+        for error in sorted(set(errors))[:5]:
+            print('  ' + error.splitlines()[0])
+        if not args.legacy:
+            assert len(assigned) == len(per_attendee) == args.badges and not errors
+    finally:
+        with Session() as session:
+            session.execute(delete(BadgeInfo).where(BadgeInfo.ident >= FIRST_IDENT))
+            session.execute(delete(Attendee).where(Attendee.id.in_(attendee_ids)))
+            session.commit()
+
+
+if __name__ == '__main__':
+    main()
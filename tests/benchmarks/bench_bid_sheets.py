@@ -0,0 +1,101 @@
+"""
+Compares the old bid sheet rendering with uber.pdfs.BidSheetDocument.
+
+The old bid_sheet_pdf parsed all three TTF fonts for every PDF, and shrank long artist names
+and titles 0.2pt at a time, measuring the string at every step. This renders --pieces bid
+sheets as one document both ways, then --requests small four-piece documents both ways,
+which is where the font cache matters most.
+
+    python -m tests.benchmarks.bench_bid_sheets [--pieces 1000] [--requests 100]
+"""
+import argparse
+import random
+import string
+from time import monotonic
+
+import fpdf
+
+from uber.models import ArtShowApplication, ArtShowPiece
+from uber.pdfs import BidSheetDocument
+from uber.utils import get_static_file_path
+
+
+def make_pieces(count, rng):
+    pieces = []
+    for artist_num in range(count // 20 + 1):
+        app = ArtShowApplication(artist_name=' '.join(
+            ''.join(rng.choices(string.ascii_letters, k=rng.randint(3, 14))) for _ in range(rng.randint(1, 5))),
+            artist_id=f'A{artist_num:03}')
+        for piece_id in range(1, 21):
+            pieces.append(ArtShowPiece(
+                app=app, piece_id=piece_id, media='Mixed media', opening_bid=rng.randint(10, 500), for_sale=True,
+                name=' '.join(''.join(rng.choices(string.ascii_letters, k=rng.randint(2, 10)))
+                              for _ in range(rng.randint(1, 12)))))
+    return pieces[:count]
+
+
+def old_render(pieces, fits):
+    pdf = fpdf.FPDF(unit='pt', format='letter')
+    pdf.add_font('3of9', '', get_static_file_path('free3of9.ttf'))
+    pdf.add_font('NotoSans', '', get_static_file_path('NotoSans-Regular.ttf'))
+    pdf.add_font('NotoSans Bold', '', get_static_file_path('NotoSans-Bold.ttf'))
+
+    def set_fitted_font_size(text, font_size=12, max_size=160):
+        pdf.set_font_size(size=font_size)
+        while pdf.get_string_width(text) > max_size:
+            font_size -= 0.2
+            pdf.set_font_size(size=font_size)
+        fits.append(font_size)
+
+    for index, piece in enumerate(sorted(pieces, key=lambda piece: (piece.gallery_label, piece.piece_id))):
+        sheet_num = index % 4
+        if sheet_num == 0:
+            pdf.add_page()
+        piece.print_bidsheet(pdf, sheet_num, 'NotoSans', 'NotoSans Bold', set_fitted_font_size)
+    return bytes(pdf.output()), pdf.pages_count
+
+
+def new_render(pieces, fits):
+    document = BidSheetDocument()
+    set_fitted_font_size = document.set_fitted_font_size
+
+    def recording_fit(text, font_size=12, max_size=160):
+        set_fitted_font_size(text, font_size, max_size)
+        fits.append(document.pdf.font_size_pt)
+
+    document.set_fitted_font_size = recording_fit
+    document.add_pieces(pieces)
+    return document.output(), document.pdf.pages_count
+
+
+def timed(label, func, *args):
+    start = monotonic()
+    result = func(*args)
+    print(f'{label:<40} {monotonic() - start:8.3f}s')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pieces', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=12)
+    args = parser.parse_args()
+
+    pieces = make_pieces(args.pieces, random.Random(args.seed))
+    old_fits, new_fits = [], []
+    new_render(pieces[:4], [])  # Warm the font cache, as it would be after the first request
+
+    old_pdf, old_pages = timed(f'old: {args.pieces} pieces', old_render, pieces, old_fits)
+    new_pdf, new_pages = timed(f'new: {args.pieces} pieces', new_render, pieces, new_fits)
+    assert old_pages == new_pages, (old_pages, new_pages)
+    assert [round(size, 6) for size in old_fits] == [round(size, 6) for size in new_fits]
+    print(f'{old_pages} pages; {len(old_pdf)} bytes old, {len(new_pdf)} bytes new')
+
+    batches = [pieces[i:i + 4] for i in range(0, 4 * args.requests, 4)]
+    timed(f'old: {len(batches)} four-piece PDFs', lambda: [old_render(batch, []) for batch in batches])
+    timed(f'new: {len(batches)} four-piece PDFs', lambda: [new_render(batch, []) for batch in batches])
+
+
+if __name__ == '__main__':
+    main()
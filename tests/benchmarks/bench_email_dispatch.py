@@ -0,0 +1,64 @@
+"""
+Load tests the email sender pool against a fake SES, without a database.
+
+Sends synthetic emails through EmailDispatcher.deliver_all using FakeSES (which
+sleeps to mimic an SES round trip) and a local token bucket, first with a single
+sender thread like the old dispatcher and then with the configured pool, and
+reports throughput and whether the rate limit held.
+
+    python -m tests.benchmarks.bench_email_dispatch [--emails 500] [--workers 8] [--rate 50] [--latency 0.1]
+"""
+import argparse
+from time import monotonic
+
+from uber.amazon_ses import FakeSES, TokenBucket
+from uber.config import c
+from uber.email import EmailDispatcher
+
+
+def payloads(count):
+    for i in range(count):
+        yield i, {
+            'source': c.CONTACT_EMAIL,
+            'toAddresses': [f'attendee{i}@example.com'],
+            'replyToAddresses': [],
+            'ccAddresses': [],
+            'bccAddresses': [],
+            'message': {'bodyText': 'Hello!', 'subject': f'Test {i}', 'charset': 'UTF-8'},
+        }
+
+
+def run(emails, workers, rate, latency, failure_rate):
+    sender = FakeSES(latency, failure_rate)
+    rate_limiter = TokenBucket('bench_email_send_rate', rate, use_redis=False)
+    start = monotonic()
+    with EmailDispatcher(workers=workers, rate_limiter=rate_limiter, sender=sender) as dispatcher:
+        errors = sum(1 for key, error in dispatcher.deliver_all(payloads(emails)) if error)
+    elapsed = monotonic() - start
+    assert sender.sent_count + sender.failed_count == emails
+    return elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--emails', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=c.EMAIL_SEND_WORKERS)
+    parser.add_argument('--rate', type=float, default=50.0, help='emails per second allowed by the token bucket')
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds per fake SES call')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    # deliver_email only calls the sender when we're actually sending emails
+    c.DEV_BOX, c.SEND_EMAILS = False, True
+
+    for workers in sorted({1, args.workers}):
+        elapsed, errors = run(args.emails, workers, args.rate, args.latency, args.failure_rate)
+        # The bucket starts full, so we may send one second's worth of emails immediately
+        allowed = args.rate + args.rate * elapsed
+        print('{:3d} worker(s): {:7.2f} emails/s over {:6.2f}s, {} error(s){}'.format(
+            workers, args.emails / elapsed, elapsed, errors,
+            ' -- RATE LIMIT EXCEEDED' if args.emails > allowed * 1.02 + 1 else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Times rendering automated email bodies, as check_emails_for_fixture does once per matching
+model, before and after giving templates a prebuilt global context.
+
+The old renderable_data built a new dict with c and every model class for each render, and
+AutomatedEmail.render_template compiled the email's stored body with from_string every time.
+This renders --emails bodies, spread over a handful of real email templates, three ways: the
+old way, the old way with each body compiled once (to separate out the context's share of
+the gain), and through AutomatedEmail.render_body.
+
+    python -m tests.benchmarks.bench_email_render [--emails 10000]
+"""
+import argparse
+import os
+import random
+from time import monotonic
+
+from uber.config import c
+from uber.decorators import render_empty
+from uber.jinja import JinjaEnv
+from uber.models import Attendee, AutomatedEmail, Session
+from uber.utils import request_cached_context
+
+TEMPLATES = [
+    'hotel/hotel_reminder.txt',
+    'placeholders/reminder.txt',
+    'placeholders/volunteer.txt',
+    'reg_workflow/attendee_confirmation.html',
+    'reg_workflow/badge_transferee.txt',
+    'reg_workflow/pending_code.txt',
+    'reg_workflow/prereg_check.txt',
+    'reg_workflow/under_18_reminder.txt',
+    'shifts/shirt_reminder.txt',
+]
+
+
+def legacy_renderable_data(fixture, attendee):
+    data = {'email_signature': c.get_signature_by_sender(fixture.sender), 'attendee': attendee}
+    data['c'] = c
+    data.update({m.__name__: m for m in Session.all_models()})
+    return data
+
+
+def legacy_render(fixture, attendee):
+    data = legacy_renderable_data(fixture, attendee)
+    with request_cached_context(clear_cache_on_start=True):
+        return JinjaEnv.env().from_string(fixture.body).render(data)
+
+
+def legacy_context_render(fixture, attendee):
+    data = legacy_renderable_data(fixture, attendee)
+    with request_cached_context(clear_cache_on_start=True):
+        return JinjaEnv.env().cached_from_string(fixture.body).render(data)
+
+
+def new_render(fixture, attendee):
+    return fixture.render_body(attendee)
+
+
+def make_attendees(count, rng):
+    return [Attendee(first_name=rng.choice(['Ann', 'Bob', 'Cat', 'Dee']), last_name=f'Test{index}',
+                     email=f'test{index}@example.com', badge_num=index, amount_extra=rng.choice([0, 20, 60]))
+            for index in range(count)]
+
+
+def timed(label, func, pairs):
+    start = monotonic()
+    bodies = [func(fixture, attendee) for fixture, attendee in pairs]
+    seconds = monotonic() - start
+    print(f'{label:<36} {seconds:8.3f}s  {len(pairs) / seconds:9.0f} emails/s')
+    return bodies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=17)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    fixtures = [AutomatedEmail(ident=template, sender=c.REGDESK_EMAIL, subject=template,
+                               body=render_empty(os.path.join('emails', template))) for template in TEMPLATES]
+    attendees = make_attendees(args.emails, rng)
+    pairs = [(rng.choice(fixtures), attendee) for attendee in attendees]
+    new_render(*pairs[0])  # Register the global context before timing anything
+
+    legacy = timed('old: dict context, compile each time', legacy_render, pairs)
+    timed('old context, compiled once', legacy_context_render, pairs)
+    new = timed('new: global context + overlay', new_render, pairs)
+    assert legacy == new
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Times solve_lottery against the old one-variable-per-entry model, without a database.
+
+Generates applications with test_solver.generate_data, converts them into the shape
+solve_lottery expects, and solves the same lottery with the original per-entry model
+and with the aggregated (per preference profile) model. Group bias weights are made
+deterministic so both models optimize the same objective, which lets us check that
+the aggregated model's assignments score as well as the per-entry model's.
+
+    python -m tests.benchmarks.bench_hotel_lottery [--apps 25000] [--rooms 2000] [--skip-legacy]
+"""
+import argparse
+import random
+from collections import Counter
+from time import monotonic
+from types import SimpleNamespace
+
+from ortools.linear_solver import pywraplp
+
+from test_solver import generate_data
+from uber.config import c
+from uber.hotel_lottery import build_entries, entry_profile, solve_lottery, weight_entry
+
+
+def convert_data(applications, hotel_rooms):
+    """
+    Converts test_solver's applications, which link to their parent by id and use a boolean entry
+    type, into objects with the same attributes as LotteryApplication.
+    """
+    converted = {app.id: SimpleNamespace(id=app.id,
+                                         entry_type=c.SUITE_ENTRY,
+                                         room_opt_out=True,
+                                         parent_application=None,
+                                         hotel_preference=app.hotel_preference,
+                                         room_type_preference=app.room_type_preference) for app in applications}
+    for app in applications:
+        if not app.entry_type:
+            continue
+        if app.parent_application:
+            converted[app.id].entry_type = c.GROUP_ENTRY
+            converted[app.id].parent_application = converted[app.parent_application]
+        else:
+            converted[app.id].entry_type = c.ROOM_ENTRY
+
+    for hotel_room in hotel_rooms:
+        hotel_room.setdefault("min_capacity", 1)
+        hotel_room.setdefault("name", f"{hotel_room['id']} {hotel_room['room_type']}")
+    return list(converted.values())
+
+
+def legacy_solve_lottery(applications, hotel_rooms, lottery_type=c.ROOM_ENTRY):
+    """The model solve_lottery used to build: one BoolVar per entry and compatible room."""
+    solver = pywraplp.Solver.CreateSolver("SAT")
+    solver.SetSolverSpecificParametersAsString(f"max_time_in_seconds: {c.HOTEL_LOTTERY_SOLVER_SECONDS}")
+
+    room_constraints = [[] for _ in hotel_rooms]
+    entries = build_entries(applications, lottery_type)
+    entry_constraints = {}
+    for app_id, entry in entries.items():
+        hotels, room_types, group_size, base_weight = entry_profile(entry)
+        entry_constraints[app_id] = []
+        for index, hotel_room in enumerate(hotel_rooms):
+            if hotel_room["id"] in hotels and hotel_room["room_type"] in room_types and (
+                    hotel_room["min_capacity"] <= group_size <= hotel_room["capacity"]):
+                is_assigned = solver.BoolVar(f'{app_id}_assigned_to_{index}')
+                entry_constraints[app_id].append((is_assigned, weight_entry(entry, hotel_room, base_weight), hotel_room))
+                room_constraints[index].append(is_assigned)
+
+    for index, constraints in enumerate(room_constraints):
+        if constraints:
+            solver.Add(sum(constraints) <= hotel_rooms[index]["quantity"])
+    for constraints in entry_constraints.values():
+        solver.Add(sum([x[0] for x in constraints]) <= 1)
+
+    objective = solver.Objective()
+    for constraints in entry_constraints.values():
+        for is_assigned, weight, hotel_room in constraints:
+            objective.SetCoefficient(is_assigned, weight)
+    objective.SetMaximization()
+
+    if solver.Solve() not in [pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE]:
+        return None
+
+    assignments = {}
+    for app_id, constraints in entry_constraints.items():
+        for is_assigned, weight, hotel_room in constraints:
+            if is_assigned.solution_value() > 0.5:
+                for member in entries[app_id]["members"]:
+                    assignments[member.id] = (hotel_room["id"], hotel_room["room_type"])
+    return assignments
+
+
+def check_assignments(applications, hotel_rooms, assignments):
+    """Returns the total weight of the assignments, after checking that they fit in the rooms."""
+    entries = build_entries(applications)
+    rooms = {(hotel_room["id"], hotel_room["room_type"]): hotel_room for hotel_room in hotel_rooms}
+    used = Counter()
+    score = 0
+    for entry in entries.values():
+        assigned = {assignments.get(member.id) for member in entry["members"]}
+        assert len(assigned) == 1, 'group members were split up'
+        assigned = assigned.pop()
+        if assigned:
+            used[assigned] += 1
+            score += weight_entry(entry, rooms[assigned], entry_profile(entry)[3])
+    for key, count in used.items():
+        assert count <= rooms[key]["quantity"], f'{key} was overbooked'
+    return score, sum(used.values())
+
+
+def run(solve, applications, hotel_rooms):
+    start = monotonic()
+    assignments = solve(list(applications), hotel_rooms)
+    elapsed = monotonic() - start
+    assert assignments is not None, 'the solver failed'
+    score, rooms_assigned = check_assignments(applications, hotel_rooms, assignments)
+    return elapsed, score, rooms_assigned
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--apps', type=int, default=25000)
+    parser.add_argument('--rooms', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-legacy', action='store_true', help="don't run the per-entry model")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    applications, hotel_rooms, num_groups, num_singles = generate_data(num_apps=args.apps, num_rooms=args.rooms)
+    applications = convert_data(applications, hotel_rooms)
+
+    # Always apply each group size's bias, so that both models solve exactly the same problem
+    c.HOTEL_LOTTERY["weights"] = dict(c.HOTEL_LOTTERY.get("weights", {}))
+    for group_size in range(1, c.HOTEL_LOTTERY["weights"].get("max_group_size", 4) + 1):
+        c.HOTEL_LOTTERY["weights"][f"group_weight_{group_size}"] = 1.0
+        c.HOTEL_LOTTERY["weights"][f"group_base_{group_size}"] = float(group_size)
+
+    entries = build_entries(applications)
+    profiles = {entry_profile(entry) for entry in entries.values()}
+    print('{} applications, {} entries, {} distinct profiles, {} rooms'.format(
+        len(applications), len(entries), len(profiles), sum(x["quantity"] for x in hotel_rooms)))
+
+    elapsed, score, rooms_assigned = run(solve_lottery, applications, hotel_rooms)
+    print('aggregated model: {:8.2f}s, {} rooms assigned, score {:.0f}'.format(elapsed, rooms_assigned, score))
+
+    if not args.skip_legacy:
+        legacy_elapsed, legacy_score, legacy_rooms = run(legacy_solve_lottery, applications, hotel_rooms)
+        print('per-entry model:  {:8.2f}s, {} rooms assigned, score {:.0f}  ({:.1f}x slower)'.format(
+            legacy_elapsed, legacy_rooms, legacy_score, legacy_elapsed / elapsed))
+        assert score >= legacy_score, 'the aggregated model found a worse solution than the per-entry model'
+
+
+if __name__ == '__main__':
+    main()
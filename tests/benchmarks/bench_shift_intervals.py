@@ -0,0 +1,97 @@
+"""
+Compares the old per-minute set/dict shift checks with ShiftIntervals.
+
+Builds a heavy staffer (40+ hours of shifts) and a few hundred candidate jobs,
+then times the `possible` filter's two expensive checks -- `no_overlap` and
+`working_limit_ok` -- against every candidate job. Nothing touches the database.
+
+    python -m tests.benchmarks.bench_shift_intervals [--jobs 600] [--shifts 30] [--repeat 5]
+"""
+import argparse
+import random
+import timeit
+from datetime import timedelta
+from types import SimpleNamespace
+
+from uber.config import c
+from uber.models import Job
+from uber.utils import ShiftIntervals
+
+
+def make_jobs(count, rng, max_start_hours=96):
+    return [Job(start_time=c.EPOCH + timedelta(minutes=15 * rng.randrange(max_start_hours * 4)),
+                duration=rng.choice([60, 90, 120, 180]),
+                extra15=rng.random() < 0.2,
+                max_consecutive_minutes=rng.choice([0, 0, 240, 360]),
+                department_id=rng.choice(['arcade', 'console', 'tabletop']))
+            for _ in range(count)]
+
+
+def old_attendee(shift_jobs):
+    minute_map = {}
+    for job in shift_jobs:
+        for minute in job.minutes:
+            minute_map[minute] = job
+    return SimpleNamespace(shift_minute_map=minute_map, shift_minutes=set(minute_map))
+
+
+def old_no_overlap(job, attendee):
+    before = job.start_time - timedelta(minutes=1)
+    after = job.start_time + timedelta(minutes=job.duration)
+    return not job.minutes.intersection(attendee.shift_minutes) and (
+        before not in attendee.shift_minute_map
+        or not attendee.shift_minute_map[before].extra15
+        or job.department_id == attendee.shift_minute_map[before].department_id
+    ) and (
+        after not in attendee.shift_minute_map
+        or not job.extra15
+        or job.department_id == attendee.shift_minute_map[after].department_id
+    )
+
+
+def old_working_limit_ok(job, attendee):
+    minute_map = attendee.shift_minute_map
+    minutes_worked = job.duration
+    limit = job.max_consecutive_minutes or 60000
+    for step in (-1, 1):
+        current = job.start_time - timedelta(minutes=1) if step < 0 else job.start_time + timedelta(minutes=job.duration)
+        while current in minute_map:
+            minutes_worked += 1
+            if minute_map[current].max_consecutive_minutes > 0:
+                limit = min(limit, minute_map[current].max_consecutive_minutes)
+            current += timedelta(minutes=step)
+    return minutes_worked <= limit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=600, help='candidate jobs to check')
+    parser.add_argument('--shifts', type=int, default=30, help='shifts the staffer is already working')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    shift_jobs = make_jobs(args.shifts, rng)
+    candidates = make_jobs(args.jobs, rng)
+
+    def run_old():
+        attendee = old_attendee(shift_jobs)
+        return [old_no_overlap(job, attendee) and old_working_limit_ok(job, attendee) for job in candidates]
+
+    def run_new():
+        attendee = SimpleNamespace(shift_intervals=ShiftIntervals(shift_jobs))
+        return [job.no_overlap(attendee) and job.working_limit_ok(attendee) for job in candidates]
+
+    assert run_old() == run_new(), 'interval checks disagree with the per-minute checks'
+
+    old = min(timeit.repeat(run_old, number=1, repeat=args.repeat))
+    new = min(timeit.repeat(run_new, number=1, repeat=args.repeat))
+    minutes = ShiftIntervals(shift_jobs).total_minutes
+    print('{} shifts ({} minutes worked), {} candidate jobs'.format(args.shifts, minutes, args.jobs))
+    print('per-minute sets: {:8.2f} ms'.format(old * 1000))
+    print('intervals:       {:8.2f} ms  ({:.1f}x)'.format(new * 1000, old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Load tests terminal sales and settlement against the SPIn simulator.
+
+Starts a SpinSimulator and queues --sales card sales on each of --terminals terminals, first
+sent from a pool of --workers threads that block on each terminal request like Celery workers
+running process_terminal_sale, then through the TerminalGateway's Redis queue (so this needs
+the configured Redis). It then settles every terminal one after another, like the old
+close_out_terminals, and all at once through TerminalGateway.settle_all. It checks that every
+sale and settlement was answered and reports how long each approach took.
+
+    python -m tests.benchmarks.bench_spin_gateway [--terminals 40] [--sales 2] [--workers 8]
+        [--card-seconds 1 3] [--settle-seconds 0.5]
+"""
+import argparse
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+from uuid import uuid4
+
+import requests
+
+import uber.spin_rest_utils as spin_rest_utils
+from uber.config import c
+from uber.terminal_gateway import IN_FLIGHT_KEY, QUEUE_KEY, TerminalGateway, queue_sale, terminal_key
+from tests.benchmarks.spin_simulator import SIMULATOR_SECRETS, SpinSimulator
+
+AUTH_KEY = 'bench'
+
+
+def sale_request(ref_id):
+    return spin_rest_utils.sale_request_dict('10.00', 'Credit', ref_id, False)
+
+
+def legacy_sale(url, terminal_id, ref_id):
+    data = dict(sale_request(ref_id), **spin_rest_utils.base_request(terminal_id, AUTH_KEY))
+    while True:
+        response_json = requests.post(spin_rest_utils.get_call_url(url, 'sale'), data=data).json()
+        if not spin_rest_utils.terminal_busy(response_json):
+            return response_json
+        sleep(1)
+
+
+def legacy_settle(url, terminal_ids):
+    for terminal_id in terminal_ids:
+        requests.post(spin_rest_utils.get_call_url(url, 'settle'),
+                      data=spin_rest_utils.base_request(terminal_id, AUTH_KEY)).json()
+
+
+async def gateway_sales(gateway, jobs):
+    results = []
+    done = threading.Event()
+
+    def on_sale_result(job, response_json, error):
+        results.append((job, response_json, error))
+        if len(results) == len(jobs):
+            done.set()
+
+    gateway.on_sale_result = on_sale_result
+    for terminal_id, ref_id in jobs:
+        queue_sale({'terminal_id': terminal_id, 'tracking_id': ref_id, 'intent_id': ref_id}, sale_request(ref_id))
+
+    runner = asyncio.create_task(gateway.run())
+    await asyncio.get_running_loop().run_in_executor(None, done.wait)
+    runner.cancel()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--terminals', type=int, default=40)
+    parser.add_argument('--sales', type=int, default=2)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--card-seconds', type=float, nargs=2, default=[1, 3])
+    parser.add_argument('--settle-seconds', type=float, default=0.5)
+    args = parser.parse_args()
+
+    assert c.REDIS_STORE.ping(), 'This needs the configured Redis'
+    for name in ['secrets', 'strings', 'templates']:
+        getattr(spin_rest_utils, name).clear()
+    spin_rest_utils.secrets.update(SIMULATOR_SECRETS)
+    spin_rest_utils.strings.update(SIMULATOR_SECRETS['strings'])
+    spin_rest_utils.templates.update(SIMULATOR_SECRETS['templates'])
+
+    simulator = SpinSimulator(card_seconds=args.card_seconds, settle_seconds=args.settle_seconds).start()
+    terminal_ids = ['bench-terminal-{}'.format(i) for i in range(args.terminals)]
+    jobs = [(terminal_id, uuid4().hex[:20]) for _ in range(args.sales) for terminal_id in terminal_ids]
+
+    try:
+        start = monotonic()
+        with ThreadPoolExecutor(args.workers) as pool:
+            legacy = list(pool.map(lambda job: legacy_sale(simulator.url, *job), jobs))
+        legacy_seconds = monotonic() - start
+        assert all(spin_rest_utils.api_response_successful(response_json) for response_json in legacy)
+
+        gateway = TerminalGateway(api_url=simulator.url, auth_key=AUTH_KEY)
+        start = monotonic()
+        results = asyncio.run(gateway_sales(gateway, jobs))
+        gateway_seconds = monotonic() - start
+        gateway.close()
+        assert all(spin_rest_utils.api_response_successful(response_json) and not error
+                   for job, response_json, error in results)
+
+        print('{} sales on {} terminals: {:.1f}s from {} blocking workers, {:.1f}s through the gateway'.format(
+            len(jobs), args.terminals, legacy_seconds, args.workers, gateway_seconds))
+
+        start = monotonic()
+        legacy_settle(simulator.url, terminal_ids)
+        legacy_seconds = monotonic() - start
+
+        start = monotonic()
+        settlements = TerminalGateway(api_url=simulator.url, auth_key=AUTH_KEY).settle_all(terminal_ids)
+        gateway_seconds = monotonic() - start
+        assert all(spin_rest_utils.api_response_successful(response_json) for response_json, error in settlements)
+
+        print('Settling {} terminals: {:.1f}s one at a time, {:.1f}s all at once ({} busy responses overall)'.format(
+            args.terminals, legacy_seconds, gateway_seconds, simulator.counts['busy']))
+    finally:
+        simulator.stop()
+        c.REDIS_STORE.delete(QUEUE_KEY, IN_FLIGHT_KEY, *[terminal_key(terminal_id) for terminal_id in terminal_ids])
+
+
+if __name__ == '__main__':
+    main()
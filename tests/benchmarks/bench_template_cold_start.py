@@ -0,0 +1,114 @@
+"""
+Measures how long a freshly started process takes to load templates, with and without the
+shared template bytecode cache that "sep precompile_templates" fills in.
+
+Each measurement runs in its own subprocess, so nothing is compiled or cached in memory
+beforehand, and loads --templates template names (every template by default) the way a page
+render does. It also checks that the template manifest resolves every name to the same files
+as the old per-search-path os.path.exists probing, and times both lookups.
+
+    python -m tests.benchmarks.bench_template_cold_start [--templates 200] [--runs 3]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+from jinja2.loaders import split_template_path
+
+
+def legacy_matching_filenames(env, template):
+    pieces = split_template_path(template)
+    search_paths = env.loader.searchpath
+    for exact_path in env.base_template_paths:
+        if template.startswith(exact_path):
+            pieces = split_template_path(template.replace(exact_path, '', 1))
+            search_paths = [s for s in env.loader.searchpath if s.endswith(exact_path)]
+    return [os.path.join(s, *pieces) for s in search_paths if os.path.exists(os.path.join(s, *pieces))]
+
+
+def template_names(env):
+    names = sorted(name for name in env.manifest if not name.endswith(('.css', '.js', '.xml')))
+    return names + [path + name for path in env.base_template_paths for name in names[:50]]
+
+
+def child(bytecode_dir, names):
+    from uber.config import c
+    c.TEMPLATE_BYTECODE_DIR = bytecode_dir
+
+    from uber.jinja import JinjaEnv
+    env = JinjaEnv.env()
+    timings = []
+    for name in names:
+        start = perf_counter()
+        env.get_template(name)
+        timings.append(perf_counter() - start)
+    print(json.dumps(timings))
+
+
+def run_child(bytecode_dir, names):
+    output = subprocess.run([sys.executable, '-m', __spec__.name, '--child', bytecode_dir],
+                            input=json.dumps(names), capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def report(label, runs):
+    totals = [sum(timings) for timings in runs]
+    first_loads = [seconds for timings in runs for seconds in timings]
+    print(f'{label:<32} {statistics.median(totals):8.3f}s total   '
+          f'p50 {statistics.median(first_loads) * 1000:6.2f}ms   '
+          f'p99 {statistics.quantiles(first_loads, n=100)[98] * 1000:7.2f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--templates', type=int, default=0, help='Number of templates to load (default: all)')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=16)
+    parser.add_argument('--child')
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child, json.loads(sys.stdin.read()))
+        return
+
+    from uber.config import c
+    c.TEMPLATE_BYTECODE_DIR = ''
+    from uber.jinja import JinjaEnv
+    env = JinjaEnv.env()
+
+    names = template_names(env)
+    start = perf_counter()
+    legacy = {name: legacy_matching_filenames(env, name) for name in names}
+    legacy_seconds = perf_counter() - start
+    start = perf_counter()
+    current = {name: env._get_matching_filenames(name) for name in names}
+    manifest_seconds = perf_counter() - start
+    assert legacy == current, [name for name in names if legacy[name] != current[name]]
+    print(f'{len(names)} template lookups: {legacy_seconds * 1000:.1f}ms probing, '
+          f'{manifest_seconds * 1000:.1f}ms with the manifest (including building it)')
+
+    page_names = [name for name in names if name.endswith('.html') and not name.startswith(tuple(
+        env.base_template_paths))]
+    if args.templates:
+        page_names = random.Random(args.seed).sample(page_names, min(args.templates, len(page_names)))
+
+    with tempfile.TemporaryDirectory() as bytecode_dir:
+        report('no bytecode cache', [run_child('', page_names) for _ in range(args.runs)])
+
+        c.TEMPLATE_BYTECODE_DIR = bytecode_dir
+        JinjaEnv._env = None
+        start = perf_counter()
+        compiled, errors = JinjaEnv.precompile()
+        print(f'precompiled {compiled} templates in {perf_counter() - start:.1f}s ({len(errors)} errors)')
+
+        report('precompiled bytecode cache', [run_child(bytecode_dir, page_names) for _ in range(args.runs)])
+
+
+if __name__ == '__main__':
+    main()
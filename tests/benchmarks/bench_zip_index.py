@@ -0,0 +1,134 @@
+"""
+Compares the statistics map's old per-zip-code lookups with the NumPy zip code index.
+
+The old refresh opened a uszipcode database connection for every distinct attendee zip code,
+and the radial report measured the geodesic distance to every zip code in a bounding box one
+at a time. This times both approaches against a uszipcode-style simple_zipcode database --
+a synthetic one with --zips random zip codes by default, or the real one with --db -- and
+--attendees random attendee zip codes. Opening a bare sqlite3 connection is cheaper than
+building a uszipcode SearchEngine, so the old timings are a lower bound.
+
+    python -m tests.benchmarks.bench_zip_index [--zips 42000] [--attendees 100000] [--db simple_db.sqlite]
+"""
+import argparse
+import math
+import os
+import random
+import sqlite3
+import tempfile
+from collections import Counter
+from time import monotonic
+
+from uber.zipcodes import ZipCodeIndex, haversine_miles, normalize_zip_code
+
+try:
+    from geopy.distance import geodesic
+except ImportError:
+    geodesic = None
+
+
+def make_db(path, count, rng):
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE simple_zipcode (zipcode TEXT PRIMARY KEY, major_city TEXT, state TEXT, '
+                       'lat REAL, lng REAL)')
+    connection.execute('CREATE INDEX ix_lat ON simple_zipcode (lat)')
+    connection.execute('CREATE INDEX ix_lng ON simple_zipcode (lng)')
+    zips = rng.sample(range(1000, 100000), count)
+    connection.executemany('INSERT INTO simple_zipcode VALUES (?, ?, ?, ?, ?)', [
+        (str(z).zfill(5), f'City {z}', f'S{z % 50}', rng.uniform(25, 49), rng.uniform(-124, -67)) for z in zips])
+    connection.commit()
+    connection.close()
+
+
+def old_refresh(path, attendee_zips):
+    counter = Counter(attendee_zips)
+    zips = {}
+    for z in counter:
+        connection = sqlite3.connect(path)
+        row = connection.execute('SELECT zipcode, major_city, state, lat, lng FROM simple_zipcode WHERE zipcode = ?',
+                                 (str(int(z.split('-')[0])).zfill(5),)).fetchone()
+        connection.close()
+        if row:
+            zips[row[0]] = row
+    return zips
+
+
+def new_refresh(index, attendee_zips):
+    # The GROUP BY now happens in SQL, so we start from its results
+    counter = Counter()
+    for z, count in Counter(z[:5] for z in attendee_zips).items():
+        counter[normalize_zip_code(z)] += count
+    return index.lookup_many(list(counter))
+
+
+def old_radial(path, lat, lng, radius):
+    lat_pad = radius / 69.17
+    lng_pad = radius / (69.17 * math.cos(math.radians(lat)))
+    connection = sqlite3.connect(path)
+    rows = connection.execute('SELECT zipcode, lat, lng FROM simple_zipcode WHERE lat BETWEEN ? AND ? '
+                              'AND lng BETWEEN ? AND ?', (lat - lat_pad, lat + lat_pad, lng - lng_pad,
+                                                          lng + lng_pad)).fetchall()
+    connection.close()
+    results = []
+    for zipcode, zip_lat, zip_lng in rows:
+        if geodesic:
+            miles = geodesic((zip_lat, zip_lng), (lat, lng)).miles
+        else:
+            miles = float(haversine_miles(zip_lat, zip_lng, lat, lng))
+        if miles <= radius:
+            results.append((zipcode, miles))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--zips', type=int, default=42000)
+    parser.add_argument('--attendees', type=int, default=100000)
+    parser.add_argument('--radii', type=int, nargs='+', default=[25, 100, 250, 500])
+    parser.add_argument('--db', help="a uszipcode simple_db.sqlite file to use instead of a synthetic one")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = args.db or os.path.join(tmpdir, 'simple_db.sqlite')
+        if not args.db:
+            make_db(path, args.zips, rng)
+
+        start = monotonic()
+        index = ZipCodeIndex.from_sqlite(path)
+        print('loaded {} zip codes into the index in {:.2f}s'.format(len(index), monotonic() - start))
+
+        known = [str(z) for z in index.zipcodes]
+        attendee_zips = [rng.choice(known) + (f'-{rng.randrange(10000):04}' if rng.random() < 0.1 else '')
+                         for _ in range(args.attendees)]
+
+        start = monotonic()
+        old_zips = old_refresh(path, attendee_zips)
+        old_seconds = monotonic() - start
+        start = monotonic()
+        new_zips = new_refresh(index, attendee_zips)
+        new_seconds = monotonic() - start
+        assert set(old_zips) == set(new_zips), 'the index found different zip codes'
+        print('refresh, {} distinct zip codes:  old {:8.3f}s   new {:8.3f}s  ({:.0f}x)'.format(
+            len(new_zips), old_seconds, new_seconds, old_seconds / new_seconds))
+
+        lat, lng = 38.80, -76.99
+        for radius in args.radii:
+            start = monotonic()
+            old_results = old_radial(path, lat, lng, radius)
+            old_seconds = monotonic() - start
+            start = monotonic()
+            new_results = index.within(lat, lng, radius)
+            new_seconds = monotonic() - start
+
+            # Haversine and geodesic distances differ slightly, so ignore zip codes right at the edge
+            old_inside = {z for z, miles in old_results if miles < radius * 0.99}
+            new_inside = {x.zipcode for x, miles in new_results}
+            assert old_inside <= new_inside, 'the index missed zip codes inside the radius'
+            print('radial, {:4} miles, {:6} zip codes:  old {:8.3f}s   new {:8.3f}s  ({:.0f}x)'.format(
+                radius, len(new_results), old_seconds, new_seconds, old_seconds / new_seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+A stand-in for the SPIn proxy, for load testing terminal payments without real terminals.
+
+It answers sale, void, return, status, and settle calls for any number of terminals. Sales take
+a random --card-seconds to complete, like an attendee tapping or inserting a card, and settlements
+take --settle-seconds. A terminal handles one request at a time and answers anything sent to it in
+the meantime with a busy error, like the real thing. --decline-rate of sales are declined.
+
+The simulator speaks the request and response format described by SIMULATOR_SECRETS, so point
+spin_terminal_url at it and set spin_rest_secrets to the JSON it prints on startup:
+
+    python -m tests.benchmarks.spin_simulator [--port 8765] [--card-seconds 3 12] [--settle-seconds 5]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+CALL_TYPES = ['sale', 'void', 'return', 'status', 'settle']
+
+SIMULATOR_SECRETS = {
+    'strings': dict({call_type: call_type for call_type in CALL_TYPES}, **{
+        'terminal_id': 'TPN',
+        'auth_key': 'AuthKey',
+        'dollar_amount': 'Amount',
+        'payment_type': 'PaymentType',
+        'ref_id': 'ReferenceId',
+        'capture_signature': 'CaptureSignature',
+        'print_receipt': 'PrintReceipt',
+        'false': 'No',
+        'gen_resp': 'GeneralResponse',
+        'res': 'ResultCode',
+        'res_success': '0',
+        'sts_code': 'StatusCode',
+        'msg': 'Message',
+        'det_msg': 'DetailedMessage',
+        'dollar_amounts': 'Amounts',
+        'total_amount': 'TotalAmount',
+        'cdata': 'CardData',
+        'etype': 'EntryType',
+        'edata': 'EMVData',
+        'ext_data': 'ExtendedData',
+        'app_name': 'ApplicationName',
+        'txn_id': 'TransactionId',
+        'auth_code': 'AuthCode',
+        'sig': 'Signature',
+        'rcpt': 'Receipts',
+        'cust': 'Customer',
+        'error_busy': 'Terminal in use',
+        'error_cancel': 'Canceled',
+        'duplicate_error': 'Duplicate reference',
+        'sts_cancelled': '2',
+    }),
+    'templates': {'sale_request_dict': {'PrintReceipt': 'No', 'GetReceipt': 'No'}},
+    'lists': {'call_url_types': CALL_TYPES, 'insecure_entry_types': ['Keyed']},
+}
+strings = SIMULATOR_SECRETS['strings']
+
+
+def response(status_code, message, **fields):
+    return dict({
+        strings['gen_resp']: {
+            strings['res']: strings['res_success'] if status_code == '0' else '1',
+            strings['sts_code']: status_code,
+            strings['msg']: message,
+            strings['det_msg']: message,
+        }
+    }, **fields)
+
+
+class SpinSimulator:
+    def __init__(self, port=0, card_seconds=(3, 12), settle_seconds=5, decline_rate=0.0):
+        self.card_seconds = card_seconds
+        self.settle_seconds = settle_seconds
+        self.decline_rate = decline_rate
+        self.terminal_locks = {}
+        self.completed = {}
+        self.counts = {'busy': 0, 'sale': 0, 'settle': 0}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/'.format(self.server.server_port)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handler_class(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                fields = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+                body = json.dumps(simulator.handle(self.path.strip('/'), fields)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def handle(self, call_type, fields):
+        terminal_id = fields.get(strings['terminal_id'], '')
+        with self.lock:
+            terminal_lock = self.terminal_locks.setdefault(terminal_id, threading.Lock())
+        if not terminal_lock.acquire(blocking=False):
+            with self.lock:
+                self.counts['busy'] += 1
+            return response('1', strings['error_busy'])
+
+        try:
+            ref_id = fields.get(strings['ref_id'], '')
+            if call_type == 'sale':
+                return self.sale(ref_id, fields)
+            elif call_type == 'settle':
+                time.sleep(self.settle_seconds)
+                with self.lock:
+                    self.counts['settle'] += 1
+                return response('0', 'Batch closed')
+            elif call_type == 'status':
+                return self.completed.get(ref_id) or response('1', 'Not found')
+            elif call_type in ('void', 'return'):
+                return response('0', 'Approved', **{strings['ref_id']: ref_id})
+            return response('1', 'Unknown call ' + call_type)
+        finally:
+            terminal_lock.release()
+
+    def sale(self, ref_id, fields):
+        time.sleep(random.uniform(*self.card_seconds))
+        with self.lock:
+            self.counts['sale'] += 1
+        if random.random() < self.decline_rate:
+            return response('1', 'Declined')
+
+        result = response('0', 'Approved', **{
+            strings['ref_id']: ref_id,
+            strings['dollar_amounts']: {strings['total_amount']: float(fields.get(strings['dollar_amount'], 0))},
+            strings['cdata']: {strings['etype']: 'Tap'},
+            strings['auth_code']: str(random.randint(100000, 999999)),
+            strings['sig']: 'signature' if fields.get(strings['capture_signature']) == 'True' else '',
+        })
+        self.completed[ref_id] = result
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--card-seconds', type=float, nargs=2, default=[3, 12])
+    parser.add_argument('--settle-seconds', type=float, default=5)
+    parser.add_argument('--decline-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    simulator = SpinSimulator(args.port, args.card_seconds, args.settle_seconds, args.decline_rate)
+    print('SPIn simulator listening at', simulator.url)
+    print('spin_rest_secrets =', json.dumps(json.dumps(SIMULATOR_SECRETS)))
+    try:
+        simulator.server.serve_forever()
+    except KeyboardInterrupt:
+        simulator.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -28,3 +28,9 @@ class TestAutomatedEmailFixture(object):
     def test_invalid_template(self, clear_automated_email_fixtures):
         with pytest.raises(TemplateNotFound):
             AutomatedEmailFixture(Attendee, 'subject', 'template.txt', lambda x: True, 'ident').body
+
+    def test_sql_filters(self, clear_automated_email_fixtures):
+        staffing = Attendee.staffing == True  # noqa: E712
+        fixture = AutomatedEmailFixture(Attendee, 'subject', 'template.txt', lambda x: True, 'ident', query=[staffing])
+        assert fixture.sql_filters == AutomatedEmailFixture.prefilters[Attendee] + [staffing]
+        assert AutomatedEmailFixture(None, 'subject', 'template.txt', None, 'no_model').sql_filters == []
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+
+from uber.config import c, config_cache
+from uber.email import AutomatedEmailIndex, IndexedFixture, automated_email_index
+from uber.models import Attendee, AutomatedEmail, Department, _check_emails, _queue_deferred_email_checks
+from uber.tasks import email as email_tasks
+
+
+@pytest.fixture
+def index(monkeypatch):
+    monkeypatch.setattr(c, 'CONFIG_CACHE_SECONDS', 300)
+    monkeypatch.setattr(config_cache, '_start_listener', lambda: None)
+    monkeypatch.setattr(AutomatedEmail, 'initialized', True)
+    builds = []
+
+    def build_index(at_the_con, post_con):
+        builds.append((at_the_con, post_con))
+        return {'Attendee': (IndexedFixture('1', 'attendee_email', ''),)}
+
+    monkeypatch.setattr(AutomatedEmailIndex, '_build_index', staticmethod(build_index))
+    automated_email_index.invalidate()
+    yield builds
+    automated_email_index.invalidate()
+
+
+def test_fixtures_are_cached_until_invalidated(index):
+    version = automated_email_index.version
+    assert automated_email_index.fixtures_for('Attendee') == (IndexedFixture('1', 'attendee_email', ''),)
+    assert automated_email_index.fixtures_for('Attendee')
+    assert len(index) == 1
+
+    automated_email_index.invalidate()
+    assert automated_email_index.version == version + 1
+    automated_email_index.fixtures_for('Attendee')
+    assert len(index) == 2
+
+
+def test_unregistered_models_skip_the_index(index):
+    assert not automated_email_index.has_fixtures('Department')
+    assert automated_email_index.fixtures_for('Department') == ()
+    assert not index
+
+
+def test_deferred_email_checks(index, monkeypatch):
+    queued = []
+    monkeypatch.setattr(email_tasks.check_emails_for_models, 'delay', queued.append)
+    attendee = Attendee()
+    session = SimpleNamespace(info={'defer_email_checks': True}, dirty=[attendee], new=[Department()])
+
+    _check_emails(session)
+    assert session.info['deferred_email_checks'] == {('Attendee', attendee.id)}
+
+    _queue_deferred_email_checks(session)
+    assert queued == [[('Attendee', attendee.id)]]
+    assert 'deferred_email_checks' not in session.info
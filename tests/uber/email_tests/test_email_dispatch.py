@@ -0,0 +1,86 @@
+"""
+Tests for uber.email.EmailDispatcher and the SES rate limiter.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+from uber.amazon_ses import FakeSES, TokenBucket
+from uber.config import c
+from uber.email import EmailDispatcher
+from uber.models import Email, Session
+
+
+@pytest.fixture
+def sending(monkeypatch):
+    monkeypatch.setattr(c, 'DEV_BOX', False)
+    monkeypatch.setattr(c, 'SEND_EMAILS', True)
+
+
+def ses_kwargs(i):
+    return {'source': c.CONTACT_EMAIL, 'toAddresses': [f'{i}@example.com'],
+            'message': {'bodyText': '', 'subject': str(i), 'charset': 'UTF-8'}}
+
+
+def test_deliver_all(sending):
+    sender = FakeSES(latency=0)
+    bucket = TokenBucket('test_send_rate', 0, use_redis=False)
+    with EmailDispatcher(workers=4, rate_limiter=bucket, sender=sender) as dispatcher:
+        results = dict(dispatcher.deliver_all((i, ses_kwargs(i)) for i in range(20)))
+    assert results == {i: None for i in range(20)}
+    assert sender.sent_count == 20
+
+
+def test_deliver_all_reports_errors(sending):
+    bucket = TokenBucket('test_send_rate', 0, use_redis=False)
+    with EmailDispatcher(workers=2, rate_limiter=bucket, sender=FakeSES(latency=0, failure_rate=1)) as dispatcher:
+        assert all(error for key, error in dispatcher.deliver_all((i, ses_kwargs(i)) for i in range(5)))
+
+
+def test_deliver_all_not_sending(monkeypatch):
+    monkeypatch.setattr(c, 'SEND_EMAILS', False)
+    sender = FakeSES(latency=0)
+    with EmailDispatcher(workers=2, sender=sender) as dispatcher:
+        assert dict(dispatcher.deliver_all([(1, ses_kwargs(1))])) == {1: ''}
+    assert sender.sent_count == 0
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket('test_send_rate', 10, burst=2, use_redis=False)
+    assert [bucket._take_local() for _ in range(2)] == [0, 0]
+    assert bucket._take_local() == pytest.approx(0.1, abs=0.01)
+
+
+def test_token_bucket_falls_back_without_redis(monkeypatch):
+    class BrokenRedis:
+        def eval(self, *args):
+            raise ConnectionError()
+
+    monkeypatch.setattr(c, 'REDIS_STORE', BrokenRedis())
+    bucket = TokenBucket('test_send_rate', 10, burst=1)
+    assert bucket._take() == 0
+    assert not bucket.use_redis
+    assert bucket._take() > 0
+
+
+def test_dispatch_moves_past_failed_emails(sending):
+    sent_after = datetime.now(pytz.UTC) - timedelta(hours=1)
+    with Session() as session:
+        session.add_all([Email(model='', ident='dispatch_test', status=c.QUEUED, sender=c.CONTACT_EMAIL,
+                               to=f'{i}@example.com', subject=str(i), body='' if i < 2 else 'Body',
+                               send_after=sent_after + timedelta(minutes=i)) for i in range(4)])
+        session.commit()
+
+    sender = FakeSES(latency=0)
+    bucket = TokenBucket('test_send_rate', 0, use_redis=False)
+    with Session() as session, EmailDispatcher(workers=2, rate_limiter=bucket, sender=sender,
+                                               batch_size=2) as dispatcher:
+        assert dispatcher.dispatch(session, None, max_emails=10) == 2
+
+    with Session() as session:
+        emails = session.query(Email).filter(Email.ident == 'dispatch_test').order_by(Email.send_after).all()
+        assert [bool(email.error) for email in emails] == [True, True, False, False]
+        assert [email.status == c.SENT for email in emails] == [False, False, True, True]
+    assert sender.sent_count == 2
@@ -0,0 +1,127 @@
+"""
+Tests for the bulk email generation path used by EmailService.check_emails_for_fixture.
+"""
+import multiprocessing
+from datetime import datetime, timedelta
+
+import pytz
+import pytest
+
+from uber.config import c
+from uber.email import EmailHandler, EmailRenderPool, EmailService
+from uber.models import Attendee, AutomatedEmail, Email
+
+
+@pytest.fixture
+def fixture_obj():
+    return AutomatedEmail(ident='test_bulk', model='Attendee', subject='Hello', sender=c.REGDESK_EMAIL,
+                          cc='cc@example.com', body='Hi {{ attendee.first_name }}!', policy=c.AUTOSEND)
+
+
+def test_email_values(fixture_obj, monkeypatch):
+    monkeypatch.setattr(AutomatedEmail, 'initialized', True)
+    attendee = Attendee(first_name='Ann', last_name='Artist', email='ann@example.com')
+    values = EmailHandler.email_values(fixture_obj, attendee, ident=fixture_obj.ident)
+    assert values['body'] == 'Hi Ann!'
+    assert values['to'] == attendee.email_to_address
+    assert values['cc'] == 'cc@example.com'
+    assert (values['fk_id'], values['model'], values['ident']) == (attendee.id, 'Attendee', 'test_bulk')
+
+    email = EmailHandler(fixture_obj, attendee, ident=fixture_obj.ident).email_obj
+    assert (email.body, email.to, email.status) == ('Hi Ann!', values['to'], c.QUEUED)
+    assert email.automated_email is fixture_obj
+
+
+def test_email_values_serializes_models():
+    attendee = Attendee(first_name='Ann')
+    values = EmailHandler.email_values(subject='Hi', body='Hi', to='ann@example.com',
+                                       data={'attendee': attendee, 'count': 2})
+    assert values['render_data']['count'] == 2
+    assert values['render_data']['attendee']['id'] == attendee.id
+    assert values['sender'] == c.CONTACT_EMAIL
+
+
+class FakeSession:
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, statement, rows):
+        self.executed.append((statement, rows))
+
+
+@pytest.mark.parametrize('policy,status', [(c.AUTOSEND, c.QUEUED), (c.NEEDS_APPROVAL, c.UNAPPROVED)])
+def test_insert_email_rows(fixture_obj, policy, status):
+    fixture_obj.policy = policy
+    session = FakeSession()
+    EmailService.insert_email_rows(session, fixture_obj, [{'fk_id': '1', 'body': 'a'}, {'fk_id': '2', 'body': 'b'}])
+    EmailService.insert_email_rows(session, fixture_obj, [])
+
+    [(statement, rows)] = session.executed
+    assert statement.table.name == Email.__tablename__
+    assert [row['fk_id'] for row in rows] == ['1', '2']
+    assert {row['status'] for row in rows} == {status}
+    assert {row['automated_email_id'] for row in rows} == {fixture_obj.id}
+    if status == c.QUEUED:
+        assert rows[0]['send_after'] > datetime.now(pytz.UTC) + timedelta(minutes=4)
+    else:
+        assert rows[0]['send_after'] is None
+
+
+def test_render_pool_renders_small_fixtures_in_process(fixture_obj, monkeypatch):
+    monkeypatch.setattr(c, 'EMAIL_RENDER_PROCESS_MIN', 100)
+    monkeypatch.setattr(EmailService, 'render_email_rows', lambda session, fixture_obj, ids: [{'fk_id': i} for i in ids])
+
+    with EmailRenderPool(processes=4) as pool:
+        assert list(pool.render(None, fixture_obj, [[1, 2], [3]])) == [[{'fk_id': 1}, {'fk_id': 2}], [{'fk_id': 3}]]
+        assert pool.pool is None
+
+
+def render_chunk_in_pool(fixture_id, ids):
+    return [{'fk_id': i, 'fixture_id': fixture_id} for i in ids]
+
+
+def render_from_daemonic_process(fixture_obj, results):
+    with EmailRenderPool(processes=2, render_chunk=render_chunk_in_pool) as pool:
+        rows = list(pool.render(None, fixture_obj, [[1, 2], [3]]))
+        results.put((pool.pool is not None, rows))
+
+
+def test_render_pool_runs_from_celery_worker_processes(fixture_obj, monkeypatch):
+    # Celery's prefork pool runs tasks in daemonic processes, which the standard library
+    # won't start processes from
+    monkeypatch.setattr(c, 'EMAIL_RENDER_PROCESS_MIN', 2)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    worker = context.Process(target=render_from_daemonic_process, args=(fixture_obj, results), daemon=True)
+    worker.start()
+    used_pool, rows = results.get(timeout=60)
+    worker.join()
+    assert used_pool
+    assert rows == [[{'fk_id': 1, 'fixture_id': fixture_obj.id}, {'fk_id': 2, 'fixture_id': fixture_obj.id}],
+                    [{'fk_id': 3, 'fixture_id': fixture_obj.id}]]
+
+
+def test_render_pool_reads_chunks_as_it_goes(fixture_obj, monkeypatch):
+    monkeypatch.setattr(c, 'EMAIL_RENDER_PROCESS_MIN', 100)
+    monkeypatch.setattr(EmailService, 'render_email_rows', lambda session, fixture_obj, ids: [{'fk_id': i} for i in ids])
+    read = []
+
+    def chunks():
+        for i in range(10):
+            read.append(i)
+            yield [i]
+
+    with EmailRenderPool(processes=1) as pool:
+        rendered = pool.render(None, fixture_obj, chunks())
+        assert next(rendered) == [{'fk_id': 0}]
+        assert len(read) == 10
+        assert list(rendered) == [[{'fk_id': i}] for i in range(1, 10)]
+
+    monkeypatch.setattr(c, 'EMAIL_RENDER_PROCESS_MIN', 3)
+    read.clear()
+    with EmailRenderPool(processes=1) as pool:
+        rendered = pool.render(None, fixture_obj, chunks())
+        assert next(rendered) == [{'fk_id': 0}]
+        assert read == [0, 1, 2]
+        assert list(rendered) == [[{'fk_id': i}] for i in range(1, 10)]
+        assert pool.pool is None
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from uber.config import c
+from uber.models import UberSession, _discard_claimed_badges
+
+
+class EmptyResult:
+    _attributes = {}
+
+    def __iter__(self):
+        return iter([])
+
+    def all(self):
+        return []
+
+
+@pytest.fixture
+def executed(monkeypatch):
+    statements = []
+
+    def execute(self, statement, *args, **kwargs):
+        statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        return EmptyResult()
+    monkeypatch.setattr(UberSession, 'execute', execute)
+    return statements
+
+
+def test_claim_skips_locked_rows(executed):
+    session = UberSession()
+    assert session.claim_badge_nums(c.ATTENDEE_BADGE, 10) == []
+    [statement] = executed
+    assert 'badge_info.attendee_id IS NULL' in statement
+    assert 'ORDER BY badge_info.ident' in statement
+    assert statement.endswith('FOR UPDATE OF badge_info SKIP LOCKED')
+    assert 'JOIN attendee' not in statement
+
+
+def test_claim_excludes_badges_this_session_claimed(executed):
+    session = UberSession()
+    session.info['claimed_badge_ids'] = {'claimed-id'}
+    session.claim_badge_nums(c.ATTENDEE_BADGE)
+    assert 'badge_info.id NOT IN' in executed[0]
+
+
+def test_reserved_badges_are_used_first(monkeypatch):
+    session = UberSession()
+    badges = [SimpleNamespace(id=str(ident), ident=ident) for ident in range(3000, 3003)]
+    claims = []
+
+    def claim_badge_nums(badge_type, count=1):
+        claims.append(count)
+        return badges[:count]
+    monkeypatch.setattr(session, 'claim_badge_nums', claim_badge_nums)
+
+    assert session.reserve_badge_nums(c.ATTENDEE_BADGE, 2) == 2
+    assert [session.get_next_badge_num(c.ATTENDEE_BADGE).ident for i in range(3)] == [3000, 3001, 3000]
+    assert claims == [2, 1]
+
+    _discard_claimed_badges(session, SimpleNamespace(parent=None))
+    assert 'reserved_badges' not in session.info
@@ -0,0 +1,61 @@
+from collections import Counter
+
+import pytest
+
+from uber.config import c
+from uber.models.counters import BadgeCounters
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        pass
+
+    def hincrby(self, key, field, amount):
+        values = self.hashes.setdefault(key, {})
+        values[field] = str(int(values.get(field, 0)) + amount)
+
+    def hmget(self, key, *fields):
+        return [self.hashes.get(key, {}).get(field) for field in fields]
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    monkeypatch.setattr(c, 'REDIS_STORE', FakeRedis())
+    monkeypatch.setattr(c, 'REDIS_BADGE_COUNTERS', True)
+    return BadgeCounters()
+
+
+def attendee_values(**kwargs):
+    values = {'badge_type': c.ATTENDEE_BADGE, 'badge_status': c.COMPLETED_STATUS, 'paid': c.HAS_PAID,
+              'amount_extra': 0, 'shirt': c.NO_SHIRT, 'num_event_shirts': -1, 'ribbon': ''}
+    values.update(kwargs)
+    return values
+
+
+def test_paid_attendee_contributions():
+    assert BadgeCounters.contributions(attendee_values()) == Counter({
+        f'badge_type:{c.ATTENDEE_BADGE}': 1, 'sold:individual': 1, 'kickin:0': 1})
+
+
+def test_unpaid_attendee_not_counted_as_badge():
+    counts = BadgeCounters.contributions(attendee_values(paid=c.NOT_PAID, badge_status=c.NEW_STATUS))
+    assert counts == Counter({'kickin:0': 1})
+
+
+def test_refunded_attendee_contributes_nothing():
+    assert not BadgeCounters.contributions(attendee_values(badge_status=c.REFUNDED_STATUS))
+
+
+def test_counters_need_reconcile_before_use(counters):
+    counters.apply(Counter({f'badge_type:{c.ATTENDEE_BADGE}': 3}))
+    assert counters.get(f'badge_type:{c.ATTENDEE_BADGE}') is None
+
+    c.REDIS_STORE.hashes[counters.redis_key]['reconciled_at'] = 'now'
+    counters.apply(Counter({f'badge_type:{c.ATTENDEE_BADGE}': -1, 'kickin:0': 0}))
+    assert counters.get(f'badge_type:{c.ATTENDEE_BADGE}', 'kickin:0') == [2, 0]
@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from uber.config import c
+from uber.models import Attendee, UberSession
+
+
+@pytest.mark.parametrize('first_name,last_name,match_name', [
+    ('Ann', 'Smith', 'ann smith'),
+    ('  ANN ', 'van  Smith ', 'ann van smith'),
+    ('', '', ''),
+    (None, 'Smith', 'smith'),
+])
+def test_normalize_match_name(first_name, last_name, match_name):
+    assert Attendee.normalize_match_name(first_name, last_name) == match_name
+
+
+def test_match_keys_are_set_on_save():
+    attendee = Attendee(first_name='Ann', last_name=' Smith', email=' Ann@Example.com ')
+    attendee._match_key_adjustments()
+    assert (attendee.match_name, attendee.match_email) == ('ann smith', 'ann@example.com')
+
+
+class EmptyResult:
+    _attributes = {}
+
+    def __iter__(self):
+        return iter([])
+
+
+class Person:
+    first_name, last_name, email = 'Ann', 'Smith', 'Ann@example.com'
+
+
+@pytest.fixture
+def executed(monkeypatch):
+    statements = []
+
+    def execute(self, statement, *args, **kwargs):
+        statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        return EmptyResult()
+    monkeypatch.setattr(UberSession, 'execute', execute)
+    return statements
+
+
+def test_duplicate_registrations_groups_in_sql(executed):
+    assert UberSession().duplicate_registrations(Attendee.badge_status == c.COMPLETED_STATUS) == {}
+    [statement] = executed
+    assert 'GROUP BY attendee.match_name, attendee.match_email' in statement
+    assert 'HAVING count(attendee.id) > %(count_1)s' in statement
+
+
+def test_possible_match_list_only_loads_matches(executed):
+    person = Person()
+    assert UberSession().possible_matches([person]) == {person: set()}
+    [statement] = executed
+    assert 'attendee.match_email IN' in statement and 'attendee.match_name IN' in statement
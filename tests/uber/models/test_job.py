@@ -1,9 +1,11 @@
 from datetime import timedelta
+from types import SimpleNamespace
 
 import pytest
 
 from uber.config import c
 from uber.models import Attendee, DeptMembership, Job, Session
+from uber.utils import ShiftIntervals
 
 
 def test_hours():
@@ -29,6 +31,27 @@ def test_total_hours(monkeypatch):
     assert Job(slots=2).total_hours == 6
 
 
+def working(*jobs):
+    return SimpleNamespace(shift_intervals=ShiftIntervals(jobs))
+
+
+def test_no_overlap_extra15():
+    first = Job(start_time=c.EPOCH, duration=60, extra15=True, department_id='a')
+    same_dept = Job(start_time=c.EPOCH + timedelta(hours=1), duration=60, department_id='a')
+    other_dept = Job(start_time=c.EPOCH + timedelta(hours=1), duration=60, department_id='b')
+    assert not Job(start_time=c.EPOCH + timedelta(minutes=30), duration=60).no_overlap(working(first))
+    assert same_dept.no_overlap(working(first))
+    assert not other_dept.no_overlap(working(first))
+
+
+def test_working_limit_ok():
+    before = Job(start_time=c.EPOCH, duration=120, max_consecutive_minutes=200)
+    after = Job(start_time=c.EPOCH + timedelta(hours=3), duration=60, max_consecutive_minutes=0)
+    job = Job(start_time=c.EPOCH + timedelta(hours=2), duration=60, max_consecutive_minutes=0)
+    assert job.working_limit_ok(working(before))
+    assert not job.working_limit_ok(working(before, after))
+
+
 @pytest.fixture
 def session(request):
     session = Session()
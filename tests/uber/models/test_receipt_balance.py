@@ -0,0 +1,116 @@
+import threading
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+
+from uber.models import ModelReceipt, ReceiptDiscount, ReceiptItem, ReceiptTransaction, Session, receipt_balance, \
+    receipt_balances
+
+
+@pytest.fixture
+def receipt_id():
+    with Session() as session:
+        receipt = ModelReceipt(owner_id=str(uuid4()), owner_model='Attendee',
+                               receipt_items=[ReceiptItem(amount=5000, count=1, desc='Badge')])
+        session.add(receipt)
+        session.commit()
+        return receipt.id
+
+
+def balance_row(receipt_id):
+    with Session() as session:
+        return session.execute(select(receipt_balance).where(receipt_balance.c.receipt_id == receipt_id)).one()
+
+
+def add_payment(session, receipt_id, amount):
+    session.add(ReceiptTransaction(receipt_id=receipt_id, amount=amount, desc='Cash payment'))
+
+
+def test_balance_follows_receipt_changes(receipt_id):
+    row = balance_row(receipt_id)
+    assert (row.item_total, row.payment_total, row.balance) == (5000, 0, 5000)
+
+    with Session() as session:
+        add_payment(session, receipt_id, 2000)
+        session.commit()
+    row = balance_row(receipt_id)
+    assert (row.payment_total, row.balance) == (2000, 3000)
+
+
+def test_concurrent_payments_are_both_counted(receipt_id):
+    first, second = Session(), Session()
+    try:
+        add_payment(first, receipt_id, 1000)
+        first.flush()
+
+        def pay_second():
+            add_payment(second, receipt_id, 2000)
+            second.commit()
+
+        waiting = threading.Thread(target=pay_second)
+        waiting.start()
+        waiting.join(1)
+        assert waiting.is_alive(), 'The second payment should wait for the first to commit'
+
+        first.commit()
+        waiting.join(10)
+        assert not waiting.is_alive()
+    finally:
+        first.close()
+        second.close()
+
+    row = balance_row(receipt_id)
+    assert (row.payment_total, row.balance) == (3000, 2000)
+
+
+def test_payments_flushed_together_are_both_counted(receipt_id, monkeypatch):
+    # Flush both payments before either refreshes, so each transaction already holds its foreign
+    # key lock on the receipt when the refreshes try to lock it
+    monkeypatch.setattr(receipt_balances, 'record_changes', lambda session: None)
+    sessions = [Session(), Session()]
+    errors = []
+
+    def refresh_and_commit(session):
+        try:
+            receipt_balances.refresh(session.connection(), {receipt_id})
+            session.commit()
+        except Exception as e:
+            errors.append(e)
+
+    try:
+        for session, amount in zip(sessions, [1000, 2000]):
+            add_payment(session, receipt_id, amount)
+            session.flush()
+
+        refreshes = [threading.Thread(target=refresh_and_commit, args=(session,)) for session in sessions]
+        for refresh in refreshes:
+            refresh.start()
+        for refresh in refreshes:
+            refresh.join(10)
+    finally:
+        for session in sessions:
+            session.close()
+
+    assert not errors
+    row = balance_row(receipt_id)
+    assert (row.payment_total, row.balance) == (3000, 2000)
+
+
+def test_reconcile_fixes_drifted_rows(receipt_id):
+    with Session() as session:
+        session.execute(receipt_balance.update().where(receipt_balance.c.receipt_id == receipt_id).values(balance=0))
+        assert receipt_balances.reconcile(session) == [receipt_id]
+        session.commit()
+    assert balance_row(receipt_id).balance == 5000
+
+
+def test_changed_receipt_ids():
+    receipt = ModelReceipt(id='new-receipt')
+    session = SimpleNamespace(
+        new=[receipt, ReceiptItem(receipt_id='item-receipt'), ReceiptDiscount(receipt_id='discount-receipt')],
+        dirty=[ReceiptTransaction(receipt_id='txn-receipt')],
+        deleted=[ReceiptItem(receipt_id=None)])
+    assert receipt_balances.changed_receipt_ids(session) == {
+        'new-receipt', 'item-receipt', 'discount-receipt', 'txn-receipt'}
@@ -0,0 +1,33 @@
+from sqlalchemy.dialects import postgresql
+
+from uber.config import c
+from uber.models import Attendee, Session, attendee_search_index
+
+
+def compile_postgres(statement):
+    sql = str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+    return sql.replace('%%', '%')
+
+
+def test_disabled_without_postgres(monkeypatch):
+    monkeypatch.setattr(c, 'ATTENDEE_SEARCH_INDEX', True)
+    with Session() as session:
+        assert not attendee_search_index.enabled(session)
+
+
+def test_documents_include_group_names():
+    sql = compile_postgres(attendee_search_index.documents())
+    assert 'lower(concat_ws(' in sql
+    assert '"group".name' in sql and 'promo_code_group.name' in sql
+    for field in Attendee.searchable_fields:
+        assert f'attendee.{field}' in sql
+
+
+def test_search_requires_every_term():
+    with Session() as session:
+        query = attendee_search_index.search(session.query(Attendee), 'Smith, Jo%n')
+        sql = compile_postgres(query.statement)
+    assert "attendee_search.document LIKE '%' || 'smith' || '%'" in sql
+    assert "attendee_search.document LIKE '%' || 'jo/%n' || '%' ESCAPE '/'" in sql
+    assert "<<% attendee_search.names" in sql
+    assert "strict_word_similarity('smith jo%n', attendee_search.names) DESC" in sql
@@ -0,0 +1,92 @@
+import queue
+from datetime import datetime, timedelta
+
+import pytest
+from pytz import UTC
+
+from uber.config import c
+from uber.models.tracking import Tracking, TrackingWriter
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        self.hashes.setdefault(key, {}).update(mapping or {field: value})
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    def hscan_iter(self, key, count=None):
+        return iter(list(self.hashes.get(key, {}).items()))
+
+
+@pytest.fixture
+def redis_store(monkeypatch):
+    store = FakeRedis()
+    monkeypatch.setattr(c, 'REDIS_STORE', store)
+    return store
+
+
+@pytest.fixture
+def written(monkeypatch):
+    batches = []
+    monkeypatch.setattr(TrackingWriter, 'insert_rows', classmethod(lambda cls, rows: batches.append(list(rows))))
+    return batches
+
+
+def make_row(**kwargs):
+    return Tracking._row(model='Attendee', fk_id='00000000-0000-0000-0000-000000000000', which='<Attendee>',
+                         action=c.UPDATED, **kwargs)
+
+
+def journal(redis_store):
+    return redis_store.hashes.get(c.REDIS_PREFIX + TrackingWriter.journal_key, {})
+
+
+def test_enqueue_writes_in_batches(monkeypatch, redis_store, written):
+    monkeypatch.setattr(c, 'TRACKING_BATCH_SIZE', 10)
+    monkeypatch.setattr(c, 'TRACKING_FLUSH_SECONDS', 0.1)
+    writer = TrackingWriter()
+    rows = [make_row() for _ in range(25)]
+    writer.enqueue(rows)
+    writer.queue.join()
+
+    assert [len(batch) for batch in written] == [10, 10, 5]
+    assert not journal(redis_store)
+
+
+def test_full_queue_writes_synchronously(monkeypatch, redis_store, written):
+    writer = TrackingWriter()
+    monkeypatch.setattr(writer, '_ensure_running', lambda: None)
+    writer.queue = queue.Queue(maxsize=1)
+
+    rows = [make_row() for _ in range(3)]
+    writer.enqueue(rows)
+
+    assert written == [rows[1:]]
+    assert list(journal(redis_store)) == [rows[0]['id']]
+
+
+def test_failed_journal_writes_synchronously(monkeypatch, written):
+    class BrokenRedis:
+        def hset(self, *args, **kwargs):
+            raise ConnectionError()
+
+    monkeypatch.setattr(c, 'REDIS_STORE', BrokenRedis())
+    rows = [make_row()]
+    TrackingWriter().enqueue(rows)
+    assert written == [rows]
+
+
+def test_replay_skips_recent_rows(redis_store, written):
+    writer = TrackingWriter()
+    old_row = make_row(when=datetime.now(UTC) - timedelta(hours=1))
+    new_row = make_row()
+    writer.journal([old_row, new_row])
+
+    assert writer.replay() == 1
+    assert [row['id'] for row in written[0]] == [old_row['id']]
+    assert list(journal(redis_store)) == [new_row['id']]
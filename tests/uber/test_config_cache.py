@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+
+from uber.config import c, ConfigCache
+from uber.models import Department, EventLocation, Attendee
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(c, 'CONFIG_CACHE_SECONDS', 300)
+    cache = ConfigCache()
+    cache.depends_on('DEPARTMENT_OPTS', 'department')
+    cache.depends_on('SCHEDULE_LOCATION_OPTS', 'event_location')
+    monkeypatch.setattr(cache, '_start_listener', lambda: None)
+    return cache
+
+
+def counting(value):
+    calls = []
+
+    def func(*args):
+        calls.append(args)
+        return list(value)
+    return func, calls
+
+
+def test_hits_and_misses(cache):
+    func, calls = counting([('1', 'Arcade')])
+    assert cache.get('DEPARTMENT_OPTS', func) == [('1', 'Arcade')]
+    assert cache.get('DEPARTMENT_OPTS', func) == [('1', 'Arcade')]
+    assert cache.get('DEPARTMENT_OPTS', func, True) == [('1', 'Arcade')]
+    assert len(calls) == 2
+    assert cache.snapshot()['properties'] == {'DEPARTMENT_OPTS': {'hits': 1, 'misses': 2}}
+
+
+def test_hits_are_copies(cache):
+    func, calls = counting([('1', 'Arcade')])
+    cache.get('DEPARTMENT_OPTS', func).append(('2', 'Oops'))
+    assert cache.get('DEPARTMENT_OPTS', func) == [('1', 'Arcade')]
+
+
+def test_invalidate_by_table(cache):
+    departments, department_calls = counting([])
+    locations, location_calls = counting([])
+    cache.get('DEPARTMENT_OPTS', departments)
+    cache.get('SCHEDULE_LOCATION_OPTS', locations)
+
+    cache.invalidate(['department'])
+    cache.get('DEPARTMENT_OPTS', departments)
+    cache.get('SCHEDULE_LOCATION_OPTS', locations)
+    assert len(department_calls) == 2
+    assert len(location_calls) == 1
+
+    cache.invalidate()
+    cache.get('SCHEDULE_LOCATION_OPTS', locations)
+    assert len(location_calls) == 2
+
+
+def test_stale_results_are_not_cached(cache):
+    def invalidated_while_querying():
+        cache.invalidate(['department'])
+        return ['stale']
+
+    assert cache.get('DEPARTMENT_OPTS', invalidated_while_querying) == ['stale']
+    assert cache.get('DEPARTMENT_OPTS', lambda: ['fresh']) == ['fresh']
+
+
+def test_disabled(cache, monkeypatch):
+    monkeypatch.setattr(c, 'CONFIG_CACHE_SECONDS', 0)
+    func, calls = counting([])
+    cache.get('DEPARTMENT_OPTS', func)
+    cache.get('DEPARTMENT_OPTS', func)
+    assert len(calls) == 2
+
+
+def test_changed_tables(cache):
+    session = SimpleNamespace(new=[Department()], dirty=[Attendee()], deleted=[EventLocation()])
+    assert cache.changed_tables(session) == {'department', 'event_location'}
@@ -1,8 +1,13 @@
+import re
 import uuid
+import zipfile
+from io import BytesIO
 
+import cherrypy
 import pytest
 
-from uber.decorators import id_required
+from uber.config import c
+from uber.decorators import csv_file, id_required, xlsx_file
 from uber.errors import HTTPRedirect
 from uber.models import Attendee, Group, Session
 
@@ -50,3 +55,40 @@ class TestIdRequired:
             assert _requires_model_id(**{
                 'session': session,
                 'id': model_id.hex})  # 'id' as a str instance
+
+
+class TestReportFiles:
+
+    @pytest.fixture(autouse=True)
+    def no_tracking(self, monkeypatch):
+        monkeypatch.setattr('uber.decorators.track_report', lambda params: None)
+        monkeypatch.setattr(c, 'EXPORT_SPOOL_MAX_BYTES', 100)
+        monkeypatch.setattr(c, 'EXPORT_CHUNK_BYTES', 64)
+        monkeypatch.setattr(c, 'EXPORT_WIDTH_SAMPLE_ROWS', 10)
+
+    def test_csv_streams_in_chunks(self):
+        @csv_file
+        def report(self, out, session):
+            out.writerow(['id', 'name'])
+            for i in range(100):
+                out.writerow([i, 'Attendee {}'.format(i)])
+
+        expected = b'id,name\r\n' + b''.join('{},Attendee {}\r\n'.format(i, i).encode() for i in range(100))
+        chunks = list(report(None, None))
+        assert all(len(chunk) <= 64 for chunk in chunks)
+        assert b''.join(chunks) == expected
+        assert cherrypy.response.stream
+        assert cherrypy.response.headers['Content-Length'] == str(len(expected))
+        assert report(None, None, set_headers=False) == expected
+
+    def test_xlsx_widths_from_sample(self):
+        @xlsx_file
+        def report(self, out, session):
+            out.writerows(['Name'], (['x' * (i + 1)] for i in range(100)))
+
+        output = report(None, None, set_headers=False)
+        with zipfile.ZipFile(BytesIO(output)) as xlsx:
+            sheet = xlsx.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        assert '<row r="101"' in sheet and 'x' * 100 in sheet
+        # The widest of the header and the first ten rows is ten characters, plus two for padding
+        assert re.search(r'<col min="1" max="1" width="12\.', sheet)
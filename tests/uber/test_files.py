@@ -0,0 +1,92 @@
+import os
+
+import cherrypy
+import pytest
+from cherrypy._cprequest import Request, Response
+from cherrypy.lib.httputil import HeaderMap, Host
+from PIL import Image
+
+from uber.config import c
+from uber.files import ImageDerivatives, ServerFileHandler, file_content_hash
+from uber.models import File
+
+
+@pytest.fixture
+def uploaded_files_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(c, 'UPLOADED_FILES_DIR', str(tmp_path))
+    monkeypatch.setattr(c, 'IMAGE_PREVIEW_SIZES', [240, 500, 1200])
+    monkeypatch.setattr(c, 'IMAGE_PREVIEW_FORMATS', ['avif', 'webp'])
+    return tmp_path
+
+
+@pytest.fixture
+def image_path(uploaded_files_dir):
+    path = os.path.join(uploaded_files_dir, 'image.png')
+    Image.new('RGBA', (800, 400), (255, 0, 0, 128)).save(path)
+    return path
+
+
+@pytest.fixture
+def request_headers():
+    request = Request(Host('127.0.0.1', 80), Host('127.0.0.1', 1234))
+    request.headers = HeaderMap()
+    cherrypy.serving.load(request, Response())
+    yield request.headers
+    cherrypy.serving.clear()
+
+
+@pytest.mark.parametrize('max_pixels,size', [(100, 240), ('240', 240), (241, 500), (500, 500), (5000, 1200)])
+def test_size_for(uploaded_files_dir, max_pixels, size):
+    assert ImageDerivatives.size_for(max_pixels) == size
+
+
+@pytest.mark.parametrize('accept,extension,image_format', [
+    ('image/avif,image/webp,*/*', 'jpg', 'avif'),
+    ('image/webp;q=0.9,*/*;q=0.8', 'jpg', 'webp'),
+    ('*/*', 'jpg', 'jpeg'),
+    ('', 'png', 'png'),
+])
+def test_format_for(uploaded_files_dir, accept, extension, image_format):
+    assert ImageDerivatives('abc', extension).format_for(accept) == image_format
+
+
+def test_generate(image_path):
+    derivatives = ImageDerivatives(file_content_hash(image_path), 'png')
+    path = derivatives.generate(image_path, 240, 'webp')
+    with Image.open(path) as image:
+        assert image.format == 'WEBP'
+        assert image.size == (240, 120)
+
+    mtime = os.path.getmtime(path)
+    assert derivatives.generate(image_path, 240, 'webp') == path
+    assert os.path.getmtime(path) == mtime
+    assert not [name for name in os.listdir(derivatives.directory) if name.endswith('.tmp')]
+
+
+def test_generate_all_and_delete_all(image_path):
+    derivatives = ImageDerivatives(file_content_hash(image_path), 'png')
+    derivatives.generate_all(image_path)
+    assert len(os.listdir(derivatives.directory)) == 9
+
+    derivatives.delete_all()
+    assert not os.listdir(derivatives.directory)
+
+
+def test_preview_conditional_get(image_path, request_headers):
+    content_hash = file_content_hash(image_path)
+    file_obj = File(filepath=image_path, filename='image.png', extension='png', content_type='image/png',
+                    fk_model='IndieGame', content_hash=content_hash)
+    handler = ServerFileHandler(None, file_obj)
+    request_headers['Accept'] = 'image/webp,*/*'
+
+    handler.preview(max_pixels=300, version=content_hash)
+    etag = cherrypy.response.headers['ETag']
+    assert etag == f'"{content_hash}-500-webp"'
+    assert 'immutable' in cherrypy.response.headers['Cache-Control']
+
+    cherrypy.serving.load(cherrypy.serving.request, Response())
+    request_headers['If-None-Match'] = etag
+    with pytest.raises(cherrypy.HTTPRedirect) as redirect:
+        handler.preview(max_pixels=300)
+    assert redirect.value.status == 304
+    assert cherrypy.response.headers['Cache-Control'] == 'private, no-cache'
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+from uber.models import Event, GuestGroup, IndieGame, guidebook_sync_state
+
+
+def test_data_hash_ignores_key_order():
+    assert guidebook_sync_state.data_hash({'a': 1, 'b': 'two'}) == guidebook_sync_state.data_hash({'b': 'two', 'a': 1})
+    assert guidebook_sync_state.data_hash({'a': 1}) != guidebook_sync_state.data_hash({'a': 2})
+
+
+def test_item_name():
+    assert guidebook_sync_state.item_name('IndieGame', {'guidebook_name': 'Cool Game'}) == 'Cool Game'
+    assert guidebook_sync_state.item_name('IndieGame', {}) == '???'
+    event_data = {'name': 'Panel', 'start_date': '01/17/2025', 'start_time': '10:00 AM',
+                  'end_date': '01/17/2025', 'end_time': '11:00 AM'}
+    assert guidebook_sync_state.item_name('schedule', event_data) == \
+        'Panel on Friday (1/17/2025) 10:00 AM to 11:00 AM'
+
+
+def test_model_label():
+    assert guidebook_sync_state.model_label('schedule') == 'Schedule Item'
+    assert guidebook_sync_state.model_label('GuestGroup_band') == 'Band'
+
+
+def test_stale_filters_use_sync_table():
+    never_synced = str(guidebook_sync_state.never_synced(Event).compile(dialect=postgresql.dialect()))
+    updated = str(guidebook_sync_state.updated_since_sync(Event).compile(dialect=postgresql.dialect()))
+    assert 'NOT (EXISTS' in never_synced and 'guidebook_sync.fk_id = event.id' in never_synced
+    assert 'guidebook_sync.synced < event.last_updated' in updated
+
+
+def test_record_deletes_only_synced_models():
+    statements = []
+    connection = SimpleNamespace(execute=statements.append)
+    session = SimpleNamespace(deleted=[IndieGame(), GuestGroup(), SimpleNamespace(id='not-synced')],
+                              connection=lambda: connection)
+
+    guidebook_sync_state.record_deletes(session)
+    assert len(statements) == 1
+    assert set(statements[0].compile().params['fk_id_1']) == {session.deleted[0].id, session.deleted[1].id}
+
+    statements.clear()
+    guidebook_sync_state.record_deletes(SimpleNamespace(deleted=[], connection=lambda: connection))
+    assert not statements
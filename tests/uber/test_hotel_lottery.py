@@ -0,0 +1,56 @@
+"""
+Tests for the aggregated hotel lottery solver in uber.hotel_lottery.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from uber.config import c
+from uber.hotel_lottery import build_entries, entry_profile, solve_lottery
+
+
+@pytest.fixture(autouse=True)
+def weights(monkeypatch):
+    monkeypatch.setitem(c.HOTEL_LOTTERY, 'weights', {'max_group_size': 4})
+
+
+def application(id, hotels='gaylord', room_types='king', parent=None):
+    return SimpleNamespace(id=id, entry_type=c.GROUP_ENTRY if parent else c.ROOM_ENTRY, room_opt_out=False,
+                           parent_application=parent, hotel_preference=hotels, room_type_preference=room_types)
+
+
+def room(hotel, room_type, quantity, capacity=4, min_capacity=1):
+    return {'id': hotel, 'room_type': room_type, 'quantity': quantity, 'capacity': capacity,
+            'min_capacity': min_capacity, 'name': f'{hotel} {room_type}'}
+
+
+def test_identical_entries_share_a_profile():
+    applications = [application(i) for i in range(10)]
+    entries = build_entries(applications)
+    assert len({entry_profile(entry) for entry in entries.values()}) == 1
+
+
+def test_solve_lottery_respects_quantity():
+    applications = [application(i) for i in range(10)]
+    assignments = solve_lottery(applications, [room('gaylord', 'king', 3)])
+    assert len(assignments) == 3
+    assert set(assignments.values()) == {('gaylord', 'king')}
+
+
+def test_solve_lottery_prefers_first_choices():
+    applications = [application(i, hotels='gaylord,marriott') for i in range(4)]
+    assignments = solve_lottery(applications, [room('gaylord', 'king', 2), room('marriott', 'king', 5)])
+    assert sorted(assignments.values()) == [('gaylord', 'king')] * 2 + [('marriott', 'king')] * 2
+
+
+def test_solve_lottery_keeps_groups_together():
+    leader = application('leader')
+    applications = [leader, application('roommate', parent=leader), application('single')]
+    assignments = solve_lottery(applications, [room('gaylord', 'king', 1, min_capacity=2)])
+    assert assignments == {'leader': ('gaylord', 'king'), 'roommate': ('gaylord', 'king')}
+
+
+def test_solve_lottery_matches_room_types():
+    applications = [application(1, room_types='queen'), application(2, room_types='king')]
+    assignments = solve_lottery(applications, [room('gaylord', 'king', 5)])
+    assert assignments == {2: ('gaylord', 'king')}
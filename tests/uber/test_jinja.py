@@ -166,3 +166,38 @@ class TestMultiPathEnvironment(object):
         abs_path = os.path.join(__here__, relative_path, name)
         pytest.raises(TemplateNotFound, environment.get_template, name)
         pytest.raises(TemplateNotFound, environment.get_template, abs_path)
+
+    def test_manifest_lists_overrides_first(self, environment):
+        assert [os.path.relpath(filename, __here__) for _, filename in environment.manifest['test_extends_1.html']] == [
+            'templates/templates_3/test_extends_1.html',
+            'templates/templates_2/test_extends_1.html',
+            'templates/templates_1/test_extends_1.html']
+        assert 'should_never_be_loaded.html' not in environment.manifest
+
+    def test_plugin_specific_template(self, loader):
+        environment = MultiPathEnvironment(loader=loader, base_template_paths=['templates/templates_2'])
+        template = environment.get_template('templates/templates_2/test_extends_1.html')
+        assert template.filename == os.path.join(__here__, 'templates/templates_2/test_extends_1.html')
+
+    def test_bytecode_cache(self, loader, tmp_path):
+        environment = MultiPathEnvironment(loader=loader, bytecode_cache=jinja2.FileSystemBytecodeCache(str(tmp_path)))
+        environment.get_template('test_standalone_3.html').render()
+        assert os.listdir(tmp_path)
+
+        def compile(*args, **kwargs):
+            raise AssertionError('Template was compiled again instead of being loaded from the bytecode cache')
+
+        fresh = MultiPathEnvironment(loader=loader, bytecode_cache=jinja2.FileSystemBytecodeCache(str(tmp_path)))
+        fresh.compile = compile
+        assert fresh.get_template('test_standalone_3.html').render().startswith('templates_3.test_standalone_3')
+
+    def test_render_layered(self, environment):
+        environment.globals.update({'greeting': 'Hello', 'name': 'World'})
+        template = environment.cached_from_string('{{ greeting }}, {{ name }}!{% set name = "x" %}')
+        assert environment.cached_from_string('{{ greeting }}, {{ name }}!{% set name = "x" %}') is template
+
+        data = {'name': 'Ann'}
+        assert environment.render_layered(template, data) == 'Hello, Ann!'
+        assert ''.join(environment.generate_layered(template, {})) == 'Hello, World!'
+        assert data == {'name': 'Ann'}
+        assert environment.globals['name'] == 'World'
@@ -0,0 +1,101 @@
+import pytest
+from sqlalchemy import select
+
+from uber.config import c
+from uber.models import Attendee, ModelReceipt, ReceiptTransaction, Session, payment_event
+from uber.payment_events import PaymentEventStore, StubEventSource
+from uber.payments import ReceiptManager
+
+
+@pytest.fixture
+def source():
+    return StubEventSource()
+
+
+@pytest.fixture
+def pending_payments():
+    with Session() as session:
+        for intent_id in ['pi_1', 'pi_2']:
+            attendee = Attendee(placeholder=True, first_name='Paying', last_name=intent_id, paid=c.NOT_PAID)
+            receipt = ModelReceipt(owner_id=attendee.id, owner_model='Attendee')
+            session.add_all([attendee, receipt, ReceiptTransaction(
+                receipt=receipt, intent_id=intent_id, amount=5000, processing_fee=175, desc='Badge')])
+        session.commit()
+
+
+@pytest.fixture
+def marked_paid(monkeypatch):
+    calls = []
+    mark_paid_from_ids = ReceiptManager.mark_paid_from_ids
+
+    def record_call(session, intent_id, charge_id):
+        calls.append((intent_id, charge_id))
+        return mark_paid_from_ids(session, intent_id, charge_id)
+
+    monkeypatch.setattr(ReceiptManager, 'mark_paid_from_ids', record_call)
+    return calls
+
+
+def event_results():
+    with Session() as session:
+        return dict(session.execute(select(payment_event.c.event_id, payment_event.c.result)).all())
+
+
+def charge_ids():
+    with Session() as session:
+        return dict(session.execute(select(ReceiptTransaction.intent_id, ReceiptTransaction.charge_id)).all())
+
+
+def test_stub_webhook_round_trip(source):
+    event = source.add_payment('pi_1')
+    assert source.from_webhook(source.webhook_payload(event), {}) == event
+    with pytest.raises(ValueError):
+        source.from_webhook('{"event_id": "evt"}', {})
+
+
+def test_same_event_is_reconciled_once(source, pending_payments, marked_paid):
+    event = source.add_payment('pi_1')
+    store = PaymentEventStore(source)
+    with Session() as session:
+        assert store.record(session, [event]) == ['evt_stub_0']
+        assert store.record(session, [event]) == []
+        session.commit()
+
+        assert store.reconcile(session) == ['pi_1']
+        assert store.reconcile(session) == []
+
+    assert marked_paid == [('pi_1', 'ch_stub_0')]
+    assert charge_ids()['pi_1'] == 'ch_stub_0'
+    assert event_results() == {'evt_stub_0': 'marked paid'}
+
+
+def test_poll_advances_cursor(source):
+    source.add_payment('pi_1')
+    source.add_payment('pi_2')
+    store = PaymentEventStore(source)
+    with Session() as session:
+        assert store.poll(session) == ['evt_stub_0', 'evt_stub_1']
+        assert store.cursor(session) == '2'
+
+        source.add_payment('pi_3')
+        assert store.poll(session) == ['evt_stub_2']
+        assert store.cursor(session) == '3'
+
+
+def test_reconcile_in_batches(source, pending_payments, marked_paid):
+    events = [source.add_payment('pi_1'), source.add_payment('pi_1'), source.add_payment('pi_2', status='canceled'),
+              source.add_payment('pi_3')]
+    store = PaymentEventStore(source, batch_size=2)
+    with Session() as session:
+        store.record(session, events)
+        session.commit()
+        assert store.reconcile(session) == ['pi_1']
+
+    assert marked_paid == [('pi_1', 'ch_stub_0')]
+    assert charge_ids() == {'pi_1': 'ch_stub_0', 'pi_2': ''}
+    assert event_results() == {
+        'evt_stub_0': 'marked paid',
+        'evt_stub_1': 'no pending transactions',
+        'evt_stub_2': 'status was canceled',
+        'evt_stub_3': 'no pending transactions',
+    }
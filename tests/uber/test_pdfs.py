@@ -0,0 +1,77 @@
+import fpdf
+import pytest
+
+from uber.models import ArtShowApplication, ArtShowPiece
+from uber.pdfs import BidSheetDocument, add_cached_font, fit_font_size, pdf_filename
+from uber.utils import get_static_file_path
+
+
+def legacy_fit(pdf, text, max_width, font_size=12):
+    pdf.set_font_size(size=font_size)
+    while pdf.get_string_width(text) > max_width:
+        font_size -= 0.2
+        pdf.set_font_size(size=font_size)
+    return font_size
+
+
+@pytest.fixture
+def pdf():
+    pdf = fpdf.FPDF(unit='pt', format='letter')
+    add_cached_font(pdf, 'NotoSans', get_static_file_path('NotoSans-Regular.ttf'))
+    pdf.set_font('NotoSans', size=12)
+    return pdf
+
+
+@pytest.mark.parametrize('text', [
+    '', 'Short', 'A Medium Length Artist Name', 'An Extraordinarily Long Title For A Very Small Painting Of A Cat',
+    'W' * 200, 'Ünïcödé Ärtist',
+])
+def test_fit_font_size_matches_legacy(pdf, text):
+    assert fit_font_size(pdf, text, 160) == pytest.approx(legacy_fit(pdf, text, 160))
+    assert pdf.get_string_width(text) <= 160
+
+
+def test_cached_font_matches_add_font(pdf):
+    path = get_static_file_path('NotoSans-Regular.ttf')
+    plain = fpdf.FPDF(unit='pt', format='letter')
+    plain.add_font('NotoSans', '', path)
+    cached, uncached = pdf.fonts['notosans'], plain.fonts['notosans']
+    assert cached.cw == uncached.cw
+    assert cached.glyph_ids == uncached.glyph_ids
+    assert cached.subset is not uncached.subset
+    assert cached.ttfont is not uncached.ttfont
+
+
+def test_cached_fonts_are_independent_per_document():
+    # fpdf2 subsets each font in place when it outputs a document, so the second
+    # document would be missing glyphs if it shared the first one's font
+    fonts = []
+    for text in ['AAA', 'xyz']:
+        pdf = fpdf.FPDF(unit='pt', format='letter')
+        add_cached_font(pdf, 'NotoSans', get_static_file_path('NotoSans-Regular.ttf'))
+        pdf.add_page()
+        pdf.set_font('NotoSans', size=12)
+        pdf.cell(200, 20, text=text)
+        assert bytes(pdf.output()).startswith(b'%PDF')
+        fonts.append(pdf.fonts['notosans'])
+
+    assert fonts[0].ttfont is not fonts[1].ttfont
+    assert {'x', 'y', 'z'} <= set(fonts[1].ttfont.getGlyphOrder())
+    assert 'x' not in fonts[0].ttfont.getGlyphOrder()
+
+
+def test_bid_sheet_document():
+    app = ArtShowApplication(artist_name='Ann Artist', artist_id='ANN')
+    pieces = [ArtShowPiece(app=app, piece_id=piece_id, name=f'Piece {piece_id}' * piece_id, media='Oil',
+                           opening_bid=10, for_sale=True) for piece_id in range(1, 7)]
+
+    document = BidSheetDocument()
+    document.add_pieces(pieces[:5])
+    document.add_pieces(pieces[5:])
+    assert document.pieces_added == 6
+    assert document.pdf.pages_count == 3
+    assert document.output().startswith(b'%PDF')
+
+
+def test_pdf_filename():
+    assert pdf_filename('Ünïcode Artist (Studio)').startswith('unicode-artist-studio_')
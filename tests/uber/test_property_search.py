@@ -0,0 +1,38 @@
+import operator
+
+from uber.models import Attendee
+from uber.property_search import matches, parse_property_search, relationships_needed
+
+
+def test_parse_and_or():
+    groups, error = parse_property_search('is_dept_head: True OR staffing: True AND age_now_or_at_con: <18')
+    assert not error
+    assert groups == [[('is_dept_head', operator.eq, True)],
+                      [('staffing', operator.eq, True), ('age_now_or_at_con', operator.lt, 18)]]
+
+
+def test_parse_operators_and_commas():
+    groups, error = parse_property_search('amount_extra: >=5, first_name: !=Jo OR badge_num: None')
+    assert not error
+    assert groups == [[('amount_extra', operator.ge, 5), ('first_name', operator.ne, 'Jo')],
+                      [('badge_num', operator.eq, None)]]
+
+
+def test_parse_errors():
+    assert parse_property_search('not_a_property: 1')[1] == 'ERROR: not_a_property is not a valid attribute'
+    assert parse_property_search('is_dept_head')[1].startswith('ERROR')
+    assert parse_property_search('  ')[1]
+
+
+def test_relationships_needed():
+    assert relationships_needed(['is_dept_head']) == ['dept_memberships']
+    assert set(relationships_needed(['is_group_leader'])) == {'group', 'promo_code_groups'}
+    assert relationships_needed(['first_name', 'age_now_or_at_con']) == []
+
+
+def test_matches():
+    attendee = Attendee(first_name='Test', amount_extra=10)
+    groups, error = parse_property_search('first_name: Nope OR amount_extra: >5')
+    assert matches(attendee, groups)
+    groups, error = parse_property_search('first_name: Test AND age_now_or_at_con: <18')
+    assert not matches(attendee, groups)
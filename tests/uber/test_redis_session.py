@@ -0,0 +1,112 @@
+"""
+Tests for uber.redis_session, using a dictionary in place of Redis.
+"""
+import pickle
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pytest
+
+from uber.redis_session import RedisSession, SessionSerializer, session_metrics
+
+
+class DictLock:
+    def __init__(self, cache, name):
+        self.cache, self.name = cache, name
+
+    def acquire(self):
+        return self.cache.lock_table.setdefault(self.name, threading.Lock()).acquire()
+
+    def release(self):
+        self.cache.lock_table[self.name].release()
+
+
+class DictCache(dict):
+    def __init__(self):
+        super().__init__()
+        self.lock_table = {}
+        self.writes = 0
+
+    def exists(self, key):
+        return key in self
+
+    def setex(self, key, ttl, value):
+        self.writes += 1
+        self[key] = value
+        return True
+
+    def expire(self, key, ttl):
+        return key in self
+
+    def delete(self, key):
+        self.pop(key, None)
+
+    def lock(self, name, **kwargs):
+        return DictLock(self, name)
+
+
+@pytest.fixture
+def session_class():
+    class TestSession(RedisSession):
+        prefix = 'test:'
+        cache = DictCache()
+        serializer = SessionSerializer(compress_min_bytes=100)
+    session_metrics.reset()
+    return TestSession
+
+
+def cart():
+    return {'unpaid_preregs': OrderedDict((str(i), {'first_name': 'Test', 'last_name': f'Attendee {i}',
+                                                    'badge_type': 51352218, 'amount_extra': 0})
+                                          for i in range(50))}
+
+
+@pytest.mark.parametrize('data', [{}, {'csrf_token': 'abc'}, cart()])
+def test_serializer_round_trip(data):
+    serializer = SessionSerializer(compress_min_bytes=100)
+    value = serializer.encode(serializer.dumps(data))
+    assert value[0] == SessionSerializer.version
+    assert serializer.decode(value)[0] == data
+
+
+def test_serializer_compresses_large_sessions():
+    serializer = SessionSerializer(compress_min_bytes=100)
+    pickled = serializer.dumps(cart())
+    value = serializer.encode(pickled)
+    assert value[1] & SessionSerializer.compressed
+    assert len(value) < len(pickled) / 3
+
+
+def test_serializer_reads_legacy_sessions():
+    expiration_time = datetime.now() + timedelta(minutes=60)
+    legacy = pickle.dumps(({'account_id': 'abc'}, expiration_time), pickle.HIGHEST_PROTOCOL)
+    assert SessionSerializer().decode(legacy) == ({'account_id': 'abc'}, None, expiration_time)
+
+
+def test_unchanged_session_is_not_rewritten(session_class):
+    session = session_class()
+    session['unpaid_preregs'] = cart()['unpaid_preregs']
+    session.save()
+    assert session_class.cache.writes == 1
+
+    session = session_class(session.id)
+    session.load()
+    session.save()
+    assert session_class.cache.writes == 1
+    assert session_metrics.snapshot()['saves_skipped'] == 1
+
+    session = session_class(session.id)
+    session['csrf_token'] = 'abc'
+    session.save()
+    assert session_class.cache.writes == 2
+    assert session_class(session.id).get('csrf_token') == 'abc'
+
+
+def test_local_locks_are_evicted(session_class):
+    session = session_class()
+    session.acquire_lock()
+    assert session.prefix + session.id in RedisSession.locks
+    session.release_lock()
+    assert session.prefix + session.id not in RedisSession.locks
+    assert session_metrics.snapshot()['lock_wait']['count'] == 1
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import uber.spin_rest_utils as spin_rest_utils
+from uber.config import c
+from uber.terminal_gateway import IN_FLIGHT_KEY, STALE_ERROR, TerminalGateway, terminal_key
+from tests.benchmarks.spin_simulator import SIMULATOR_SECRETS, SpinSimulator
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    async def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    async def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(field, None)
+
+
+@pytest.fixture
+def simulator(monkeypatch):
+    monkeypatch.setattr(spin_rest_utils, 'secrets', SIMULATOR_SECRETS)
+    monkeypatch.setattr(spin_rest_utils, 'strings', SIMULATOR_SECRETS['strings'])
+    monkeypatch.setattr(spin_rest_utils, 'templates', SIMULATOR_SECRETS['templates'])
+    monkeypatch.setattr(c, 'SPIN_TERMINAL_BUSY_TIMEOUT', 5)
+    simulator = SpinSimulator(card_seconds=(0.5, 0.5), settle_seconds=0.5).start()
+    yield simulator
+    simulator.stop()
+
+
+def test_settles_terminals_concurrently(simulator):
+    start = time.monotonic()
+    results = TerminalGateway(api_url=simulator.url).settle_all(['t1', 't2', 't3', 't4', 't5'])
+    assert time.monotonic() - start < 2
+    assert simulator.counts['settle'] == 5
+    assert all(spin_rest_utils.api_response_successful(response_json) and not error
+               for response_json, error in results)
+
+
+def test_retries_while_terminal_is_busy(simulator):
+    sale = threading.Thread(target=simulator.handle, args=('sale', {'TPN': 't1', 'ReferenceId': 'ref'}))
+    sale.start()
+    time.sleep(0.1)
+
+    gateway = TerminalGateway(api_url=simulator.url)
+    try:
+        response_json, error = asyncio.run(gateway.call('t1', 'status', {'ReferenceId': 'ref'}, 5))
+    finally:
+        gateway.close()
+    sale.join()
+    assert simulator.counts['busy'] == 1
+    assert not error and spin_rest_utils.api_response_successful(response_json)
+
+
+def test_records_sale_result(simulator):
+    results = []
+    gateway = TerminalGateway(api_url=simulator.url, redis_store=FakeRedis(),
+                              on_sale_result=lambda *args: results.append(args))
+    job = {'terminal_id': 't1', 'tracking_id': 'tracker', 'intent_id': 'ref', 'queued': time.time(),
+           'request': spin_rest_utils.sale_request_dict('10.00', 'Credit', 'ref', False)}
+    try:
+        asyncio.run(gateway.sale(job))
+    finally:
+        gateway.close()
+
+    [(recorded_job, response_json, error)] = results
+    assert recorded_job is job and not error
+    assert spin_rest_utils.approved_amount(response_json) == 10
+    assert gateway.redis.hashes[terminal_key('t1')]['gateway_status'] == 'recording'
+    assert not gateway.redis.hashes[IN_FLIGHT_KEY]
+
+
+def test_stale_sales_are_not_sent(simulator):
+    results = []
+    gateway = TerminalGateway(api_url=simulator.url, redis_store=FakeRedis(),
+                              on_sale_result=lambda *args: results.append(args))
+    job = {'terminal_id': 't1', 'tracking_id': 'tracker', 'queued': time.time() - c.SPIN_TERMINAL_SALE_TIMEOUT - 1}
+    try:
+        asyncio.run(gateway.sale(job))
+    finally:
+        gateway.close()
+
+    assert simulator.counts['sale'] == 0
+    assert results == [(job, {}, STALE_ERROR)]
+
+
+def test_sales_that_go_stale_while_queued_are_not_sent(simulator):
+    results = []
+    gateway = TerminalGateway(api_url=simulator.url, redis_store=FakeRedis(),
+                              on_sale_result=lambda *args: results.append(args))
+    jobs = [{'terminal_id': 't1', 'tracking_id': f'tracker{i}', 'intent_id': f'ref{i}',
+             'queued': time.time() - c.SPIN_TERMINAL_SALE_TIMEOUT + 0.25,
+             'request': spin_rest_utils.sale_request_dict('10.00', 'Credit', f'ref{i}', False)} for i in range(2)]
+
+    async def run_sales():
+        await asyncio.gather(*[gateway.sale(job) for job in jobs])
+
+    try:
+        asyncio.run(run_sales())
+    finally:
+        gateway.close()
+
+    assert simulator.counts['sale'] == 1
+    [(first, first_response, first_error), (second, second_response, second_error)] = results
+    assert first is jobs[0] and not first_error
+    assert second is jobs[1] and (second_response, second_error) == ({}, STALE_ERROR)
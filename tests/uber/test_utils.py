@@ -6,9 +6,9 @@ import stripe
 from mock import Mock
 
 from uber.config import c
-from uber.models import Attendee, Group
+from uber.models import Attendee, Group, Job
 from uber.utils import add_opt, convert_to_absolute_url, get_age_from_birthday, localized_now, \
-    remove_opt, normalize_newlines
+    remove_opt, normalize_newlines, ShiftIntervals
 from uber.payments import PreregCart
 
 
@@ -215,3 +215,49 @@ class TestAgeCalculations:
     def test_default_today(self, birthdate_delta, expected):
         birthdate = localized_now() - birthdate_delta
         assert expected == get_age_from_birthday(birthdate)
+
+
+class TestShiftIntervals:
+    @pytest.fixture
+    def intervals(self):
+        # Two back-to-back jobs from hour 0 to 3, then a gap, then hour 5 to 6
+        self.jobs = [Job(start_time=c.EPOCH + timedelta(hours=hour), duration=minutes)
+                     for hour, minutes in [(0, 60), (1, 120), (5, 60)]]
+        return ShiftIntervals(reversed(self.jobs))
+
+    def minute(self, hours):
+        return Job(start_time=c.EPOCH + timedelta(hours=hours), duration=0).start_minute
+
+    def test_total_minutes(self, intervals):
+        assert intervals.total_minutes == 240
+        assert ShiftIntervals().total_minutes == 0
+
+    def test_overlaps(self, intervals):
+        assert intervals.overlaps(self.minute(2), self.minute(4))
+        assert not intervals.overlaps(self.minute(3), self.minute(5))
+        assert not intervals.overlaps(self.minute(-1), self.minute(0))
+
+    def test_nested_intervals_overlap(self):
+        outer = Job(start_time=c.EPOCH, duration=600)
+        inner = Job(start_time=c.EPOCH + timedelta(hours=1), duration=60)
+        intervals = ShiftIntervals([outer, inner])
+        assert intervals.overlaps(outer.start_minute + 300, outer.start_minute + 301)
+        assert intervals.job_at(outer.start_minute + 300) is outer
+
+    def test_identical_intervals(self):
+        # Jobs can't be compared, so sorting two shifts with the same times must not fall through to them
+        first, second = Job(start_time=c.EPOCH, duration=60), Job(start_time=c.EPOCH, duration=60)
+        intervals = ShiftIntervals([first, second])
+        assert intervals.jobs == [first, second]
+        assert intervals.total_minutes == 60
+
+    def test_job_at(self, intervals):
+        assert intervals.job_at(self.minute(0)) is self.jobs[0]
+        assert intervals.job_at(self.minute(1)) is self.jobs[1]
+        assert intervals.job_at(self.minute(3)) is None
+
+    def test_blocks(self, intervals):
+        assert intervals.block_at(self.minute(2)) == (self.minute(0), self.minute(3))
+        assert intervals.block_at(self.minute(4)) is None
+        assert [jobs for start, end, jobs in intervals.blocks()] == [self.jobs[:2], self.jobs[2:]]
+        assert intervals.jobs_between(self.minute(2), self.minute(6)) == self.jobs[1:]
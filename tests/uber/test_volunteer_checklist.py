@@ -0,0 +1,54 @@
+import pytest
+
+import uber.volunteer_checklist as volunteer_checklist
+from uber.config import c
+from uber.models import Attendee, Session
+from uber.volunteer_checklist import VolunteerChecklistItem
+
+
+@pytest.fixture
+def checklist(monkeypatch):
+    monkeypatch.setattr(c, 'VOLUNTEER_CHECKLIST', [
+        'staffing/placeholder_item.html', 'staffing/shirt_item.html', 'plugin/custom_thing_item.html'])
+    monkeypatch.setattr(c, 'HOURS_FOR_SHIRT', 0)
+    monkeypatch.setattr(c, 'SHIRTS_PER_STAFFER', 1)
+    monkeypatch.setattr(volunteer_checklist, 'render', lambda template, data, encoding: (
+        '<img src="../static/images/checkbox_checked.png" />' if data['attendee'].first_name == 'Staffer' else ''))
+
+
+def test_names_from_templates():
+    assert VolunteerChecklistItem.name_from_template('staffing/emergency_procedures_item.html') \
+        == 'Emergency Procedures'
+    assert VolunteerChecklistItem.name_from_template('plugin/thing.html') == 'Thing'
+
+
+def test_statuses(checklist):
+    with Session() as session:
+        staffer = Attendee(first_name='Staffer', last_name='Checklist', staffing=True, badge_type=c.STAFF_BADGE)
+        volunteer = Attendee(first_name='Volunteer', last_name='Checklist', staffing=True, placeholder=True)
+        session.add_all([staffer, volunteer])
+        session.commit()
+
+        statuses = VolunteerChecklistItem.statuses(session, [staffer, volunteer])
+
+    assert list(statuses[staffer.id]) == ['Placeholder', 'Shirt', 'Custom Thing']
+    assert statuses[staffer.id]['Placeholder'] == {'is_applicable': True, 'is_complete': True}
+    assert statuses[volunteer.id]['Placeholder'] == {'is_applicable': True, 'is_complete': False}
+    assert statuses[staffer.id]['Shirt']['is_applicable']
+    assert statuses[volunteer.id]['Shirt'] == {'is_applicable': False, 'is_complete': False}
+    assert statuses[staffer.id]['Custom Thing'] == {'is_applicable': True, 'is_complete': True}
+    assert statuses[volunteer.id]['Custom Thing'] == {'is_applicable': False, 'is_complete': False}
+
+
+def test_default_items_run(monkeypatch):
+    sql_templates = [template for template, item in VolunteerChecklistItem._items.items() if item.in_sql]
+    monkeypatch.setattr(c, 'VOLUNTEER_CHECKLIST', sql_templates)
+    with Session() as session:
+        attendee = Attendee(first_name='Default', last_name='Checklist', staffing=True)
+        session.add(attendee)
+        session.commit()
+
+        statuses = VolunteerChecklistItem.statuses(session, [attendee])[attendee.id]
+
+    assert list(statuses) == [VolunteerChecklistItem._items[template].name for template in sql_templates]
+    assert all(status['is_applicable'] or not status['is_complete'] for status in statuses.values())
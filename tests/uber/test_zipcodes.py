@@ -0,0 +1,92 @@
+import sqlite3
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from uber.config import c
+from uber.zipcodes import ZipCodeIndex, haversine_miles, normalize_zip_code, zip_code_index
+
+try:
+    import uszipcode.db as uszipcode_db
+except Exception:
+    # uszipcode fails to import alongside sqlalchemy_mate 2.x
+    uszipcode_db = None
+
+ZIP_CODES = [
+    ('20745', 'Oxon Hill', 'MD', 38.80, -76.99),
+    ('20001', 'Washington', 'DC', 38.91, -77.02),
+    ('21201', 'Baltimore', 'MD', 39.29, -76.62),
+    ('02134', 'Allston', 'MA', 42.36, -71.13),
+    ('90001', 'Los Angeles', 'CA', 33.97, -118.25),
+]
+
+
+@pytest.fixture
+def index():
+    return ZipCodeIndex(*zip(*ZIP_CODES))
+
+
+@pytest.mark.parametrize('zip_code,expected', [
+    ('02134', '02134'), ('02134-1234', '02134'), (' 2134', '02134'), (20745, '20745'), ('', ''), ('N/A', ''),
+])
+def test_normalize_zip_code(zip_code, expected):
+    assert normalize_zip_code(zip_code) == expected
+
+
+def test_haversine_miles():
+    assert haversine_miles(40.7128, -74.0060, 34.0522, -118.2437) == pytest.approx(2445, rel=0.005)
+    assert np.allclose(haversine_miles(0, 0, np.array([0, 1]), np.array([0, 0])), [0, 69.09], atol=0.01)
+
+
+def test_lookup(index):
+    assert index.lookup('02134-0001').city == 'Allston'
+    assert index.lookup('99999') is None
+    assert set(index.lookup_many(['20745', '20745-1111', '99999', ''])) == {'20745'}
+    assert list(index.states_of(['21201', '99999'])) == ['MD', None]
+
+
+def test_within_matches_brute_force():
+    rng = np.random.default_rng(0)
+    lats, lngs = rng.uniform(25, 49, 5000), rng.uniform(-124, -67, 5000)
+    index = ZipCodeIndex([str(i).zfill(5) for i in range(5000)], [''] * 5000, [''] * 5000, lats, lngs)
+    for radius in [10, 100, 500]:
+        expected = np.flatnonzero(haversine_miles(38.8, -77.0, lats, lngs) <= radius)
+        results = index.within(38.8, -77.0, radius)
+        assert sorted(int(x.zipcode) for x, miles in results) == sorted(expected)
+        assert [miles for x, miles in results] == sorted(miles for x, miles in results)
+
+
+def test_within_sample(index):
+    assert [x.zipcode for x, miles in index.within(38.80, -76.99, 50)] == ['20745', '20001', '21201']
+
+
+def write_zip_code_db(path):
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE simple_zipcode (zipcode TEXT, major_city TEXT, state TEXT, lat REAL, lng REAL)')
+    connection.executemany('INSERT INTO simple_zipcode VALUES (?, ?, ?, ?, ?)',
+                           ZIP_CODES + [('00000', 'Nowhere', 'XX', None, None)])
+    connection.commit()
+    connection.close()
+
+
+def test_from_sqlite(tmp_path):
+    path = tmp_path / 'simple_db.sqlite'
+    write_zip_code_db(path)
+
+    index = ZipCodeIndex.from_sqlite(path)
+    assert len(index) == len(ZIP_CODES)
+    assert index.lookup('21201').state == 'MD'
+
+
+@pytest.mark.skipif(uszipcode_db is None, reason="uszipcode can't be imported here")
+def test_zip_code_index_downloads_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(c, 'MAPS_DIR', str(tmp_path))
+    zip_code_index.cache_clear()
+    try:
+        with patch.object(uszipcode_db, 'download_db_file', autospec=True,
+                          side_effect=lambda db_file_path, **kwargs: write_zip_code_db(db_file_path)) as download:
+            assert zip_code_index().lookup('02134').city == 'Allston'
+    finally:
+        zip_code_index.cache_clear()
+    download.assert_called_once()
@@ -17,6 +17,8 @@ elif [ "$1" = 'celery-beat' ]; then
     celery -A uber.tasks beat --loglevel=DEBUG --pidfile=
 elif [ "$1" = 'celery-worker' ]; then
     celery -A uber.tasks worker --loglevel=DEBUG
+elif [ "$1" = 'terminal-gateway' ]; then
+    python /app/sep.py run_terminal_gateway
 else
     exec "$@"
 fi
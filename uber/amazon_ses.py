@@ -6,8 +6,12 @@ import logging
 import base64
 import boto3
 import os
+import random
+import threading
+import time
 
 from botocore.exceptions import ClientError
+from collections import deque
 from datetime import datetime
 from xml.etree.ElementTree import XML
 
@@ -66,4 +70,101 @@ class AmazonSES:
         except Exception as e:
             return e
 
-email_sender = AmazonSES(c.AWS_REGION_EMAIL)
+class FakeSES:
+    """
+    Stands in for AmazonSES when load testing email dispatch: every call sleeps for
+    `latency` seconds to mimic an SES round trip, then fails `failure_rate` of the
+    time with SES's throttling error and otherwise records the message as sent.
+    """
+    def __init__(self, latency=0.1, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent_count = 0
+        self.failed_count = 0
+        self.recent = deque(maxlen=100)
+        self._lock = threading.Lock()
+
+    def sendEmail(self, source, toAddresses, message, replyToAddresses=None, returnPath=None, ccAddresses=None, bccAddresses=None):
+        time.sleep(self.latency)
+        with self._lock:
+            if random.random() < self.failure_rate:
+                self.failed_count += 1
+                return 'Maximum sending rate exceeded.'
+            self.sent_count += 1
+            self.recent.append({'source': source, 'to': toAddresses, 'subject': message['subject']})
+
+
+class TokenBucket:
+    """
+    Limits how many emails per second we hand to SES across every process and Celery
+    worker. The bucket lives in Redis so all senders share one quota; if Redis is
+    unavailable, each process falls back to its own bucket with the same rate.
+    """
+    # Refills the bucket based on Redis's clock, then either takes a token and returns 0
+    # or returns how many seconds the caller should wait before trying again.
+    _script = """
+        local now = redis.call('TIME')
+        now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+        local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+        local tokens = tonumber(state[1]) or burst
+        local timestamp = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - timestamp) * rate)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'timestamp', now)
+        redis.call('EXPIRE', KEYS[1], 60)
+        return tostring(wait)
+    """
+
+    def __init__(self, name, rate, burst=None, use_redis=True):
+        self.key = c.REDIS_PREFIX + name
+        self.rate = rate
+        self.burst = max(1, burst or rate)
+        self.use_redis = use_redis
+        self._tokens = self.burst
+        self._timestamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take_local(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._timestamp) * self.rate)
+            self._timestamp = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def _take(self):
+        if self.use_redis:
+            try:
+                return float(c.REDIS_STORE.eval(self._script, 1, self.key, self.rate, self.burst))
+            except Exception:
+                log.warning("Could not reach Redis for the email rate limit; limiting this process on its own.",
+                            exc_info=True)
+                self.use_redis = False
+        return self._take_local()
+
+    def acquire(self):
+        """
+        Blocks until we're allowed to send one more email.
+        """
+        if self.rate <= 0:
+            return
+        wait = self._take()
+        while wait:
+            time.sleep(wait)
+            wait = self._take()
+
+
+if c.FAKE_EMAIL_SENDER:
+    email_sender = FakeSES(c.FAKE_EMAIL_LATENCY, c.FAKE_EMAIL_FAILURE_RATE)
+else:
+    email_sender = AmazonSES(c.AWS_REGION_EMAIL)
+
+email_rate_limiter = TokenBucket('email_send_rate', c.EMAIL_SEND_RATE)
@@ -57,6 +57,13 @@ class AutomatedEmailFixture:
         GuestGroup: [joinedload(GuestGroup.group)]
     }
 
+    # SQL criteria that every model must meet to pass `gets_emails`, used to narrow down
+    # candidates in the database before we load any models and run fixture filters on them
+    prefilters = {
+        Attendee: [Attendee.badge_status.in_([c.NEW_STATUS, c.COMPLETED_STATUS])],
+        Group: [Group.status != c.IMPORTED],
+    }
+
     def __init__(
             self,
             model,
@@ -74,7 +81,13 @@ class AutomatedEmailFixture:
             replyto: list[str] = [],
             allow_at_the_con=False,
             allow_post_con=False,
-            extra_data=None):
+            extra_data=None,
+            query: list = []):
+        """
+        `query` is an optional list of SQL criteria on `model` which every model passing
+        `filter` also meets. It's only an optimization: when generating emails we skip
+        loading any model which doesn't match it, but `filter` is still checked on the rest.
+        """
 
         assert ident, 'AutomatedEmail ident may not be empty.'
 
@@ -109,6 +122,7 @@ class AutomatedEmailFixture:
         self.allow_at_the_con = allow_at_the_con
         self.allow_post_con = allow_post_con
         self.extra_data = extra_data or {}
+        self.query = list(query)
 
         when = when
 
@@ -142,6 +156,10 @@ class AutomatedEmailFixture:
     def body(self):
         return decorators.render_empty(os.path.join('emails', self.template))
 
+    @property
+    def sql_filters(self):
+        return AutomatedEmailFixture.prefilters.get(self.model, []) + self.query
+
 
 class AdminReportEmailFixture(AutomatedEmailFixture):
     def __init__(self, subject, template, ident, **kwargs):
@@ -694,6 +712,7 @@ class MarketplaceEmailFixture(AutomatedEmailFixture):
             dealer_filter,
             ident,
             sender=c.MARKETPLACE_EMAIL,
+            query=[Group.is_dealer == True] + kwargs.pop('query', []),  # noqa: E712
             **kwargs)
 
 
@@ -815,6 +834,7 @@ class StopsEmailFixture(AutomatedEmailFixture):
             staff_filter,
             ident,
             sender=c.STAFF_EMAIL,
+            query=[Attendee.staffing == True] + kwargs.pop('query', []),  # noqa: E712
             **kwargs)
 
 
@@ -922,7 +942,7 @@ if c.SHIFTS_CREATED:
         f'Reminder to sign up for {c.EVENT_NAME} ({c.EVENT_DATE}) shifts',
         'shifts/reminder.txt',
         "lambda a: c.AFTER_SHIFTS_CREATED and a.badge_type != c.CONTRACTOR_BADGE and \
-            days_after(14, max(a.registered_local, c.SHIFTS_CREATED))() and a.takes_shifts and not a.shift_minutes",
+            days_after(14, max(a.registered_local, c.SHIFTS_CREATED))() and a.takes_shifts and not a.shift_intervals",
         'volunteer_shift_signup_reminder',
         when=[before(c.PREREG_TAKEDOWN)])
 
@@ -930,7 +950,7 @@ if c.SHIFTS_CREATED:
         f'Last chance to sign up for {c.EVENT_NAME} ({c.EVENT_DATE}) shifts',
         'shifts/reminder.txt',
         "lambda a: c.AFTER_SHIFTS_CREATED and a.badge_type != c.CONTRACTOR_BADGE and \
-            (not c.PREREG_TAKEDOWN or c.BEFORE_PREREG_TAKEDOWN) and a.takes_shifts and not a.shift_minutes",
+            (not c.PREREG_TAKEDOWN or c.BEFORE_PREREG_TAKEDOWN) and a.takes_shifts and not a.shift_intervals",
         'volunteer_shift_signup_reminder_last_chance',
         when=[days_before(10, c.EPOCH)])
 
@@ -1018,7 +1038,8 @@ class DeptChecklistEmailFixture(AutomatedEmailFixture):
             when=when,
             sender=c.STAFF_EMAIL,
             extra_data={'conf': conf},
-            allow_post_con=conf.email_post_con)
+            allow_post_con=conf.email_post_con,
+            query=[Attendee.admin_account.has()])
 
 if c.DEPT_CHECKLIST_START:
     for _conf in DeptChecklistConf.instances.values():
@@ -1046,6 +1067,7 @@ class HotelLotteryEmailFixture(AutomatedEmailFixture):
             lottery_filter,
             ident,
             sender=c.HOTEL_LOTTERY_EMAIL,
+            query=[LotteryApplication.attendee_id != None] + kwargs.pop('query', []),  # noqa: E711
             **kwargs)
 
 
@@ -1378,6 +1400,7 @@ class RetroGuestEmailFixture(AutomatedEmailFixture):
             guest_filter,
             ident,
             sender=c.INDIE_RETRO_EMAIL,
+            query=[GuestGroup.group_type == c.MIVS] + kwargs.pop('query', []),
             **kwargs)
 
 
@@ -1428,6 +1451,7 @@ class IAGuestEmailFixture(AutomatedEmailFixture):
             guest_filter,
             ident,
             sender=c.INDIE_ARCADE_EMAIL,
+            query=[GuestGroup.group_type == c.MIVS] + kwargs.pop('query', []),
             **kwargs)
 
 
@@ -1505,6 +1529,7 @@ class MIVSGuestEmailFixture(AutomatedEmailFixture):
             guest_filter,
             ident,
             sender=c.MIVS_EMAIL,
+            query=[GuestGroup.group_type == c.MIVS] + kwargs.pop('query', []),
             **kwargs)
 
 
@@ -1926,6 +1951,7 @@ class ArenaEmailFixture(AutomatedEmailFixture):
             arena_filter,
             ident,
             sender=c.ARENA_EMAIL,
+            query=[GuestGroup.group_type == c.ARENA] + kwargs.pop('query', []),
             **kwargs)
 
 
@@ -1946,6 +1972,7 @@ class BandEmailFixture(AutomatedEmailFixture):
             band_filter,
             ident,
             sender=c.BAND_EMAIL,
+            query=[GuestGroup.group_type.in_([c.BAND, c.SIDE_STAGE])] + kwargs.pop('query', []),
             **kwargs)
 
 
@@ -1966,6 +1993,7 @@ class GuestEmailFixture(AutomatedEmailFixture):
             guest_filter,
             ident,
             sender=c.GUEST_EMAIL,
+            query=[GuestGroup.group_type == c.GUEST] + kwargs.pop('query', []),
             **kwargs)
 
 
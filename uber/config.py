@@ -1,5 +1,6 @@
 import ast
 import contextlib
+import copy
 import csv
 import hashlib
 import inspect
@@ -10,6 +11,7 @@ import pytz
 import re
 import redis
 import six
+import socket
 import yaml
 import json
 import uuid
@@ -20,6 +22,7 @@ import validate
 import configobj
 import pathlib
 from tempfile import NamedTemporaryFile
+from time import monotonic, sleep
 from collections import defaultdict, OrderedDict
 from datetime import date, datetime, time, timedelta
 from hashlib import sha512
@@ -143,6 +146,200 @@ def cached_property(func):
         return getattr(self, cache_attr)
     return caching
 
+class ConfigCache:
+    """
+    A process-wide cache for Config properties that query the database but give the same
+    answer no matter who's asking, like c.DEPARTMENT_OPTS or c.ACCESS_GROUP_OPTS. Unlike
+    request_cached_property, values outlive the request and are shared by every thread.
+
+    Each cached property names the tables it reads. After a transaction commits, we publish
+    the names of any of those tables it changed to a Redis channel; every web and Celery
+    process subscribes to that channel and drops the values that depend on them. Values also
+    expire after c.CONFIG_CACHE_SECONDS, which covers changes made outside of our sessions
+    (e.g. bulk updates or raw SQL) and anything missed while Redis was unreachable.
+
+    Hits and misses are counted per property. Every process writes its counts to a Redis hash
+    every `stats_seconds`, so `all_stats` can show how well the cache is doing everywhere.
+    """
+    channel = 'config_cache'
+    stats_key = 'config_cache_stats'
+    stats_seconds = 60
+    retry_seconds = 5
+
+    def __init__(self):
+        self.dependencies = defaultdict(set)
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._generations = defaultdict(int)
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.invalidations = 0
+        self._listener = None
+        self.subscribed = False
+
+    @property
+    def watched_tables(self):
+        return set(self.dependencies)
+
+    def depends_on(self, name, *tables):
+        for table in tables:
+            self.dependencies[table].add(name)
+
+    def generation(self, name):
+        """How many times values for this name have been invalidated in this process."""
+        with self._lock:
+            return self._generations[name]
+
+    def get(self, name, func, *args):
+        if not c.CONFIG_CACHE_SECONDS:
+            return func(*args)
+
+        self._start_listener()
+        key = (name, args)
+        now = monotonic()
+        with self._lock:
+            expires, value = self._values.get(key, (0, None))
+            if expires > now:
+                self.hits[name] += 1
+                return copy.copy(value)
+            self.misses[name] += 1
+            generation = self._generations[name]
+
+        value = func(*args)
+        with self._lock:
+            # If this was invalidated while we were querying, what we have might already be stale
+            if self._generations[name] == generation:
+                self._values[key] = (now + c.CONFIG_CACHE_SECONDS, value)
+        return copy.copy(value)
+
+    def invalidate(self, tables=None):
+        """Drops cached values that depend on any of the given tables, or all of them."""
+        names = set(self._generations) if tables is None else \
+            set(chain.from_iterable(self.dependencies.get(table, []) for table in tables))
+        if not names:
+            return
+
+        with self._lock:
+            self.invalidations += 1
+            for name in names:
+                self._generations[name] += 1
+            for key in [key for key in self._values if key[0] in names]:
+                del self._values[key]
+
+    def changed_tables(self, session):
+        """Called after a flush; returns the names of watched tables that the flush wrote to."""
+        watched = self.watched_tables
+        return {instance.__table__.name for instance in chain(session.new, session.dirty, session.deleted)
+                if instance.__table__.name in watched}
+
+    def publish(self, tables):
+        """Called after a commit; tells every process (including this one) that these tables changed."""
+        if not tables:
+            return
+
+        self.invalidate(tables)
+        try:
+            c.REDIS_STORE.publish(c.REDIS_PREFIX + self.channel, json.dumps(sorted(tables)))
+        except Exception:
+            log.warning("Could not publish config cache invalidation; other processes will catch up "
+                        "after {} seconds.".format(c.CONFIG_CACHE_SECONDS), exc_info=True)
+
+    def _start_listener(self):
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name='config_cache', daemon=True)
+                    self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = c.REDIS_STORE.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(c.REDIS_PREFIX + self.channel)
+                # We may have missed invalidations before we subscribed or while we were disconnected
+                self.invalidate()
+                self.subscribed = True
+                stats_due = monotonic()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message['type'] == 'message':
+                        self.invalidate(json.loads(message['data']))
+                    if monotonic() >= stats_due:
+                        self.report_stats()
+                        stats_due = monotonic() + self.stats_seconds
+            except Exception:
+                self.subscribed = False
+                log.warning("Lost the config cache invalidation channel; retrying in {} seconds.".format(
+                    self.retry_seconds), exc_info=True)
+                sleep(self.retry_seconds)
+
+    @property
+    def process_id(self):
+        return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+    def snapshot(self):
+        with self._lock:
+            names = sorted(set(self.hits) | set(self.misses))
+            return {
+                'subscribed': self.subscribed,
+                'invalidations': self.invalidations,
+                'cached': len(self._values),
+                'properties': {name: {'hits': self.hits[name], 'misses': self.misses[name]} for name in names},
+            }
+
+    def report_stats(self):
+        c.REDIS_STORE.hset(c.REDIS_PREFIX + self.stats_key, self.process_id,
+                           json.dumps(dict(self.snapshot(), reported=datetime.now(pytz.UTC).isoformat())))
+
+    def all_stats(self):
+        """
+        Returns the most recent snapshot from each running process, keyed by hostname and PID.
+        Processes that haven't reported in a while have probably exited, so we clear them out.
+        """
+        key = c.REDIS_PREFIX + self.stats_key
+        cutoff = datetime.now(pytz.UTC) - timedelta(seconds=self.stats_seconds * 5)
+        stats, exited = {}, []
+        for process_id, snapshot in sorted(c.REDIS_STORE.hgetall(key).items()):
+            snapshot = json.loads(snapshot)
+            if datetime.fromisoformat(snapshot['reported']) < cutoff:
+                exited.append(process_id)
+            else:
+                stats[process_id] = snapshot
+        if exited:
+            c.REDIS_STORE.hdel(key, *exited)
+        return stats
+
+
+config_cache = ConfigCache()
+
+
+def process_cached(*tables):
+    """
+    Caches a method's return value for each set of arguments it's called with, in this
+    process, until one of the given tables changes. See ConfigCache.
+    """
+    def decorator(func):
+        name = func.__name__
+        config_cache.depends_on(name, *tables)
+
+        @functools.wraps(func)
+        def with_caching(self, *args):
+            return config_cache.get(name, functools.partial(func, self), *args)
+        return with_caching
+    return decorator
+
+
+def process_cached_property(*tables):
+    """Like request_cached_property, but cached for the whole process; see ConfigCache."""
+    def decorator(func):
+        return property(process_cached(*tables)(func))
+    return decorator
+
+
 def create_namespace_uuid(s):
     return uuid.UUID(hashlib.sha1(s.encode('utf-8')).hexdigest()[:32])
 
@@ -354,6 +551,12 @@ class Config(_Overridable):
         badges, since those have by definition not been promised to anyone.
         """
         from uber.models import Session, Attendee
+        from uber.models.counters import badge_counters
+
+        counts = badge_counters.get(f'badge_type:{badge_type}')
+        if counts is not None:
+            return counts[0]
+
         count = 0
         with Session() as session:
             count = session.query(Attendee).filter(
@@ -546,6 +749,7 @@ class Config(_Overridable):
         This is used for bucket-based pricing and to estimate year-over-year sales.
         """
         from uber.models import Session, Attendee, Group, PromoCode, PromoCodeGroup
+        from uber.models.counters import badge_counters
         if self.BADGES_SOLD_ESTIMATE_ENABLED:
             with Session() as session:
                 attendee_count = int(session.execute(
@@ -555,6 +759,10 @@ class Config(_Overridable):
                 staff_count = self.get_badge_count_by_type(c.STAFF_BADGE)
                 return max(0, attendee_count - staff_count)
         else:
+            counts = badge_counters.get('sold:individual', 'sold:group', 'sold:promo_code')
+            if counts is not None:
+                return sum(counts)
+
             with Session() as session:
                 attendees = session.query(Attendee)
                 individuals = attendees.filter(Attendee.has_badge == True, or_(  # noqa: E712
@@ -1125,6 +1333,17 @@ class Config(_Overridable):
         return c.OIDC_ENABLED and not c.SSO_EMAIL_DOMAINS
     
     def get_dept_opts(self, admin_access=False, public=False, has_email=False, include_desc=False):
+        opts = self._query_dept_opts(public, has_email, include_desc)
+        if admin_access and opts and opts[0][0] != -1 and not self.has_section_or_page_access(full=True):
+            from uber.models import Session
+            with Session() as session:
+                admin_memberships = {str(d.id) for d in
+                                     session.current_admin_account().attendee.dept_memberships_with_inherent_role}
+            opts = [opt for opt in opts if str(opt[0]) in admin_memberships]
+        return opts
+
+    @process_cached('department')
+    def _query_dept_opts(self, public, has_email, include_desc):
         from uber.models import Session, Department
         with Session() as session:
             if include_desc:
@@ -1140,10 +1359,6 @@ class Config(_Overridable):
             if public:
                 query = query.filter(Department.solicits_volunteers == True)
 
-            if admin_access and not self.has_section_or_page_access(full=True):
-                admin_memberships = [str(d.id) for d in session.current_admin_account().attendee.dept_memberships_with_inherent_role]
-                query = query.filter(Department.id.in_(admin_memberships))
-
             return [tuple(info) for info in query.order_by(Department.name)]
 
     @request_cached_property
@@ -1187,6 +1402,12 @@ class Config(_Overridable):
 
     def get_kickin_count(self, kickin_level):
         from uber.models import Session, Attendee
+        from uber.models.counters import badge_counters
+
+        counts = badge_counters.get(f'kickin:{kickin_level}')
+        if counts is not None:
+            return counts[0]
+
         with Session() as session:
             count = session.query(Attendee).filter_by(amount_extra=kickin_level).filter(
                     ~Attendee.badge_status.in_([c.INVALID_GROUP_STATUS, c.INVALID_STATUS,
@@ -1195,6 +1416,12 @@ class Config(_Overridable):
 
     def get_shirt_count(self, shirt_enum_key):
         from uber.models import Session, Attendee
+        from uber.models.counters import badge_counters
+
+        counts = badge_counters.get(f'shirt:{shirt_enum_key}')
+        if counts is not None:
+            return counts[0]
+
         with Session() as session:
             shirt_count = 0
 
@@ -1254,7 +1481,7 @@ class Config(_Overridable):
     def ACCESS_GROUPS(self):
         return dict(self.ACCESS_GROUP_OPTS)
 
-    @request_cached_property
+    @process_cached_property('access_group')
     @dynamic
     def ACCESS_GROUP_OPTS(self):
         from uber.models import Session, AccessGroup
@@ -1446,7 +1673,7 @@ class Config(_Overridable):
     # panels
     # =========================
 
-    @request_cached_property
+    @process_cached_property('admin_account', 'access_group')
     @dynamic
     def PANEL_POC_OPTS(self):
         from uber.models import Session, AdminAccount
@@ -1457,7 +1684,7 @@ class Config(_Overridable):
                 if 'panels_admin' in a.read_or_write_access_set
             ], key=lambda tup: tup[1], reverse=False)
         
-    @request_cached_property
+    @process_cached_property('department')
     @dynamic
     def get_panels_id(self):
         from uber.models import Session, Department
@@ -1470,7 +1697,7 @@ class Config(_Overridable):
             else:
                 return c.PANELS
 
-    @request_cached_property
+    @process_cached_property('event_location')
     @dynamic
     def SCHEDULE_LOCATION_OPTS(self):
         from uber.models import Session, EventLocation
@@ -1508,7 +1735,7 @@ class Config(_Overridable):
 
         return make_room_trie(c.SCHEDULE_LOCATION_OPTS)
 
-    @request_cached_property
+    @process_cached_property('department')
     @dynamic
     def EVENT_DEPTS_OPTS(self):
         from uber.models import Session, Department
@@ -1530,7 +1757,7 @@ class Config(_Overridable):
     def EVENT_DEPTS(self):
         return {key: name for key, name in self.EVENT_DEPTS_OPTS}
 
-    @request_cached_property
+    @process_cached_property('department')
     @dynamic
     def PANELS_DEPT_OPTS_WITH_DESC(self):
         from uber.models import Session, Department
@@ -11,12 +11,13 @@ import threading
 import traceback
 import uuid
 import zipfile
-from collections import defaultdict, OrderedDict
+from collections import ChainMap, defaultdict, OrderedDict
 from datetime import datetime
 from functools import wraps
-from io import StringIO, BytesIO
+from io import TextIOWrapper
 from itertools import count
 from threading import RLock
+from types import MappingProxyType
 import tempfile
 
 import cherrypy
@@ -484,6 +485,30 @@ def _set_response_filename(base_filename):
         cherrypy.response.headers['Content-Disposition'] = 'attachment; filename=' + base_filename
 
 
+def _read_and_close(file):
+    with file:
+        file.seek(0)
+        return file.read()
+
+
+def _stream_file(file):
+    """
+    Streams a finished export back to the client in chunks and closes (and thereby deletes)
+    the temporary file it was written to. Reports are written to temporary files that spill
+    to disk, rather than to memory, so large exports don't balloon our workers' memory.
+    """
+    file.seek(0, os.SEEK_END)
+    cherrypy.response.headers['Content-Length'] = str(file.tell())
+    cherrypy.response.stream = True
+    file.seek(0)
+
+    def chunks():
+        with file:
+            for chunk in iter(lambda: file.read(c.EXPORT_CHUNK_BYTES), b''):
+                yield chunk
+    return chunks()
+
+
 def xlsx_file(func):
     signature = inspect.signature(func)
     if len(signature.parameters) == 3:
@@ -494,13 +519,12 @@ def xlsx_file(func):
 
     @wraps(func)
     def xlsx_out(self, session, set_headers=True, **kwargs):
-        rawoutput = BytesIO()
+        output = tempfile.TemporaryFile()
 
-        # Even though the final file will be in memory the module uses temp
-        # files during assembly for efficiency. To avoid this on servers that
-        # don't allow temp files, for example the Google APP Engine, set the
-        # 'in_memory' constructor option to True:
-        with xlsxwriter.Workbook(rawoutput, {'in_memory': False}) as workbook:
+        # In constant_memory mode, xlsxwriter flushes each row to a temp file as soon as we move on
+        # to the next one, so the worksheet is never held in memory. This means rows have to be
+        # written in order, which ExcelWorksheetStreamWriter always does.
+        with xlsxwriter.Workbook(output, {'in_memory': False, 'constant_memory': True}) as workbook:
             worksheet = workbook.add_worksheet()
 
             writer = ExcelWorksheetStreamWriter(workbook, worksheet)
@@ -509,16 +533,15 @@ def xlsx_file(func):
             # in the future, could pass in the workbook too
             func(self, writer, session, **kwargs)
 
-        output = rawoutput.getvalue()
+        track_report(kwargs)
+        if not set_headers:
+            return _read_and_close(output)
 
         # set headers last in case there were errors, so end user still see error page
-        if set_headers:
-            cherrypy.response.headers['Content-Type'] = \
-                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            _set_response_filename(func.__name__ + datetime.now().strftime('%Y%m%d_%H%M') + '.xlsx')
-
-        track_report(kwargs)
-        return output
+        cherrypy.response.headers['Content-Type'] = \
+            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        _set_response_filename(func.__name__ + datetime.now().strftime('%Y%m%d_%H%M') + '.xlsx')
+        return _stream_file(output)
     return xlsx_out
 
 
@@ -532,17 +555,19 @@ def csv_file(func):
 
     @wraps(func)
     def csvout(self, session, set_headers=True, **kwargs):
-        writer = StringIO()
+        output = tempfile.SpooledTemporaryFile(max_size=c.EXPORT_SPOOL_MAX_BYTES)
+        writer = TextIOWrapper(output, encoding='utf-8', newline='')
         func(self, csv.writer(writer), session, **kwargs)
-        output = writer.getvalue().encode('utf-8')
-
-        # set headers last in case there were errors, so end user still see error page
-        if set_headers:
-            cherrypy.response.headers['Content-Type'] = 'application/csv'
-            _set_response_filename(func.__name__ + datetime.now().strftime('%Y%m%d_%H%M') + '.csv')
+        writer.detach()
 
         track_report(kwargs)
-        return output
+        if not set_headers:
+            return _read_and_close(output)
+
+        # set headers last in case there were errors, so end user still see error page
+        cherrypy.response.headers['Content-Type'] = 'application/csv'
+        _set_response_filename(func.__name__ + datetime.now().strftime('%Y%m%d_%H%M') + '.csv')
+        return _stream_file(output)
     return csvout
 
 
@@ -730,11 +755,20 @@ def sessionized(func):
     return with_session
 
 
+def global_render_context():
+    """
+    The data every template gets: c and every model class. It's built the first time we
+    render anything, by which point every plugin has defined its models, and registered
+    as globals on the Jinja environment, so each render only has to supply its own data.
+    """
+    if JinjaEnv.global_context is None:
+        JinjaEnv.register_global_context(MappingProxyType(
+            {'c': c, **{m.__name__: m for m in uber.models.Session.all_models()}}))
+    return JinjaEnv.global_context
+
+
 def renderable_data(data=None):
-    data = data or {}
-    data['c'] = c
-    data.update({m.__name__: m for m in uber.models.Session.all_models()})
-    return data
+    return ChainMap(data or {}, global_render_context())
 
 
 # render using the first template that actually exists in template_name_list
@@ -743,7 +777,7 @@ def render_stream(template_name_list, data=None, encoding='utf-8'):
     data = renderable_data(data)
     env = JinjaEnv.env()
     template = env.get_or_select_template(template_name_list)
-    rendered = template.generate(data)
+    rendered = env.generate_layered(template, data)
     if encoding:
         for chunk in rendered:
             yield chunk.encode(encoding)
@@ -755,7 +789,7 @@ def render(template_name_list, data=None, encoding='utf-8'):
     data = renderable_data(data)
     env = JinjaEnv.env()
     template = env.get_or_select_template(template_name_list)
-    rendered = template.render(data)
+    rendered = env.render_layered(template, data)
     if encoding:
         return rendered.encode(encoding)
     return rendered
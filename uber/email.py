@@ -3,18 +3,23 @@ import traceback
 import json
 import logging
 import pytz
+import billiard
 
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import partial
+from itertools import islice
+from time import time
+from sqlalchemy import insert, select, update, or_
 from sqlalchemy.orm import joinedload
-from sqlalchemy import update, or_
 
-from uber.amazon_ses import email_sender
+from uber.amazon_ses import email_sender, email_rate_limiter
 from uber.automated_emails import AutomatedEmailFixture
-from uber.config import c
+from uber.config import c, config_cache
 from uber.custom_tags import email_only, readable_join
 from uber.decorators import reconcile_fixtures
-from uber.models import AutomatedEmail, Email
+from uber.models import AutomatedEmail, Email, Session
 from uber.utils import listify, localized_now
 
 log = logging.getLogger(__name__)
@@ -36,51 +41,52 @@ class EmailHandler:
         Creates an email with properties based on any passed arguments, falling back to the email's fixture if there is one.
         We don't generate the subject or cc, bcc, or replyto based on the model as that's done at send time.
         """
-        email_obj = Email(status=c.QUEUED)
+        email_obj = Email(status=c.QUEUED, **self.email_values(fixture_obj, to_model, **kwargs))
+        email_obj.automated_email = fixture_obj
+        return email_obj
 
-        for attr in ['to', 'cc', 'bcc', 'replyto', 'sender', 'subject', 'body', 'shared_ident']:
-            setattr(email_obj, attr, kwargs.get(attr, getattr(email_obj, attr, '')))
+    @staticmethod
+    def email_values(fixture_obj=None, to_model=None, **kwargs):
+        """
+        Works out the column values for a new email (see `create_email_obj`), including rendering its body.
+        This doesn't create an Email, so it's also used to build rows for bulk inserts.
+        """
+        values = {attr: kwargs.get(attr, '') for attr in ['to', 'cc', 'bcc', 'replyto', 'sender', 'subject',
+                                                           'body', 'shared_ident']}
 
         render_data = kwargs.get('data', {})
         for key, val in render_data.items():
-            try:
-                json.dumps(val)
-            except TypeError:
+            if hasattr(val, 'to_dict'):
                 render_data[key] = val.to_dict()
 
-        email_obj.render_data = render_data or email_obj.render_data
-        email_obj.fk_id = to_model.id if to_model else None
-        email_obj.model = to_model.__class__.__name__ if to_model else ''
+        values['render_data'] = render_data or {}
+        values['fk_id'] = to_model.id if to_model else None
+        values['model'] = to_model.__class__.__name__ if to_model else ''
+        values['ident'] = kwargs.get('ident', '')
 
         if fixture_obj:
-            email_obj.cc = email_obj.cc or fixture_obj.cc
-            email_obj.bcc = email_obj.bcc or fixture_obj.bcc
-            email_obj.replyto = email_obj.replyto or fixture_obj.replyto
-            email_obj.sender = email_obj.sender or fixture_obj.sender
-            email_obj.subject = email_obj.subject or fixture_obj.subject
-            email_obj.shared_ident = email_obj.shared_ident or fixture_obj.shared_ident
-
-            if not email_obj.body:
+            for attr in ['cc', 'bcc', 'replyto', 'sender', 'subject', 'shared_ident']:
+                values[attr] = values[attr] or getattr(fixture_obj, attr)
+
+            if not values['body']:
                 try:
-                    render_data = fixture_obj.renderable_data(to_model, email_obj.render_data)
-                    email_obj.body = fixture_obj.render_template(fixture_obj.body, render_data)
+                    render_data = fixture_obj.renderable_data(to_model, values['render_data'])
+                    values['body'] = fixture_obj.render_template(fixture_obj.body, render_data)
                 except Exception as e:
-                    log.error(f"Error generating body for email {email_obj.__repr__()}: {e}")
+                    log.error(f"Error generating body for email {values['ident']} to {values['model']} "
+                              f"{values['fk_id']}: {e}")
                     traceback.print_exc()
         
         if to_model:
             # We want queued emails to have a 'to' address so admins can see + search by it
             # The 'to' address will always be re-generated on send and cannot be overridden with a custom value
-            email_obj.to = to_model.email_to_address
-
-        email_obj.sender = email_obj.sender or c.CONTACT_EMAIL
-        email_obj.ident = kwargs.get('ident', '')
-        email_obj.automated_email = fixture_obj
+            values['to'] = to_model.email_to_address
 
-        email_obj.to, email_obj.cc, email_obj.bcc, email_obj.replyto = map(lambda x: ','.join(listify(x if x else [])),
-                                                                           [email_obj.to, email_obj.cc, email_obj.bcc, email_obj.replyto])
+        values['sender'] = values['sender'] or c.CONTACT_EMAIL
+        for attr in ['to', 'cc', 'bcc', 'replyto']:
+            values[attr] = ','.join(listify(values[attr] if values[attr] else []))
         
-        return email_obj
+        return values
 
     def can_queue_email(self, session, limit_one=False, delete_existing=False):
         # Checks if we're allowed to queue our email object
@@ -129,47 +135,113 @@ class EmailService:
         if not fixture_obj.fixture or not fixture_obj.fixture.filter or not fixture_obj.can_generate:
             return
 
+        start_time = time()
+        fixture = fixture_obj.fixture
         model_class = fixture_obj.model_class
         if fixture_obj.shared_ident:
             ident_filter = or_(Email.ident == fixture_obj.ident, Email.shared_ident == fixture_obj.shared_ident)
         else:
             ident_filter = Email.ident == fixture_obj.ident
 
-        existing_fk_ids = [id for id, in session.query(Email.fk_id).filter(ident_filter)]
+        # Let the database rule out models that already have this email or can't pass the
+        # fixture's SQL prefilter, then check and render the remaining candidates a chunk at a time
+        already_emailed = select(Email.id).where(Email.fk_id == model_class.id, ident_filter).exists()
+        candidate_ids = select(model_class.id).where(~already_emailed, *fixture.sql_filters).execution_options(
+            yield_per=c.EMAIL_GENERATION_CHUNK_SIZE)
 
-        to_models = session.query(model_class).filter(~model_class.id.in_(existing_fk_ids))
-        if AutomatedEmailFixture.queries.get(model_class):
-            to_models = to_models.options(*AutomatedEmailFixture.queries[model_class])
+        candidate_count = model_count = 0
 
-        model_count = 0
-        for to_model in to_models:
-            if fixture_obj.fixture.filter(to_model):
-                model_count += 1
+        def chunks():
+            nonlocal candidate_count
+            for ids in session.execute(candidate_ids).scalars().partitions():
+                candidate_count += len(ids)
+                yield ids
 
-                email_handler = EmailHandler(fixture_obj, to_model, ident=fixture_obj.ident)
-                email_handler.queue_email_obj(session)
+        with EmailRenderPool() as pool:
+            for rows in pool.render(session, fixture_obj, chunks()):
+                EmailService.insert_email_rows(session, fixture_obj, rows)
+                model_count += len(rows)
 
         session.commit()
+        EmailService.record_generation_stats(fixture_obj.ident, candidate_count, model_count,
+                                             time() - start_time)
         return model_count
 
     @staticmethod
-    def check_emails_for_model(session, to_model):
-        if to_model.__class__ not in set([fixture.model for fixture in AutomatedEmail._fixtures.values()]):
+    def render_email_rows(session, fixture_obj, ids):
+        """
+        Loads the models with the given IDs, and for each one that passes the fixture's filter, returns the
+        values for a new email for them, with its body rendered. This is what EmailRenderPool runs in each process.
+        """
+        model_class = fixture_obj.model_class
+        to_models = session.query(model_class).filter(model_class.id.in_(ids))
+        if AutomatedEmailFixture.queries.get(model_class):
+            to_models = to_models.options(*AutomatedEmailFixture.queries[model_class])
+
+        return [EmailHandler.email_values(fixture_obj, to_model, ident=fixture_obj.ident)
+                for to_model in to_models if fixture_obj.fixture.filter(to_model)]
+
+    @staticmethod
+    def insert_email_rows(session, fixture_obj, rows):
+        """
+        Queues emails from `render_email_rows` the way `EmailHandler.queue_email_obj` would, with one
+        multi-row INSERT rather than adding each Email to the session.
+        """
+        if not rows:
             return
-        
-        if not AutomatedEmail.initialized:
-            AutomatedEmail.reconcile_fixtures()
-            AutomatedEmail.initialized = True
 
+        if not fixture_obj.policy or fixture_obj.policy == c.NEEDS_APPROVAL:
+            status, send_after = c.UNAPPROVED, None
+        else:
+            status, send_after = c.QUEUED, Email.next_send_after(fixture_obj)
+
+        generated = datetime.now(pytz.UTC)
+        session.execute(insert(Email), [dict(row, automated_email_id=fixture_obj.id, status=status,
+                                             send_after=send_after, generated=generated) for row in rows])
+
+    @staticmethod
+    def record_generation_stats(ident, candidates, generated, seconds):
+        """
+        Logs and saves how long it took to check a fixture for new emails and how many models we had to
+        load to do so, so that we can spot fixtures that need a better SQL prefilter.
+        """
+        per_second = round(generated / seconds, 1) if seconds else 0
+        log.info(f"Checked {candidates} candidate(s) for {ident} and generated {generated} email(s) "
+                 f"in {seconds:.2f} seconds ({per_second} emails/second).")
+        stats = {'candidates': candidates, 'generated': generated, 'seconds': round(seconds, 3),
+                 'per_second': per_second, 'checked_at': datetime.now(pytz.UTC).isoformat()}
+        try:
+            c.REDIS_STORE.hset(c.REDIS_PREFIX + 'email_generation_stats', ident, json.dumps(stats))
+        except Exception:
+            log.warning(f"Could not save email generation stats for {ident}.", exc_info=True)
+
+    @staticmethod
+    def generation_stats(ident=None):
+        """
+        Returns the most recent generation stats for one fixture, or a dictionary of stats for every fixture.
+        """
+        key = c.REDIS_PREFIX + 'email_generation_stats'
+        if ident:
+            stats = c.REDIS_STORE.hget(key, ident)
+            return json.loads(stats) if stats else {}
+        return {ident: json.loads(stats) for ident, stats in c.REDIS_STORE.hgetall(key).items()}
+
+    @staticmethod
+    def check_emails_for_model(session, to_model):
+        """
+        Queues any emails that `to_model` now qualifies for and deletes unsent emails it no longer
+        qualifies for. This runs for every new or changed model when a session commits, so the active
+        fixtures come from `automated_email_index` rather than the database.
+        """
         model_str = to_model.__class__.__name__
-        active_automated_emails = session.query(AutomatedEmail).filter(
-            AutomatedEmail.model == model_str).filter(*AutomatedEmail.filters_for_allowed).all()
-        active_idents = []
-        active_shared_idents = set()
-        for email in active_automated_emails:
-            active_idents.append(email.ident)
-            if email.shared_ident:
-                active_shared_idents.add(email.shared_ident)
+        fixtures = [(entry, AutomatedEmail._fixtures.get(entry.ident))
+                    for entry in automated_email_index.fixtures_for(model_str)]
+        fixtures = [(entry, fixture) for entry, fixture in fixtures if fixture and fixture.filter]
+        if not fixtures:
+            return
+
+        active_idents = [entry.ident for entry, fixture in fixtures]
+        active_shared_idents = set([entry.shared_ident for entry, fixture in fixtures if entry.shared_ident])
 
         existing_emails = session.query(Email).filter(Email.model == model_str,
                                                       Email.fk_id == to_model.id,
@@ -182,57 +254,24 @@ class EmailService:
             if email.shared_ident:
                 existing_by_shared_ident[email.shared_ident].append(email)
 
-        for fixture_obj in active_automated_emails:
-            fixture = AutomatedEmail._fixtures[fixture_obj.ident]
-            if fixture and fixture.filter:
-                existing = existing_by_ident.get(fixture_obj.ident)
-                if fixture_obj.shared_ident:
-                    existing = existing_by_shared_ident.get(fixture_obj.shared_ident) or existing
-
-                if not existing and fixture.filter(to_model):
-                    email_handler = EmailHandler(fixture_obj, to_model, ident=fixture_obj.ident)
-                    email_handler.queue_email_obj(session)
-                elif existing and not fixture.filter(to_model):
-                    for email in existing:
-                        if email.status != c.SENT:
-                            session.delete(email)
+        for entry, fixture in fixtures:
+            existing = existing_by_ident.get(entry.ident)
+            if entry.shared_ident:
+                existing = existing_by_shared_ident.get(entry.shared_ident) or existing
+
+            if not existing and fixture.filter(to_model):
+                fixture_obj = session.get(AutomatedEmail, entry.id)
+                email_handler = EmailHandler(fixture_obj, to_model, ident=entry.ident)
+                email_handler.queue_email_obj(session)
+            elif existing and not fixture.filter(to_model):
+                for email in existing:
+                    if email.status != c.SENT:
+                        session.delete(email)
 
     @staticmethod
     def process_emails_by_class(session, model_class):
-        model_str = model_class.__name__ if model_class else ''
-
-        queued_emails = session.query(Email).filter(
-            Email.status == c.QUEUED, Email.model == model_str,
-            Email.send_after != None, Email.send_after < datetime.now(pytz.UTC)
-            ).options(joinedload(Email.automated_email)).limit(5000)
-
-        if not queued_emails.count():
-            return 0
-
-        if model_class:
-            log.debug(f"Found {queued_emails.count()} queued emails for {model_str}.")
-            
-            fk_ids = set()
-            for email in queued_emails:
-                fk_ids.add(email.fk_id)
-            fk_ids.discard(None)
-            
-            to_models = session.query(model_class).filter(model_class.id.in_(fk_ids))
-            if AutomatedEmailFixture.queries.get(model_class):
-                to_models = to_models.options(AutomatedEmailFixture.queries[model_class])
-            models_by_id = {model.id: model for model in to_models}
-        else:
-            log.debug(f"Found {queued_emails.count()} classless queued emails.")
-            models_by_id = {}
-
-        sent_count = 0
-        for email in queued_emails:
-            sent_email = EmailService.send_email(session, email, email.automated_email, models_by_id.get(email.fk_id, None))
-            if sent_email:
-                session.add(sent_email)
-                sent_count += 1
-        session.commit()
-        return sent_count
+        with EmailDispatcher() as dispatcher:
+            return dispatcher.dispatch(session, model_class)
     
     @staticmethod
     def reconcile_policy(session, fixture_obj):
@@ -266,6 +305,18 @@ class EmailService:
 
     @staticmethod
     def send_email(session, email, fixture_obj=None, to_model=None):
+        ses_kwargs = EmailService.prepare_email(session, email, fixture_obj, to_model)
+        if ses_kwargs is None:
+            return
+        return EmailService.mark_sent(email, EmailService.deliver_email(ses_kwargs))
+
+    @staticmethod
+    def prepare_email(session, email, fixture_obj=None, to_model=None):
+        """
+        Runs every check and update we make on an email before sending it. Returns the keyword
+        arguments for `sendEmail` if it's ready to go, or None if it shouldn't be sent now.
+        The returned dictionary only contains strings, so it's safe to send from another thread.
+        """
         fixture_obj = fixture_obj or email.automated_email
         if not to_model and email.fk_id:
             model_class = email.model_class
@@ -337,31 +388,44 @@ class EmailService:
         
         if fixture_obj:
             email.subject = (email.subject or fixture_obj.subject).format_map(render_data)
-        
+
+        return {
+            'source': email.sender,
+            'toAddresses': email.to.split(','),
+            'replyToAddresses': email.replyto.split(',') if email.replyto else [],
+            'ccAddresses': email.cc.split(',') if email.cc else [],
+            'bccAddresses': email.bcc.split(',') if email.bcc else [],
+            'message': {
+                'bodyText' if email.format == 'text' else 'bodyHtml': email.body,
+                'subject': email.subject,
+                'charset': 'UTF-8',
+            },
+        }
+
+    @staticmethod
+    def deliver_email(ses_kwargs, sender=None, rate_limiter=None):
+        """
+        Hands a prepared email to SES (unless we're not sending emails) and returns any error.
+        This doesn't touch the database, so it may be called from a sender thread.
+        """
+        if c.DEV_BOX or not c.SEND_EMAILS:
+            return ''
+
         try:
-            error_msg = ''
-            if not c.DEV_BOX and c.SEND_EMAILS:
-                ses_payload = {
-                    'bodyText' if email.format == 'text' else 'bodyHtml': email.body,
-                    'subject': email.subject,
-                    'charset': 'UTF-8',
-                }
-                error_msg = email_sender.sendEmail(
-                    source=email.sender,
-                    toAddresses=email.to.split(','),
-                    replyToAddresses=email.replyto.split(',') if email.replyto else [],
-                    ccAddresses=email.cc.split(',') if email.cc else [],
-                    bccAddresses=email.bcc.split(',') if email.bcc else [],
-                    message=ses_payload)
-
-            if error_msg:
-                email.error = f"Error while sending email: {str(error_msg)}"
-                return
-            email.status = c.SENT
-            email.sent = datetime.now(pytz.UTC)
-            return email
+            if rate_limiter:
+                rate_limiter.acquire()
+            return (sender or email_sender).sendEmail(**ses_kwargs)
         except Exception as error:
-            email.error = f"Error while sending email: {str(error)}"
+            return error
+
+    @staticmethod
+    def mark_sent(email, error_msg=''):
+        if error_msg:
+            email.error = f"Error while sending email: {str(error_msg)}"
+            return
+        email.status = c.SENT
+        email.sent = datetime.now(pytz.UTC)
+        return email
 
     @staticmethod
     @reconcile_fixtures
@@ -428,3 +492,231 @@ class EmailService:
         related_emails = c.RELATED_EMAILS.get(email_sender, [])
         department_ids = session.query(Department.id, Department.name).filter(Department.from_email.in_(related_emails + [email_sender]))
         return [(id, name) for id, name in department_ids]
+
+
+IndexedFixture = namedtuple('IndexedFixture', ['id', 'ident', 'shared_ident'])
+
+
+class AutomatedEmailIndex:
+    """
+    The allowed AutomatedEmails for each model, cached for the whole process by config_cache so
+    that checking a saved model for emails doesn't start with a query. The index is rebuilt when
+    the automated_email table changes (in any process), and `version` goes up each time it's
+    invalidated in this one.
+
+    Models that no fixture is registered for are ruled out before we ever touch the database, and
+    fixtures are reconciled with the database the first time a model that needs them is checked.
+    """
+    name = 'automated_email_index'
+
+    def __init__(self):
+        config_cache.depends_on(self.name, AutomatedEmail.__tablename__)
+        config_cache.depends_on(self.name + '_models', AutomatedEmail.__tablename__)
+
+    @property
+    def version(self):
+        return config_cache.generation(self.name)
+
+    def invalidate(self):
+        config_cache.invalidate([AutomatedEmail.__tablename__])
+
+    def index(self):
+        # The allowed fixtures change when the event starts and ends, so that's part of the key
+        return config_cache.get(self.name, self._build_index, c.AT_THE_CON, c.POST_CON)
+
+    def has_fixtures(self, model_name):
+        return model_name in config_cache.get(self.name + '_models', self._registered_models)
+
+    def fixtures_for(self, model_name):
+        """Returns an IndexedFixture for each allowed AutomatedEmail for the given model name."""
+        if not self.has_fixtures(model_name):
+            return ()
+
+        if not AutomatedEmail.initialized:
+            AutomatedEmail.reconcile_fixtures()
+            AutomatedEmail.initialized = True
+            self.invalidate()
+        return self.index().get(model_name, ())
+
+    @staticmethod
+    def _registered_models():
+        return frozenset([fixture.model.__name__ for fixture in AutomatedEmail._fixtures.values() if fixture.model])
+
+    @staticmethod
+    def _build_index(at_the_con, post_con):
+        fixtures = defaultdict(list)
+        with Session() as session:
+            for row in session.execute(select(
+                    AutomatedEmail.model, AutomatedEmail.id, AutomatedEmail.ident, AutomatedEmail.shared_ident
+                    ).where(*AutomatedEmail.filters_for_allowed).order_by(AutomatedEmail.ident)):
+                fixtures[row.model].append(IndexedFixture(row.id, row.ident, row.shared_ident))
+        return {model: tuple(rows) for model, rows in fixtures.items()}
+
+
+automated_email_index = AutomatedEmailIndex()
+
+
+def _render_email_chunk(fixture_id, ids):
+    with Session() as session:
+        return EmailService.render_email_rows(session, session.get(AutomatedEmail, fixture_id), ids)
+
+
+class EmailRenderPool:
+    """
+    Checks and renders a fixture's emails for each chunk of candidate model IDs.
+
+    That's all CPU-bound Python (loading each model, running the fixture's filter, and rendering
+    its template), so fixtures with at least c.EMAIL_RENDER_PROCESS_MIN candidates are spread over
+    c.EMAIL_RENDER_PROCESSES processes. Each process has its own database connection and loads its
+    chunk's models itself, since templates use model properties and relationships that a
+    serialized copy wouldn't have, then sends back plain dictionaries of column values for the
+    caller to insert. Processes are spawned rather than forked because our web and Celery
+    processes have background threads running.
+
+    We check emails from Celery's default prefork worker pool, whose worker processes are daemonic,
+    and the standard library refuses to start processes from a daemonic process. The pool therefore
+    comes from billiard, Celery's own fork of multiprocessing, which allows it, so this works from
+    any worker pool as well as from the web server and sep commands.
+
+    Anything smaller, or anything at all if we can't start processes, is rendered in this
+    process using the caller's session.
+
+    The chunks usually come straight from a streaming query, so we don't know up front how many
+    candidates there are. We read chunks until we've seen c.EMAIL_RENDER_PROCESS_MIN candidates
+    (or run out) before deciding whether to start processes, and after that hand the processes
+    a few chunks at a time, so we never hold more than a few chunks of IDs in memory at once.
+    """
+    def __init__(self, processes=None, render_chunk=_render_email_chunk):
+        self.processes = processes or c.EMAIL_RENDER_PROCESSES
+        self.render_chunk = render_chunk
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        try:
+            self.pool = billiard.get_context('spawn').Pool(self.processes)
+        except Exception:
+            log.warning(f"Could not start {self.processes} processes to render emails; rendering in this "
+                        "process instead.", exc_info=True)
+
+    def close(self):
+        if self.pool:
+            # Every chunk has been rendered (or the caller gave up) by now, and close() can spend
+            # half a minute waiting on billiard's pool handler threads to wind down
+            self.pool.terminate()
+
+    def render(self, session, fixture_obj, chunks):
+        """
+        Yields the email rows for each chunk of IDs, in order; see `EmailService.render_email_rows`.
+        """
+        chunks = iter(chunks)
+        window, candidate_count = [], 0
+        for ids in chunks:
+            window.append(ids)
+            candidate_count += len(ids)
+            if candidate_count >= c.EMAIL_RENDER_PROCESS_MIN:
+                break
+
+        if self.processes > 1 and candidate_count >= c.EMAIL_RENDER_PROCESS_MIN:
+            self.start()
+
+        while window:
+            if self.pool:
+                yield from self.pool.imap(partial(self.render_chunk, fixture_obj.id), window)
+            else:
+                for ids in window:
+                    yield EmailService.render_email_rows(session, fixture_obj, ids)
+            window = list(islice(chunks, self.processes * 2))
+
+
+class EmailDispatcher:
+    """
+    Sends queued emails for a model class in batches. Each batch is claimed with
+    FOR UPDATE SKIP LOCKED, so any number of dispatchers (e.g., on different Celery
+    workers) can work through the same queue without sending anything twice.
+
+    Emails are checked and rendered in the calling thread, which owns the session,
+    then handed to a pool of sender threads that share a rate limit. Once the whole
+    batch is back we mark it sent and commit, which also releases the row locks.
+    """
+    def __init__(self, workers=None, rate_limiter=None, sender=None, batch_size=None):
+        self.workers = workers or c.EMAIL_SEND_WORKERS
+        self.rate_limiter = rate_limiter or email_rate_limiter
+        self.sender = sender or email_sender
+        self.batch_size = batch_size or c.EMAIL_SEND_BATCH_SIZE
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='email_sender')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def deliver_all(self, payloads):
+        """
+        Takes an iterable of (key, ses_kwargs) pairs and sends them in parallel,
+        yielding (key, error_msg) pairs in the order they finish.
+        """
+        futures = {self.pool.submit(EmailService.deliver_email, ses_kwargs, self.sender, self.rate_limiter): key
+                   for key, ses_kwargs in payloads}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def claim(self, session, model_str, limit, skip_ids=()):
+        """
+        Locks and returns up to `limit` of the oldest queued emails that are due, skipping `skip_ids`.
+        """
+        query = session.query(Email).filter(
+            Email.status == c.QUEUED, Email.model == model_str,
+            Email.send_after != None, Email.send_after < datetime.now(pytz.UTC)  # noqa: E711
+            )
+        if skip_ids:
+            query = query.filter(Email.id.notin_(skip_ids))
+        return query.options(joinedload(Email.automated_email)).order_by(Email.send_after).limit(limit) \
+            .with_for_update(skip_locked=True, of=Email).all()
+
+    def dispatch(self, session, model_class, max_emails=None):
+        model_str = model_class.__name__ if model_class else ''
+        max_emails = max_emails or c.EMAIL_SEND_MAX_PER_RUN
+        sent_count = 0
+
+        # Emails that fail stay queued for the next run, so we skip any we've already tried in this
+        # one; otherwise we'd keep claiming the same failures until we hit max_emails
+        claimed_ids = set()
+        while len(claimed_ids) < max_emails:
+            queued_emails = self.claim(session, model_str, min(self.batch_size, max_emails - len(claimed_ids)),
+                                       claimed_ids)
+            if not queued_emails:
+                break
+            claimed_ids.update(email.id for email in queued_emails)
+            log.debug(f"Claimed {len(queued_emails)} queued emails for {model_str or 'no model'}.")
+
+            models_by_id = {}
+            fk_ids = {email.fk_id for email in queued_emails} - {None}
+            if model_class and fk_ids:
+                to_models = session.query(model_class).filter(model_class.id.in_(fk_ids))
+                if AutomatedEmailFixture.queries.get(model_class):
+                    to_models = to_models.options(*AutomatedEmailFixture.queries[model_class])
+                models_by_id = {model.id: model for model in to_models}
+
+            payloads = []
+            for email in queued_emails:
+                ses_kwargs = EmailService.prepare_email(session, email, email.automated_email,
+                                                        models_by_id.get(email.fk_id, None))
+                if ses_kwargs is not None:
+                    payloads.append((email, ses_kwargs))
+
+            for email, error_msg in self.deliver_all(payloads):
+                if EmailService.mark_sent(email, error_msg):
+                    sent_count += 1
+            session.commit()
+
+        return sent_count
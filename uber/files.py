@@ -1,6 +1,7 @@
 import bcrypt
 import cherrypy
 import contextlib
+import hashlib
 import math
 import os
 import phonenumbers
@@ -15,10 +16,10 @@ import urllib
 import logging
 import warnings
 import six
-import shutil
 
 from abc import ABC, abstractmethod
 from PIL import Image
+from cherrypy.lib import cptools
 from cherrypy.lib.static import serve_file
 from collections import defaultdict, OrderedDict
 from collections.abc import Iterable, Mapping, Sized
@@ -40,6 +41,92 @@ from uber.models import File, uncamel
 log = logging.getLogger(__name__)
 
 
+def file_content_hash(filepath, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ImageDerivatives:
+    """
+    Resized copies of an uploaded image, stored under c.UPLOADED_FILES_DIR by the image's
+    content hash, size and format. Since the same image always has the same hash, a
+    derivative never changes once it's written, and identical uploads share derivatives.
+    """
+    mime_types = {'avif': 'image/avif', 'webp': 'image/webp', 'png': 'image/png', 'jpeg': 'image/jpeg'}
+    extensions = {'avif': 'avif', 'webp': 'webp', 'png': 'png', 'jpeg': 'jpg'}
+    save_options = {'avif': {'quality': 60}, 'webp': {'quality': 80}, 'png': {'optimize': True},
+                    'jpeg': {'quality': 85, 'optimize': True}}
+
+    def __init__(self, content_hash, source_extension=''):
+        self.content_hash = content_hash
+        # Browsers that don't accept a modern format get PNGs for formats that may be transparent
+        self.fallback_format = 'png' if source_extension.lower() in ['png', 'gif', 'webp', 'avif'] else 'jpeg'
+
+    @property
+    def directory(self):
+        return os.path.join(c.UPLOADED_FILES_DIR, 'image_derivatives', self.content_hash[:2])
+
+    def path(self, size, image_format):
+        return os.path.join(self.directory, f"{self.content_hash}_{size}.{self.extensions[image_format]}")
+
+    def etag(self, size, image_format):
+        return f'"{self.content_hash}-{size}-{image_format}"'
+
+    @staticmethod
+    def size_for(max_pixels):
+        """Returns the smallest configured size that's at least max_pixels, or the largest one."""
+        sizes = sorted(c.IMAGE_PREVIEW_SIZES)
+        return next((size for size in sizes if size >= int(max_pixels)), sizes[-1])
+
+    def format_for(self, accept_header):
+        accepted = {value.split(';')[0].strip().lower() for value in (accept_header or '').split(',')}
+        return next((image_format for image_format in c.IMAGE_PREVIEW_FORMATS
+                     if self.mime_types.get(image_format) in accepted), self.fallback_format)
+
+    @property
+    def formats(self):
+        return list(dict.fromkeys([image_format for image_format in c.IMAGE_PREVIEW_FORMATS
+                                   if image_format in self.mime_types] + [self.fallback_format]))
+
+    def generate(self, source_path, size, image_format):
+        """
+        Writes one derivative, unless it already exists, and returns its path. We write to a
+        temporary file first so that nobody is ever served a half-written image.
+        """
+        path = self.path(size, image_format)
+        if os.path.exists(path):
+            return path
+
+        os.makedirs(self.directory, exist_ok=True)
+        with Image.open(source_path) as image:
+            thumbnail = image.copy()
+        thumbnail.thumbnail((size, size))
+        if image_format == 'jpeg' and thumbnail.mode not in ['RGB', 'L']:
+            thumbnail = thumbnail.convert('RGB')
+
+        temp_path = f"{path}.{uuid4().hex}.tmp"
+        try:
+            thumbnail.save(temp_path, format=image_format.upper(), **self.save_options[image_format])
+            os.replace(temp_path, path)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+        return path
+
+    def generate_all(self, source_path):
+        for size in c.IMAGE_PREVIEW_SIZES:
+            for image_format in self.formats:
+                self.generate(source_path, size, image_format)
+
+    def delete_all(self):
+        for path in glob(os.path.join(self.directory, f"{self.content_hash}_*")):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+
 class FileHandler(ABC):
     @abstractmethod
     def __init__(self, session, file_or_parent_obj, *args, **kwargs):
@@ -90,6 +177,11 @@ class ServerFileHandler(FileHandler):
             os.remove(self.file_obj.filepath)
             os.remove(self.thumbnail_path)
 
+        content_hash = self.file_obj.content_hash
+        if content_hash and not self.session.query(File).filter(
+                File.content_hash == content_hash, File.id != self.file_obj.id).first():
+            ImageDerivatives(content_hash).delete_all()
+
         try:
             self.session.delete(self.file_obj)
         except InvalidRequestError:
@@ -126,8 +218,12 @@ class ServerFileHandler(FileHandler):
 
         os.makedirs(self.folderpath, mode=0o744, exist_ok=True)
 
+        sha = hashlib.sha256()
         with open(self.file_obj.filepath, 'wb') as f:
-            shutil.copyfileobj(file_part.file, f)
+            for chunk in iter(lambda: file_part.file.read(1024 * 1024), b''):
+                sha.update(chunk)
+                f.write(chunk)
+        self.file_obj.content_hash = sha.hexdigest()
 
         if run_validations:
             errors = self.validate_file()
@@ -141,6 +237,10 @@ class ServerFileHandler(FileHandler):
         self.file_obj.extension = extension
         
         self.session.add(self.file_obj)
+
+        if self.file_obj.content_type.startswith('image/'):
+            from uber.tasks.files import generate_image_derivatives
+            generate_image_derivatives.delay(self.file_obj.filepath, self.file_obj.content_hash, extension)
     
     def prevalidate_file(self, file_part, allowed_extensions=[]):
         if allowed_extensions:
@@ -167,7 +267,12 @@ class ServerFileHandler(FileHandler):
                 return f"{image_label} dimensions must be {size_list[0]}x{size_list[1]} pixels, \
                     not {str(image_size[0])}x{str(image_size[1])} pixels."
 
-    def preview(self, max_pixels=500, filename=''):
+    def preview(self, max_pixels=500, filename='', version=''):
+        """
+        Serves a resized copy of an image, generating it if the background worker hasn't yet.
+        Previews are cached by content hash, so when the page asked for this file's current
+        version, browsers can keep it forever; otherwise they revalidate it with its ETag.
+        """
         if not self.file_obj.filepath:
             return "This file has not been uploaded yet or we do not know where it is on the server."
         
@@ -176,19 +281,30 @@ class ServerFileHandler(FileHandler):
         else:
             filename = self.file_obj.filename
 
-        if not os.path.exists(self.thumbnail_path):
-            # TODO: Rerender if max pixels is smaller than file?
-            max_pixels = int(max_pixels)
+        if not self.file_obj.content_hash:
             try:
-                with Image.open(self.file_obj.filepath) as image:
-                    thumbnail = image.copy()
-                    thumbnail.thumbnail((max_pixels, max_pixels))
-                    thumbnail.save(self.thumbnail_path)
+                self.file_obj.content_hash = file_content_hash(self.file_obj.filepath)
             except OSError:
-                return "We can only render previews for images."
+                return "We could not find this file on the server."
+            self.session.add(self.file_obj)
 
-        cherrypy.response.headers['Cache-Control'] = 'no-store'
-        return serve_file(self.thumbnail_path, name=filename, content_type=self.file_obj.content_type)
+        derivatives = ImageDerivatives(self.file_obj.content_hash, self.file_obj.extension)
+        size = derivatives.size_for(max_pixels)
+        image_format = derivatives.format_for(cherrypy.request.headers.get('Accept'))
+        try:
+            path = derivatives.generate(self.file_obj.filepath, size, image_format)
+        except OSError:
+            return "We can only render previews for images."
+
+        cherrypy.response.headers['ETag'] = derivatives.etag(size, image_format)
+        cherrypy.response.headers['Vary'] = 'Accept'
+        if version == self.file_obj.content_hash:
+            cherrypy.response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+        else:
+            cherrypy.response.headers['Cache-Control'] = 'private, no-cache'
+        cptools.validate_etags()
+
+        return serve_file(path, name=filename, content_type=derivatives.mime_types[image_format])
 
     def serve_file(self, filename=''):
         cherrypy.response.headers['Cache-Control'] = 'no-store'
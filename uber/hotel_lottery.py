@@ -0,0 +1,334 @@
+import logging
+import random
+import uuid
+from collections import Counter, defaultdict
+from copy import deepcopy
+from datetime import datetime
+from time import monotonic
+
+from dateutil import parser as dateparser
+from ortools.sat.python import cp_model
+from pytz import UTC
+from sqlalchemy import func, or_
+
+from uber.config import c
+from uber.models import Attendee, LotteryApplication
+from uber.utils import localized_now
+
+log = logging.getLogger(__name__)
+
+# CP-SAT only accepts integer coefficients, but group base weights are configured as floats
+WEIGHT_SCALE = 100
+
+
+def weight_entry(entry, hotel_room, base_weight):
+    """Takes a lottery entry and a hotel room and returns an arbitrary score for how likely that applicant
+        should be to get that particular room.
+    """
+    weight = 0
+
+    # Give 10 points for being the first choice hotel, 9 points for the second, etc
+    hotel_choice_rank = 10 - entry["hotels"].index(hotel_room["id"])
+    weight += hotel_choice_rank
+
+    # Give 10 points for being the first choice room type, 9 points for the second, etc
+    try:
+        room_type_rank = 10 - entry["room_types"].index(hotel_room["room_type"])
+        assert room_type_rank >= 0
+        weight += room_type_rank
+    except ValueError:
+        # room types are optional, so we need to figure out how much weight to give people who don't choose any
+        weight += 9  # Probably fine?
+
+    return weight + base_weight
+
+
+def build_entries(applications, lottery_type=c.ROOM_ENTRY):
+    """
+    Turns a list of applications into lottery entries, i.e., one entry per room or suite application
+    with its roommates attached. Roommates whose parent application isn't in the list are ignored.
+    """
+    entries = {}
+    for app in applications:
+        if app.entry_type == lottery_type or (lottery_type == c.ROOM_ENTRY and
+                                              app.entry_type == c.SUITE_ENTRY and
+                                              app.room_opt_out is False):
+            if lottery_type == c.ROOM_ENTRY:
+                room_types = app.room_type_preference
+            elif lottery_type == c.SUITE_ENTRY:
+                room_types = app.suite_type_preference
+            entries[app.id] = {
+                "members": [app],
+                "hotels": app.hotel_preference.split(","),
+                "room_types": room_types.split(","),
+            }
+
+    for app in applications:
+        if app.parent_application and app.parent_application.id in entries:
+            entries[app.parent_application.id]["members"].append(app)
+    return entries
+
+
+def entry_profile(entry):
+    """
+    Returns everything the solver knows about an entry: its hotel and room type preferences, its size,
+    and its (randomly awarded) group bias. Entries with the same profile are interchangeable, so the
+    solver decides how many entries of each profile get each room rather than deciding per entry.
+    """
+    weights = c.HOTEL_LOTTERY["weights"]
+    group_size = len(entry["members"])
+    base_weight = 0
+    if random.random() < weights.get(f"group_weight_{group_size}", 0):
+        base_weight = weights.get(f"group_base_{group_size}", 0)
+    return tuple(entry["hotels"]), tuple(entry["room_types"]), group_size, base_weight
+
+
+class LotteryRun:
+    """
+    The state of a lottery run on a Celery worker, kept in a Redis hash so the admin pages can
+    poll it. Only one lottery may run at a time, since every run hands out the same inventory.
+    """
+    lock_key = 'hotel_lottery_running'
+    expire_seconds = 60 * 60 * 24 * 7
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+
+    @property
+    def key(self):
+        return c.REDIS_PREFIX + 'hotel_lottery_run:' + self.run_id
+
+    @classmethod
+    def start(cls, **params):
+        """
+        Returns a tuple of (run, started). If another lottery is still running, we return
+        that run instead of starting a new one.
+        """
+        run = cls(uuid.uuid4().hex)
+        lock_key = c.REDIS_PREFIX + cls.lock_key
+        if not c.REDIS_STORE.set(lock_key, run.run_id, nx=True, ex=c.HOTEL_LOTTERY_SOLVER_SECONDS + 3600):
+            return cls(c.REDIS_STORE.get(lock_key)), False
+
+        run.update(status='queued', requested_at=datetime.now(UTC).isoformat(), **params)
+        return run, True
+
+    def get(self):
+        return c.REDIS_STORE.hgetall(self.key)
+
+    def update(self, **fields):
+        pipeline = c.REDIS_STORE.pipeline()
+        pipeline.hset(self.key, mapping={key: '' if val is None else val for key, val in fields.items()})
+        pipeline.expire(self.key, self.expire_seconds)
+        pipeline.execute()
+
+    def finish(self, **fields):
+        self.update(finished_at=datetime.now(UTC).isoformat(), **fields)
+        lock_key = c.REDIS_PREFIX + self.lock_key
+        if c.REDIS_STORE.get(lock_key) == self.run_id:
+            c.REDIS_STORE.delete(lock_key)
+
+
+class _ProgressCallback(cp_model.CpSolverSolutionCallback):
+    """Writes the solver's best objective and bound to a LotteryRun, at most once per interval."""
+
+    def __init__(self, run, interval=1.0):
+        super().__init__()
+        self.run = run
+        self.interval = interval
+        self.solutions = 0
+        self.last_update = 0
+
+    def on_solution_callback(self):
+        self.solutions += 1
+        if monotonic() - self.last_update < self.interval:
+            return
+        self.last_update = monotonic()
+        self.run.update(solutions=self.solutions,
+                        objective=self.ObjectiveValue() / WEIGHT_SCALE,
+                        best_bound=self.BestObjectiveBound() / WEIGHT_SCALE,
+                        solve_seconds=round(self.WallTime(), 1))
+
+
+def solve_lottery(applications, hotel_rooms, lottery_type=c.ROOM_ENTRY, run=None):
+    """Takes a set of hotel_rooms and applications and assigns the hotel_rooms mostly randomly.
+        Parameters:
+        applications List[Application]: Iterable set of Application objects to assign
+        hotel_rooms  List[hotels]: Iterable set of hotel rooms, represented as dictionaries with the following keys:
+        * id: c.HOTEL_LOTTERY_HOTELS_OPTS
+        * capacity: int
+        * min_capacity: int
+        * room_type: c.HOTEL_LOTTERY_ROOM_TYPE_OPTS
+        * quantity: int
+        run LotteryRun: Optional run to report the solver's progress to
+
+        Entries are grouped by their profile (see entry_profile) and the model has one integer variable
+        per profile and compatible room, so its size depends on how many distinct profiles there are
+        rather than how many people entered. Each profile's rooms are then handed out to its entries
+        in their (shuffled) order.
+
+        Returns Dict[Applications -> hotel, room_type]: A mapping of Application.id -> (id, room_type) or None if it failed
+    """
+    random.shuffle(applications)
+    entries = build_entries(applications, lottery_type)
+
+    profiles = defaultdict(list)
+    for entry in entries.values():
+        profiles[entry_profile(entry)].append(entry)
+
+    model = cp_model.CpModel()
+    profile_vars = defaultdict(list)
+    room_vars = defaultdict(list)
+    objective_vars, objective_weights = [], []
+    for profile, profile_entries in profiles.items():
+        hotels, room_types, group_size, base_weight = profile
+        for index, hotel_room in enumerate(hotel_rooms):
+            if hotel_room["id"] in hotels and hotel_room["room_type"] in room_types and (
+                    hotel_room["min_capacity"] <= group_size <= hotel_room["capacity"]):
+                upper_bound = max(0, min(len(profile_entries), hotel_room["quantity"]))
+                num_assigned = model.NewIntVar(0, upper_bound, f'assigned_{len(objective_vars)}')
+                profile_vars[profile].append((num_assigned, hotel_room))
+                room_vars[index].append(num_assigned)
+                objective_vars.append(num_assigned)
+                objective_weights.append(round(weight_entry(profile_entries[0], hotel_room, base_weight) * WEIGHT_SCALE))
+
+    # Set up constraints
+    ## Only allow each room type to fit only the quantity available
+    for index, num_assigned in room_vars.items():
+        model.Add(cp_model.LinearExpr.Sum(num_assigned) <= max(0, hotel_rooms[index]["quantity"]))
+
+    ## Only allow each group to have one room
+    for profile, num_assigned in profile_vars.items():
+        model.Add(cp_model.LinearExpr.Sum([var for var, hotel_room in num_assigned]) <= len(profiles[profile]))
+
+    model.Maximize(cp_model.LinearExpr.WeightedSum(objective_vars, objective_weights))
+
+    log.info(f"Solving lottery with {len(entries)} entries in {len(profiles)} profiles "
+             f"({len(objective_vars)} variables)")
+    if run:
+        run.update(status='solving', entries=len(entries), profiles=len(profiles), variables=len(objective_vars))
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = c.HOTEL_LOTTERY_SOLVER_SECONDS
+    solver.parameters.num_workers = c.HOTEL_LOTTERY_SOLVER_WORKERS
+    status = solver.Solve(model, _ProgressCallback(run) if run else None)
+
+    if status not in [cp_model.OPTIMAL, cp_model.FEASIBLE]:
+        log.error(f"Error solving room lottery: {solver.StatusName(status)}")
+        return None
+
+    # If it's optimal we know we got an ideal solution
+    # If it's feasible then we may have been on the way to an ideal solution,
+    # but we gave up searching because we ran out of time or something
+    if run:
+        run.update(solver_status=solver.StatusName(status),
+                   objective=solver.ObjectiveValue() / WEIGHT_SCALE,
+                   best_bound=solver.BestObjectiveBound() / WEIGHT_SCALE,
+                   solve_seconds=round(solver.WallTime(), 1))
+
+    assignments = {}
+    histogram = Counter()
+    for profile, num_assigned in profile_vars.items():
+        unassigned = iter(profiles[profile])
+        for var, hotel_room in num_assigned:
+            for _ in range(solver.Value(var)):
+                entry = next(unassigned)
+                for member in entry["members"]:
+                    assignments[member.id] = (hotel_room["id"], hotel_room["room_type"])
+                histogram[len(entry["members"])] += 1
+
+    log.info("Rooms assigned by group size: " + ", ".join(
+        f"{group_size}: {room_count}" for group_size, room_count in sorted(histogram.items())))
+    return assignments
+
+
+def run_lottery(session, lottery_group="attendee", lottery_type="room", cutoff='', run=None):
+    """
+    Runs the room or suite lottery for complete, eligible entries and marks each winning entry
+    and its roommates as processed. Returns a summary of the run, or None if the solver failed.
+    """
+    if lottery_type == "room":
+        lottery_type_val = c.ROOM_ENTRY
+    elif lottery_type == "suite":
+        lottery_type_val = c.SUITE_ENTRY
+    else:
+        raise ValueError(f"Unknown lottery_type {lottery_type}")
+
+    applications = session.query(LotteryApplication).join(LotteryApplication.attendee
+                                                          ).filter(LotteryApplication.status == c.COMPLETE,
+                                                                   Attendee.hotel_lottery_eligible == True)  # noqa: E712
+
+    if cutoff:
+        last_time = dateparser.parse(cutoff).replace(tzinfo=c.EVENT_TIMEZONE)
+        applications = applications.filter(LotteryApplication.last_submitted < last_time)
+
+    # We always grab all roommate entries, but the solver only looks at those that have a matching parent
+    # in the lottery batch.
+    if lottery_type_val == c.SUITE_ENTRY:
+        applications = applications.filter(LotteryApplication.entry_type.in_([lottery_type_val, c.GROUP_ENTRY]))
+    else:
+        applications = applications.filter(or_(LotteryApplication.entry_type.in_([lottery_type_val, c.GROUP_ENTRY]),
+                                               LotteryApplication.room_opt_out == False))  # noqa: E712
+
+    # If lottery_group is "both" don't filter either way
+    if lottery_group == "staff":
+        applications = applications.filter(LotteryApplication.is_staff_entry == True)  # noqa: E712
+    elif lottery_group == "attendee":
+        applications = applications.filter(LotteryApplication.is_staff_entry == False)  # noqa: E712
+
+    applications = applications.all()
+    assigned_applications = session.query(LotteryApplication.assigned_hotel,
+                                          LotteryApplication.assigned_room_type,
+                                          func.count(LotteryApplication.id)).join(LotteryApplication.attendee).filter(
+                                              LotteryApplication.status.in_(c.HOTEL_LOTTERY_AWARD_STATUSES),
+                                              LotteryApplication.entry_type != c.GROUP_ENTRY,
+                                              ).group_by(LotteryApplication.assigned_hotel).group_by(
+                                                  LotteryApplication.assigned_room_type).all()
+
+    assigned_applications_dict = {(hotel, room_type): count for hotel, room_type, count in assigned_applications}
+
+    if lottery_type_val == c.SUITE_ENTRY:
+        inventory_table = c.HOTEL_LOTTERY_SUITE_INVENTORY
+    else:
+        inventory_table = c.HOTEL_LOTTERY_ROOM_INVENTORY
+
+    available_rooms = deepcopy(inventory_table)
+    for hotel_and_room in available_rooms:
+        hotel, room_type = int(hotel_and_room['id']), int(hotel_and_room['room_type'])
+        if assigned_applications_dict.get((hotel, room_type)):
+            hotel_and_room['quantity'] -= assigned_applications_dict[(hotel, room_type)]
+
+    assignments = solve_lottery(applications, available_rooms, lottery_type=lottery_type_val, run=run)
+    if assignments is None:
+        return None
+
+    if run:
+        run.update(status='saving')
+
+    num_rooms_assigned = 0
+    lottery_name = f"{lottery_group}_{lottery_type}_{localized_now().strftime('%Y%m%d_%H%M%S')}"
+    for application in applications:
+        if application.id in assignments:
+            hotel, room_type = assignments[application.id]
+            application.assigned_hotel = hotel
+            application.lottery_name = lottery_name
+            if lottery_type_val == c.SUITE_ENTRY:
+                application.assigned_suite_type = room_type
+            else:
+                application.assigned_room_type = room_type
+            # For now, everyone gets the dates they picked
+            application.assigned_check_in_date = application.earliest_checkin_date
+            application.assigned_check_out_date = application.latest_checkout_date
+            application.status = c.PROCESSED
+            session.add(application)
+            if not application.parent_application:
+                num_rooms_assigned += 1
+    session.commit()
+
+    num_rooms_available = sum([x['quantity'] for x in available_rooms])
+    return {
+        'lottery_name': lottery_name,
+        'lottery_type_val': lottery_type_val,
+        'num_entries': len(build_entries(applications, lottery_type_val)),
+        'num_rooms_available_before': num_rooms_available,
+        'num_rooms_available_after': num_rooms_available - num_rooms_assigned,
+    }
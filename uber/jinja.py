@@ -1,5 +1,7 @@
+import logging
 import os
 import sys
+from collections import ChainMap
 from functools import lru_cache
 from types import FunctionType
 
@@ -11,6 +13,8 @@ from jinja2.exceptions import TemplateNotFound, TemplatesNotFound
 
 from uber.config import c, request_cached_property
 
+log = logging.getLogger(__name__)
+
 # This used to be in jinja2._compat, but that was removed in version 3.0.0
 string_types = (str,)
 if sys.version_info[0] == 2:
@@ -20,16 +24,66 @@ if sys.version_info[0] == 2:
 class MultiPathEnvironment(jinja2.Environment):
     def __init__(self, base_template_paths=[], **kwargs):
         self.base_template_paths = base_template_paths
+        self._manifest = None
         jinja2.Environment.__init__(self, **kwargs)
 
     @request_cached_property
     def _templates_loaded_for_current_request(self):
         return set()
 
-    @lru_cache()
+    @property
+    def manifest(self):
+        """
+        Maps every template name to the (search path, filename) of each file that provides it,
+        in search path order, so plugin overrides come first. We build this with one walk over
+        the template directories rather than checking each search path for each template.
+        """
+        if self._manifest is None:
+            manifest = {}
+            for searchpath in self.loader.searchpath:
+                for dirpath, dirnames, filenames in os.walk(searchpath, followlinks=True):
+                    dirnames.sort()
+                    for filename in sorted(filenames):
+                        pieces = os.path.relpath(os.path.join(dirpath, filename), searchpath).split(os.sep)
+                        manifest.setdefault('/'.join(pieces), []).append(
+                            (searchpath, os.path.join(searchpath, *pieces)))
+            self._manifest = manifest
+        return self._manifest
+
+    def clear_manifest(self):
+        self._manifest = None
+
+    @lru_cache(maxsize=512)
+    def cached_from_string(self, source):
+        """
+        Like from_string, but only compiles each distinct source once. Automated email
+        bodies are rendered from their stored source thousands of times per run.
+        """
+        return self.from_string(source)
+
+    @staticmethod
+    def _layered_context(template, data):
+        # Jinja normally copies every global into a fresh dict for each render, and our globals
+        # include every model class, so instead we put this render's data in front of them
+        return template.new_context(ChainMap(data, template.globals), shared=True)
+
+    def render_layered(self, template, data):
+        """Renders a template with the given data layered over the environment's globals."""
+        try:
+            return self.concat(template.root_render_func(self._layered_context(template, data)))
+        except Exception:
+            self.handle_exception()
+
+    def generate_layered(self, template, data):
+        """Like render_layered, but yields the rendered template in pieces."""
+        try:
+            yield from template.root_render_func(self._layered_context(template, data))
+        except Exception:
+            yield self.handle_exception()
+
     def _get_matching_filenames(self, template):
         pieces = split_template_path(template)
-        search_paths = self.loader.searchpath
+        search_paths = None
 
         # Check to see if this template string specifies a plugin
         for exact_path in self.base_template_paths:
@@ -37,13 +91,15 @@ class MultiPathEnvironment(jinja2.Environment):
                 pieces = split_template_path(template.replace(exact_path, '', 1))
                 search_paths = [s for s in self.loader.searchpath if s.endswith(exact_path)]
 
-        matching_filenames = []
-        for searchpath in search_paths:
-            filename = os.path.join(searchpath, *pieces)
-            if os.path.exists(filename):
-                matching_filenames.append(filename)
+        matches = self.manifest.get('/'.join(pieces))
+        if matches is None:
+            if not self.auto_reload:
+                return []
+            # On dev boxes, templates can be added while the server is running
+            matches = [(searchpath, os.path.join(searchpath, *pieces)) for searchpath in self.loader.searchpath]
+            matches = [(searchpath, filename) for searchpath, filename in matches if os.path.exists(filename)]
 
-        return matching_filenames
+        return [filename for searchpath, filename in matches if search_paths is None or searchpath in search_paths]
 
     def _load_template(self, name, globals, use_request_cache=True):
         """
@@ -149,6 +205,7 @@ class AbsolutePathLoader(jinja2.FileSystemLoader):
 
 class JinjaEnv:
     _env = None
+    global_context = None
     _exportable_functions = {}
     _filter_functions = {}
     _test_functions = {}
@@ -176,10 +233,59 @@ class JinjaEnv:
             cls._env = cls._init_env(**kwargs)
         return cls._env
 
+    @classmethod
+    def register_global_context(cls, context):
+        """
+        Makes every key in the given (read-only) mapping a global in every template. This is
+        how templates get c and the model classes; see uber.decorators.global_render_context.
+        """
+        cls.global_context = context
+        cls.env().globals.update(context)
+
     @classmethod
     def clear_cache(cls):
         if cls._env is not None:
-            cls._env._get_matching_filenames.cache_clear()
+            cls._env.clear_manifest()
+
+    @classmethod
+    def bytecode_cache(cls):
+        """
+        Compiled templates are shared between processes (and kept across restarts) through
+        a directory of Jinja bytecode, which "sep precompile_templates" fills in ahead of
+        time. Each entry is checked against its template's source, so edited templates are
+        simply recompiled.
+        """
+        directory = getattr(c, 'TEMPLATE_BYTECODE_DIR', '')
+        if not directory:
+            return None
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            log.warning(f"Could not create template bytecode directory {directory}; templates will be "
+                        "compiled in each process.", exc_info=True)
+            return None
+        return jinja2.FileSystemBytecodeCache(directory)
+
+    @classmethod
+    def precompile(cls):
+        """
+        Compiles every file in every template directory, including each plugin override,
+        which writes its bytecode to the bytecode cache. Returns the number of templates
+        compiled and a dictionary of the ones that failed to compile, with their errors.
+        """
+        env = cls.env()
+        compiled, errors = 0, {}
+        for name, matches in env.manifest.items():
+            for searchpath, filename in matches:
+                try:
+                    env.loader.load(env, filename)
+                except UnicodeDecodeError:
+                    pass  # Images and other static files that live alongside templates
+                except jinja2.TemplateError as e:
+                    errors[filename] = e
+                else:
+                    compiled += 1
+        return compiled, errors
 
     @classmethod
     def _init_env(cls, **kwargs):
@@ -191,6 +297,9 @@ class JinjaEnv:
             'lstrip_blocks': True,
             'trim_blocks': True,
             'keep_trailing_newline': True,
+            # Keep every template we've loaded; the default of 400 is less than we have
+            'cache_size': -1,
+            'bytecode_cache': cls.bytecode_cache(),
         }
         params.update(kwargs)
 
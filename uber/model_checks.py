@@ -28,9 +28,9 @@ from uber.decorators import prereg_validation, validation
 from uber.models import (AccessGroup, AdminAccount, ApiToken, Attendee, ArtShowApplication, ArtShowPiece,
                          Attraction, AttractionFeature, ArtShowBidder, DeptRole, Event,
                          GuestDetailedTravelPlan, IndieDeveloper, IndieGame, IndieGameCode, IndieJudge, IndieStudio,
-                         Job, ArtistMarketplaceApplication, MITSApplicant, MITSGame, MITSTeam,
+                         ArtistMarketplaceApplication, MITSApplicant, MITSGame, MITSTeam,
                          PromoCode, PromoCodeGroup, Sale, Session, WatchList)
-from uber.utils import localized_now, valid_email, get_age_from_birthday, slugify
+from uber.utils import localized_now, valid_email, get_age_from_birthday, slugify, ShiftIntervals
 from uber.payments import PreregCart
 
 log = logging.getLogger(__name__)
@@ -174,10 +174,10 @@ def slots(job):
 @validation.Job
 def time_conflicts(job):
     if not job.is_new and job.slots:
-        original_minutes = Job(start_time=job.orig_value_of('start_time'),
-                               duration=job.orig_value_of('duration')).minutes
         for shift in job.shifts:
-            if job.minutes.intersection(shift.attendee.shift_minutes - original_minutes):
+            # The attendee's intervals still include this job at its original time, so skip it
+            others = ShiftIntervals(s.job for s in shift.attendee.shifts if s.job_id != job.id)
+            if others.overlaps(job.start_minute, job.end_minute):
                 return 'You cannot change this job to this time, because {} is already working a shift then'.format(
                     shift.attendee.full_name)
 
@@ -25,7 +25,7 @@ from sqlalchemy.event import listen
 from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlalchemy.ext.hybrid import hybrid_method, hybrid_property
 from sqlalchemy.ext.mutable import MutableDict
-from sqlalchemy.orm import Query, joinedload, selectinload, subqueryload, contains_eager, declared_attr, sessionmaker, scoped_session
+from sqlalchemy.orm import Query, joinedload, lazyload, selectinload, subqueryload, contains_eager, declared_attr, sessionmaker, scoped_session
 import sqlalchemy.orm
 from sqlalchemy.orm.attributes import get_history, instance_state
 from sqlalchemy.orm.collections import InstrumentedList
@@ -34,7 +34,7 @@ from sqlalchemy.types import Boolean, Integer, Float, Date, Numeric, DateTime, U
 from sqlmodel import SQLModel
 
 import uber
-from uber.config import c, create_namespace_uuid
+from uber.config import c, config_cache, create_namespace_uuid
 from uber.errors import HTTPRedirect
 from uber.decorators import presave_adjustment, suffix_property, cached_classproperty, classproperty
 from uber.models.types import Choice, MultiChoice, utcnow, UniqueList, DefaultField as Field
@@ -775,13 +775,15 @@ from uber.models.attraction import *  # noqa: F401,E402,F403
 from uber.models.tabletop import *  # noqa: F401,E402,F403
 from uber.models.guests import *  # noqa: F401,E402,F403
 from uber.models.art_show import *  # noqa: F401,E402,F403
+from uber.models.search import *  # noqa: F401,E402,F403
+from uber.models.guidebook import *  # noqa: F401,E402,F403
 
 # Explicitly import models used by the Session class to quiet flake8
 from uber.models.admin import AccessGroup, AdminAccount, WatchList, WorkstationAssignment  # noqa: E402
 from uber.models.art_show import ArtShowApplication, ArtShowBidder  # noqa: E402
 from uber.models.attendee import Attendee, AttendeeAccount  # noqa: E402
 from uber.models.badge_printing import PrintJob  # noqa: E402
-from uber.models.commerce import ModelReceipt  # noqa: E402
+from uber.models.commerce import ModelReceipt, receipt_balances  # noqa: E402
 from uber.models.department import Job, Shift, Department, DeptRole  # noqa: E402
 from uber.models.email import Email  # noqa: E402
 from uber.models.group import Group  # noqa: E402
@@ -791,7 +793,10 @@ from uber.models.mits import MITSApplicant, MITSTeam  # noqa: E402
 from uber.models.showcase import IndieJudge, IndieGame, IndieStudio  # noqa: E402
 from uber.models.panels import PanelApplication, PanelApplicant  # noqa: E402
 from uber.models.promo_code import PromoCode, PromoCodeGroup  # noqa: E402
-from uber.models.tracking import Tracking  # noqa: E402
+from uber.models.tracking import Tracking, tracking_writer  # noqa: E402
+from uber.models.counters import badge_counters  # noqa: E402
+from uber.models.search import attendee_search_index  # noqa: E402
+from uber.models.guidebook import guidebook_sync_state  # noqa: E402
 
 class UberSession(sqlalchemy.orm.Session):
     engine = engine
@@ -865,6 +870,13 @@ class UberSession(sqlalchemy.orm.Session):
             return self.filter(*filters)
 
     class SessionMixin:
+        def defer_email_checks(self, defer=True):
+            """
+            Checks the models this session saves for automated emails in a Celery task after it commits,
+            instead of right before it commits; for pages where saving needs to be fast.
+            """
+            self.info['defer_email_checks'] = defer
+
         def current_admin_account(self):
             if getattr(cherrypy, 'session', {}).get('account_id', getattr(cherrypy.request, 'admin_account', None)):
                 return self.admin_account(cherrypy.session.get('account_id', getattr(cherrypy.request, 'admin_account', None)))
@@ -1115,23 +1127,61 @@ class UberSession(sqlalchemy.orm.Session):
 
         def jobs_for_signups(self, id, all=False):
             jobs = self.volunteer_from_id(id).possible
-            restricted_minutes = set()
-            for job in jobs:
-                if job.required_roles:
-                    restricted_minutes.add(frozenset(job.minutes))
             if all:
                 return jobs
+
+            # Hide unrestricted jobs that exactly coincide with a restricted job the volunteer can take
+            restricted_spans = {(job.start_minute, job.end_minute) for job in jobs if job.required_roles}
             return [
                 job
-                for job in jobs if (job.required_roles or frozenset(job.minutes) not in restricted_minutes)]
+                for job in jobs if (job.required_roles or (job.start_minute, job.end_minute) not in restricted_spans)]
+
+        def possible_match_list(self, people=None):
+            """
+            Returns valid attendees keyed both by their match_email and by their match_name (see
+            Attendee.normalize_match_name). Pass a list of people (anything with a first_name, last_name,
+            and email) to only load the attendees who might match them.
+            """
+            attendees = self.valid_attendees()
+            if people is not None:
+                attendees = attendees.filter(or_(
+                    Attendee.match_email.in_(set(Attendee.normalize_match_email(p.email) for p in people)),
+                    Attendee.match_name.in_(set(Attendee.normalize_match_name(p.first_name, p.last_name)
+                                                for p in people))))
 
-        def possible_match_list(self):
             possibles = defaultdict(list)
-            for a in self.valid_attendees():
-                possibles[a.email.lower()].append(a)
-                possibles[a.first_name, a.last_name].append(a)
+            for a in attendees:
+                if a.match_email:
+                    possibles[a.match_email].append(a)
+                possibles[a.match_name].append(a)
             return possibles
 
+        def possible_matches(self, people):
+            """Returns the set of valid attendees with the same name or email as each person."""
+            people = list(people)
+            possibles = self.possible_match_list(people)
+            return {p: set(possibles[Attendee.normalize_match_email(p.email)] +
+                           possibles[Attendee.normalize_match_name(p.first_name, p.last_name)]) for p in people}
+
+        def duplicate_registrations(self, *filters):
+            """
+            Finds attendees matching `filters` who share both a match_name and a match_email with another
+            one. Returns a dictionary of lists of these attendees, ordered by when they registered and keyed
+            by (full name, email address).
+            """
+            duplicate_keys = self.query(Attendee.match_name, Attendee.match_email).outerjoin(Attendee.group).filter(
+                *filters).group_by(Attendee.match_name, Attendee.match_email).having(func.count(Attendee.id) > 1
+                                                                                      ).subquery()
+            attendees = self.query(Attendee).join(duplicate_keys, and_(
+                Attendee.match_name == duplicate_keys.c.match_name,
+                Attendee.match_email == duplicate_keys.c.match_email)).outerjoin(Attendee.group).filter(
+                *filters).options(contains_eager(Attendee.group)).order_by(Attendee.registered)
+
+            grouped = defaultdict(list)
+            for a in attendees:
+                grouped[a.match_name, a.match_email].append(a)
+            return {(dupes[0].full_name, dupes[0].email.lower()): dupes for dupes in grouped.values()}
+
         def guess_attendee_watchentry(self, attendee, active=True):
             """
             Finds all watchlist entries that match a given attendee.
@@ -1658,19 +1708,52 @@ class UberSession(sqlalchemy.orm.Session):
         
         def get_next_badge_num(self, badge_type):
             """
-            Returns the next open badge number for a given badge type.
+            Returns the next open badge number for a given badge type, taking it from any numbers this
+            session reserved with reserve_badge_nums first. See claim_badge_nums.
 
             Args:
                 badge_type: Which badge type to select an open badge number within.
 
+            """
+            reserved = self.info.get('reserved_badges', {}).get(badge_type)
+            if reserved:
+                return reserved.pop(0)
+
+            badges = self.claim_badge_nums(badge_type)
+            return badges[0] if badges else None
+
+        def claim_badge_nums(self, badge_type, count=1):
+            """
+            Returns up to `count` of the lowest open badge numbers for a given badge type.
+
+            The BadgeInfo rows are locked until this session's transaction ends, and rows that
+            another transaction has already locked are skipped rather than waited on, so concurrent
+            registrations each get different numbers without blocking each other. Numbers this
+            session has already claimed aren't returned again before it commits.
             """
             lower_bound, upper_bound = c.BADGE_RANGES[badge_type]
+            claimed = self.info.setdefault('claimed_badge_ids', set())
+
+            query = self.query(BadgeInfo).filter(BadgeInfo.attendee_id == None,  # noqa: E711
+                                                 BadgeInfo.ident >= lower_bound,
+                                                 BadgeInfo.ident <= upper_bound)
+            if claimed:
+                query = query.filter(BadgeInfo.id.notin_(claimed))
 
-            return self.query(BadgeInfo).filter(BadgeInfo.attendee_id == None,
-                                                BadgeInfo.ident >= lower_bound,
-                                                BadgeInfo.ident <= upper_bound
-                                                ).order_by(BadgeInfo.attendee_id).order_by(
-                                                    BadgeInfo.ident).limit(1).first()
+            badges = query.options(lazyload(BadgeInfo.attendee)).order_by(BadgeInfo.ident).limit(
+                count).with_for_update(skip_locked=True, of=BadgeInfo).all()
+            claimed.update(badge.id for badge in badges)
+            return badges
+
+        def reserve_badge_nums(self, badge_type, count):
+            """
+            Claims `count` badge numbers at once for attendees this session is about to add, e.g. in
+            an import, so that each one's get_next_badge_num doesn't need its own query. Returns how
+            many numbers were reserved, which may be fewer than `count` if the badge type is sold out.
+            """
+            reserved = self.info.setdefault('reserved_badges', defaultdict(list))[badge_type]
+            reserved.extend(self.claim_badge_nums(badge_type, count))
+            return len(reserved)
 
         def update_badge(self, attendee):
             """
@@ -1867,7 +1950,8 @@ class UberSession(sqlalchemy.orm.Session):
             id_search = None
 
             terms = text.split()
-            if len(terms) == 2:
+            use_search_index = attendee_search_index.enabled(self)
+            if len(terms) == 2 and not use_search_index:
                 first, last = terms
                 if first.endswith(','):
                     last, first = first.strip(','), last
@@ -1997,6 +2081,8 @@ class UberSession(sqlalchemy.orm.Session):
                             and_checks.append(attr_search_filter)
 
                         last_term = term
+            elif use_search_index:
+                return attendee_search_index.search(attendees, text), ''
             else:
                 or_checks.extend(check_text_fields(text))
 
@@ -2017,28 +2103,20 @@ class UberSession(sqlalchemy.orm.Session):
             has been either creating custom reports or making sysadmins cry. This is our
             quick-ish solution -- a way to filter attendees by any property. Because this is
             resource-intensive, it is locked behind the Devtools site section.
-            """
-            if "OR" in text:
-                return None, 'Sorry, property search does not currently support OR conditions.'
-            delimited_text = text.replace('AND', 'AND,')
-            list_of_attr_searches = delimited_text.split(',')
-
-            conditions_list = []
-            results = []
 
-            for search_text in list_of_attr_searches:
-                target, term, search_term, op = self.parse_attr_search_terms(search_text)
-                try:
-                    search_term = int(search_term)
-                except Exception:
-                    pass
-                conditions_list.append((target, search_term, op))
+            Conditions may be combined with AND and OR, e.g. "is_dept_head: True OR
+            staffing_or_will_be: True AND age_now_or_at_con: <18". For large databases, use
+            uber.property_search.PropertySearch to run the search in the background instead.
+            """
+            from uber.property_search import iter_property_search, parse_property_search
 
-            for attendee in self.valid_attendees():
-                if all([self.get_truth(getattr(attendee, target), op, search_term)
-                        for target, search_term, op in conditions_list]):
-                    results.append(attendee)
+            groups, error = parse_property_search(text)
+            if error:
+                return None, error
 
+            results = []
+            for checked, attendees in iter_property_search(self, groups):
+                results.extend(attendees)
             return results, ''
 
         def delete_from_group(self, attendee, group):
@@ -2066,6 +2144,7 @@ class UberSession(sqlalchemy.orm.Session):
             if int(new_badge_type) in c.PREASSIGNED_BADGE_TYPES and c.AFTER_PRINTED_BADGE_DEADLINE and diff > 0:
                 return 'Custom badges have already been ordered, so you will need to select a different badge type'
             elif diff > 0:
+                new_attendees = []
                 for i in range(diff):
                     new_attendee = Attendee(
                         badge_type=new_badge_type,
@@ -2073,6 +2152,12 @@ class UberSession(sqlalchemy.orm.Session):
                         paid=paid,
                         **extra_create_args)
                     group.attendees.append(new_attendee)
+                    new_attendees.append(new_attendee)
+
+                from uber.badge_funcs import needs_badge_num
+                needing_nums = [a for a in new_attendees if needs_badge_num(a)]
+                if len(needing_nums) > 1:
+                    self.reserve_badge_nums(needing_nums[0].badge_type_real, len(needing_nums))
 
             elif diff < 0:
                 if len(group.floating) < abs(diff):
@@ -2423,10 +2508,71 @@ def _track_changes(session, context, instances='deprecated'):
                 Tracking.track(session, action, instance)
 
 
+def _collect_counter_deltas(session, context):
+    badge_counters.collect(session)
+
+
+def _refresh_attendee_search(session, context):
+    attendee_search_index.refresh_flushed(session)
+
+
+def _record_guidebook_deletes(session, context):
+    guidebook_sync_state.record_deletes(session)
+
+
+def _refresh_receipt_balances(session, context):
+    receipt_balances.record_changes(session)
+
+
+def _apply_counter_deltas(session):
+    badge_counters.apply(session.info.pop('counter_deltas', {}))
+
+
+def _discard_counter_deltas(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('counter_deltas', None)
+
+
+def _collect_config_cache_tables(session, context):
+    session.info.setdefault('config_cache_tables', set()).update(config_cache.changed_tables(session))
+
+
+def _publish_config_cache_tables(session):
+    config_cache.publish(session.info.pop('config_cache_tables', set()))
+
+
+def _discard_config_cache_tables(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('config_cache_tables', None)
+
+
+def _discard_claimed_badges(session, transaction):
+    # Once the transaction ends, claimed badges are either assigned in the database or free again
+    if transaction.parent is None:
+        session.info.pop('claimed_badge_ids', None)
+        session.info.pop('reserved_badges', None)
+
+
+def _write_pending_tracking(session):
+    tracking_writer.enqueue(session.info.pop('pending_tracking', []))
+
+
+def _discard_pending_tracking(session, transaction):
+    # Tracking rows captured in a transaction that never committed describe changes that never happened
+    if transaction.parent is None:
+        session.info.pop('pending_tracking', None)
+
+
 def _check_emails(session, instances='deprecated'):
-    from uber.email import EmailService
+    from uber.email import EmailService, automated_email_index
     import traceback
 
+    if session.info.get('defer_email_checks', c.DEFER_EMAIL_CHECKS):
+        session.info.setdefault('deferred_email_checks', set()).update(
+            (model.__class__.__name__, model.id) for model in chain(session.dirty, session.new)
+            if automated_email_index.has_fixtures(model.__class__.__name__))
+        return
+
     for model in chain(session.dirty, session.new):
         try:
             EmailService.check_emails_for_model(session, model)
@@ -2435,13 +2581,42 @@ def _check_emails(session, instances='deprecated'):
             traceback.print_exc()
 
 
+def _queue_deferred_email_checks(session):
+    deferred = session.info.pop('deferred_email_checks', None)
+    if deferred:
+        from uber.tasks.email import check_emails_for_models
+        try:
+            check_emails_for_models.delay(sorted(deferred))
+        except Exception:
+            log.error("Could not queue email checks for {} model(s)".format(len(deferred)), exc_info=True)
+
+
+def _discard_deferred_email_checks(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('deferred_email_checks', None)
+
+
 def register_session_listeners():
     """
     The order in which we register these listeners matters.
     """
     listen(Session.session_factory, 'before_flush', _presave_adjustments)
     listen(Session.session_factory, 'after_flush', _track_changes)
+    listen(Session.session_factory, 'after_flush', _collect_counter_deltas)
+    listen(Session.session_factory, 'after_flush', _refresh_attendee_search)
+    listen(Session.session_factory, 'after_flush', _record_guidebook_deletes)
+    listen(Session.session_factory, 'after_flush', _refresh_receipt_balances)
+    listen(Session.session_factory, 'after_flush', _collect_config_cache_tables)
     listen(Session.session_factory, 'before_commit', _check_emails)
+    listen(Session.session_factory, 'after_commit', _write_pending_tracking)
+    listen(Session.session_factory, 'after_commit', _apply_counter_deltas)
+    listen(Session.session_factory, 'after_commit', _publish_config_cache_tables)
+    listen(Session.session_factory, 'after_commit', _queue_deferred_email_checks)
+    listen(Session.session_factory, 'after_transaction_end', _discard_pending_tracking)
+    listen(Session.session_factory, 'after_transaction_end', _discard_counter_deltas)
+    listen(Session.session_factory, 'after_transaction_end', _discard_config_cache_tables)
+    listen(Session.session_factory, 'after_transaction_end', _discard_deferred_email_checks)
+    listen(Session.session_factory, 'after_transaction_end', _discard_claimed_badges)
 
 
 def _track_collection_append(target, value, initiator):
@@ -24,7 +24,8 @@ from uber.models.group import Group
 from uber.models.types import default_relationship as relationship, Choice, DefaultColumn as Column, \
     MultiChoice, TakesPaymentMixin, DefaultField as Field, DefaultRelationship as Relationship
 from uber.utils import add_opt, get_age_from_birthday, get_age_conf_from_birthday, hour_day_format, \
-    localized_now, mask_string, normalize_email, normalize_email_legacy, remove_opt, RegistrationCode, listify, groupify
+    localized_now, mask_string, normalize_email, normalize_email_legacy, remove_opt, RegistrationCode, listify, groupify, \
+    ShiftIntervals
 
 log = logging.getLogger(__name__)
 
@@ -200,6 +201,7 @@ class BadgeInfo(MagModel, table=True):
 
 
 Index('ix_badge_info_attendee_id', BadgeInfo.attendee_id.desc())
+Index('ix_badge_info_unassigned_ident', BadgeInfo.ident, postgresql_where=BadgeInfo.attendee_id.is_(None))
 
 
 class Attendee(MagModel, TakesPaymentMixin, table=True):
@@ -258,6 +260,8 @@ class Attendee(MagModel, TakesPaymentMixin, table=True):
     last_name: str = ''
     legal_name: str = ''
     email: str = ''
+    match_name: str = ''
+    match_email: str = ''
     birthdate: date | None = None
     age_group: int | None = Field(sa_column=Column(Choice(c.AGE_GROUPS), nullable=True), default=c.AGE_UNKNOWN)
 
@@ -566,6 +570,8 @@ class Attendee(MagModel, TakesPaymentMixin, table=True):
     _attendee_table_args: ClassVar = [
         Index('ix_attendee_paid_group_id', 'paid', 'group_id'),
         Index('ix_attendee_badge_status_badge_type', 'badge_status', 'badge_type'),
+        Index('ix_attendee_match_name_match_email', 'match_name', 'match_email'),
+        Index('ix_attendee_match_email', 'match_email'),
     ]
 
     __table_args__: ClassVar = tuple(_attendee_table_args)
@@ -615,6 +621,24 @@ class Attendee(MagModel, TakesPaymentMixin, table=True):
         if self.group and not getattr(self, 'is_group_save', False):
             self.group.presave_adjustments()
 
+    @presave_adjustment
+    def _match_key_adjustments(self):
+        self.match_name = self.normalize_match_name(self.first_name, self.last_name)
+        self.match_email = self.normalize_match_email(self.email)
+
+    @staticmethod
+    def normalize_match_name(first_name, last_name):
+        """
+        The name we compare when looking for attendees who might be the same person, which is kept
+        in match_name. This ignores case and extra whitespace.
+        """
+        return ' '.join('{} {}'.format(first_name or '', last_name or '').lower().split())
+
+    @staticmethod
+    def normalize_match_email(email):
+        """Like normalize_match_name, for email addresses; kept in match_email."""
+        return (email or '').strip().lower()
+
     @presave_adjustment
     def _status_adjustments(self):
         from uber.email import EmailService
@@ -1209,12 +1233,13 @@ class Attendee(MagModel, TakesPaymentMixin, table=True):
 
     @amount_paid.expression
     def amount_paid(cls):
-        from uber.models import ModelReceipt
+        from uber.models import ModelReceipt, receipt_balance
 
-        return select(ModelReceipt.payment_total_sql).outerjoin(ModelReceipt.receipt_txns).where(
-            and_(ModelReceipt.owner_id == cls.id,
-                 ModelReceipt.owner_model == "Attendee",
-                 ModelReceipt.closed == None)).label('amount_paid')  # noqa: E711
+        return select(func.coalesce(func.sum(receipt_balance.c.payment_total), 0)).join(
+            ModelReceipt, ModelReceipt.id == receipt_balance.c.receipt_id).where(
+                and_(receipt_balance.c.owner_id == cls.id,
+                     receipt_balance.c.owner_model == "Attendee",
+                     ModelReceipt.closed == None)).label('amount_paid')  # noqa: E711
 
     @hybrid_property
     def amount_refunded(self):
@@ -1222,11 +1247,11 @@ class Attendee(MagModel, TakesPaymentMixin, table=True):
 
     @amount_refunded.expression
     def amount_refunded(cls):
-        from uber.models import ModelReceipt
+        from uber.models import receipt_balance
 
-        return select(ModelReceipt.refund_total_sql).outerjoin(ModelReceipt.receipt_txns).where(
-            and_(ModelReceipt.owner_id == cls.id,
-                 ModelReceipt.owner_model == "Attendee")).label('amount_refunded')
+        return select(func.coalesce(func.sum(receipt_balance.c.refund_total), 0)).where(
+            and_(receipt_balance.c.owner_id == cls.id,
+                 receipt_balance.c.owner_model == "Attendee")).label('amount_refunded')
 
     @property
     def amount_unpaid(self):
@@ -1941,6 +1966,10 @@ class Attendee(MagModel, TakesPaymentMixin, table=True):
             all_minutes.update(shift.job.minutes)
         return all_minutes
 
+    @cached_property
+    def shift_intervals(self):
+        return ShiftIntervals.from_shifts(self.shifts)
+
     @cached_property
     def shift_minute_map(self):
         all_minutes = {}
@@ -1,12 +1,16 @@
 from datetime import datetime
+from itertools import chain
 import stripe
 import logging
 
 from pytz import UTC
-from sqlalchemy import func, or_
+from sqlalchemy import and_, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.schema import ForeignKey, Index, Table
 
 from sqlalchemy.sql.functions import coalesce
-from sqlalchemy.types import DateTime, Uuid, JSON
+from sqlalchemy.types import DateTime, Integer, Unicode, Uuid, JSON
 from sqlalchemy.dialects.postgresql.json import JSONB
 from sqlalchemy.ext.mutable import MutableDict
 from typing import Any, ClassVar
@@ -25,7 +29,8 @@ log = logging.getLogger(__name__)
 
 __all__ = [
     'ArbitraryCharge', 'MerchDiscount', 'MerchPickup', 'ModelReceipt', 'MPointsForCash', 'ReceiptDiscount',
-    'NoShirt', 'OldMPointExchange', 'ReceiptInfo', 'ReceiptItem', 'ReceiptTransaction', 'Sale', 'TerminalSettlement']
+    'NoShirt', 'OldMPointExchange', 'ReceiptInfo', 'ReceiptItem', 'ReceiptTransaction', 'Sale', 'TerminalSettlement',
+    'payment_event', 'payment_event_cursor', 'receipt_balance', 'receipt_balances']
 
 
 class ArbitraryCharge(MagModel, table=True):
@@ -563,6 +568,11 @@ class ReceiptTransaction(MagModel, table=True):
             return "You cannot delete Stripe transactions."
 
 
+# Payment events are matched to the transactions still waiting on their intents
+Index('ix_receipt_transaction_pending_intent_id', ReceiptTransaction.intent_id,
+      postgresql_where=and_(ReceiptTransaction.charge_id == '', ReceiptTransaction.intent_id != ''))
+
+
 class ReceiptDiscount(MagModel, table=True):
     # A special type of receipt item for Attendee receipts that is calculated based on the current state of the attendee
     # Prevents cases where a discount (especially a percentage discount) becomes incorrect due to changes on the attendee,
@@ -933,3 +943,158 @@ class TerminalSettlement(MagModel, table=True):
     terminal_id: str = ''
     response: dict[str, Any] = Field(sa_type=MutableDict.as_mutable(JSONB), default_factory=dict)
     error: str = ''
+
+
+# One row per receipt with the totals that ModelReceipt calculates from its items, transactions, and
+# discounts, kept up to date in the same transaction as any change to them. This lets reports filter
+# and sum receipts by balance without grouping every item and transaction.
+receipt_balance = Table(
+    'receipt_balance',
+    MagModel.metadata,
+    Column('receipt_id', Uuid(as_uuid=False), ForeignKey('model_receipt.id', ondelete='CASCADE'), primary_key=True),
+    Column('owner_id', Uuid(as_uuid=False), index=True),
+    Column('owner_model', Unicode()),
+    Column('item_total', Integer()),
+    Column('fkless_item_total', Integer()),
+    Column('discount_total', Integer()),
+    Column('payment_total', Integer()),
+    Column('refund_total', Integer()),
+    Column('balance', Integer()),
+    Column('updated', DateTime(timezone=True)),
+)
+
+Index('ix_receipt_balance_owner_model_balance', receipt_balance.c.owner_model, receipt_balance.c.balance)
+
+
+class ReceiptBalances:
+    """
+    Maintains the receipt_balance table. Rows are recalculated from scratch in SQL, using the same
+    expressions as ModelReceipt's *_total_sql properties, for every receipt whose items, transactions,
+    or discounts were flushed. `reconcile` fixes any rows that drifted anyway, e.g. after bulk updates.
+    """
+    totals = ['item_total', 'fkless_item_total', 'discount_total', 'payment_total', 'refund_total', 'balance']
+    receipt_children = (ReceiptItem, ReceiptTransaction, ReceiptDiscount)
+
+    @staticmethod
+    def calculated(*filters):
+        """Returns a select of what each receipt_balance row should be for receipts matching `filters`."""
+        def receipt_sum(total_sql, model):
+            return select(total_sql).where(model.receipt_id == ModelReceipt.id).scalar_subquery()
+
+        sums = select(
+            ModelReceipt.id.label('receipt_id'),
+            ModelReceipt.owner_id,
+            ModelReceipt.owner_model,
+            receipt_sum(ModelReceipt.item_total_sql, ReceiptItem).label('item_total'),
+            receipt_sum(ModelReceipt.fkless_item_total_sql, ReceiptItem).label('fkless_item_total'),
+            receipt_sum(ModelReceipt.discount_total_sql, ReceiptDiscount).label('discount_total'),
+            receipt_sum(ModelReceipt.payment_total_sql, ReceiptTransaction).label('payment_total'),
+            receipt_sum(ModelReceipt.refund_total_sql, ReceiptTransaction).label('refund_total'),
+        ).where(*filters).subquery()
+
+        return select(
+            sums,
+            (sums.c.item_total - sums.c.discount_total - sums.c.payment_total + sums.c.refund_total).label('balance'),
+            literal(datetime.now(UTC), DateTime(timezone=True)).label('updated'))
+
+    def refresh(self, connection, receipt_ids):
+        if not receipt_ids:
+            return
+        receipt_ids = sorted(receipt_ids)
+
+        # Two transactions adding to the same receipt at once (e.g., a payment webhook and a cashier)
+        # would each recalculate it from their own snapshot, and whichever upserted last would drop
+        # the other's changes. Locking the receipts first makes the second transaction wait for the
+        # first to commit, and with Postgres' default READ COMMITTED isolation its next statement then
+        # sees both. We lock in ID order so that two refreshes can't deadlock.
+        #
+        # This runs after the flush, when each transaction's new items and payments already hold a
+        # KEY SHARE lock on their receipt through the foreign key. A plain FOR UPDATE would conflict
+        # with the other transaction's KEY SHARE and deadlock, so we take FOR NO KEY UPDATE, which
+        # only conflicts with itself.
+        connection.execute(select(ModelReceipt.id).where(ModelReceipt.id.in_(receipt_ids))
+                           .order_by(ModelReceipt.id).with_for_update(key_share=True))
+
+        columns = [column.name for column in receipt_balance.columns]
+        insert = postgresql_insert(receipt_balance).from_select(
+            columns, self.calculated(ModelReceipt.id.in_(receipt_ids)))
+        connection.execute(insert.on_conflict_do_update(
+            index_elements=['receipt_id'], set_={name: insert.excluded[name] for name in columns[1:]}))
+
+    def changed_receipt_ids(self, session):
+        """Called after a flush; returns the IDs of receipts whose totals may have changed."""
+        receipt_ids = set()
+        for instance in chain(session.new, session.dirty, session.deleted):
+            if isinstance(instance, self.receipt_children):
+                history = get_history(instance, 'receipt_id')
+                receipt_ids.update(history.sum())
+            elif isinstance(instance, ModelReceipt) and instance not in session.deleted:
+                receipt_ids.add(instance.id)
+        receipt_ids.discard(None)
+        return receipt_ids
+
+    def record_changes(self, session):
+        self.refresh(session.connection(), self.changed_receipt_ids(session))
+
+    def reconcile(self, session):
+        """
+        Recalculates every receipt's totals and fixes any receipt_balance rows that are missing or
+        don't match. Returns the IDs of the receipts that were fixed.
+        """
+        calculated = self.calculated().subquery()
+        stale = select(calculated.c.receipt_id).outerjoin(
+            receipt_balance, receipt_balance.c.receipt_id == calculated.c.receipt_id
+        ).where(or_(receipt_balance.c.receipt_id == None,  # noqa: E711
+                    receipt_balance.c.owner_id != calculated.c.owner_id,
+                    *[receipt_balance.c[name] != calculated.c[name] for name in self.totals]))
+
+        receipt_ids = session.execute(stale).scalars().all()
+        for start in range(0, len(receipt_ids), 1000):
+            self.refresh(session.connection(), receipt_ids[start:start + 1000])
+        if receipt_ids:
+            log.warning(f"Fixed the balances of {len(receipt_ids)} receipt(s) that were out of date.")
+        return receipt_ids
+
+    @staticmethod
+    def owner_totals(session):
+        """
+        Returns a subquery of each receipt owner's totals across all of their receipts, with the same
+        columns as receipt_balance (minus receipt_id), to join on owner_id.
+        """
+        return session.query(receipt_balance.c.owner_id, *[
+            func.sum(receipt_balance.c[name]).label(name) for name in ReceiptBalances.totals
+        ]).group_by(receipt_balance.c.owner_id).subquery()
+
+
+receipt_balances = ReceiptBalances()
+
+
+# One row per event a payment processor has told us about, whether through a webhook or by polling its
+# event list, keyed by the processor's own event ID so that hearing about an event twice is harmless.
+# `processed` is set once the event has been reconciled against our receipts, with `result` saying how.
+payment_event = Table(
+    'payment_event',
+    MagModel.metadata,
+    Column('processor', Unicode(), primary_key=True),
+    Column('event_id', Unicode(), primary_key=True),
+    Column('event_type', Unicode()),
+    Column('intent_id', Unicode(), index=True),
+    Column('charge_id', Unicode()),
+    Column('status', Unicode()),
+    Column('created', DateTime(timezone=True)),
+    Column('received', DateTime(timezone=True)),
+    Column('processed', DateTime(timezone=True), nullable=True, default=None),
+    Column('result', Unicode(), nullable=True, default=None),
+)
+
+Index('ix_payment_event_unprocessed', payment_event.c.processor, payment_event.c.created,
+      postgresql_where=payment_event.c.processed.is_(None))
+
+# Where each processor's catch-up poller left off in its event list
+payment_event_cursor = Table(
+    'payment_event_cursor',
+    MagModel.metadata,
+    Column('processor', Unicode(), primary_key=True),
+    Column('cursor', Unicode()),
+    Column('updated', DateTime(timezone=True)),
+)
@@ -0,0 +1,213 @@
+import logging
+from collections import Counter
+from datetime import datetime
+
+from pytz import UTC
+from sqlalchemy import func
+from sqlalchemy.orm.attributes import get_history
+
+from uber.config import c
+
+log = logging.getLogger(__name__)
+
+
+class BadgeCounters:
+    """
+    Keeps the attendee counts behind our badge caps and stock limits in a Redis hash, so
+    that c.ATTENDEE_BADGE_COUNT, c.SHIRT_AVAILABLE and friends don't need a COUNT(*) over
+    the attendee table on every prereg page load.
+
+    Every counter is a field in the hash, e.g., "badge_type:<badge type>", "kickin:<amount
+    extra>" or "shirt:<shirt size>". As attendees are flushed we work out how much each one
+    contributed to each counter before and after the flush, and once the transaction commits
+    we apply the differences with HINCRBY. `reconcile` recounts everything from the database
+    and overwrites the hash; it runs periodically as a Celery task to correct any drift.
+
+    Until the first reconcile, or if Redis isn't reachable, `get` returns None and callers
+    fall back to counting in the database.
+    """
+    key = 'badge_counters'
+    columns = ['badge_type', 'badge_status', 'paid', 'amount_extra', 'shirt', 'num_event_shirts', 'ribbon']
+
+    @property
+    def redis_key(self):
+        return c.REDIS_PREFIX + self.key
+
+    @staticmethod
+    def _has_badge(badge_status):
+        # Mirrors the Attendee.has_badge hybrid property
+        return badge_status not in [c.PENDING_STATUS, c.INVALID_STATUS, c.IMPORTED_STATUS, c.INVALID_GROUP_STATUS,
+                                    c.REFUNDED_STATUS, c.NOT_ATTENDING, c.UNAPPROVED_DEALER_STATUS, c.DEFERRED_STATUS]
+
+    @staticmethod
+    def _counts_for_stock(badge_status):
+        return badge_status not in [c.INVALID_GROUP_STATUS, c.INVALID_STATUS, c.IMPORTED_STATUS, c.REFUNDED_STATUS]
+
+    @classmethod
+    def contributions(cls, values):
+        """
+        Given a dictionary of an attendee's column values, returns how much that attendee
+        adds to each counter. This must agree with the queries in `recount`.
+        """
+        counts = Counter()
+        if not values:
+            return counts
+
+        status = values['badge_status']
+        has_badge = cls._has_badge(status)
+        if has_badge and values['paid'] != c.NOT_PAID:
+            counts[f"badge_type:{values['badge_type']}"] += 1
+
+        if has_badge and status == c.COMPLETED_STATUS and values['paid'] in [c.HAS_PAID, c.REFUNDED]:
+            counts['sold:individual'] += 1
+
+        if cls._counts_for_stock(status):
+            amount_extra = values['amount_extra'] or 0
+            counts[f'kickin:{amount_extra}'] += 1
+
+            shirts = 0
+            if amount_extra >= c.SHIRT_LEVEL:
+                shirts += 1
+            if c.SHIRTS_PER_STAFFER > 0 and values['badge_type'] == c.STAFF_BADGE \
+                    and values['num_event_shirts'] not in [None, -1]:
+                shirts += values['num_event_shirts']
+            if c.HOURS_FOR_SHIRT and str(c.VOLUNTEER_RIBBON) in (values['ribbon'] or ''):
+                shirts += 1
+            if shirts:
+                counts[f"shirt:{values['shirt']}"] += shirts
+
+        return counts
+
+    @classmethod
+    def _values(cls, instance, original=False):
+        values = {}
+        for name in cls.columns:
+            if not original:
+                values[name] = getattr(instance, name)
+                continue
+
+            history = get_history(instance, name)
+            if history.deleted or history.unchanged:
+                values[name] = (history.deleted or history.unchanged)[0]
+            elif history.added:
+                # The attribute was set without ever being loaded, so we don't know what it was
+                return None
+            else:
+                values[name] = getattr(instance, name)
+        return values
+
+    def collect(self, session):
+        """
+        Called after a flush; adds the counter changes caused by flushed attendees to the
+        session, to be applied if and when the transaction commits.
+        """
+        from uber.models import Attendee
+
+        if not c.REDIS_BADGE_COUNTERS:
+            return
+
+        deltas = session.info.setdefault('counter_deltas', Counter())
+        for instances, before, after in [(session.new, False, True),
+                                         (session.dirty, True, True),
+                                         (session.deleted, True, False)]:
+            for instance in instances:
+                if not isinstance(instance, Attendee):
+                    continue
+
+                old_values = self._values(instance, original=True) if before else {}
+                if old_values is None:
+                    log.debug(f"Couldn't tell how {instance} changed; its counts will be fixed by the next reconcile.")
+                    continue
+                deltas.update(self.contributions(self._values(instance) if after else {}))
+                deltas.subtract(self.contributions(old_values))
+
+    def apply(self, deltas):
+        deltas = {field: amount for field, amount in deltas.items() if amount}
+        if not deltas:
+            return
+
+        try:
+            pipeline = c.REDIS_STORE.pipeline()
+            for field, amount in deltas.items():
+                pipeline.hincrby(self.redis_key, field, amount)
+            pipeline.execute()
+        except Exception:
+            log.warning("Could not update badge counters in Redis; they will be fixed by the next reconcile.",
+                        exc_info=True)
+
+    def get(self, *fields):
+        """
+        Returns a list with the current value of each counter, or None if the counters
+        haven't been reconciled yet, are disabled, or can't be read.
+        """
+        if not c.REDIS_BADGE_COUNTERS:
+            return None
+
+        try:
+            reconciled_at, *values = c.REDIS_STORE.hmget(self.redis_key, 'reconciled_at', *fields)
+        except Exception:
+            log.warning("Could not read badge counters from Redis; counting in the database instead.",
+                        exc_info=True)
+            return None
+
+        if not reconciled_at:
+            return None
+        return [int(value or 0) for value in values]
+
+    def recount(self, session):
+        """
+        Counts everything from scratch in the database, returning a dictionary of counters.
+        """
+        from uber.models import Attendee, Group, PromoCode, PromoCodeGroup
+
+        counts = Counter()
+        attendees = session.query(Attendee)
+
+        for badge_type, count in session.query(Attendee.badge_type, func.count(Attendee.id)).filter(
+                Attendee.paid != c.NOT_PAID, Attendee.has_badge == True  # noqa: E712
+                ).group_by(Attendee.badge_type):
+            counts[f'badge_type:{badge_type}'] = count
+
+        counts['sold:individual'] = attendees.filter(
+            Attendee.has_badge == True,  # noqa: E712
+            Attendee.paid.in_([c.HAS_PAID, c.REFUNDED]),
+            Attendee.badge_status == c.COMPLETED_STATUS).count()
+
+        stock_filter = ~Attendee.badge_status.in_([c.INVALID_GROUP_STATUS, c.INVALID_STATUS,
+                                                   c.IMPORTED_STATUS, c.REFUNDED_STATUS])
+        for amount_extra, count in session.query(Attendee.amount_extra, func.count(Attendee.id)).filter(
+                stock_filter).group_by(Attendee.amount_extra):
+            counts[f'kickin:{amount_extra or 0}'] += count
+
+        shirt_queries = [session.query(Attendee.shirt, func.count(Attendee.id)).filter(
+            stock_filter, Attendee.amount_extra >= c.SHIRT_LEVEL)]
+        if c.SHIRTS_PER_STAFFER > 0:
+            shirt_queries.append(session.query(Attendee.shirt, func.sum(Attendee.num_event_shirts)).filter(
+                stock_filter, Attendee.badge_type == c.STAFF_BADGE, Attendee.num_event_shirts != -1))
+        if c.HOURS_FOR_SHIRT:
+            shirt_queries.append(session.query(Attendee.shirt, func.count(Attendee.id)).filter(
+                stock_filter, Attendee.ribbon.contains(c.VOLUNTEER_RIBBON)))
+        for query in shirt_queries:
+            for shirt, count in query.group_by(Attendee.shirt):
+                counts[f'shirt:{shirt}'] += int(count or 0)
+
+        # These depend on groups and promo code groups rather than individual attendees,
+        # so they're only refreshed here rather than kept up to date as attendees change
+        counts['sold:group'] = attendees.join(Attendee.group).filter(
+            Attendee.has_badge == True,  # noqa: E712
+            Attendee.paid == c.PAID_BY_GROUP,
+            Group.amount_paid > 0).count()
+        counts['sold:promo_code'] = session.query(PromoCode).join(PromoCodeGroup).filter(PromoCode.cost > 0).count()
+
+        return counts
+
+    def reconcile(self, session):
+        counts = self.recount(session)
+        pipeline = c.REDIS_STORE.pipeline(transaction=True)
+        pipeline.delete(self.redis_key)
+        pipeline.hset(self.redis_key, mapping=dict(counts, reconciled_at=datetime.now(UTC).isoformat()))
+        pipeline.execute()
+        return counts
+
+
+badge_counters = BadgeCounters()
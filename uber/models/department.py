@@ -11,7 +11,7 @@ from typing import ClassVar
 from uber.config import c
 from uber.custom_tags import readable_join
 from uber.decorators import presave_adjustment, cached_property, classproperty
-from uber.utils import groupify
+from uber.utils import epoch_minute, groupify
 from uber.models import MagModel
 from uber.models.attendee import Attendee
 from uber.models.types import (default_relationship as relationship, Choice, DefaultColumn as Column, MultiChoice,
@@ -528,6 +528,14 @@ class Job(MagModel, table=True):
     def end_time(cls):
         return cls.start_time + (cls.duration * text("interval '1 minute'"))
 
+    @property
+    def start_minute(self):
+        return epoch_minute(self.start_time)
+
+    @property
+    def end_minute(self):
+        return self.start_minute + int(self.duration)
+
     def working_limit_ok(self, attendee):
         """
         Prevent signing up for too many shifts in a row. `minutes_worked` is the
@@ -540,43 +548,49 @@ class Job(MagModel, table=True):
         block the signup.
         """
 
-        attendee_minute_map = attendee.shift_minute_map
+        intervals = attendee.shift_intervals
+        start, end = self.start_minute, self.end_minute
         minutes_worked = self.duration
         working_minutes_limit = self.max_consecutive_minutes
         if working_minutes_limit == 0:
             working_minutes_limit = 60000  # just default to something large
 
+        neighbors = []
+
         # count the number of filled minutes before this shift
-        current_shift_minute = self.start_time - timedelta(minutes=1)
-        while current_shift_minute in attendee_minute_map:
-            minutes_worked += 1
-            this_job_minute_limit = attendee_minute_map[current_shift_minute].max_consecutive_minutes
-            if this_job_minute_limit > 0:
-                working_minutes_limit = min(working_minutes_limit, this_job_minute_limit)
-            current_shift_minute = current_shift_minute - timedelta(minutes=1)
+        block_before = intervals.block_at(start - 1)
+        if block_before:
+            minutes_worked += start - block_before[0]
+            neighbors.extend(intervals.jobs_between(block_before[0], start))
 
         # count the number of filled minutes after this shift
-        current_shift_minute = self.start_time + timedelta(minutes=self.duration)
-        while current_shift_minute in attendee_minute_map:
-            minutes_worked += 1
-            this_job_minute_limit = attendee_minute_map[current_shift_minute].max_consecutive_minutes
-            if this_job_minute_limit > 0:
-                working_minutes_limit = min(working_minutes_limit, this_job_minute_limit)
-            current_shift_minute = current_shift_minute + timedelta(minutes=1)
+        block_after = intervals.block_at(end)
+        if block_after:
+            minutes_worked += block_after[1] - end
+            neighbors.extend(intervals.jobs_between(end, block_after[1]))
+
+        for job in neighbors:
+            if job.max_consecutive_minutes > 0:
+                working_minutes_limit = min(working_minutes_limit, job.max_consecutive_minutes)
 
         return minutes_worked <= working_minutes_limit
 
     def no_overlap(self, attendee):
-        before = self.start_time - timedelta(minutes=1)
-        after = self.start_time + timedelta(minutes=self.duration)
-        return not self.minutes.intersection(attendee.shift_minutes) and (
-            before not in attendee.shift_minute_map
-            or not attendee.shift_minute_map[before].extra15
-            or self.department_id == attendee.shift_minute_map[before].department_id
+        intervals = attendee.shift_intervals
+        start, end = self.start_minute, self.end_minute
+        if intervals.overlaps(start, end):
+            return False
+
+        before = intervals.job_at(start - 1)
+        after = intervals.job_at(end)
+        return (
+            not before
+            or not before.extra15
+            or self.department_id == before.department_id
         ) and (
-            after not in attendee.shift_minute_map
+            not after
             or not self.extra15
-            or self.department_id == attendee.shift_minute_map[after].department_id
+            or self.department_id == after.department_id
         )
 
     @hybrid_property
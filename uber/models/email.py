@@ -7,7 +7,7 @@ from datetime import datetime, timedelta
 from dateutil import parser as dateparser
 
 from pytz import UTC
-from sqlalchemy import func, or_, select, update
+from sqlalchemy import func, or_, select, update, Index
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.types import Uuid, DateTime, JSON
@@ -264,7 +264,8 @@ class AutomatedEmail(MagModel, BaseEmailMixin, table=True):
 
     def render_template(self, text, data):
         with request_cached_context(clear_cache_on_start=True):
-            return JinjaEnv.env().from_string(text).render(data)
+            env = JinjaEnv.env()
+            return env.render_layered(env.cached_from_string(text), data)
 
     def would_send_if_approved(self, model_instance):
         return model_instance and getattr(model_instance, 'email_to_address', False) and self.filter(model_instance)
@@ -285,6 +286,10 @@ class Email(MagModel, BaseEmailMixin, table=True):
     sent: str | None = Field(sa_type=DateTime(timezone=True), nullable=True, default=None)
     error: str = ''
 
+    __table_args__: ClassVar = (
+        Index('ix_email_fk_id_ident', 'fk_id', 'ident'),
+    )
+
     @cached_property
     def fk(self):
         return self.session.get(self.model_class, self.fk_id) \
@@ -323,9 +328,13 @@ class Email(MagModel, BaseEmailMixin, table=True):
     
     @property
     def new_send_after(self):
+        return self.next_send_after(self.automated_email, self.send_after)
+
+    @staticmethod
+    def next_send_after(automated_email, send_after=None):
         five_minute_delay = datetime.now(pytz.UTC) + timedelta(seconds=300)
-        if self.automated_email.active_after and self.automated_email.active_after > five_minute_delay:
-            return self.automated_email.active_after
+        if automated_email.active_after and automated_email.active_after > five_minute_delay:
+            return automated_email.active_after
         
-        if not self.send_after or self.send_after < five_minute_delay:
+        if not send_after or send_after < five_minute_delay:
             return five_minute_delay
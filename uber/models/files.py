@@ -38,6 +38,7 @@ class File(MagModel, table=True):
     extension: str = ''  # Used in exports since we do not use the original filename
     filepath: str = ''
     download_url: str = ''  # Not used for server files
+    content_hash: str = Field(default='', index=True)  # SHA-256 of the file, used to cache image previews
     flags: dict[str, bool] = Field(sa_type=MutableDict.as_mutable(JSONB), default_factory=dict)
 
     @property
@@ -55,19 +56,24 @@ class File(MagModel, table=True):
         return Markup(
             f"""<a href="{self.url}" target="_blank">{self.filename}</a>""")
     
+    @property
+    def preview_url(self):
+        # Including the content hash lets browsers cache the preview until the file changes
+        return f"{self.url}&preview=True" + (f"&version={self.content_hash}" if self.content_hash else '')
+
     @property
     def preview_image(self):
         if not self.filename:
             return ''
         return Markup(
-            f"""<a href="{self.url}" target="_blank"><img class="img-fluid" src="{self.url}&preview=True" /></a>""")
+            f"""<a href="{self.url}" target="_blank"><img class="img-fluid" src="{self.preview_url}" /></a>""")
 
     @property
     def preview_image_with_filename(self):
         if not self.filename:
             return ''
         return Markup(
-            f"""<a href="{self.url}" target="_blank"><img class="img-fluid" src="{self.url}&preview=True" /><br/>{self.filename}</a>""")
+            f"""<a href="{self.url}" target="_blank"><img class="img-fluid" src="{self.preview_url}" /><br/>{self.filename}</a>""")
     
     @property
     def delete_button(self):
@@ -396,12 +396,13 @@ class Group(MagModel, TakesPaymentMixin, table=True):
 
     @amount_paid.expression
     def amount_paid(cls):
-        from uber.models import ModelReceipt
+        from uber.models import ModelReceipt, receipt_balance
 
-        return select(ModelReceipt.payment_total_sql).outerjoin(ModelReceipt.receipt_txns
-                      ).where(and_(ModelReceipt.owner_id == cls.id,
-                                   ModelReceipt.owner_model == "Group",
-                                   ModelReceipt.closed == None)).label('amount_paid')  # noqa: E711
+        return select(func.coalesce(func.sum(receipt_balance.c.payment_total), 0)).join(
+            ModelReceipt, ModelReceipt.id == receipt_balance.c.receipt_id).where(
+                and_(receipt_balance.c.owner_id == cls.id,
+                     receipt_balance.c.owner_model == "Group",
+                     ModelReceipt.closed == None)).label('amount_paid')  # noqa: E711
 
     @hybrid_property
     def amount_refunded(self):
@@ -409,11 +410,11 @@ class Group(MagModel, TakesPaymentMixin, table=True):
 
     @amount_refunded.expression
     def amount_refunded(cls):
-        from uber.models import ModelReceipt
+        from uber.models import receipt_balance
 
-        return select(ModelReceipt.refund_total_sql).outerjoin(ModelReceipt.receipt_txns
-                      ).where(and_(ModelReceipt.owner_id == cls.id,
-                                   ModelReceipt.owner_model == "Group")).label('amount_refunded')
+        return select(func.coalesce(func.sum(receipt_balance.c.refund_total), 0)).where(
+            and_(receipt_balance.c.owner_id == cls.id,
+                 receipt_balance.c.owner_model == "Group")).label('amount_refunded')
 
     @property
     def dealer_max_badges(self):
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+from pytz import UTC
+from sqlalchemy import and_, exists, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.schema import Index, Table
+from sqlalchemy.types import DateTime, Unicode, Uuid
+
+from uber.config import c
+from uber.models import MagModel
+from uber.models.types import DefaultColumn as Column
+
+log = logging.getLogger(__name__)
+
+__all__ = ['guidebook_sync', 'guidebook_sync_state']
+
+
+# One row per item we've exported to Guidebook: which Guidebook list it's in, what it was called,
+# a hash of the data we exported and when, and when it was deleted here, if it has been. The
+# rows outlive their items so that we can tell Guidebook admins what to remove.
+guidebook_sync = Table(
+    'guidebook_sync',
+    MagModel.metadata,
+    Column('fk_id', Uuid(as_uuid=False), primary_key=True),
+    Column('model', Unicode()),
+    Column('name', Unicode()),
+    Column('data_hash', Unicode()),
+    Column('synced', DateTime(timezone=True)),
+    Column('deleted', DateTime(timezone=True), nullable=True, default=None),
+)
+
+Index('ix_guidebook_sync_deleted', guidebook_sync.c.deleted, postgresql_where=guidebook_sync.c.deleted.isnot(None))
+
+
+class GuidebookSyncState:
+    """
+    Reads and writes the guidebook_sync table. Models are keyed the same way as
+    c.GUIDEBOOK_MODELS (e.g. "GuestGroup_band"), with "schedule" for events.
+    """
+    @staticmethod
+    def data_hash(data):
+        return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def item_name(model_key, data):
+        if model_key != 'schedule':
+            return data.get('guidebook_name') or data.get('name') or '???'
+
+        start_day = datetime.strptime(data['start_date'], '%m/%d/%Y').strftime('%A (%-m/%-d/%Y)')
+        end_day = datetime.strptime(data['end_date'], '%m/%d/%Y').strftime('%A (%-m/%-d/%Y)')
+        if start_day != end_day:
+            return f"{data['name']} on {start_day} {data['start_time']} to {end_day} {data['end_time']}"
+        return f"{data['name']} on {start_day} {data['start_time']} to {data['end_time']}"
+
+    @staticmethod
+    def model_label(model_key):
+        return 'Schedule Item' if model_key == 'schedule' else dict(c.GUIDEBOOK_MODELS).get(model_key, model_key)
+
+    @staticmethod
+    def synced_model_names():
+        return {key.split('_')[0] for key, label in c.GUIDEBOOK_MODELS} | {'Event'}
+
+    @classmethod
+    def row(cls, model_key, instance, data, sync_time):
+        return {
+            'fk_id': instance.id,
+            'model': model_key,
+            'name': cls.item_name(model_key, data),
+            'data_hash': cls.data_hash(data),
+            'synced': sync_time,
+            'deleted': None,
+        }
+
+    def mark_synced(self, session, model_key, instances, sync_time):
+        """Records that we exported each instance's current guidebook_data at sync_time."""
+        rows = [self.row(model_key, instance, instance.guidebook_data, sync_time) for instance in instances]
+        self.mark_synced_rows(session, rows)
+
+    def mark_synced_rows(self, session, rows):
+        if not rows:
+            return
+        insert = postgresql_insert(guidebook_sync).values(rows)
+        session.execute(insert.on_conflict_do_update(
+            index_elements=['fk_id'],
+            set_={key: insert.excluded[key] for key in ['model', 'name', 'data_hash', 'synced', 'deleted']}))
+
+    @staticmethod
+    def never_synced(model_cls):
+        return ~exists().where(guidebook_sync.c.fk_id == model_cls.id)
+
+    @staticmethod
+    def updated_since_sync(model_cls):
+        return exists().where(guidebook_sync.c.fk_id == model_cls.id, guidebook_sync.c.synced < model_cls.last_updated)
+
+    @staticmethod
+    def sync_rows(session, fk_ids):
+        """Returns a dictionary of each id in fk_ids that has been synced to its guidebook_sync row."""
+        if not fk_ids:
+            return {}
+        return {row.fk_id: row for row in session.execute(
+            select(guidebook_sync).where(guidebook_sync.c.fk_id.in_(fk_ids)))}
+
+    @staticmethod
+    def deleted_rows(session, deleted_since=None):
+        filters = [guidebook_sync.c.deleted.isnot(None)]
+        if deleted_since:
+            filters.append(guidebook_sync.c.deleted > deleted_since)
+        return session.execute(select(guidebook_sync).where(and_(*filters)).order_by(guidebook_sync.c.deleted)).all()
+
+    def record_deletes(self, session):
+        """Called after a flush; marks synced items that were just deleted."""
+        model_names = self.synced_model_names()
+        deleted_ids = [instance.id for instance in session.deleted if instance.__class__.__name__ in model_names]
+        if deleted_ids:
+            session.connection().execute(update(guidebook_sync).where(
+                guidebook_sync.c.fk_id.in_(deleted_ids), guidebook_sync.c.deleted.is_(None)
+            ).values(deleted=datetime.now(UTC)))
+
+
+guidebook_sync_state = GuidebookSyncState()
@@ -0,0 +1,142 @@
+import logging
+
+from sqlalchemy import and_, case, event, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.schema import DDL, ForeignKey, Index, Table
+from sqlalchemy.types import UnicodeText, Uuid
+
+from uber.config import c
+from uber.models import MagModel
+from uber.models.attendee import Attendee
+from uber.models.group import Group
+from uber.models.promo_code import PromoCode, PromoCodeGroup
+from uber.models.types import DefaultColumn as Column
+
+log = logging.getLogger(__name__)
+
+__all__ = ['attendee_search', 'attendee_search_index']
+
+
+# One row per attendee with everything the attendee search box looks at, lowercased and joined
+# into one string. Both columns have trigram indexes, so substring and similarity searches don't
+# need to scan the attendee table.
+attendee_search = Table(
+    'attendee_search',
+    MagModel.metadata,
+    Column('attendee_id', Uuid(as_uuid=False), ForeignKey('attendee.id', ondelete='CASCADE'), primary_key=True),
+    Column('document', UnicodeText()),
+    Column('names', UnicodeText()),
+    Index('ix_attendee_search_document_trgm', 'document',
+          postgresql_using='gin', postgresql_ops={'document': 'gin_trgm_ops'}),
+    Index('ix_attendee_search_names_trgm', 'names',
+          postgresql_using='gin', postgresql_ops={'names': 'gin_trgm_ops'}),
+)
+
+event.listen(attendee_search, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+
+class AttendeeSearchIndex:
+    """
+    Keeps the attendee_search table up to date and searches it. Documents are rebuilt with a
+    single INSERT ... SELECT after each flush that touches an attendee, or that renames a group
+    or promo code group, so the index is always consistent with the transaction it's used in.
+
+    The index needs Postgres' pg_trgm extension, so on other databases (and when
+    c.ATTENDEE_SEARCH_INDEX is off) the search box falls back to ILIKE over the attendee table.
+    """
+    name_fields = ['first_name', 'last_name', 'legal_name', 'badge_printed_name']
+
+    @staticmethod
+    def available(session):
+        return session.get_bind().dialect.name == 'postgresql'
+
+    def enabled(self, session):
+        return c.ATTENDEE_SEARCH_INDEX and self.available(session)
+
+    @classmethod
+    def documents(cls):
+        """
+        Returns a SELECT of (attendee_id, document, names) for every attendee, which callers
+        can filter to the attendees they want to rebuild.
+        """
+        fields = [getattr(Attendee, name) for name in Attendee.searchable_fields]
+        return select(
+            Attendee.id,
+            func.lower(func.concat_ws(' ', *fields, Group.name, PromoCodeGroup.name)),
+            func.lower(func.concat_ws(' ', *[getattr(Attendee, name) for name in cls.name_fields])),
+        ).select_from(Attendee).outerjoin(Group, Attendee.group_id == Group.id
+                                          ).outerjoin(PromoCode, Attendee.promo_code_id == PromoCode.id
+                                                      ).outerjoin(PromoCodeGroup, PromoCode.group_id == PromoCodeGroup.id)
+
+    def refresh(self, connection, attendee_ids=(), group_ids=(), promo_code_group_ids=()):
+        conditions = []
+        if attendee_ids:
+            conditions.append(Attendee.id.in_(attendee_ids))
+        if group_ids:
+            conditions.append(Attendee.group_id.in_(group_ids))
+        if promo_code_group_ids:
+            conditions.append(PromoCode.group_id.in_(promo_code_group_ids))
+        if not conditions:
+            return
+
+        insert = postgresql_insert(attendee_search).from_select(
+            ['attendee_id', 'document', 'names'], self.documents().where(or_(*conditions)))
+        connection.execute(insert.on_conflict_do_update(
+            index_elements=['attendee_id'],
+            set_={'document': insert.excluded.document, 'names': insert.excluded.names}))
+
+    def rebuild(self, session):
+        """Rebuilds every attendee's document; used by the rebuild_attendee_search entry point."""
+        connection = session.connection()
+        connection.execute(attendee_search.delete())
+        connection.execute(attendee_search.insert().from_select(['attendee_id', 'document', 'names'],
+                                                                self.documents()))
+
+    @staticmethod
+    def _renamed(instance, attr='name'):
+        history = get_history(instance, attr)
+        return bool(history.added or history.deleted)
+
+    def refresh_flushed(self, session):
+        """Called after a flush; rebuilds the documents of attendees affected by the flush."""
+        if not self.available(session):
+            return
+
+        attendee_ids, group_ids, promo_code_group_ids = set(), set(), set()
+        for instance in list(session.new) + list(session.dirty):
+            if isinstance(instance, Attendee):
+                attendee_ids.add(instance.id)
+            elif isinstance(instance, Group) and self._renamed(instance):
+                group_ids.add(instance.id)
+            elif isinstance(instance, PromoCodeGroup) and self._renamed(instance):
+                promo_code_group_ids.add(instance.id)
+
+        self.refresh(session.connection(), attendee_ids, group_ids, promo_code_group_ids)
+
+    def search(self, query, text):
+        """
+        Filters an attendee query to attendees whose documents contain every term in the
+        search text, or whose names are close to it, and orders them by relevance: attendees
+        containing every term come first, then those whose names start with the search text,
+        then by how similar their names are to it.
+        """
+        terms = text.replace(',', ' ').lower().split()
+        text = ' '.join(terms)
+        document, names = attendee_search.c.document, attendee_search.c.names
+
+        contains_terms = and_(*[document.contains(term, autoescape=True) for term in terms])
+        # Catches typos in names: true when the search text's strict_word_similarity to the names is at
+        # least pg_trgm.strict_word_similarity_threshold (0.5 by default). Unlike calling the function,
+        # the operator can use the trigram index.
+        fuzzy_match = literal(text).op('<<%')(names)
+        starts_name = or_(names.startswith(text, autoescape=True), names.contains(' ' + text, autoescape=True))
+        rank = case((contains_terms, 2.0), else_=0.0) + case((starts_name, 1.0), else_=0.0) \
+            + func.strict_word_similarity(literal(text), names)
+
+        return query.join(attendee_search, attendee_search.c.attendee_id == Attendee.id).filter(
+            or_(contains_terms, fuzzy_match)).order_by(rank.desc())
+
+
+attendee_search_index = AttendeeSearchIndex()
@@ -1,17 +1,26 @@
+import atexit
 import json
+import os
+import queue
 import six
 import sys
 import logging
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 from markupsafe import Markup
 from threading import current_thread
+from time import monotonic
 from urllib.parse import parse_qsl
+from uuid import uuid4
 
 import cherrypy
+from dateutil import parser as dateparser
 from pytz import UTC
 from sqlalchemy.ext import associationproxy
 
-from sqlalchemy import Sequence
+from sqlalchemy import Sequence, insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.types import Boolean, Integer, DateTime, String, Uuid
 from sqlalchemy.dialects.postgresql.json import JSONB
 from sqlalchemy.ext.mutable import MutableDict
@@ -205,28 +214,62 @@ class Tracking(MagModel, table=True):
                 diff[attr] = "'{} -> {}'".format(old_val_repr, new_val_repr)
         return diff
 
+    @classmethod
+    def _who(cls):
+        if sys.argv == ['']:
+            return 'server admin'
+        return AdminAccount.admin_or_volunteer_name() or (
+            current_thread().name if current_thread().daemon else 'non-admin')
+
+    @classmethod
+    def _row(cls, **values):
+        """
+        Returns a dictionary of column values for a new Tracking row, suitable
+        for a bulk INSERT. We fill in everything that would normally be set by
+        Python-side defaults, since those aren't applied to Core inserts.
+        """
+        now = datetime.now(UTC)
+        row = {
+            'id': str(uuid4()),
+            'created': now,
+            'last_updated': now,
+            'external_id': {},
+            'last_synced': {},
+            'when': now,
+            'supervisor': AdminAccount.supervisor_name() or '',
+            'page': c.PAGE_PATH,
+            'links': '',
+            'data': '',
+            'snapshot': '',
+        }
+        row.update(values)
+        if 'who' not in row:
+            row['who'] = cls._who()
+        return row
+
     @classmethod
     def track_collection_change(cls, action, target, instance):
         from uber.models import Session
-        if sys.argv == ['']:
-            who = 'server admin'
-        else:
-            who = AdminAccount.admin_or_volunteer_name() or (current_thread().name if current_thread().daemon else 'non-admin')
 
-        with Session() as session:
-            session.add(Tracking(
-                model=target.__class__.__name__,
-                fk_id=target.id,
-                which=repr(target),
-                who=who,
-                supervisor=AdminAccount.supervisor_name() or '',
-                page=c.PAGE_PATH,
-                action=action,
-                data=repr(instance),
-            ))
+        row = cls._row(model=target.__class__.__name__, fk_id=target.id, which=repr(target), action=action,
+                       data=repr(instance))
+
+        if not c.ASYNC_TRACKING:
+            with Session() as session:
+                session.add(Tracking(**row))
+        elif target.session:
+            target.session.info.setdefault('pending_tracking', []).append(row)
+        else:
+            tracking_writer.enqueue([row])
 
     @classmethod
     def track(cls, session, action, instance):
+        """
+        Records a change to a model instance. The row is built now, while the
+        original values are still available, but unless async_tracking is off
+        it's only written after the session's transaction commits, in a batch
+        with any other pending rows.
+        """
         from uber.models import ApiJob
 
         if action in [c.CREATED, c.UNPAID_PREREG, c.EDITED_PREREG]:
@@ -248,10 +291,7 @@ class Tracking(MagModel, table=True):
             and 'creator' not in str(column)
             and getattr(instance, name))
 
-        if sys.argv == ['']:
-            who = 'server admin'
-        else:
-            who = AdminAccount.admin_or_volunteer_name() or (current_thread().name if current_thread().daemon else 'non-admin')
+        who = cls._who()
         
         if isinstance(instance, ApiJob) and who == 'non-admin':
             # Automated processing of API jobs is tracked in the jobs themselves
@@ -265,18 +305,191 @@ class Tracking(MagModel, table=True):
         except TypeError as e:
             snapshot = "Could not save JSON dump due to error: {}".format(e)
 
-        session.add(Tracking(
+        row = cls._row(
             model=instance.__class__.__name__,
             fk_id=instance.id,
             which=repr(instance),
             who=who,
-            supervisor=AdminAccount.supervisor_name() or '',
-            page=c.PAGE_PATH,
             links=links,
             action=action,
             data=data,
             snapshot=snapshot,
-        ))
+        )
+
+        if c.ASYNC_TRACKING:
+            session.info.setdefault('pending_tracking', []).append(row)
+        else:
+            session.add(Tracking(**row))
+
+
+class TrackingWriter:
+    """
+    Writes Tracking rows from a bounded in-process queue using a background
+    thread, so that saving a model doesn't also have to insert its audit log
+    rows inside the same transaction.
+
+    Rows are journaled in a Redis hash before they're queued and removed from
+    it once they've been written. If the process dies before a batch is
+    written, the replay_tracking_journal task picks up the leftover rows;
+    since each row already has its primary key, replaying is idempotent.
+    If the queue is full or Redis is unavailable, we write synchronously
+    instead of dropping anything.
+    """
+    journal_key = 'tracking_journal'
+
+    def __init__(self):
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def _ensure_running(self):
+        # Celery and CherryPy both fork worker processes, which don't inherit our thread
+        if self.thread and self.thread.is_alive() and self.pid == os.getpid():
+            return
+
+        with self.lock:
+            if self.thread and self.thread.is_alive() and self.pid == os.getpid():
+                return
+            self.queue = queue.Queue(maxsize=c.TRACKING_QUEUE_SIZE)
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name='tracking_writer', daemon=True)
+            self.thread.start()
+
+    @classmethod
+    def _encode(cls, row):
+        return json.dumps(row, cls=serializer)
+
+    @classmethod
+    def _decode(cls, row_json):
+        row = json.loads(row_json)
+        for key in ['created', 'last_updated', 'when']:
+            row[key] = dateparser.parse(row[key]).replace(tzinfo=UTC)
+        return row
+
+    def journal(self, rows):
+        c.REDIS_STORE.hset(c.REDIS_PREFIX + self.journal_key,
+                           mapping={row['id']: self._encode(row) for row in rows})
+
+    def enqueue(self, rows):
+        if not rows:
+            return
+
+        try:
+            self.journal(rows)
+        except Exception:
+            log.error('Could not journal {} tracking rows, writing them synchronously'.format(len(rows)),
+                      exc_info=True)
+            self.write(rows, journaled=False)
+            return
+
+        self._ensure_running()
+        for index, row in enumerate(rows):
+            try:
+                self.queue.put_nowait(row)
+            except queue.Full:
+                log.warning('Tracking queue is full, writing {} rows synchronously'.format(len(rows) - index))
+                self.write(rows[index:])
+                return
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = monotonic() + c.TRACKING_FLUSH_SECONDS
+        while len(batch) < c.TRACKING_BATCH_SIZE:
+            timeout = deadline - monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self.write(batch)
+            except Exception:
+                # The rows are still in the journal, so they'll be replayed later
+                log.error('Failed to write {} tracking rows'.format(len(batch)), exc_info=True)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    @classmethod
+    def insert_rows(cls, rows):
+        from uber.models import Session
+
+        table = Tracking.__table__
+        if Session.engine.dialect.name == 'postgresql':
+            stmt = postgresql_insert(table).on_conflict_do_nothing(index_elements=['id'])
+        elif Session.engine.dialect.name == 'sqlite':
+            stmt = sqlite_insert(table).on_conflict_do_nothing(index_elements=['id'])
+        else:
+            stmt = insert(table)
+
+        with Session.engine.begin() as conn:
+            conn.execute(stmt, rows)
+
+    def write(self, rows, journaled=True):
+        self.insert_rows(rows)
+        if journaled:
+            try:
+                c.REDIS_STORE.hdel(c.REDIS_PREFIX + self.journal_key, *[row['id'] for row in rows])
+            except Exception:
+                log.warning('Could not clear {} tracking rows from the journal'.format(len(rows)), exc_info=True)
+
+    def drain(self):
+        """
+        Synchronously writes anything still waiting in the queue. This is run
+        when the process exits so that a clean shutdown never depends on the
+        replay task.
+        """
+        if not self.queue or self.pid != os.getpid():
+            return
+
+        rows = []
+        while True:
+            try:
+                rows.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if rows:
+            for start in range(0, len(rows), c.TRACKING_BATCH_SIZE):
+                try:
+                    self.write(rows[start:start + c.TRACKING_BATCH_SIZE])
+                except Exception:
+                    log.error('Could not write tracking rows on shutdown, leaving them in the journal',
+                              exc_info=True)
+
+    def replay(self, min_age=timedelta(minutes=5)):
+        """
+        Writes journaled rows which are older than min_age, i.e., rows that
+        any live writer should have finished with by now. Returns the number
+        of rows replayed.
+        """
+        cutoff = datetime.now(UTC) - min_age
+        replayed = 0
+        batch = []
+        for row_id, row_json in c.REDIS_STORE.hscan_iter(c.REDIS_PREFIX + self.journal_key,
+                                                         count=c.TRACKING_BATCH_SIZE):
+            row = self._decode(row_json)
+            if row['when'] < cutoff:
+                batch.append(row)
+            if len(batch) >= c.TRACKING_BATCH_SIZE:
+                self.write(batch)
+                replayed += len(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+            replayed += len(batch)
+        return replayed
+
+
+tracking_writer = TrackingWriter()
+atexit.register(tracking_writer.drain)
+cherrypy.engine.subscribe('stop', tracking_writer.drain)
 
 
 class TxnRequestTracking(MagModel, table=True):
@@ -0,0 +1,201 @@
+"""
+A local record of the payment events our processors tell us about, and the reconciliation of those
+events against the receipt transactions that are still waiting on them.
+
+Events arrive two ways: the processor's webhook, and a catch-up poller (`check_missed_stripe_payments`)
+that reads the processor's event list from where it last left off, in case a webhook never made it.
+Both record events in the payment_event table, keyed by the processor's event ID, so an event we hear
+about twice is only ever reconciled once. Reconciliation then works through unprocessed events in
+batches, looking up which of their intents still have pending transactions in a single query.
+
+`StubEventSource` stands in for a processor so the whole flow can be exercised offline.
+"""
+import json
+import logging
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import pytz
+import stripe
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+
+from uber.config import c
+from uber.models import ReceiptTransaction, payment_event, payment_event_cursor
+from uber.payments import ReceiptManager
+
+log = logging.getLogger(__name__)
+
+PaymentEvent = namedtuple('PaymentEvent', ['event_id', 'event_type', 'intent_id', 'charge_id', 'status', 'created'])
+
+SUCCEEDED = 'payment_intent.succeeded'
+
+
+class StripeEventSource:
+    name = 'stripe'
+
+    # Stripe event timestamps only have one-second resolution and events can show up in the list a
+    # little after they were created, so each poll re-reads a short window before the stored cursor
+    overlap = 5 * 60
+
+    @staticmethod
+    def to_event(event):
+        payment_intent = event['data']['object']
+        return PaymentEvent(event['id'], event['type'], payment_intent['id'],
+                            payment_intent.get('latest_charge') or '', payment_intent.get('status') or '',
+                            datetime.fromtimestamp(event['created'], pytz.UTC))
+
+    def from_webhook(self, payload, headers):
+        """
+        Verifies and parses a webhook request, raising ValueError if it isn't a valid Stripe event.
+        Returns None for event types we don't track.
+        """
+        try:
+            event = stripe.Webhook.construct_event(payload, headers.get('Stripe-Signature', ''),
+                                                   c.STRIPE_ENDPOINT_SECRET)
+        except stripe.error.SignatureVerificationError as e:
+            raise ValueError(f"Invalid signature: {e}")
+
+        if event['type'] != SUCCEEDED:
+            return None
+        return self.to_event(event)
+
+    def poll(self, cursor):
+        """
+        Returns a list of events since `cursor`, oldest first, and the cursor to poll from next time.
+        With no cursor, we start from the last hour of events.
+        """
+        now = int(time.time())
+        since = int(cursor) - self.overlap if cursor else now - 60 * 60
+        events = stripe.Event.list(type=SUCCEEDED, created={'gte': since})
+        events = sorted((self.to_event(event) for event in events.auto_paging_iter()), key=lambda e: e.created)
+        return events, str(max([now] + [int(event.created.timestamp()) for event in events]))
+
+
+class StubEventSource:
+    """
+    An in-memory payment processor for tests and local development. Payments added with `add_payment`
+    show up in `poll`, and `from_webhook` accepts the events it builds as plain JSON.
+    """
+    name = 'stub'
+
+    def __init__(self):
+        self.events = []
+
+    def add_payment(self, intent_id, charge_id='', status='succeeded', event_id=None):
+        event = PaymentEvent(event_id or f'evt_stub_{len(self.events)}', SUCCEEDED, intent_id,
+                             charge_id or f'ch_stub_{len(self.events)}', status, datetime.now(pytz.UTC))
+        self.events.append(event)
+        return event
+
+    def webhook_payload(self, event):
+        return json.dumps(dict(event._asdict(), created=event.created.isoformat()))
+
+    def from_webhook(self, payload, headers):
+        try:
+            event = json.loads(payload)
+            return PaymentEvent(**dict(event, created=datetime.fromisoformat(event['created'])))
+        except (TypeError, KeyError) as e:
+            raise ValueError(f"Invalid payload: {e}")
+
+    def poll(self, cursor):
+        return self.events[int(cursor or 0):], str(len(self.events))
+
+
+class PaymentEventStore:
+    def __init__(self, source=None, batch_size=500):
+        self.source = source or StripeEventSource()
+        self.batch_size = batch_size
+
+    @property
+    def processor(self):
+        return self.source.name
+
+    def record(self, session, events):
+        """Stores the given events, skipping any we already have, and returns the IDs of the new ones."""
+        if not events:
+            return []
+
+        received = datetime.now(pytz.UTC)
+        return session.execute(
+            postgresql_insert(payment_event).values([
+                dict(event._asdict(), processor=self.processor, received=received) for event in events
+            ]).on_conflict_do_nothing().returning(payment_event.c.event_id)
+        ).scalars().all()
+
+    def cursor(self, session):
+        return session.execute(select(payment_event_cursor.c.cursor).where(
+            payment_event_cursor.c.processor == self.processor)).scalar()
+
+    def save_cursor(self, session, cursor):
+        values = {'cursor': cursor, 'updated': datetime.now(pytz.UTC)}
+        session.execute(postgresql_insert(payment_event_cursor).values(processor=self.processor, **values)
+                        .on_conflict_do_update(index_elements=[payment_event_cursor.c.processor], set_=values))
+
+    def poll(self, session):
+        """Records any events the processor has had since our last poll and advances the cursor."""
+        events, cursor = self.source.poll(self.cursor(session))
+        new_ids = self.record(session, events)
+        self.save_cursor(session, cursor)
+        return new_ids
+
+    def unprocessed(self, session, event_ids=None, limit=None):
+        """
+        Returns up to `limit` unprocessed events (or just the given ones), oldest first, and locks them
+        until the transaction ends. Events that another transaction has locked are skipped, so a webhook
+        and the poller reconciling at the same time never handle the same event.
+        """
+        query = select(payment_event).where(payment_event.c.processor == self.processor,
+                                            payment_event.c.processed.is_(None))
+        if event_ids is not None:
+            query = query.where(payment_event.c.event_id.in_(event_ids))
+        return session.execute(query.order_by(payment_event.c.created).limit(limit)
+                               .with_for_update(skip_locked=True)).all()
+
+    def pending_intent_ids(self, session, intent_ids):
+        """Returns which of the given intents still have transactions waiting to be marked paid."""
+        if not intent_ids:
+            return set()
+        return set(session.execute(select(ReceiptTransaction.intent_id).distinct().where(
+            ReceiptTransaction.intent_id.in_(intent_ids), ReceiptTransaction.charge_id == '',
+            ReceiptTransaction.intent_id != '')).scalars())
+
+    def reconcile(self, session, event_ids=None):
+        """
+        Marks pending transactions paid for each unprocessed event (or just the given ones), a batch
+        at a time, and records what happened with each event. Returns the intent IDs marked paid.
+        """
+        paid_ids = []
+        while True:
+            # Each batch is locked as we read it and released when we commit it, so we fetch one
+            # batch at a time rather than reading every event up front
+            batch = self.unprocessed(session, event_ids, limit=self.batch_size)
+            if not batch:
+                break
+            pending_ids = self.pending_intent_ids(session, {event.intent_id for event in batch})
+            results = []
+            for event in batch:
+                if event.intent_id not in pending_ids:
+                    result = 'no pending transactions'
+                elif event.status != 'succeeded':
+                    result = f'status was {event.status}'
+                elif not event.charge_id:
+                    result = 'no charge'
+                else:
+                    ReceiptManager.mark_paid_from_ids(session, event.intent_id, event.charge_id)
+                    pending_ids.discard(event.intent_id)
+                    paid_ids.append(event.intent_id)
+                    result = 'marked paid'
+
+                if result not in ('marked paid', 'no pending transactions'):
+                    log.error(f"Couldn't mark payments with intent ID {event.intent_id} as paid: {result}")
+                results.append({'b_event_id': event.event_id, 'b_result': result})
+
+            processed = datetime.now(pytz.UTC)
+            session.execute(payment_event.update().where(
+                payment_event.c.processor == self.processor,
+                payment_event.c.event_id == bindparam('b_event_id'),
+            ).values(processed=processed, result=bindparam('b_result')), results)
+            session.commit()
+        return paid_ids
@@ -1082,7 +1082,7 @@ class RefundRequest(TransactionRequest):
 
             return_response_json = return_response.json()
             self.tracker.response = return_response_json
-            self.tracker.resolved = datetime.now(UTC)
+            self.tracker.resolved = datetime.now(pytz.UTC)
 
             self.spin_request.log_api_response(return_response_json)
 
@@ -1155,12 +1155,13 @@ class SpinTerminalRequest(TransactionRequest):
         return api_call
 
     def retry_if_busy(self, func, *args, **kwargs):
-        from time import sleep
+        from time import monotonic, sleep
 
+        give_up = monotonic() + c.SPIN_TERMINAL_BUSY_TIMEOUT
         response = func(*args, **kwargs)
-        while self.error_message_from_response(response.json()) == 'busy':
-            response = func(*args, **kwargs)
+        while response is not None and spin_rest_utils.terminal_busy(response.json()) and monotonic() < give_up:
             sleep(1)
+            response = func(*args, **kwargs)
         return response
 
     def error_message_from_response(self, response_json):
@@ -1190,7 +1191,7 @@ class SpinTerminalRequest(TransactionRequest):
         except AttributeError:
             response_json = response
         self.tracker.response = response_json
-        self.tracker.resolved = datetime.now(UTC)
+        self.tracker.resolved = datetime.now(pytz.UTC)
 
         receipt_items_to_add = self.get_receipt_items_to_add()
         if receipt_items_to_add:
@@ -1325,15 +1326,48 @@ class SpinTerminalRequest(TransactionRequest):
                                          fk_id=self.tracker.fk_id,
                                          who=self.tracker.who)
         self.tracker = new_tracker
+        session.add(new_tracker)
+        session.commit()
         new_intent_id = self.intent_id_from_txn_tracker(self.tracker)
         matching_txns = session.query(ReceiptTransaction).filter_by(intent_id=self.intent.id)
         for txn in matching_txns:
             txn.intent_id = new_intent_id
             session.add(txn)
         session.commit()
+        self.intent = self.generate_payment_intent(new_intent_id)
 
+        if c.SPIN_TERMINAL_GATEWAY:
+            return self.queue_sale_txn()
         return self.retry_if_busy(self.send_sale_txn)
 
+    @property
+    def gateway_sale(self):
+        # Everything record_terminal_sale needs to pick this request back up once the terminal responds
+        return {
+            'terminal_id': self.terminal_id,
+            'tracking_id': self.tracker.id,
+            'intent_id': self.intent.id,
+            'amount': self.amount,
+            'capture_signature': self.capture_signature,
+            'payment_type': self.payment_type,
+            'use_account_info': self.use_account_info,
+        }
+
+    @classmethod
+    def from_gateway_sale(cls, session, sale, tracker):
+        request = cls(session, terminal_id=sale['terminal_id'], amount=sale['amount'],
+                      capture_signature=sale['capture_signature'], tracker=tracker,
+                      spin_payment_type=sale['payment_type'], use_account_info=sale['use_account_info'],
+                      account=None)
+        request.intent = request.generate_payment_intent(sale['intent_id'])
+        return request
+
+    def queue_sale_txn(self):
+        from uber.terminal_gateway import queue_sale
+
+        queue_sale(self.gateway_sale, spin_rest_utils.sale_request_dict(str(self.dollar_amount), self.payment_type,
+                                                                        self.ref_id, self.capture_signature))
+
     @handle_api_call
     def send_void_txn(self):
         return requests.post(spin_rest_utils.get_call_url(self.api_url, 'void'), data=self.sale_request_dict)
@@ -1911,10 +1945,12 @@ class ReceiptManager:
         from uber.models import Attendee, ArtShowApplication, Group, ReceiptTransaction, Session
         from uber.email import EmailService
 
+        # Locking the transactions means that if something else is marking the same intent paid
+        # (e.g., another reconciliation), we wait for it to commit and then find nothing left to do
         matching_txns = session.query(ReceiptTransaction).filter(
             ReceiptTransaction.intent_id == intent_id,
             ReceiptTransaction.charge_id == '').options(
-                selectinload(ReceiptTransaction.receipt_items)).all()
+                selectinload(ReceiptTransaction.receipt_items)).with_for_update(of=ReceiptTransaction).all()
 
         if not matching_txns:
             log.debug(f"Tried to mark payments with intent ID {intent_id} as paid but we couldn't find any!")
@@ -0,0 +1,278 @@
+import copy
+import functools
+import glob
+import logging
+import math
+import os
+import re
+import time
+import unicodedata
+import uuid
+from datetime import datetime
+from io import BytesIO
+
+import fpdf
+from fontTools import ttLib
+from fpdf.fonts import SubsetMap
+from fpdf.image_parsing import preload_image
+from pytz import UTC
+
+from uber.config import c
+from uber.utils import get_static_file_path, localized_now
+
+log = logging.getLogger(__name__)
+
+__all__ = ['BidSheetDocument', 'PdfJob', 'add_cached_font', 'add_cached_image', 'fit_font_size', 'pdf_filename']
+
+
+@functools.cache
+def _parsed_font(path, family, style):
+    """
+    Parses a TTF file once per process. fpdf2 reads every glyph's width out of the font each
+    time add_font is called, which is most of the cost of starting a small document.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    template = fpdf.FPDF()
+    template.add_font(family, style, path)
+    font = template.fonts[family.lower() + style]
+
+    # fpdf2 patches a fallback .notdef glyph into fonts that don't have one; we can only
+    # share a font's metrics if the file on disk is exactly what fpdf2 parsed
+    reusable = not ('glyf' in font.ttfont and '.notdef' not in ttLib.TTFont(BytesIO(data), lazy=True)['glyf'])
+    return font, data, reusable
+
+
+def add_cached_font(pdf, family, path, style=''):
+    """
+    A drop-in replacement for pdf.add_font(family, style, path) which reuses the widths,
+    character map and descriptor parsed by the first document to use the font. Each
+    document still gets its own fontTools object and subset, since fpdf2 subsets the
+    font in place when the document is output.
+    """
+    style = ''.join(sorted(style.upper()))
+    fontkey = family.lower() + style
+    if fontkey in pdf.fonts:
+        return
+
+    template, data, reusable = _parsed_font(str(path), family, style)
+    if not reusable:
+        pdf.add_font(family, style, path)
+        return
+
+    font = copy.copy(template)
+    font.i = len(pdf.fonts) + 1
+    font.fontkey = fontkey
+    font.ttfont = ttLib.TTFont(BytesIO(data), recalcTimestamp=False, fontNumber=0, lazy=True)
+    font.hbfont = None
+    font.missing_glyphs = []
+    font.subset = SubsetMap(font)
+    pdf.fonts[fontkey] = font
+
+
+@functools.cache
+def _parsed_image(path):
+    """
+    Decodes an image once per process. For PNGs with an alpha channel, fpdf2 checks every
+    pixel to see whether the image is actually transparent, which is slow for a full-page
+    background like the bid sheet.
+    """
+    template = fpdf.FPDF()
+    name, img, info = preload_image(template.image_cache, path)
+    return name, info
+
+
+def add_cached_image(pdf, path):
+    """
+    Adds an image to a document's image cache, so that pdf.image(path) reuses the data
+    decoded by the first document to use the image rather than decoding it again.
+    """
+    path = str(path)
+    name, info = _parsed_image(path)
+    if name in pdf.image_cache.images or info.get('iccp_i') is not None:
+        # Images with ICC profiles are numbered per document, so we let fpdf2 load those
+        return
+
+    pdf.image_cache.images[name] = type(info)(info, i=len(pdf.image_cache.images) + 1, usages=0)
+
+
+def fit_font_size(pdf, text, max_width, font_size=12, step=0.2):
+    """
+    Sets the font size to the largest of font_size, font_size - step, font_size - 2 * step...
+    at which text fits in max_width, and returns it. We binary search the number of steps, so
+    this measures the string a handful of times instead of once per step.
+    """
+    pdf.set_font_size(size=font_size)
+    if pdf.get_string_width(text) <= max_width:
+        return font_size
+
+    low, high = 0, math.ceil(font_size / step)
+    while high - low > 1:
+        middle = (low + high) // 2
+        pdf.set_font_size(size=font_size - middle * step)
+        if pdf.get_string_width(text) > max_width:
+            low = middle
+        else:
+            high = middle
+
+    pdf.set_font_size(size=font_size - high * step)
+    return font_size - high * step
+
+
+def pdf_filename(name):
+    """Turns a name like "Ünïcode Artist" into a filename like "unicode-artist_10172026_1530"."""
+    filename = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    filename = re.sub(r'[^\w\s-]', '', filename).strip().lower()
+    filename = re.sub(r'[-\s]+', '-', filename)
+    return filename + "_" + localized_now().strftime("%m%d%Y_%H%M")
+
+
+class BidSheetDocument:
+    """
+    A letter-sized PDF of art show bid sheets, four to a page.
+    """
+    normal_font_name = 'NotoSans'
+    bold_font_name = 'NotoSans Bold'
+    sheets_per_page = 4
+
+    def __init__(self):
+        self.pdf = fpdf.FPDF(unit='pt', format='letter')
+        add_cached_font(self.pdf, '3of9', get_static_file_path('free3of9.ttf'))
+        add_cached_font(self.pdf, self.normal_font_name, get_static_file_path('NotoSans-Regular.ttf'))
+        add_cached_font(self.pdf, self.bold_font_name, get_static_file_path('NotoSans-Bold.ttf'))
+        add_cached_image(self.pdf, get_static_file_path('bidsheet.png'))
+        self.sheet_count = 0
+        self.pieces_added = 0
+
+    def set_fitted_font_size(self, text, font_size=12, max_size=160):
+        fit_font_size(self.pdf, text, max_size, font_size)
+
+    def add_pieces(self, pieces, progress=None):
+        """
+        Adds a bid sheet for each piece, starting on a new page, sorted the way the pieces
+        are hung. progress, if given, is called with the number of pieces added so far.
+        """
+        self.sheet_count += -self.sheet_count % self.sheets_per_page
+        for piece in sorted(pieces, key=lambda piece: (piece.gallery_label, piece.piece_id)):
+            sheet_num = self.sheet_count % self.sheets_per_page
+            if sheet_num == 0:
+                self.pdf.add_page()
+
+            piece.print_bidsheet(self.pdf, sheet_num, self.normal_font_name, self.bold_font_name,
+                                 self.set_fitted_font_size)
+            self.sheet_count += 1
+            self.pieces_added += 1
+            if progress:
+                progress(self.pieces_added)
+
+    def output(self):
+        return bytes(self.pdf.output())
+
+
+def all_bid_sheets(session, job):
+    """
+    Renders bid sheets for every piece of every approved artist, with each artist starting
+    on a new page, in artist ID order.
+    """
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+
+    from uber.models import ArtShowApplication, ArtShowPiece
+
+    apps = session.scalars(select(ArtShowApplication).where(
+        ArtShowApplication.status == c.APPROVED,
+        ArtShowApplication.art_show_pieces.any()).options(
+        selectinload(ArtShowApplication.art_show_pieces)).order_by(ArtShowApplication.artist_id)).all()
+    job.update(total=session.query(ArtShowPiece).filter(ArtShowPiece.app_id.in_([app.id for app in apps])).count())
+
+    document = BidSheetDocument()
+    for app in apps:
+        document.add_pieces(app.art_show_pieces, progress=job.progress)
+        if job.cancel_requested:
+            return None
+    job.update(rendered=document.pieces_added)
+    return document.output()
+
+
+class PdfJob:
+    """
+    A PDF rendered on a Celery worker. Large documents take long enough to render that
+    we don't want to do it in a web request, so pages start a job, poll its progress,
+    which is kept in a Redis hash, and download the finished PDF from
+    c.UPLOADED_FILES_DIR once it's done.
+    """
+    renderers = {
+        'bid_sheets': all_bid_sheets,
+    }
+    expire_seconds = 60 * 60 * 24
+    progress_interval = 50
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    @property
+    def key(self):
+        return c.REDIS_PREFIX + 'pdf_job:' + self.job_id
+
+    @staticmethod
+    def directory():
+        return os.path.join(c.UPLOADED_FILES_DIR, 'pdf_jobs')
+
+    @property
+    def filepath(self):
+        return os.path.join(self.directory(), self.job_id + '.pdf')
+
+    @classmethod
+    def start(cls, kind, name, requested_by=''):
+        job = cls(uuid.uuid4().hex)
+        job.update(status='queued', kind=kind, name=name, requested_by=requested_by, rendered=0, total=0,
+                   requested_at=datetime.now(UTC).isoformat())
+        return job
+
+    def get(self):
+        return c.REDIS_STORE.hgetall(self.key)
+
+    def update(self, **fields):
+        pipeline = c.REDIS_STORE.pipeline()
+        pipeline.hset(self.key, mapping={key: '' if val is None else val for key, val in fields.items()})
+        pipeline.expire(self.key, self.expire_seconds)
+        pipeline.execute()
+
+    def progress(self, rendered):
+        if rendered % self.progress_interval == 0:
+            self.update(rendered=rendered)
+
+    def cancel(self):
+        c.REDIS_STORE.hset(self.key, 'cancel_requested', 1)
+
+    @property
+    def cancel_requested(self):
+        return bool(c.REDIS_STORE.hget(self.key, 'cancel_requested'))
+
+    @classmethod
+    def remove_expired(cls):
+        cutoff = time.time() - cls.expire_seconds
+        for path in glob.glob(os.path.join(cls.directory(), '*.pdf')):
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+    def run(self, session):
+        info = self.get()
+        renderer = self.renderers.get(info.get('kind'))
+        if not renderer:
+            self.update(status='error', error=f"Unknown kind of PDF: {info.get('kind')}")
+            return
+
+        self.update(status='running', started_at=datetime.now(UTC).isoformat())
+        contents = renderer(session, self)
+        if contents is None:
+            self.update(status='cancelled', finished_at=datetime.now(UTC).isoformat())
+            return
+
+        self.remove_expired()
+        os.makedirs(self.directory(), exist_ok=True)
+        with open(self.filepath + '.tmp', 'wb') as f:
+            f.write(contents)
+        os.replace(self.filepath + '.tmp', self.filepath)
+        self.update(status='done', size=len(contents), filename=pdf_filename(info.get('name', 'document')),
+                    finished_at=datetime.now(UTC).isoformat())
@@ -0,0 +1,234 @@
+import inspect
+import json
+import operator
+import re
+import uuid
+from datetime import datetime
+
+from pytz import UTC
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from uber.config import c
+from uber.models import Attendee
+
+OPERATORS = [('>=', operator.ge), ('<=', operator.le), ('!=', operator.ne),
+             ('!', operator.ne), ('>', operator.gt), ('<', operator.lt)]
+
+LITERALS = {'true': True, 'false': False, 'none': None}
+
+
+def parse_condition(search_text):
+    """
+    Turns text like "is_dept_head: True" or "age_now_or_at_con: <18" into a tuple
+    of (property name, operator, value). Values are converted to ints, True, False
+    or None where possible, since that's what most properties return.
+    """
+    target, term = search_text.split(':', 1)
+    target, term = target.strip(), term.strip()
+
+    op = operator.eq
+    for prefix, prefix_op in OPERATORS:
+        if term.startswith(prefix):
+            op, term = prefix_op, term[len(prefix):].strip()
+            break
+
+    if term.lower() in LITERALS:
+        value = LITERALS[term.lower()]
+    else:
+        try:
+            value = int(term)
+        except ValueError:
+            value = term
+    return target, op, value
+
+
+def parse_property_search(text):
+    """
+    Parses a property search into a list of OR-ed groups, each of which is a list of
+    AND-ed conditions, so "a: 1 AND b: 2 OR c: 3" matches attendees with both a and b,
+    or with c. Commas also separate AND-ed conditions.
+
+    Returns a tuple of (groups, error message).
+    """
+    groups = []
+    for group_text in re.split(r'\s+OR\s+', text.strip()):
+        conditions = []
+        for search_text in re.split(r'\s+AND\s+|,', group_text):
+            if not search_text.strip():
+                continue
+            if ':' not in search_text:
+                return None, 'ERROR: "{}" should look like property_name: value'.format(search_text.strip())
+            target, op, value = parse_condition(search_text)
+            if target.startswith('_') or not hasattr(Attendee, target):
+                return None, 'ERROR: {} is not a valid attribute'.format(target)
+            conditions.append((target, op, value))
+        if conditions:
+            groups.append(conditions)
+
+    if not groups:
+        return None, 'Please enter at least one condition.'
+    return groups, ''
+
+
+def search_targets(groups):
+    return list(dict.fromkeys(target for conditions in groups for target, op, value in conditions))
+
+
+def _source_of(name):
+    try:
+        attr = inspect.getattr_static(Attendee, name)
+    except AttributeError:
+        return ''
+    func = getattr(attr, 'fget', attr)
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return ''
+
+
+def relationships_needed(targets):
+    """
+    Returns the names of the Attendee relationships used by the given properties,
+    following properties that use other properties. We find these by reading each
+    property's source for "self.<name>", which is crude, but missing a relationship
+    only costs us a lazy load per attendee.
+    """
+    relationships = set(Attendee.__mapper__.relationships.keys())
+    needed, seen, to_check = set(), set(), list(targets)
+    while to_check:
+        name = to_check.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        if name in relationships:
+            needed.add(name)
+        else:
+            to_check.extend(re.findall(r'\bself\.(\w+)', _source_of(name)))
+    return sorted(needed)
+
+
+def matches(attendee, groups):
+    for conditions in groups:
+        try:
+            if all(op(getattr(attendee, target), value) for target, op, value in conditions):
+                return True
+        except TypeError:
+            # e.g., comparing a property that returned None to a number
+            pass
+    return False
+
+
+def iter_property_search(session, groups, chunk_size=500):
+    """
+    Yields (attendees checked, matching attendees) for each chunk of valid attendees.
+    Attendees are streamed with yield_per and only the relationships the searched
+    properties use are loaded, one SELECT per relationship per chunk. Clean objects
+    are only weakly referenced by the session, so memory stays flat as we go.
+    """
+    options = [selectinload(getattr(Attendee, name)) for name in relationships_needed(search_targets(groups))]
+    query = select(Attendee).where(Attendee.is_valid == True).options(*options).order_by(  # noqa: E712
+        Attendee.id).execution_options(yield_per=chunk_size)
+
+    checked = 0
+    for chunk in session.scalars(query).partitions():
+        checked += len(chunk)
+        yield checked, [attendee for attendee in chunk if matches(attendee, groups)]
+
+
+class PropertySearch:
+    """
+    A property search running on a Celery worker. Its status and progress are kept
+    in a Redis hash, and the matching attendees in a Redis list of JSON-encoded CSV
+    rows, so the devtools pages can poll it and download the results.
+    """
+    recent_key = 'property_searches'
+    expire_seconds = 60 * 60 * 24
+    max_recent = 20
+    chunk_size = 500
+
+    def __init__(self, search_id):
+        self.search_id = search_id
+
+    @property
+    def key(self):
+        return c.REDIS_PREFIX + 'property_search:' + self.search_id
+
+    @property
+    def results_key(self):
+        return c.REDIS_PREFIX + 'property_search_results:' + self.search_id
+
+    @classmethod
+    def start(cls, text, requested_by=''):
+        search = cls(uuid.uuid4().hex)
+        search.update(status='queued', text=text, requested_by=requested_by, checked=0, matched=0,
+                      requested_at=datetime.now(UTC).isoformat())
+        recent_key = c.REDIS_PREFIX + cls.recent_key
+        pipeline = c.REDIS_STORE.pipeline()
+        pipeline.lpush(recent_key, search.search_id)
+        pipeline.ltrim(recent_key, 0, cls.max_recent - 1)
+        pipeline.execute()
+        return search
+
+    @classmethod
+    def recent(cls):
+        searches = []
+        for search_id in c.REDIS_STORE.lrange(c.REDIS_PREFIX + cls.recent_key, 0, -1):
+            info = cls(search_id).get()
+            if info:
+                searches.append(dict(info, search_id=search_id))
+        return searches
+
+    def get(self):
+        return c.REDIS_STORE.hgetall(self.key)
+
+    def update(self, **fields):
+        pipeline = c.REDIS_STORE.pipeline()
+        pipeline.hset(self.key, mapping={key: '' if val is None else val for key, val in fields.items()})
+        pipeline.expire(self.key, self.expire_seconds)
+        pipeline.execute()
+
+    def cancel(self):
+        c.REDIS_STORE.hset(self.key, 'cancel_requested', 1)
+
+    @property
+    def cancel_requested(self):
+        return bool(c.REDIS_STORE.hget(self.key, 'cancel_requested'))
+
+    def add_results(self, rows):
+        if rows:
+            pipeline = c.REDIS_STORE.pipeline()
+            pipeline.rpush(self.results_key, *[json.dumps(row) for row in rows])
+            pipeline.expire(self.results_key, self.expire_seconds)
+            pipeline.execute()
+
+    def results(self):
+        return [json.loads(row) for row in c.REDIS_STORE.lrange(self.results_key, 0, -1)]
+
+    @staticmethod
+    def header(groups):
+        return ['Attendee ID', 'Name', 'Badge #', 'Email'] + search_targets(groups)
+
+    @staticmethod
+    def row(attendee, groups):
+        return [attendee.id, attendee.full_name, attendee.badge_num or '', attendee.email] + [
+            str(getattr(attendee, target)) for target in search_targets(groups)]
+
+    def run(self, session):
+        groups, error = parse_property_search(self.get().get('text', ''))
+        if error:
+            self.update(status='error', error=error, finished_at=datetime.now(UTC).isoformat())
+            return
+
+        self.update(status='running', total=session.valid_attendees().count(), started_at=datetime.now(UTC).isoformat())
+        self.add_results([self.header(groups)])
+        matched = 0
+        for checked, attendees in iter_property_search(session, groups, self.chunk_size):
+            matched += len(attendees)
+            self.add_results([self.row(attendee, groups) for attendee in attendees])
+            self.update(checked=checked, matched=matched)
+            if self.cancel_requested:
+                self.update(status='cancelled', finished_at=datetime.now(UTC).isoformat())
+                return
+
+        self.update(status='done', finished_at=datetime.now(UTC).isoformat())
@@ -1,14 +1,114 @@
+import hashlib
+import logging
+import pickle
 import threading
-
-try:
-  import cPickle as pickle
-except ImportError:
-  import pickle
+import weakref
+import zlib
+from collections import deque
+from datetime import timedelta
+from time import perf_counter
 
 from cherrypy.lib.sessions import Session
 import redis
-import cherrypy
 from redis import Sentinel
+from redis.exceptions import LockError
+
+log = logging.getLogger(__name__)
+
+
+class SessionMetrics:
+    """
+    Thread-safe timings and counters for session loads, saves, and lock waits. We keep totals
+    plus a window of recent samples so the diagnostics pages can show percentiles.
+    """
+    timings = ['load', 'save', 'lock_wait']
+    window = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = {name: 0 for name in self.timings}
+            self.totals = {name: 0.0 for name in self.timings}
+            self.maxes = {name: 0.0 for name in self.timings}
+            self.recent = {name: deque(maxlen=self.window) for name in self.timings}
+            self.counters = {'saves_skipped': 0, 'lock_timeouts': 0, 'lock_leases_expired': 0, 'bytes_written': 0}
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.counts[name] += 1
+            self.totals[name] += seconds
+            self.maxes[name] = max(self.maxes[name], seconds)
+            self.recent[name].append(seconds)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def snapshot(self):
+        """Returns a dictionary of all metrics, with timings in milliseconds."""
+        with self._lock:
+            stats = dict(self.counters)
+            for name in self.timings:
+                recent = sorted(self.recent[name])
+                stats[name] = {
+                    'count': self.counts[name],
+                    'avg_ms': round(1000 * self.totals[name] / self.counts[name], 3) if self.counts[name] else 0,
+                    'max_ms': round(1000 * self.maxes[name], 3),
+                    'p50_ms': round(1000 * recent[len(recent) // 2], 3) if recent else 0,
+                    'p95_ms': round(1000 * recent[int(len(recent) * 0.95)], 3) if recent else 0,
+                }
+            return stats
+
+
+session_metrics = SessionMetrics()
+
+
+class SessionSerializer:
+    """
+    Stored sessions start with a two-byte header: the format version and a set of flags. The
+    rest is the pickled session data, compressed with zlib if it's at least `compress_min_bytes`
+    long (prereg carts full of sessionized attendees shrink several times over).
+
+    Sessions saved before we had a header are a pickled (data, expiration_time) tuple, which
+    always starts with the pickle protocol opcode, so we can still tell them apart and read them.
+    """
+    version = 1
+    compressed = 0x01
+    legacy_prefix = pickle.PROTO[0]
+
+    def __init__(self, compress_min_bytes=1024):
+        self.compress_min_bytes = compress_min_bytes
+
+    @staticmethod
+    def dumps(data):
+        return pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+    def encode(self, pickled):
+        flags = 0
+        if self.compress_min_bytes is not None and len(pickled) >= self.compress_min_bytes:
+            flags |= self.compressed
+            pickled = zlib.compress(pickled)
+        return bytes([self.version, flags]) + pickled
+
+    def decode(self, value):
+        """
+        Returns a tuple of (data, pickled data, expiration_time). The expiration time is only
+        set for legacy sessions; otherwise, Redis expires the session for us.
+        """
+        if value[0] == self.legacy_prefix:
+            data, expiration_time = pickle.loads(value)
+            return data, None, expiration_time
+
+        version, flags, payload = value[0], value[1], value[2:]
+        if version != self.version:
+            raise ValueError(f"Unknown session format version {version}")
+        if flags & self.compressed:
+            payload = zlib.decompress(payload)
+        return pickle.loads(payload), payload, None
+
 
 class RedisSession(Session):
 
@@ -21,7 +121,14 @@ class RedisSession(Session):
     is_sentinel = False
     ssl = False
     user = ""
+    lock_lease = 30
+    lock_wait = 35
+    compress_min_bytes = 1024
 
+    serializer = SessionSerializer()
+    _loaded_digest = None
+    _local_lock = None
+    _redis_lock = None
 
     @classmethod
     def setup(cls, **kwargs):
@@ -32,15 +139,17 @@ class RedisSession(Session):
         for k, v in kwargs.items():
             setattr(cls, k, v)
 
+        cls.serializer = SessionSerializer(cls.compress_min_bytes)
+
         if cls.tls_skip_verify:
-            cls.ssl_cert_req=None
+            cls.ssl_cert_req = None
         else:
-            cls.ssl_cert_req="required"
+            cls.ssl_cert_req = "required"
 
         if cls.is_sentinel:
             sentinel = Sentinel([(cls.host, cls.port)], ssl=cls.ssl, ssl_cert_reqs=cls.ssl_cert_req, sentinel_kwargs={"password":cls.sentinel_pass, "ssl": cls.ssl, "ssl_cert_reqs": cls.ssl_cert_req}, username=cls.user, password=cls.password)
             cls.cache = sentinel.master_for(cls.sentinel_service)
-            
+
         else:
             cls.cache = redis.Redis(
                 host=cls.host,
@@ -50,44 +159,99 @@ class RedisSession(Session):
                 username=cls.user,
                 password=cls.password)
 
+    @staticmethod
+    def _digest(pickled):
+        return hashlib.blake2b(pickled, digest_size=16).digest()
+
     def _exists(self):
         return bool(self.cache.exists(self.prefix+self.id))
 
     def _load(self):
+        start = perf_counter()
         try:
-          return pickle.loads(self.cache.get(self.prefix+self.id))
-        except TypeError:
-          # if id not defined pickle can't load None and raise TypeError
-          return None
+            value = self.cache.get(self.prefix+self.id)
+            if value is None:
+                return None
+            data, pickled, expiration_time = self.serializer.decode(value)
         except Exception as e:
             # Keep the entire thread from getting stuck
             self._delete()
             raise e
+        finally:
+            session_metrics.record('load', perf_counter() - start)
 
-    def _save(self, expiration_time):
-        pickled_data = pickle.dumps(
-            (self._data, expiration_time),
-            pickle.HIGHEST_PROTOCOL)
+        if pickled is not None:
+            self._loaded_digest = self._digest(pickled)
+        return data, expiration_time or self.now() + timedelta(minutes=self.timeout)
 
-        result = self.cache.setex(self.prefix+self.id, self.timeout * 60, pickled_data)
+    def _save(self, expiration_time):
+        """
+        Redis expires sessions for us, so expiration_time isn't stored. If the data hasn't
+        changed since we loaded it, we just push back the expiration instead of rewriting it.
+        """
+        start = perf_counter()
+        try:
+            key = self.prefix + self.id
+            pickled = self.serializer.dumps(self._data)
+            if self._loaded_digest == self._digest(pickled) and self.cache.expire(key, self.timeout * 60):
+                session_metrics.incr('saves_skipped')
+                return
 
-        if not result:
-            raise AssertionError("Session data for id %r not set." % self.prefix+self.id)
+            value = self.serializer.encode(pickled)
+            result = self.cache.setex(key, self.timeout * 60, value)
+            if not result:
+                raise AssertionError("Session data for id %r not set." % key)
+            session_metrics.incr('bytes_written', len(value))
+        finally:
+            session_metrics.record('save', perf_counter() - start)
 
     def _delete(self):
         self.cache.delete(self.prefix+self.id)
 
     # http://docs.cherrypy.org/dev/refman/lib/sessions.html?highlight=session#locking-sessions
-    # session id locks as done in RamSession
+    # Requests for the same session are serialized with a lock in Redis, so that they're exclusive
+    # across all of our app servers. The lock has a lease, so a crashed server can't hold it forever.
+    # Threads in the same process queue up on a local lock first; these are weakly referenced, so
+    # they disappear once nobody holds or is waiting on them.
 
-    locks = {}
+    locks = weakref.WeakValueDictionary()
+    locks_lock = threading.Lock()
 
     def acquire_lock(self):
         """Acquire an exclusive lock on the currently-loaded session data."""
+        start = perf_counter()
+        with self.locks_lock:
+            self._local_lock = self.locks.setdefault(self.prefix+self.id, threading.RLock())
+        self._local_lock.acquire()
         self.locked = True
-        self.locks.setdefault(self.prefix+self.id, threading.RLock()).acquire()
+
+        self._redis_lock = self.cache.lock(self.prefix + 'lock:' + self.id, timeout=self.lock_lease,
+                                           sleep=0.05, blocking_timeout=self.lock_wait)
+        try:
+            acquired = self._redis_lock.acquire()
+        except redis.RedisError:
+            log.warning(f"Could not lock session {self.id}", exc_info=True)
+            acquired = False
+
+        if not acquired:
+            log.warning(f"Timed out waiting {self.lock_wait} seconds for the lock on session {self.id}; "
+                        "continuing without it")
+            session_metrics.incr('lock_timeouts')
+            self._redis_lock = None
+        session_metrics.record('lock_wait', perf_counter() - start)
 
     def release_lock(self):
         """Release the lock on the currently-loaded session data."""
-        self.locks[self.prefix+self.id].release()
-        self.locked = False
+        try:
+            if self._redis_lock:
+                self._redis_lock.release()
+        except LockError:
+            # Our lease ran out, and another request may have taken the lock since
+            session_metrics.incr('lock_leases_expired')
+        except redis.RedisError:
+            log.warning(f"Could not unlock session {self.id}", exc_info=True)
+        finally:
+            self._redis_lock = None
+            self._local_lock.release()
+            self._local_lock = None
+            self.locked = False
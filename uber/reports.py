@@ -27,7 +27,7 @@ class PersonalizedBadgeReport(ReportBase):
     def run(self, out, session, *filters, order_by=None, badge_type_override=None):
         for a in (session.query(Attendee).join(BadgeInfo)
                          .filter(Attendee.has_badge == True, *filters)  # noqa: E712
-                         .order_by(order_by).all()):
+                         .order_by(order_by).yield_per(c.EXPORT_YIELD_PER)):
 
             # write the actual data
             row = [a.id, a.badge_num] if self._include_badge_nums else [a.id]
@@ -168,6 +168,89 @@ def resave_all_attendees_and_groups():
     print("Done!")
 
 
+@entry_point
+def rebuild_attendee_search():
+    """
+    Rebuild the attendee_search table, which backs the attendee search box, from scratch. It's
+    normally kept up to date as attendees are saved, so this is only needed if rows were changed
+    outside of the app (e.g., with raw SQL) or if we change what goes into each search document.
+    """
+    from uber.models import attendee_search_index
+
+    with Session() as session:
+        if not attendee_search_index.available(session):
+            print("The attendee search index is only supported on Postgres.")
+            return
+        attendee_search_index.rebuild(session)
+        session.commit()
+    print("Done!")
+
+
+@entry_point
+def reconcile_receipt_balances():
+    """
+    Recalculate the receipt_balance table, which backs balance-based receipt reports, and fix any
+    rows that don't match their receipts. It's kept up to date as receipts change, so this is only
+    needed if receipt items or transactions were changed outside of the app (e.g., with raw SQL).
+    """
+    from uber.models import receipt_balances
+
+    with Session() as session:
+        receipt_ids = receipt_balances.reconcile(session)
+        session.commit()
+    print(f"Fixed {len(receipt_ids)} receipt balance(s).")
+
+
+@entry_point
+def run_terminal_gateway():
+    """
+    Run the terminal gateway, which sends card sales queued by Celery workers to the payment terminals
+    and waits on all of them at once. Only used if spin_terminal_gateway is set.
+    """
+    import asyncio
+    from uber.terminal_gateway import TerminalGateway
+
+    gateway = TerminalGateway()
+    try:
+        asyncio.run(gateway.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gateway.close()
+
+
+@entry_point
+def precompile_templates():
+    """
+    Compile every template, including plugin overrides, into the template bytecode cache
+    (c.TEMPLATE_BYTECODE_DIR), so that servers and workers don't have to compile them on
+    their first requests after a deploy. Pass --manifest to print the file each template
+    name resolves to, with any files it overrides.
+    """
+    from time import perf_counter
+    from uber.jinja import JinjaEnv
+
+    if not c.TEMPLATE_BYTECODE_DIR:
+        print("template_bytecode_dir is not set, so there's nowhere to put compiled templates.")
+        exit(1)
+
+    start = perf_counter()
+    compiled, errors = JinjaEnv.precompile()
+    print("Compiled {} templates into {} in {:.1f} seconds".format(
+        compiled, c.TEMPLATE_BYTECODE_DIR, perf_counter() - start))
+
+    for filename, error in sorted(errors.items()):
+        print("Could not compile {}: {}".format(filename, error))
+
+    if '--manifest' in sys.argv:
+        manifest = JinjaEnv.env().manifest
+        print(dumps({name: [filename for _, filename in matches]
+                     for name, matches in sorted(manifest.items())}, indent=2))
+
+    if errors:
+        exit(1)
+
+
 @entry_point
 def insert_admin():
     with Session() as session:
@@ -1,4 +1,5 @@
 import cherrypy
+import os
 from barcode import Code39
 from barcode.writer import ImageWriter
 from collections import defaultdict
@@ -14,6 +15,7 @@ from decimal import Decimal
 from sqlalchemy import or_, and_
 from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.orm.exc import NoResultFound
+from cherrypy.lib.static import serve_file
 from io import BytesIO
 
 from uber.config import c
@@ -25,8 +27,10 @@ from uber.forms import load_forms
 from uber.models import AdminAccount, ArtShowApplication, ArtShowBidder, ArtShowPayment, ArtShowPiece, ArtShowReceipt, ArtShowPanel, \
                         ArtPanelAssignment, Attendee, BadgeInfo, Email, Tracking, PageViewTracking, ReceiptItem, ReceiptTransaction, \
                         WorkstationAssignment
-from uber.utils import check, get_static_file_path, localized_now, Order, validate_model
+from uber.utils import check, localized_now, Order, validate_model
 from uber.payments import TransactionRequest, ReceiptManager
+from uber.pdfs import BidSheetDocument, PdfJob, pdf_filename
+from uber.tasks.pdfs import render_pdf_job
 
 log = logging.getLogger(__name__)
 
@@ -776,8 +780,6 @@ class Root:
         return png_file_output
 
     def bid_sheet_pdf(self, session, id, **params):
-        import fpdf
-
         app = session.get(ArtShowApplication, id, options=[selectinload(ArtShowApplication.art_show_pieces)])
 
         if 'piece_id' in params:
@@ -800,35 +802,46 @@ class Root:
         else:
             pieces = app.art_show_pieces
 
-        pdf = fpdf.FPDF(unit='pt', format='letter')
-        pdf.add_font('3of9', '', get_static_file_path('free3of9.ttf'), uni=True)
-        pdf.add_font('NotoSans', '', get_static_file_path('NotoSans-Regular.ttf'), uni=True)
-        pdf.add_font('NotoSans Bold', '', get_static_file_path('NotoSans-Bold.ttf'), uni=True)
-        normal_font_name = 'NotoSans'
-        bold_font_name = 'NotoSans Bold'
+        document = BidSheetDocument()
+        document.add_pieces(pieces)
 
-        def set_fitted_font_size(text, font_size=12, max_size=160):
-            pdf.set_font_size(size=font_size)
-            while pdf.get_string_width(text) > max_size:
-                font_size -= 0.2
-                pdf.set_font_size(size=font_size)
+        cherrypy.response.headers['Content-Type'] = 'application/pdf'
+        cherrypy.response.headers['Content-Disposition'] = 'inline; filename={}.pdf'.format(
+            pdf_filename(app.display_name))
+        return document.output()
 
-        for index, piece in enumerate(sorted(pieces, key=lambda piece: (piece.gallery_label, piece.piece_id))):
-            sheet_num = index % 4
-            if sheet_num == 0:
-                pdf.add_page()
+    def all_bid_sheets(self, session, message='', job_id=''):
+        return {
+            'message': message,
+            'job_id': job_id,
+            'job': PdfJob(job_id).get() if job_id else {},
+        }
 
-            piece.print_bidsheet(pdf, sheet_num, normal_font_name, bold_font_name, set_fitted_font_size)
+    def start_all_bid_sheets(self, session):
+        job = PdfJob.start('bid_sheets', 'art show bid sheets',
+                           requested_by=AdminAccount.admin_name() or '')
+        render_pdf_job.delay(job.job_id)
+        raise HTTPRedirect('all_bid_sheets?job_id={}', job.job_id)
 
-        import unicodedata
-        filename = str(unicodedata.normalize('NFKD', piece.app.display_name).encode('ascii', 'ignore'))
-        filename = re.sub(r'[^\w\s-]', '', filename[1:]).strip().lower()
-        filename = re.sub(r'[-\s]+', '-', filename)
-        filename = filename + "_" + localized_now().strftime("%m%d%Y_%H%M")
+    @ajax
+    def poll_pdf_job(self, session, job_id):
+        job = PdfJob(job_id).get()
+        if not job:
+            return {'success': False, 'message': "That PDF could not be found. It may have expired."}
+        return {'success': True, 'job': job}
 
-        cherrypy.response.headers['Content-Type'] = 'application/pdf'
-        cherrypy.response.headers['Content-Disposition'] = 'inline; filename={}.pdf'.format(filename)
-        return bytes(pdf.output())
+    @ajax
+    def cancel_pdf_job(self, session, job_id):
+        PdfJob(job_id).cancel()
+        return {'success': True, 'message': "Cancelling..."}
+
+    def download_pdf_job(self, session, job_id):
+        job = PdfJob(job_id)
+        info = job.get()
+        if info.get('status') != 'done' or not os.path.exists(job.filepath):
+            raise HTTPRedirect('all_bid_sheets?job_id={}&message={}', job_id,
+                               "That PDF isn't available. It may have expired.")
+        return serve_file(job.filepath, 'application/pdf', 'inline', name=info['filename'] + '.pdf')
 
     def bidder_signup(self, session, message='', page=1, search_text='', order=''):
         filters = []
@@ -6,7 +6,8 @@ from sqlalchemy import func, or_, and_
 from sqlalchemy.orm import joinedload, lazyload
 
 from uber.custom_tags import format_currency
-from uber.models import ArtShowApplication, ArtShowBidder, ArtShowPiece, ArtShowReceipt, Attendee, ModelReceipt
+from uber.models import (ArtShowApplication, ArtShowBidder, ArtShowPiece, ArtShowReceipt, Attendee, ModelReceipt,
+                         receipt_balance)
 from uber.utils import localized_now
 
 
@@ -250,9 +251,9 @@ class Root:
     def artist_receipt_discrepancies(self, session):
         apps = session.query(ArtShowApplication).filter(
             ArtShowApplication.status == c.APPROVED
-            ).join(ArtShowApplication.active_receipt).outerjoin(ModelReceipt.receipt_items).group_by(
-                ModelReceipt.id).group_by(ArtShowApplication.id).having(
-                    ArtShowApplication.true_default_cost_cents != ModelReceipt.fkless_item_total_sql).options(
+            ).join(ArtShowApplication.active_receipt).join(
+                receipt_balance, receipt_balance.c.receipt_id == ModelReceipt.id).filter(
+                    ArtShowApplication.true_default_cost_cents != receipt_balance.c.fkless_item_total).options(
                         lazyload("*")
                     )
 
@@ -262,21 +263,18 @@ class Root:
 
     @log_pageview
     def artists_nonzero_balance(self, session, include_no_receipts=False, include_discrepancies=False):
-        item_subquery = session.query(ModelReceipt.owner_id, ModelReceipt.item_total_sql.label('item_total')
-                                      ).join(ModelReceipt.receipt_items).group_by(ModelReceipt.owner_id).subquery()
-
         if include_discrepancies:
             filter = True
         else:
-            filter = ArtShowApplication.true_default_cost_cents == item_subquery.c.item_total
+            filter = ArtShowApplication.true_default_cost_cents == receipt_balance.c.item_total
 
         apps_and_totals = session.query(
-            ArtShowApplication, ModelReceipt.payment_total_sql, ModelReceipt.refund_total_sql, item_subquery.c.item_total
-            ).filter(ArtShowApplication.status == c.APPROVED).join(ArtShowApplication.active_receipt).outerjoin(
-                ModelReceipt.receipt_txns).join(item_subquery, ArtShowApplication.id == item_subquery.c.owner_id).group_by(
-                    ModelReceipt.id).group_by(ArtShowApplication.id).group_by(item_subquery.c.item_total).having(
-                        and_((ModelReceipt.payment_total_sql - ModelReceipt.refund_total_sql) != item_subquery.c.item_total,
-                             filter)).options(lazyload("*"))
+            ArtShowApplication, receipt_balance.c.payment_total, receipt_balance.c.refund_total,
+            receipt_balance.c.item_total
+            ).filter(ArtShowApplication.status == c.APPROVED).join(ArtShowApplication.active_receipt).join(
+                receipt_balance, receipt_balance.c.receipt_id == ModelReceipt.id).filter(
+                    receipt_balance.c.payment_total - receipt_balance.c.refund_total != receipt_balance.c.item_total,
+                    filter).options(lazyload("*"))
 
         if include_no_receipts:
             apps_no_receipts = session.query(ArtShowApplication).outerjoin(
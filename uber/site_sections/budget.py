@@ -11,7 +11,7 @@ from uber.config import c
 from uber.decorators import all_renderable, log_pageview, csv_file
 from uber.errors import HTTPRedirect
 from uber.models import (ArbitraryCharge, Attendee, AttendeeAccount, Group, ModelReceipt, MPointsForCash, Sale, PromoCodeGroup,
-                         ReceiptTransaction, ReceiptItem)
+                         ReceiptTransaction, ReceiptItem, receipt_balance, receipt_balances)
 from uber.server import redirect_site_section
 from uber.utils import localized_now, Order
 
@@ -20,18 +20,10 @@ from uber.models import ReceiptTransaction, ReceiptItem, AttendeeAccount
 log = logging.getLogger(__name__)
 
 
-def _build_item_subquery(session):
-    return session.query(ModelReceipt.owner_id, ModelReceipt.item_total_sql.label('item_total')
-                         ).join(ModelReceipt.receipt_items).group_by(ModelReceipt.owner_id).subquery()
-
-def _build_txn_subquery(session):
-    return session.query(ModelReceipt.owner_id, ModelReceipt.payment_total_sql.label('payment_total'),
-                         ModelReceipt.refund_total_sql.label('refund_total')
-                         ).join(ModelReceipt.receipt_txns).group_by(ModelReceipt.owner_id).subquery()
-
-def _build_discount_subquery(session):
-    return session.query(ModelReceipt.owner_id, ModelReceipt.discount_total_sql.label('discount_total')
-                         ).join(ModelReceipt.receipt_discounts).group_by(ModelReceipt.owner_id).subquery()
+def _build_paid_filters(balances):
+    # Returns the (paid, unpaid) filters for owners joined to receipt_balances.owner_totals()
+    amount_paid = balances.c.payment_total - balances.c.refund_total
+    return amount_paid >= balances.c.item_total, amount_paid < balances.c.item_total
 
 def get_grouped_costs(session, filters=[], joins=[], selector=Attendee.badge_cost):
     # Returns a defaultdict with the {int(cost): count} of badges
@@ -54,13 +46,12 @@ def get_dict_sum(dict_to_sum):
 class Root:
     @log_pageview
     def index(self, session):
-        receipt_items = session.query(ReceiptItem)
-        receipt_total = sum([item.amount for item in receipt_items.filter_by(txn_type=c.PAYMENT).all()]
-                            ) - sum([item.amount for item in receipt_items.filter_by(txn_type=c.REFUND).all()])
-        sales_total = sum([sale.cash * 100 for sale in session.query(Sale).all()])
-        arbitrary_charge_total = sum([charge.amount * 100 for charge in session.query(ArbitraryCharge).all()])
+        receipt_total = session.query(func.coalesce(func.sum(
+            receipt_balance.c.payment_total - receipt_balance.c.refund_total), 0)).scalar()
+        sales_total = session.query(func.coalesce(func.sum(Sale.cash * 100), 0)).scalar()
+        arbitrary_charge_total = session.query(func.coalesce(func.sum(ArbitraryCharge.amount * 100), 0)).scalar()
         return {
-            'receipt_items': receipt_items.filter_by(txn_type=c.REFUND),
+            'refunds': session.query(ReceiptTransaction).filter(ReceiptTransaction.amount < 0),
             'arbitrary_charges': session.query(ArbitraryCharge),
             'sales': session.query(Sale),
             'total': receipt_total + sales_total + arbitrary_charge_total,
@@ -68,9 +59,8 @@ class Root:
 
     def badge_cost_summary(self, session):
         attendees = session.query(Attendee)
-        item_subquery = _build_item_subquery(session)
-        txn_subquery = _build_txn_subquery(session)
-        discount_subquery = _build_discount_subquery(session)  # TODO: Make this work
+        balances = receipt_balances.owner_totals(session)
+        paid_filter, unpaid_filter = _build_paid_filters(balances)
 
         base_filter = [Attendee.has_or_will_have_badge]
 
@@ -85,16 +75,10 @@ class Root:
             *group_filter).join(Attendee.group).filter(Group.cost > 0, Group.auto_recalc == False).count()  # noqa: E712
 
         group_subquery_base = session.query(Attendee.id).filter(*group_filter).outerjoin(
-            Attendee.group).filter(*badge_cost_matters_filter).outerjoin(
-                item_subquery, Group.id == item_subquery.c.owner_id
-                ).outerjoin(txn_subquery, Group.id == txn_subquery.c.owner_id).group_by(Attendee.id).group_by(
-                    item_subquery.c.item_total).group_by(txn_subquery.c.payment_total).group_by(
-                        txn_subquery.c.refund_total)
-
-        paid_group_subquery = group_subquery_base.having(
-            (txn_subquery.c.payment_total - txn_subquery.c.refund_total) >= item_subquery.c.item_total).subquery()
-        unpaid_group_subquery = group_subquery_base.having(
-            (txn_subquery.c.payment_total - txn_subquery.c.refund_total) < item_subquery.c.item_total).subquery()
+            Attendee.group).filter(*badge_cost_matters_filter).join(balances, Group.id == balances.c.owner_id)
+
+        paid_group_subquery = group_subquery_base.filter(paid_filter).subquery()
+        unpaid_group_subquery = group_subquery_base.filter(unpaid_filter).subquery()
         paid_group_badges = get_grouped_costs(
             session, joins=[(paid_group_subquery, Attendee.id == paid_group_subquery.c.id)])
         unpaid_group_badges = get_grouped_costs(
@@ -129,16 +113,11 @@ class Root:
         individual_filter = base_filter + [not_(Attendee.paid.in_([c.PAID_BY_GROUP, c.NEED_NOT_PAY])),
                                            Attendee.promo_code_group_name == None,  # noqa: E711
                                            Attendee.badge_cost > 0]
-        ind_subquery_base = session.query(Attendee.id).filter(*individual_filter).outerjoin(
-                item_subquery, Attendee.id == item_subquery.c.owner_id
-                ).outerjoin(txn_subquery, Attendee.id == txn_subquery.c.owner_id).group_by(Attendee.id).group_by(
-                    item_subquery.c.item_total).group_by(txn_subquery.c.payment_total).group_by(
-                        txn_subquery.c.refund_total)
-        
-        paid_ind_subquery = ind_subquery_base.having(
-            (txn_subquery.c.payment_total - txn_subquery.c.refund_total) >= item_subquery.c.item_total).subquery()
-        unpaid_ind_subquery = ind_subquery_base.having(
-            (txn_subquery.c.payment_total - txn_subquery.c.refund_total) < item_subquery.c.item_total).subquery()
+        ind_subquery_base = session.query(Attendee.id).filter(*individual_filter).join(
+            balances, Attendee.id == balances.c.owner_id)
+
+        paid_ind_subquery = ind_subquery_base.filter(paid_filter).subquery()
+        unpaid_ind_subquery = ind_subquery_base.filter(unpaid_filter).subquery()
 
         individual_badges = get_grouped_costs(session, joins=[(paid_ind_subquery, Attendee.id == paid_ind_subquery.c.id)])
         unpaid_badges = get_grouped_costs(session, filters=[Attendee.default_cost > 0],
@@ -253,19 +232,12 @@ class Root:
         extra_donation_filter = base_filter + [Attendee.extra_donation > 0]
         badge_upgrade_filter = base_filter + [Attendee.badge_type.in_(c.BADGE_TYPE_PRICES)]
 
-        item_subquery = _build_item_subquery(session)
-        txn_subquery = _build_txn_subquery(session)
+        balances = receipt_balances.owner_totals(session)
+        paid_filter, unpaid_filter = _build_paid_filters(balances)
+        addons_subquery_base = session.query(Attendee.id).join(balances, Attendee.id == balances.c.owner_id)
 
-        addons_subquery_base = session.query(Attendee.id).outerjoin(
-                item_subquery, Attendee.id == item_subquery.c.owner_id
-                ).outerjoin(txn_subquery, Attendee.id == txn_subquery.c.owner_id).group_by(Attendee.id).group_by(
-                    item_subquery.c.item_total).group_by(txn_subquery.c.payment_total).group_by(
-                        txn_subquery.c.refund_total)
-        
-        paid_addons_subquery = addons_subquery_base.having(
-            (txn_subquery.c.payment_total - txn_subquery.c.refund_total) >= item_subquery.c.item_total).subquery()
-        unpaid_addons_subquery = addons_subquery_base.having(
-            (txn_subquery.c.payment_total - txn_subquery.c.refund_total) < item_subquery.c.item_total).subquery()
+        paid_addons_subquery = addons_subquery_base.filter(paid_filter).subquery()
+        unpaid_addons_subquery = addons_subquery_base.filter(unpaid_filter).subquery()
 
         paid_preordered_merch = get_grouped_costs(session,
                                                   filters=preordered_merch_filter,
@@ -1,8 +1,8 @@
-from sqlalchemy import or_, and_
+from sqlalchemy import or_
 
 from uber.config import c
 from uber.decorators import all_renderable, csv_file, xlsx_file, log_pageview
-from uber.models import Group, ModelReceipt
+from uber.models import Group, ModelReceipt, receipt_balance
 from uber.utils import extract_urls
 
 
@@ -15,9 +15,9 @@ class Root:
         else:
             filters = [or_(Group.is_dealer == False, Group.status.in_(c.DEALER_ACCEPTED_STATUSES))]
 
-        groups = session.query(Group).filter(*filters).join(Group.active_receipt).outerjoin(
-            ModelReceipt.receipt_items).group_by(ModelReceipt.id).group_by(Group.id).having(
-                Group.cost_cents != ModelReceipt.fkless_item_total_sql)
+        groups = session.query(Group).filter(*filters).join(Group.active_receipt).join(
+            receipt_balance, receipt_balance.c.receipt_id == ModelReceipt.id).filter(
+                Group.cost_cents != receipt_balance.c.fkless_item_total)
 
         return {
             'groups': groups,
@@ -26,21 +26,17 @@ class Root:
 
     @log_pageview
     def dealers_nonzero_balance(self, session, include_no_receipts=False, include_discrepancies=False):
-        item_subquery = session.query(ModelReceipt.owner_id, ModelReceipt.item_total_sql.label('item_total')
-                                      ).join(ModelReceipt.receipt_items).group_by(ModelReceipt.owner_id).subquery()
-        
         if include_discrepancies:
             filter = True
         else:
-            filter = Group.cost_cents == item_subquery.c.item_total
+            filter = Group.cost_cents == receipt_balance.c.item_total
 
         groups_and_totals = session.query(
-            Group, ModelReceipt.payment_total_sql, ModelReceipt.refund_total_sql, item_subquery.c.item_total
-            ).filter(Group.is_valid == True).join(Group.active_receipt).outerjoin(
-                ModelReceipt.receipt_txns).join(item_subquery, Group.id == item_subquery.c.owner_id).group_by(
-                    ModelReceipt.id).group_by(Group.id).group_by(item_subquery.c.item_total).having(
-                        and_((ModelReceipt.payment_total_sql - ModelReceipt.refund_total_sql) != item_subquery.c.item_total,
-                             filter))
+            Group, receipt_balance.c.payment_total, receipt_balance.c.refund_total, receipt_balance.c.item_total
+            ).filter(Group.is_valid == True).join(Group.active_receipt).join(
+                receipt_balance, receipt_balance.c.receipt_id == ModelReceipt.id).filter(
+                    receipt_balance.c.payment_total - receipt_balance.c.refund_total != receipt_balance.c.item_total,
+                    filter)
         
         if include_no_receipts:
             groups_no_receipts = session.query(Group).outerjoin(ModelReceipt,
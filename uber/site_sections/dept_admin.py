@@ -1,6 +1,5 @@
 import cherrypy
 from sqlalchemy.orm import joinedload, selectinload, subqueryload
-from datetime import timedelta
 
 from uber.config import c
 from uber.custom_tags import pluralize, yesno, readable_join
@@ -245,39 +244,19 @@ class Root:
 
     @csv_file
     def overworked_attendees(self, out, session):
-        def single_sequence(attendee, start_minute, minute_map):
-            all_depts_limit = 1000
-            minutes_worked = 0
-            current_minute = start_minute
-            while current_minute in minute_map:
-                dept_limit = minute_map[current_minute].max_consecutive_minutes
-                if dept_limit > 0:
-                    all_depts_limit = min(all_depts_limit, dept_limit)
-                minutes_worked += 1
-                current_minute = current_minute + timedelta(minutes=1)
-
-            if minutes_worked > all_depts_limit:
-                # reiterate over to gather department names
-                current_minute = start_minute
-                departments_overworked = set()
-                while current_minute in minute_map:
-                    dept_limit = minute_map[current_minute].max_consecutive_minutes
-                    if dept_limit > 0 and minutes_worked > dept_limit:
-                        departments_overworked.add(minute_map[current_minute].department_name)
-                    current_minute = current_minute + timedelta(minutes=1)
-                out.writerow([attendee.full_name,
-                              start_minute.astimezone(c.EVENT_TIMEZONE),
-                              minutes_worked] +
-                             list(departments_overworked))
-
         out.writerow(["Attendee name", "Start of overworked shift sequence",
                       "Length of shift sequence", "Departments overworked in"])
         for attendee in session.query(Attendee).filter(Attendee.staffing == True).all():  # noqa: E712
-            minute_map = attendee.shift_minute_map
-            for start_minute in minute_map:
-                # only look at start-of-sequence minutes
-                if start_minute - timedelta(minutes=1) not in minute_map:
-                    single_sequence(attendee, start_minute, minute_map)
+            for start, end, jobs in attendee.shift_intervals.blocks():
+                minutes_worked = end - start
+                dept_limits = [job.max_consecutive_minutes for job in jobs if job.max_consecutive_minutes > 0]
+                if minutes_worked > min(dept_limits, default=1000):
+                    departments_overworked = {job.department_name for job in jobs
+                                              if 0 < job.max_consecutive_minutes < minutes_worked}
+                    out.writerow([attendee.full_name,
+                                  min(job.start_time for job in jobs).astimezone(c.EVENT_TIMEZONE),
+                                  minutes_worked] +
+                                 list(departments_overworked))
 
     def role(self, session, department_id=None, message='', **params):
         if not department_id or department_id == 'None':
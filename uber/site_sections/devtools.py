@@ -19,8 +19,13 @@ from pytz import UTC
 from sqlalchemy.types import DateTime
 from sqlalchemy import text
 
-from uber.decorators import all_renderable, csv_file, public, site_mappable
-from uber.models import Choice, UniqueList, MultiChoice, Session
+from uber.config import c, config_cache
+from uber.decorators import ajax, all_renderable, csv_file, public, site_mappable
+from uber.errors import HTTPRedirect
+from uber.models import AdminAccount, Choice, UniqueList, MultiChoice, Session
+from uber.property_search import PropertySearch, parse_property_search
+from uber.redis_session import session_metrics
+from uber.tasks.devtools import run_property_search
 from uber.tasks.health import ping
 
 log = logging.getLogger(__name__)
@@ -44,10 +49,12 @@ def run_git_cmd(cmd):
 
 
 def prepare_model_export(model, filtered_models=None):
-    rows = []
-
+    """
+    Yields a header row and then one row per model, so that exports can be written as the
+    models are loaded, e.g. from a yield_per query.
+    """
     cols = [getattr(model, col.name) for col in model.__table__.columns]
-    rows.append([col.name for col in cols])
+    yield [col.name for col in cols]
 
     for model in filtered_models:
         row = []
@@ -75,8 +82,7 @@ def prepare_model_export(model, filtered_models=None):
                 # For everything else we'll just dump the value, although we might
                 # consider adding more special cases for things like foreign keys.
                 row.append(getattr(model, col.name))
-        rows.append(row)
-    return rows
+        yield row
 
 def _get_thread_current_stacktrace(thread_stack, thread):
     out = []
@@ -123,6 +129,12 @@ def general_system_info():
 def database_pool_information():
     return Session.engine.pool.status()
 
+def session_store_information():
+    return json.dumps(session_metrics.snapshot(), indent=2)
+
+def config_cache_information():
+    return json.dumps({'this_process': config_cache.snapshot(), 'all_processes': config_cache.all_stats()}, indent=2)
+
 @all_renderable()
 class Root:
     def index(self):
@@ -146,7 +158,8 @@ class Root:
 
     def dump_diagnostics(self):
         out = ''
-        for func in [general_system_info, threading_information, database_pool_information]:
+        for func in [general_system_info, threading_information, database_pool_information,
+                     session_store_information, config_cache_information]:
             out += '--------- {} ---------\n{}\n\n\n'.format(func.__name__.replace('_', ' ').upper(), func())
         return {
             'diagnostics_data': out,
@@ -203,7 +216,7 @@ class Root:
     @site_mappable
     def csv_export(self, message='', **params):
         if 'model' in params:
-            self.export_model(selected_model=params['model'])
+            return self.export_model(selected_model=params['model'])
 
         return {
             'message': message,
@@ -213,10 +226,46 @@ class Root:
     @csv_file
     def export_model(self, out, session, selected_model=''):
         model = Session.resolve_model(selected_model)
-        rows = prepare_model_export(model, filtered_models=session.query(model).all())
+        rows = prepare_model_export(model, filtered_models=session.query(model).yield_per(c.EXPORT_YIELD_PER))
         for row in rows:
             out.writerow(row)
 
+    def property_search(self, message='', search_id='', text=''):
+        search = PropertySearch(search_id).get() if search_id else {}
+        return {
+            'message': message,
+            'search_id': search_id,
+            'search': search,
+            'text': text or search.get('text', ''),
+            'recent_searches': PropertySearch.recent(),
+        }
+
+    def start_property_search(self, text=''):
+        groups, error = parse_property_search(text)
+        if error:
+            raise HTTPRedirect('property_search?text={}&message={}', text, error)
+
+        search = PropertySearch.start(text, requested_by=AdminAccount.admin_name() or '')
+        run_property_search.delay(search.search_id)
+        raise HTTPRedirect('property_search?search_id={}', search.search_id)
+
+    @ajax
+    def poll_property_search(self, search_id):
+        search = PropertySearch(search_id).get()
+        if not search:
+            return {'success': False, 'message': "That search could not be found. It may have expired."}
+        return {'success': True, 'search': search}
+
+    @ajax
+    def cancel_property_search(self, search_id):
+        PropertySearch(search_id).cancel()
+        return {'success': True, 'message': "Cancelling search..."}
+
+    @csv_file
+    def property_search_results(self, out, session, search_id):
+        for row in PropertySearch(search_id).results():
+            out.writerow(row)
+
     @public
     def health(self, session):
         cherrypy.response.headers["Access-Control-Allow-Origin"] = "*"
@@ -239,4 +288,6 @@ class Root:
             'session_commit_time': session_commit_time,
             'db_read_time': db_read_time,
             'db_status': Session.engine.pool.status(),
+            'session_metrics': session_metrics.snapshot(),
+            'config_cache': config_cache.snapshot(),
         })
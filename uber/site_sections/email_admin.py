@@ -261,9 +261,15 @@ class Root:
             return {"success": False, 'message': email_check_error}
         elif email_check_count:
             c.REDIS_STORE.delete(c.REDIS_PREFIX + 'email_generation:' + id)
+            checked = ''
+            if email_check_status.get('candidates'):
+                checked = (f" Checked {email_check_status['candidates']} candidate(s) in "
+                           f"{email_check_status.get('seconds', '?')} seconds.")
             if email_check_count == '0':
-                return {"success": True, 'message': "There were no new emails to generate."}
-            return {"success": True, 'message': f"{email_check_count} email(s) generated."}
+                return {"success": True, 'message': "There were no new emails to generate." + checked}
+            if email_check_status.get('per_second'):
+                checked += f" That's {email_check_status['per_second']} emails per second."
+            return {"success": True, 'message': f"{email_check_count} email(s) generated." + checked}
         
     @ajax
     @requires_email_admin('dept_head')
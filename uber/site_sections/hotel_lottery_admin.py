@@ -2,16 +2,12 @@ import base64
 import pycountry
 import cherrypy
 import logging
-import random
 import math
-from copy import deepcopy
 from collections import defaultdict
 from datetime import datetime, timedelta
-from dateutil import parser as dateparser
 from sqlalchemy import and_, func, or_
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import contains_eager, joinedload
 from sqlalchemy.types import String
-from ortools.linear_solver import pywraplp
 
 from uber.config import c
 from uber.custom_tags import datetime_local_filter
@@ -19,7 +15,9 @@ from uber.decorators import all_renderable, log_pageview, ajax, xlsx_file, csv_f
 from uber.email import EmailService
 from uber.errors import HTTPRedirect
 from uber.forms import load_forms
+from uber.hotel_lottery import LotteryRun
 from uber.models import Attendee, Group, LotteryApplication, Email, Tracking, PageViewTracking
+from uber.tasks.hotel_lottery import run_hotel_lottery
 from uber.utils import Order, get_page, localized_now, validate_model, get_age_from_birthday, normalize_email_legacy
 
 log = logging.getLogger(__name__)
@@ -53,128 +51,6 @@ def _search(session, text):
 
     return applications.filter(or_(*check_list)), ''
 
-def weight_entry(entry, hotel_room, base_weight):
-    """Takes a lottery entry and a hotel room and returns an arbitrary score for how likely that applicant
-        should be to get that particular room.
-    """
-    weight = 0
-    
-    # Give 10 points for being the first choice hotel, 9 points for the second, etc
-    hotel_choice_rank = 10 - entry["hotels"].index(hotel_room["id"])
-    weight += hotel_choice_rank
-    
-    # Give 10 points for being the first choice room type, 9 points for the second, etc
-    try:
-        room_type_rank = 10 - entry["room_types"].index(hotel_room["room_type"])
-        assert room_type_rank >= 0
-        weight += room_type_rank
-    except ValueError:
-        # room types are optional, so we need to figure out how much weight to give people who don't choose any
-        weight += 9 # Probably fine?
-    
-    return weight + base_weight
-    
-def solve_lottery(applications, hotel_rooms, lottery_type=c.ROOM_ENTRY):
-    """Takes a set of hotel_rooms and applications and assigns the hotel_rooms mostly randomly.
-        Parameters:
-        applications List[Application]: Iterable set of Application objects to assign
-        hotel_rooms  List[hotels]: Iterable set of hotel rooms, represented as dictionaries with the following keys:
-        * id: c.HOTEL_LOTTERY_HOTELS_OPTS
-        * capacity: int
-        * min_capacity: int
-        * room_type: c.HOTEL_LOTTERY_ROOM_TYPE_OPTS
-        * quantity: int
-        
-        Returns Dict[Applications -> hotel, room_type]: A mapping of Application.id -> (id, room_type) or None if it failed
-    """
-    random.shuffle(applications)
-    solver = pywraplp.Solver.CreateSolver("SAT")
-    solver.SetSolverSpecificParametersAsString("log_search_progress: true")
-
-    # Set up our data structures
-    for hotel_room in hotel_rooms:
-        hotel_room["constraints"] = []
-    entries = {}
-    for app in applications:
-        if app.entry_type == lottery_type or (lottery_type == c.ROOM_ENTRY and
-                                              app.entry_type == c.SUITE_ENTRY and
-                                              app.room_opt_out is False):
-            if lottery_type == c.ROOM_ENTRY:
-                entry = {
-                    "members": [app],
-                    "hotels": app.hotel_preference.split(","),
-                    "room_types": app.room_type_preference.split(","),
-                    "constraints": []
-                }
-            elif lottery_type == c.SUITE_ENTRY:
-                entry = {
-                    "members": [app],
-                    "hotels": app.hotel_preference.split(","),
-                    "room_types": app.suite_type_preference.split(","),
-                    "constraints": []
-                }
-            entries[app.id] = entry
-                    
-    for app in applications:
-        if app.parent_application and app.parent_application.id in entries:
-            entries[app.parent_application.id]["members"].append(app)
-    
-    for app_id, entry in entries.items():
-        # Bias weights based on group weights
-        base_weight = 0
-        if random.random() < c.HOTEL_LOTTERY["weights"][f"group_weight_{len(entry['members'])}"]:
-            base_weight = c.HOTEL_LOTTERY["weights"][f"group_base_{len(entry['members'])}"]
-        
-        for hotel_room in hotel_rooms:
-            if hotel_room["id"] in entry["hotels"] and hotel_room["room_type"] in entry["room_types"] and (hotel_room["min_capacity"] <= len(entry["members"]) <= hotel_room["capacity"]):
-                weight = weight_entry(entry, hotel_room, base_weight)
-                
-                # Each constraint is a tuple of (BoolVar(), weight, hotel_room)
-                constraint = solver.BoolVar(f'{app_id}_assigned_to_{hotel_room["id"]}')
-                entry["constraints"].append((constraint, weight, hotel_room))
-                hotel_room["constraints"].append(constraint)
-    
-    # Set up constraints
-    ## Only allow each room type to fit only the quantity available
-    for hotel_room in hotel_rooms:
-        if hotel_room["constraints"]:
-            print(f"hotel_room {hotel_room['name']} constraints {len(hotel_room['constraints'])}, {hotel_room['quantity']}: {type(hotel_room['quantity'])}", flush=True)
-            solver.Add(sum(hotel_room["constraints"]) <= hotel_room["quantity"])   
-    
-    ## Only allow each group to have one room
-    for app, entry in entries.items():
-        solver.Add(sum([x[0] for x in entry["constraints"]]) <= 1)
-    
-    # Set up Objective function
-    objective = solver.Objective()
-    for app, entry in entries.items():
-        for is_assigned, weight, hotel_room in entry["constraints"]:
-            objective.SetCoefficient(is_assigned, weight)
-    
-    objective.SetMaximization()
-    
-    # Run the solver
-    status = solver.Solve()
-    histogram = {x: 0 for x in range(1, 5)}
-    if status in [pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE]:
-        # If it's optimal we know we got an ideal solution
-        # If it's feasible then we may have been on the way to an ideal solution,
-        # but we gave up searching because we ran out of time or something
-        assignments = {}
-        for app, entry in entries.items():
-            for is_assigned, weight, hotel_room in entry["constraints"]:
-                if is_assigned.solution_value() > 0.5:
-                    assert not app in assignments
-                    for member in entry["members"]:
-                        assignments[member.id] = (hotel_room["id"], hotel_room["room_type"])
-                    histogram[len(entry["members"])] += 1
-        for group_size, room_count in histogram.items():
-            print(f"  {group_size}: {room_count}")
-        return assignments
-    else:
-        log.error(f"Error solving room lottery: {status}")
-        return None
-
 @all_renderable()
 class Root:
     def index(self, session, message='', page='0', search_text='', order='status'):
@@ -442,90 +318,55 @@ class Root:
                            f"{total} {lottery_type_val} {lottery_group_val} processed lottery entries have been awarded.")
         
     def run_lottery(self, session, lottery_group="attendee", lottery_type="room", **params):
-        if lottery_type == "room":
-            lottery_type_val = c.ROOM_ENTRY
-        if lottery_type == "suite":
-            lottery_type_val = c.SUITE_ENTRY
-        applications = session.query(LotteryApplication).join(LotteryApplication.attendee
-                                                              ).filter(LotteryApplication.status == c.COMPLETE,
-                                                                       Attendee.hotel_lottery_eligible == True)
-
-        if params.get('cutoff', ''):
-            last_time = dateparser.parse(params['cutoff']).replace(tzinfo=c.EVENT_TIMEZONE)
-            applications = applications.filter(LotteryApplication.last_submitted < last_time)
-
-        # We always grab all roommate entries, but the solver only looks at those that have a matching parent
-        # in the lottery batch.
-        if lottery_type_val == c.SUITE_ENTRY:
-            applications = applications.filter(LotteryApplication.entry_type.in_([lottery_type_val, c.GROUP_ENTRY]))
-        else:
-            applications = applications.filter(or_(LotteryApplication.entry_type.in_([lottery_type_val, c.GROUP_ENTRY]),
-                                                   LotteryApplication.room_opt_out == False))
-
-        # If lottery_group is "both" don't filter either way
-        if lottery_group == "staff":
-            applications = applications.filter(LotteryApplication.is_staff_entry == True)
-        elif lottery_group == "attendee":
-            applications = applications.filter(LotteryApplication.is_staff_entry == False)
-            
-        applications = applications.all()
-        assigned_applications = session.query(LotteryApplication.assigned_hotel,
-                                              LotteryApplication.assigned_room_type,
-                                              func.count(LotteryApplication.id)).join(LotteryApplication.attendee).filter(
-                                                  LotteryApplication.status.in_(c.HOTEL_LOTTERY_AWARD_STATUSES),
-                                                  LotteryApplication.entry_type != c.GROUP_ENTRY,
-                                                  ).group_by(LotteryApplication.assigned_hotel).group_by(
-                                                      LotteryApplication.assigned_room_type).all()
-        
-        assigned_applications_dict = {(hotel, room_type): count for hotel, room_type, count in assigned_applications}
-
-        if lottery_type_val == c.SUITE_ENTRY:
+        if lottery_type not in ["room", "suite"]:
+            raise HTTPRedirect('index?message={}', f"Unknown lottery type {lottery_type}.")
+
+        cutoff = params.get('cutoff', '')
+        run, started = LotteryRun.start(lottery_group=lottery_group, lottery_type=lottery_type, cutoff=cutoff)
+        if not started:
+            raise HTTPRedirect('lottery_results?run_id={}&message={}', run.run_id,
+                               "Another lottery is already running. Its progress is shown below.")
+
+        run_hotel_lottery.delay(run.run_id, lottery_group, lottery_type, cutoff)
+        raise HTTPRedirect('lottery_results?run_id={}', run.run_id)
+
+    def lottery_results(self, session, run_id, message=''):
+        lottery_run = LotteryRun(run_id).get()
+        if not lottery_run:
+            raise HTTPRedirect('index?message={}', "That lottery run could not be found. It may have expired.")
+
+        if lottery_run['status'] != 'done':
+            return {
+                'run_id': run_id,
+                'lottery_run': lottery_run,
+                'message': message,
+            }
+
+        applications = session.query(LotteryApplication).filter(
+            LotteryApplication.lottery_name == lottery_run['lottery_name']).all()
+        if int(lottery_run['lottery_type_val']) == c.SUITE_ENTRY:
             room_or_suite_lookup = dict(c.HOTEL_LOTTERY_SUITE_ROOM_TYPES_OPTS)
-            inventory_table = c.HOTEL_LOTTERY_SUITE_INVENTORY
         else:
             room_or_suite_lookup = dict(c.HOTEL_LOTTERY_ROOM_TYPES_OPTS)
-            inventory_table = c.HOTEL_LOTTERY_ROOM_INVENTORY
 
-        available_rooms = deepcopy(inventory_table)
-        for hotel_and_room in available_rooms:
-            hotel, room_type = int(hotel_and_room['id']), int(hotel_and_room['room_type'])
-            if assigned_applications_dict.get((hotel, room_type)):
-                hotel_and_room['quantity'] -= assigned_applications_dict[(hotel, room_type)]
-
-        assignments = solve_lottery(applications, available_rooms, lottery_type=lottery_type_val)
-
-        num_rooms_assigned = 0
-        lottery_name = f"{lottery_group}_{lottery_type}_{localized_now().strftime('%Y%m%d_%H%M%S')}"
-        for application in applications:
-            if application.id in assignments:
-                hotel, room_type = assignments[application.id]
-                application.assigned_hotel = hotel
-                application.lottery_name = lottery_name
-                if lottery_type_val == c.SUITE_ENTRY:
-                    application.assigned_suite_type = room_type
-                elif lottery_type_val == c.ROOM_ENTRY:
-                    application.assigned_room_type = room_type
-                else:
-                    raise NotImplementedError(f"Unknown lottery type {lottery_type}")
-                # For now, everyone gets the dates they picked
-                application.assigned_check_in_date = application.earliest_checkin_date
-                application.assigned_check_out_date = application.latest_checkout_date
-                application.status = c.PROCESSED
-                session.add(application)
-                if not application.parent_application:
-                    num_rooms_assigned += 1
-        session.commit()
-        application_lookup = {x.id: x for x in applications}
-        
         return {
-            'lottery_type': lottery_type_val,
-            'num_rooms_available_before': sum([x['quantity'] for x in available_rooms]),
-            'num_rooms_available_after': sum([x['quantity'] for x in available_rooms]) - num_rooms_assigned,
-            'num_entries': len([x for x in applications if x.entry_type == lottery_type]),
-            'assignments': [(application_lookup[x], y[0], y[1]) for x, y in assignments.items()],
+            'run_id': run_id,
+            'lottery_run': lottery_run,
+            'message': message,
+            'num_rooms_available_before': int(lottery_run['num_rooms_available_before']),
+            'num_rooms_available_after': int(lottery_run['num_rooms_available_after']),
+            'num_entries': int(lottery_run['num_entries']),
+            'assignments': [(app, app.assigned_hotel, app.assigned_room_or_suite_type) for app in applications],
             'hotel_lookup': dict(c.HOTEL_LOTTERY_HOTELS_OPTS),
             'room_or_suite_lookup': room_or_suite_lookup,
         }
+
+    @ajax
+    def poll_lottery(self, session, run_id, **params):
+        lottery_run = LotteryRun(run_id).get()
+        if not lottery_run:
+            return {'success': False, 'message': "That lottery run could not be found. It may have expired."}
+        return {'success': True, 'run': lottery_run}
     
     def hotel_inventory(self, session, message=''):
         assigned_applications = session.query(
@@ -713,7 +554,8 @@ class Root:
         else:
             applications = applications.filter(LotteryApplication.is_staff_entry == False)
 
-        for app in applications:
+        applications = applications.options(contains_eager(LotteryApplication.attendee))
+        for app in applications.yield_per(c.EXPORT_YIELD_PER):
             attendee = app.attendee
             row = []
 
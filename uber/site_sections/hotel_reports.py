@@ -10,6 +10,7 @@ from uber.config import c
 from uber.decorators import all_renderable, csv_file
 from uber.models import Attendee, HotelRequests, Job, Room, RoomAssignment, Shift
 from uber.utils import noon_datetime
+from uber.zipcodes import zip_code_index
 
 log = logging.getLogger(__name__)
 
@@ -420,19 +421,18 @@ class Root:
             'Zip Code',
             'Non-US?'
         ])
-        engine = None
+        index = None
         if c.MAPS_ENABLED:
-            from uszipcode import SearchEngine
             try:
-                engine = SearchEngine(db_file_dir=c.MAPS_DIR)
-            except Exception as e:
-                log.error("Error calling SearchEngine: " + e)
+                index = zip_code_index()
+            except Exception:
+                log.error("Error loading the zip code index", exc_info=True)
 
         for attendee in session.valid_attendees().filter(Attendee.is_unassigned == False):  # noqa: E712
             city = ''
             state = ''
-            if engine and attendee.zip_code and not attendee.international:
-                simple_zip = engine.by_zipcode(attendee.zip_code[:5])
+            simple_zip = index.lookup(attendee.zip_code) if index and not attendee.international else None
+            if simple_zip:
                 city = simple_zip.city
                 state = simple_zip.state
             out.writerow([
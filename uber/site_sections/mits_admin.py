@@ -75,16 +75,10 @@ class Root:
         }
 
     def badges(self, session):
-        possibles = session.possible_match_list()
-
-        applicants = []
-        for team in session.mits_teams():
-            if team.status == c.ACCEPTED:
-                for a in team.applicants:
-                    if not a.attendee_id:
-                        applicants.append([a, set(possibles[a.email.lower()] + possibles[a.first_name, a.last_name])])
-
-        return {'applicants': applicants}
+        unlinked = [a for team in session.mits_teams() if team.status == c.ACCEPTED
+                    for a in team.applicants if not a.attendee_id]
+        possibles = session.possible_matches(unlinked)
+        return {'applicants': [[a, possibles[a]] for a in unlinked]}
 
     def teams_and_badges(self, session):
         return {
@@ -288,14 +288,9 @@ class Root:
         }
 
     def badges(self, session):
-        possibles = session.possible_match_list()
-
-        applicants = []
-        for pa in session.panel_applicants():
-            if not pa.attendee_id and pa.accepted_applications:
-                applicants.append([pa, set(possibles[pa.email.lower()] + possibles[pa.first_name, pa.last_name])])
-
-        return {'applicants': applicants}
+        unlinked = [pa for pa in session.panel_applicants() if not pa.attendee_id and pa.accepted_applications]
+        possibles = session.possible_matches(unlinked)
+        return {'applicants': [[pa, possibles[pa]] for pa in unlinked]}
 
     @ajax
     def link_badge(self, session, applicant_id, attendee_id):
@@ -1189,14 +1189,11 @@ class Root:
         raise HTTPRedirect('orphaned_attendees?show_all={}&message={}', show_all, ' '.join(messages))
 
     def payment_pending_attendees(self, session):
-        possibles = session.possible_match_list()
-        attendees = []
-        pending = session.query(Attendee).filter_by(paid=c.PENDING).filter(Attendee.badge_status != c.INVALID_STATUS)
-        for attendee in pending:
-            attendees.append([attendee, set(possibles[attendee.email.lower()] +
-                                            possibles[attendee.first_name, attendee.last_name])])
+        pending = session.query(Attendee).filter_by(paid=c.PENDING).filter(
+            Attendee.badge_status != c.INVALID_STATUS).all()
+        possibles = session.possible_matches(pending)
         return {
-            'attendees': attendees,
+            'attendees': [[attendee, possibles[attendee]] for attendee in pending],
         }
 
     @ajax
@@ -1378,7 +1375,7 @@ class Root:
                                ).format(search_text, order, invalid, error)
         attendees = attendees.order(order)
 
-        rows = devtools.prepare_model_export(Attendee, filtered_models=attendees)
+        rows = devtools.prepare_model_export(Attendee, filtered_models=attendees.yield_per(c.EXPORT_YIELD_PER))
         for row in rows:
             out.writerow(row)
 
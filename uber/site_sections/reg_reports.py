@@ -9,7 +9,8 @@ from sqlalchemy.sql.expression import literal
 from uber.config import c
 from uber.custom_tags import datetime_local_filter, format_currency
 from uber.decorators import all_renderable, log_pageview, csv_file
-from uber.models import Attendee, Group, PromoCode, ReceiptTransaction, ModelReceipt, ReceiptItem, Tracking
+from uber.models import (Attendee, Group, PromoCode, ReceiptTransaction, ModelReceipt, ReceiptItem, Tracking,
+                         receipt_balance)
 from uber.utils import localize_datetime
 
 
@@ -88,10 +89,9 @@ class Root:
         else:
             filter = Attendee.is_valid == True  # noqa: E712
 
-        attendees = session.query(Attendee).filter(
-            filter).join(Attendee.active_receipt).outerjoin(ModelReceipt.receipt_items).group_by(
-                ModelReceipt.id).group_by(Attendee.id).having(
-                    Attendee.default_cost_cents != ModelReceipt.fkless_item_total_sql).options(lazyload("*"))
+        attendees = session.query(Attendee).filter(filter).join(Attendee.active_receipt).join(
+            receipt_balance, receipt_balance.c.receipt_id == ModelReceipt.id).filter(
+                Attendee.default_cost_cents != receipt_balance.c.fkless_item_total).options(lazyload("*"))
 
         return {
             'attendees': attendees,
@@ -100,21 +100,17 @@ class Root:
 
     @log_pageview
     def attendees_nonzero_balance(self, session, include_no_receipts=False, include_discrepancies=False):
-        item_subquery = session.query(ModelReceipt.owner_id, ModelReceipt.item_total_sql.label('item_total')
-                                      ).join(ModelReceipt.receipt_items).group_by(ModelReceipt.owner_id).subquery()
-
         if include_discrepancies:
             filter = True
         else:
-            filter = Attendee.default_cost_cents == item_subquery.c.item_total
+            filter = Attendee.default_cost_cents == receipt_balance.c.item_total
 
         attendees_and_totals = session.query(
-            Attendee, ModelReceipt.payment_total_sql, ModelReceipt.refund_total_sql, item_subquery.c.item_total
-            ).filter(Attendee.is_valid == True).join(Attendee.active_receipt).outerjoin(
-                ModelReceipt.receipt_txns).join(item_subquery, Attendee.id == item_subquery.c.owner_id).group_by(
-                    ModelReceipt.id).group_by(Attendee.id).group_by(item_subquery.c.item_total).having(
-                        and_((ModelReceipt.payment_total_sql - ModelReceipt.refund_total_sql) != item_subquery.c.item_total,
-                             filter)).options(lazyload("*"))
+            Attendee, receipt_balance.c.payment_total, receipt_balance.c.refund_total, receipt_balance.c.item_total
+            ).filter(Attendee.is_valid == True).join(Attendee.active_receipt).join(
+                receipt_balance, receipt_balance.c.receipt_id == ModelReceipt.id).filter(
+                    receipt_balance.c.payment_total - receipt_balance.c.refund_total != receipt_balance.c.item_total,
+                    filter).options(lazyload("*"))
         
         if include_no_receipts:
             attendees_no_receipts = session.query(Attendee).outerjoin(
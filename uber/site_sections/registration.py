@@ -120,7 +120,7 @@ def create_new_account(session, attendee):
 
 @all_renderable()
 class Root:
-    def index(self, session, message='', page='0', search_text='', uploaded_id='', order='last_first', invalid=''):
+    def index(self, session, message='', page='0', search_text='', uploaded_id='', order='', invalid=''):
         # DEVELOPMENT ONLY: it's an extremely convenient shortcut to show the first page
         # of search results when doing testing. it's too slow in production to do this by
         # default due to the possibility of large amounts of reg stations accessing this
@@ -152,11 +152,16 @@ class Root:
             attendees = session.index_attendees().filter(*filter)
             count = attendees.count()
 
-        if order in ['badge_num', '-badge_num']:
+        if order:
+            # Choosing a sort order overrides the search index's relevance ranking
+            attendees = attendees.order_by(None)
+        sort_order = order or 'last_first'
+
+        if sort_order in ['badge_num', '-badge_num']:
             attendees = attendees.order_by(BadgeInfo.ident.desc()
-                                           if order.startswith('-') else BadgeInfo.ident)
+                                           if sort_order.startswith('-') else BadgeInfo.ident)
         else:
-            attendees = attendees.order(order)
+            attendees = attendees.order(sort_order)
 
         page = int(page)
         if search_text:
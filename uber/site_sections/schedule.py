@@ -126,7 +126,7 @@ class Root:
                 EventLocation.id == location_id,
                 Event.start_time >= now - timedelta(hours=6), Event.start_time <= now).all()
             for event in approx:
-                if now in event.minutes:
+                if event.start_time <= now < event.end_time:
                     current.append(event)
 
             next_events = session.query(Event).join(Event.location).filter(
@@ -1,13 +1,12 @@
 import json
 import logging
-from collections import defaultdict
 from datetime import datetime
 from sqlalchemy import func, or_
 
 from uber.config import c
 from uber.decorators import all_renderable, ajax, multifile_zipfile, xlsx_file, _set_response_filename
 from uber.files import FileService
-from uber.models import Event,File
+from uber.models import Event, guidebook_sync_state
 from uber.utils import filename_safe, localized_now, GuidebookUtils
 from uber.tasks.panels import sync_guidebook_models
 
@@ -19,14 +18,7 @@ class Root:
     def index(self, session, message=''):
         cl_updates, schedule_updates, image_updates = GuidebookUtils.get_changed_models(session)
 
-        image_data = defaultdict(dict)
-        cl_updates_ids = [x.id for xs in cl_updates.values() for x in xs]
-        existing_headers = session.query(File).filter(File.fk_id.in_(cl_updates_ids), File.flags['guidebook_header'].astext == 'true')
-        existing_thumbnails = session.query(File).filter(File.fk_id.in_(cl_updates_ids), File.flags['guidebook_thumbnail'].astext == 'true')
-        for header in existing_headers:
-            image_data[header.fk_id]['guidebook_header'] = header
-        for thumbnail in existing_thumbnails:
-            image_data[thumbnail.fk_id]['guidebook_thumbnail'] = thumbnail
+        image_data = GuidebookUtils.guidebook_files(session, [x for xs in cl_updates.values() for x in xs])
 
         return {
             'message': message,
@@ -55,13 +47,7 @@ class Root:
             return {'success': False,
                     'message': "Couldn't find a valid model for syncing. This item may no longer qualify for Guidebook export."}
 
-        update_model.update_last_synced('guidebook', sync_time)
-        if not update_model.last_synced.get('data', {}):
-            update_model.last_synced['data'] = {}
-        update_model.last_synced['data']['guidebook'] = sync_data
-        update_model.skip_last_updated = True
-
-        session.add(update_model)
+        GuidebookUtils.mark_synced(session, selected_model, [update_model], sync_time, sync_data=sync_data)
         session.commit()
 
         return {'success': True, 'message': "Item marked as updated!", 'id': id, 'model': selected_model}
@@ -90,7 +76,7 @@ class Root:
         rows = []
         query = session.query(Event).order_by('start_time')
         if new_only:
-            query = query.filter(Event.last_synced['guidebook'] == None)
+            query = query.filter(guidebook_sync_state.never_synced(Event))
 
         for event in query.all():
             guidebook_fields = event.guidebook_data
@@ -127,8 +113,10 @@ class Root:
         rows = []
         id_list = []
         sync_time = str(datetime.now())
+        models = query.all()
+        images = GuidebookUtils.guidebook_files(session, models)
 
-        for model in query:
+        for model in models:
             id_list.append(model.id)
             if not model.guidebook_data:
                 log.error(f"Tried to export model {selected_model} for Guidebook, but it has no guidebook_data property!")
@@ -138,7 +126,7 @@ class Root:
             for key, val in c.GUIDEBOOK_PROPERTIES:
                 row.append(model.guidebook_data.get(key, '').replace('\n', '<br/>'))
 
-            files_list = GuidebookUtils.get_guidebook_images(session, model)
+            files_list = GuidebookUtils.get_guidebook_images(session, model, images)
             for filename, file in files_list:
                 row.append(filename)
             rows.append(row + ['', '', ''])
@@ -154,9 +142,11 @@ class Root:
             query = query.filter(filters[0])
 
         written_files = []
+        models = query.all()
+        images = GuidebookUtils.guidebook_files(session, models)
 
-        for model in query:
-            files_list = GuidebookUtils.get_guidebook_images(session, model)
+        for model in models:
+            files_list = GuidebookUtils.get_guidebook_images(session, model, images)
 
             for filename, file in files_list:
                 if filename and not filename in written_files:
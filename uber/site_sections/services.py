@@ -1,5 +1,4 @@
 import os
-import stripe
 import logging
 import cherrypy
 import pytz
@@ -16,7 +15,7 @@ from uber.models import AdminAccount, AttendeeAccount
 from uber.model_checks import mivs_show_info_required_fields
 from uber.utils import check, filename_extension
 from uber.files import FileService
-from uber.payments import ReceiptManager
+from uber.payment_events import PaymentEventStore
 
 
 log = logging.getLogger(__name__)
@@ -25,10 +24,10 @@ log = logging.getLogger(__name__)
 @all_renderable(public=True)
 class Root:
     @not_site_mappable
-    def download_file(self, session, id, filename='', preview=False):
+    def download_file(self, session, id, filename='', preview=False, max_pixels=500, version=''):
         file_handler = FileService.from_db_id(session, id)
         if preview:
-            return file_handler.preview(filename=filename)
+            return file_handler.preview(max_pixels=max_pixels, filename=filename, version=version)
         else:
             return file_handler.serve_file(filename=filename)
         
@@ -77,30 +76,21 @@ class Root:
         if not cherrypy.request or not cherrypy.request.body:
             cherrypy.response.status = 400
             return "Request required"
-        sig_header = cherrypy.request.headers.get('Stripe-Signature', '')
         payload = cherrypy.request.body.read()
-        event = None
+        store = PaymentEventStore()
 
         try:
-            event = stripe.Webhook.construct_event(
-                payload, sig_header, c.STRIPE_ENDPOINT_SECRET
-            )
-        except ValueError:
+            event = store.source.from_webhook(payload, cherrypy.request.headers)
+        except ValueError as e:
             cherrypy.response.status = 400
-            return "Invalid payload: " + payload
-        except stripe.error.SignatureVerificationError:
-            cherrypy.response.status = 400
-            return "Invalid signature: " + sig_header
+            return str(e)
 
         if not event:
-            cherrypy.response.status = 400
-            return "No event"
+            return "Event type not tracked"
 
-        if event and event['type'] == 'payment_intent.succeeded':
-            payment_intent = event['data']['object']
-            matching_txns = ReceiptManager.mark_paid_from_stripe_intent(session, payment_intent)
-            if not matching_txns:
-                cherrypy.response.status = 400
-                return "No matching Stripe transactions"
-            cherrypy.response.status = 200
-            return "Payments marked complete for payment intent ID " + payment_intent['id']
\ No newline at end of file
+        # Record the event before acting on it, so the poller can retry it if reconciling fails
+        store.record(session, [event])
+        session.commit()
+        if not store.reconcile(session, [event.event_id]):
+            return "No pending transactions for payment intent ID " + event.intent_id
+        return "Payments marked complete for payment intent ID " + event.intent_id
@@ -12,6 +12,7 @@ from uber.errors import HTTPRedirect
 from uber.forms import load_forms
 from uber.models import Attendee, Job, FoodRestrictions
 from uber.utils import check_csrf, create_valid_user_supplied_redirect_url, ensure_csrf_token_exists, localized_now, extract_urls, validate_model
+from uber.volunteer_checklist import VolunteerChecklistItem
 
 log = logging.getLogger(__name__)
 
@@ -51,7 +52,8 @@ class Root:
         else:
             return {
                 'message': message,
-                'attendee': attendee
+                'attendee': attendee,
+                'checklist_items': VolunteerChecklistItem.statuses(session, [attendee])[attendee.id],
             }
 
     @requires_account()
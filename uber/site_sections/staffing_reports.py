@@ -1,8 +1,6 @@
 import cherrypy
-import os
-import re
 
-from collections import defaultdict, OrderedDict
+from collections import defaultdict
 from datetime import timedelta
 from dateutil import parser as dateparser
 
@@ -10,8 +8,10 @@ from sqlalchemy import and_
 from sqlalchemy.orm import subqueryload, selectinload
 
 from uber.config import c
-from uber.decorators import all_renderable, csv_file, render
+from uber.decorators import all_renderable, csv_file
 from uber.models import Attendee, Department, DeptMembership, Job
+from uber.utils import epoch_minute, ShiftIntervals
+from uber.volunteer_checklist import VolunteerChecklistItem
 
 
 def volunteer_checklists(session):
@@ -20,38 +20,16 @@ def volunteer_checklists(session):
             Attendee.staffing == True,  # noqa: E712
             Attendee.badge_status.in_([c.NEW_STATUS, c.COMPLETED_STATUS])).options(
                 selectinload(Attendee.hotel_requests), selectinload(Attendee.food_restrictions),
-                selectinload(Attendee.shifts)
+                selectinload(Attendee.shifts), selectinload(Attendee.assigned_depts)
             ) \
         .order_by(Attendee.full_name, Attendee.id).all()
 
-    checklist_items = OrderedDict()
-    for item_template in c.VOLUNTEER_CHECKLIST:
-        item_name = os.path.splitext(os.path.basename(item_template))[0]
-        if item_name.endswith('_item'):
-            item_name = item_name[:-5]
-        item_name = item_name.replace('_', ' ').title()
-        checklist_items[item_name] = item_template
-
-    re_checkbox = re.compile(r'<img src="\.\./static/images/checkbox_.*?/>')
+    statuses = VolunteerChecklistItem.statuses(session, attendees)
     for attendee in attendees:
-        attendee.checklist_items = OrderedDict()
-        for item_name, item_template in checklist_items.items():
-            html = render(item_template, {'attendee': attendee}, encoding=None)
-            match = re_checkbox.search(html)
-            is_complete = False
-            is_applicable = False
-            if match:
-                is_applicable = True
-                checkbox_html = match.group(0)
-                if 'checkbox_checked' in checkbox_html:
-                    is_complete = True
-            attendee.checklist_items[item_name] = {
-                'is_applicable': is_applicable,
-                'is_complete': is_complete,
-            }
+        attendee.checklist_items = statuses[attendee.id]
 
     return {
-        'checklist_items': checklist_items,
+        'checklist_items': VolunteerChecklistItem.checklist_items(),
         'attendees': attendees,
     }
 
@@ -132,17 +110,12 @@ class Root:
                     filters = [Job.start_time < end, Job.end_time > start]
                     if department_id:
                         filters.append(Job.department_id == department_id)
-                    minutes = set()
-                    minute = start
-                    while minute < end:
-                        minutes.add(minute)
-                        minute += timedelta(minutes=1)
+                    # The filters above already select exactly the jobs overlapping [start, end)
                     for job in session.query(Job).filter(*filters):
-                        if minutes.intersection(job.minutes):
-                            for shift in job.shifts:
-                                if shift.attendee.badge_type != c.CONTRACTOR_BADGE and (
-                                        shift.attendee.badge_type == c.STAFF_BADGE or shift.attendee.weighted_hours >= c.HOURS_FOR_FOOD):
-                                    staffers.add(shift.attendee)
+                        for shift in job.shifts:
+                            if shift.attendee.badge_type != c.CONTRACTOR_BADGE and (
+                                    shift.attendee.badge_type == c.STAFF_BADGE or shift.attendee.weighted_hours >= c.HOURS_FOR_FOOD):
+                                staffers.add(shift.attendee)
 
         return {
             'message': message,
@@ -171,29 +144,35 @@ class Root:
                 out.writerow([a.badge_num, a.full_name, a.email, a.weighted_hours, a.worked_hours])
 
     def restricted_untaken(self, session):
-        untaken = defaultdict(lambda: defaultdict(list))
+        untaken_jobs = defaultdict(list)
         for job in session.jobs():
             if job.restricted and job.slots_taken < job.slots:
-                for minute in job.minutes:
-                    untaken[job.department_id][minute].append(job)
+                untaken_jobs[job.department_id].append(job)
+        untaken = {department_id: ShiftIntervals(jobs) for department_id, jobs in untaken_jobs.items()}
         flagged = []
         for attendee in session.staffers():
             if not attendee.is_dept_head:
                 overlapping = defaultdict(set)
                 for shift in attendee.shifts:
                     if not shift.job.restricted:
+                        start = epoch_minute(shift.job.start_time)
+                        end = start + int(shift.job.duration)
                         for dept in attendee.assigned_depts:
-                            for minute in shift.job.minutes:
-                                if attendee.trusted_in(dept) and minute in untaken[dept]:
-                                    overlapping[shift.job].update(untaken[dept][minute])
+                            if attendee.trusted_in(dept) and dept.id in untaken \
+                                    and untaken[dept.id].overlaps(start, end):
+                                overlapping[shift.job].update(untaken[dept.id].jobs_between(start, end))
                 if overlapping:
                     flagged.append([attendee, sorted(overlapping.items(), key=lambda tup: tup[0].start_time)])
         return {'flagged': flagged}
 
     def consecutive_threshold(self, session):
         def exceeds_threshold(start_time, attendee):
-            time_slice = (start_time, start_time + timedelta(hours=18))
-            return len([h for h in attendee.shift_minutes if time_slice[0] < h < time_slice[1]]) >= 13 * 60
+            # Count worked minutes strictly inside the 18-hour window
+            window_start = epoch_minute(start_time) + 1
+            window_end = epoch_minute(start_time + timedelta(hours=18))
+            minutes_worked = sum(max(0, min(end, window_end) - max(start, window_start))
+                                 for start, end, jobs in attendee.shift_intervals.blocks())
+            return minutes_worked >= 13 * 60
         flagged = []
         for attendee in session.staffers():
             if attendee.staffing and attendee.unweighted_hours >= 12:
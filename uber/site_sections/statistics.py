@@ -1,6 +1,5 @@
 from collections import Counter, defaultdict, OrderedDict
 
-from geopy.distance import geodesic
 import logging
 import six
 from sqlalchemy import func
@@ -11,6 +10,7 @@ from uber.config import c
 from uber.decorators import ajax, all_renderable, csv_file, not_site_mappable
 from uber.jinja import JinjaEnv
 from uber.models import Attendee, Group, PromoCode
+from uber.zipcodes import normalize_zip_code, zip_code_index
 
 log = logging.getLogger(__name__)
 
@@ -232,103 +232,76 @@ class Root:
         }
 
     if c.MAPS_ENABLED:
-        from uszipcode import SearchEngine
-
+        default_center_zip = '20745'
         zips_counter = Counter()
         zips = {}
-        try:
-            center = SearchEngine(db_file_dir="/srv/reggie/data").by_zipcode(20745)  # noqa: F821
-        except Exception as e:
-            log.error("Error calling SearchEngine: " + e)
+        center = None
+
+        def _get_center(self):
+            if not self.center:
+                self.center = zip_code_index().lookup(self.default_center_zip)
+            return self.center
 
         def map(self):
             return {
                 'zip_counts': self.zips_counter,
-                'center': self.center,
+                'center': self._get_center(),
                 'zips': self.zips
             }
 
         @ajax
         def refresh(self, session, **params):
-            from uszipcode import SearchEngine
+            zip_code = func.substr(Attendee.zip_code, 1, 5)
+            counts = session.query(zip_code, func.count(Attendee.id)).filter(Attendee.zip_code != '').group_by(zip_code)
 
-            zips = {}
             self.zips_counter = Counter()
-            attendees = session.query(Attendee).all()
-            for person in attendees:
-                if person.zip_code:
-                    self.zips_counter[person.zip_code] += 1
-
-            for z in self.zips_counter.keys():
-                try:
-                    found = SearchEngine(db_file_dir="/srv/reggie/data").by_zipcode(int(z))
-                except Exception as e:
-                    log.error("Error calling SearchEngine: " + e)
-                else:
-                    if found.zipcode:
-                        zips[z] = found
+            for z, count in counts:
+                self.zips_counter[normalize_zip_code(z)] += count
 
-            self.zips = zips
+            self.zips = zip_code_index().lookup_many(list(self.zips_counter))
             return True
 
         @csv_file
         @not_site_mappable
         def radial_zip_data(self, out, session, **params):
-            from uszipcode import SearchEngine
-
             if params.get('radius'):
-                try:
-                    res = SearchEngine(db_file_dir="/srv/reggie/data").by_coordinates(
-                        self.center.lat, self.center.lng, radius=int(params['radius']), returns=None)
-                except Exception as e:
-                    log.error("Error calling SearchEngine: " + e)
-                else:
-                    out.writerow(['# of Attendees', 'City', 'State', 'Zipcode',
-                                  'Miles from Event', '% of Total Attendees'])
-                    if len(res) > 0:
-                        keys = self.zips.keys()
-                        center_coord = (self.center.lat, self.center.lng)
-                        total_count = session.attendees_with_badges().count()
-                        for x in res:
-                            if x.zipcode in keys:
-                                out.writerow([self.zips_counter[x.zipcode], x.city, x.state, x.zipcode,
-                                            geodesic((x.lat, x.lng), center_coord).miles,
-                                            "%.2f" % float(self.zips_counter[x.zipcode] / total_count * 100)])
+                center = self._get_center()
+                out.writerow(['# of Attendees', 'City', 'State', 'Zipcode',
+                              'Miles from Event', '% of Total Attendees'])
+                total_count = session.attendees_with_badges().count()
+                for x, miles in zip_code_index().within(center.lat, center.lng, int(params['radius'])):
+                    if x.zipcode in self.zips:
+                        out.writerow([self.zips_counter[x.zipcode], x.city, x.state, x.zipcode, miles,
+                                      "%.2f" % float(self.zips_counter[x.zipcode] / total_count * 100)])
 
         @ajax
         def set_center(self, session, **params):
-            from uszipcode import SearchEngine
-
             if params.get("zip"):
-                try:
-                    self.center = SearchEngine(db_file_dir="/srv/reggie/data").by_zipcode(int(params["zip"]))
-                except Exception as e:
-                    log.error("Error calling SearchEngine: " + e)
-                else:
+                center = zip_code_index().lookup(params["zip"])
+                if center:
+                    self.center = center
                     return "Set to %s, %s - %s" % (self.center.city, self.center.state, self.center.zipcode)
             return False
 
         @csv_file
         def attendees_by_state(self, out, session):
-            from uszipcode import SearchEngine
-
-            # set(map(lambda x: x.state, SearchEngine(db_file_dir="/srv/reggie/data").ses.query(SimpleZipcode)))
             states = ['SD', 'IL', 'WY', 'NV', 'NJ', 'NM', 'UT', 'OR', 'TX', 'NE', 'MS', 'FL', 'VA', 'HI',
                       'KY', 'MO', 'NY', 'WV', 'DC', 'AR', 'MT', 'MD', 'SC', 'NC', 'KS', 'OH', 'PR', 'CO',
                       'IN', 'VT', 'LA', 'ND', 'AZ', 'AK', 'AL', 'CT', 'TN', 'PA', 'IA', 'WA', 'ME', 'NH',
                       'MA', 'ID', 'OK', 'WI', 'GA', 'CA', 'DE', 'MN', 'MI', 'RI']
             total_count = session.attendees_with_badges().count()
 
-            out.writerow(['# of Attendees', 'State', '% of Total Attendees'])
+            zip_code = func.substr(Attendee.zip_code, 1, 5)
+            zip_counts = session.attendees_with_badges().with_entities(zip_code, func.count(Attendee.id)).filter(
+                Attendee.zip_code != '').group_by(zip_code).all()
 
+            state_counts = Counter()
+            if zip_counts:
+                zip_codes, counts = zip(*zip_counts)
+                for state, count in zip(zip_code_index().states_of(zip_codes), counts):
+                    state_counts[state] += count
+
+            out.writerow(['# of Attendees', 'State', '% of Total Attendees'])
             for state in states:
-                try:
-                    zip_codes = list(map(lambda x: x.zipcode,
-                                         SearchEngine(db_file_dir="/srv/reggie/data").by_state(state,
-                                                                                               returns=None)))
-                except Exception as e:
-                    log.error("Error calling SearchEngine: " + e)
-                else:
-                    current_count = session.attendees_with_badges().filter(Attendee.zip_code.in_(zip_codes)).count()
-                    if current_count:
-                        out.writerow([current_count, state, "%.2f" % float(current_count / total_count * 100)])
+                if state_counts[state]:
+                    out.writerow([state_counts[state], state, "%.2f" % float(state_counts[state] / total_count * 100)])
@@ -18,7 +18,7 @@ def base_request(terminal_id, auth_key):
         }
 
 def sale_request_dict(dollar_amount, payment_type, ref_id, capture_signature):
-    sale_request = templates.get("sale_request_dict")
+    sale_request = dict(templates.get("sale_request_dict"))
     sale_request[strings.get("dollar_amount")] = dollar_amount
     sale_request[strings.get("payment_type")] = payment_type
     sale_request[strings.get("ref_id")] = ref_id
@@ -37,6 +37,11 @@ def error_message_from_response(response_json):
     detailed_message = response_json[strings.get("gen_resp")].get(strings.get("det_msg"), response_json[strings.get("gen_resp")].get(strings.get("msg"), 'Unknown error.'))
     return f"{status_code}: {detailed_message}"
 
+def terminal_busy(response_json):
+    if not response_json.get(strings.get("gen_resp")):
+        return False
+    return error_message_from_response(response_json).split(": ", 1)[-1] == strings.get("error_busy")
+
 def api_response_successful(response_json):
     return response_json[strings.get("gen_resp")].get(strings.get("res"), -1) == strings.get("res_success")
 
@@ -0,0 +1,22 @@
+import logging
+
+from uber.models import Session
+from uber.property_search import PropertySearch
+from uber.tasks import celery
+
+
+log = logging.getLogger(__name__)
+
+
+__all__ = ['run_property_search']
+
+
+@celery.task
+def run_property_search(search_id):
+    search = PropertySearch(search_id)
+    try:
+        with Session() as session:
+            search.run(session)
+    except Exception as e:
+        log.exception(f"Error running property search {search_id}")
+        search.update(status='error', error=f"The search failed: {e}")
@@ -7,7 +7,7 @@ import traceback
 import logging
 
 from celery.schedules import crontab
-from sqlalchemy import select, func
+from sqlalchemy import func
 from sqlalchemy.orm import joinedload, raiseload, sessionmaker
 from sqlalchemy.orm.exc import NoResultFound
 
@@ -15,15 +15,15 @@ from uber import utils
 from uber.amazon_ses import email_sender
 from uber.automated_emails import AutomatedEmailFixture
 from uber.config import c
-from uber.email import EmailService
+from uber.email import EmailDispatcher, EmailService
 from uber.models import AutomatedEmail, Email, MagModel, UberSession, Session
 from uber.tasks import celery
 
 log = logging.getLogger(__name__)
 
 
-__all__ = ['notify_admins_of_pending_emails', 'send_automated_emails', 'send_email',
-           'check_emails_for_fixture', 'generate_missing_emails']
+__all__ = ['notify_admins_of_pending_emails', 'send_automated_emails', 'send_queued_emails', 'send_email',
+           'check_emails_for_fixture', 'check_emails_for_models', 'generate_missing_emails']
 
 def _is_dev_email(email):
     """
@@ -100,7 +100,33 @@ def check_emails_for_fixture(id):
                                "This email is not eligible for generation. Please check the send policy and date restrictions.")
         email_count = EmailService.check_emails_for_fixture(session, fixture_obj)
         if email_count or email_count == 0:
-            c.REDIS_STORE.hset(c.REDIS_PREFIX + 'email_generation:' + id, 'emails_generated', email_count)
+            stats = EmailService.generation_stats(fixture_obj.ident)
+            c.REDIS_STORE.hset(c.REDIS_PREFIX + 'email_generation:' + id, mapping={
+                'candidates': stats.get('candidates', ''),
+                'seconds': stats.get('seconds', ''),
+                'per_second': stats.get('per_second', ''),
+                'emails_generated': email_count,
+            })
+
+
+@celery.task
+def check_emails_for_models(models):
+    """
+    Checks each (model name, id) pair for automated emails, for sessions that deferred those
+    checks until after they committed; see UberSession.SessionMixin.defer_email_checks.
+    """
+    with Session() as session:
+        session.defer_email_checks(False)
+        for model_name, id in models:
+            model = session.get(Session.resolve_model(model_name), id)
+            if not model:
+                continue
+            try:
+                EmailService.check_emails_for_model(session, model)
+            except Exception as e:
+                log.error(f"Error generating emails for {model.__repr__()}: {e}")
+                traceback.print_exc()
+        session.commit()
 
 
 @celery.schedule(timedelta(minutes=60))
@@ -117,17 +143,9 @@ def generate_missing_emails():
                 c.REDIS_STORE.delete(c.REDIS_PREFIX + 'email_generation:' + id)
 
 
-@celery.schedule(timedelta(minutes=5))
-def send_automated_emails():
-    """
-    Send any queued emails while using DB locks to ensure the same email doesn't get processed twice.
-    Emails are processed per model.
-    """
+def _send_queued_emails():
     from uber.tasks import panels
 
-    if not (c.DEV_BOX or c.SEND_EMAILS):
-        return None
-
     quantity_sent = 0
     start_time = time()
     panels.setup_panel_emails(reconcile_fixtures=False)
@@ -135,23 +153,37 @@ def send_automated_emails():
     try:
         Session.session_factory = sessionmaker(bind=Session.engine, expire_on_commit=False, autoflush=False, autocommit=False,
                                                query_cls=UberSession.QuerySubclass)
-        with Session() as session:
+        with Session() as session, EmailDispatcher() as dispatcher:
             for model_class in set([fixture.model for fixture in AutomatedEmail._fixtures.values()]):
-                with Session.engine.connect() as guard_conn:
-                    model_name = model_class.__name__ if model_class else 'Classless'
-                    lock_key = model_name.lower() + '_email_queue'
-                    lock_key = int.from_bytes(lock_key.encode())  & ((1<<63)-1)
-                    log.debug(f"Attempting to lock {model_name} email queue for processing.")
-
-                    with guard_conn.begin():
-                        if guard_conn.execute(select(func.pg_try_advisory_lock(lock_key))).scalar():
-                            log.debug(f"Sending queued emails for {model_name}.")
-                            quantity_sent += EmailService.process_emails_by_class(session, model_class)
-                            session.commit()
-                            if guard_conn.execute(select(func.pg_advisory_unlock(lock_key))).scalar():
-                                log.debug(f"{model_name} email queue sent and unlocked.")
-                        else:
-                            log.debug(f"Skipping {model_name} as it is being worked by another thread.")
+                model_name = model_class.__name__ if model_class else 'Classless'
+                log.debug(f"Sending queued emails for {model_name}.")
+                quantity_sent += dispatcher.dispatch(session, model_class)
             log.info(f"Sent {quantity_sent} emails in {time() - start_time} seconds.")
     except Exception:
         traceback.print_exc()
+
+
+@celery.task
+def send_queued_emails():
+    """
+    Works through the email queue alongside any other running dispatchers. Emails are claimed
+    in batches using FOR UPDATE SKIP LOCKED, so each email is only picked up by one worker.
+    """
+    if not (c.DEV_BOX or c.SEND_EMAILS):
+        return None
+
+    _send_queued_emails()
+
+
+@celery.schedule(timedelta(minutes=5))
+def send_automated_emails():
+    """
+    Send any queued emails, spreading the work across email_send_shards Celery workers.
+    Emails are processed per model.
+    """
+    if not (c.DEV_BOX or c.SEND_EMAILS):
+        return None
+
+    for _ in range(c.EMAIL_SEND_SHARDS - 1):
+        send_queued_emails.delay()
+    _send_queued_emails()
@@ -0,0 +1,22 @@
+import logging
+
+from uber.files import ImageDerivatives
+from uber.tasks import celery
+
+
+log = logging.getLogger(__name__)
+
+
+__all__ = ['generate_image_derivatives']
+
+
+@celery.task
+def generate_image_derivatives(filepath, content_hash, extension=''):
+    """
+    Pre-renders every preview size and format of a newly uploaded image, so that the
+    first person to view it doesn't have to wait for it to be resized.
+    """
+    try:
+        ImageDerivatives(content_hash, extension).generate_all(filepath)
+    except OSError:
+        log.warning(f"Could not generate previews for {filepath}", exc_info=True)
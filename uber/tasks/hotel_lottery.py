@@ -0,0 +1,32 @@
+import logging
+
+from uber.config import c
+from uber.hotel_lottery import LotteryRun, run_lottery
+from uber.models import Session
+from uber.tasks import celery
+
+
+log = logging.getLogger(__name__)
+
+
+__all__ = ['run_hotel_lottery']
+
+
+# Building the model and saving the assignments take far less time than solving, but give them
+# plenty of room anyway; the solver itself stops after HOTEL_LOTTERY_SOLVER_SECONDS.
+@celery.task(soft_time_limit=c.HOTEL_LOTTERY_SOLVER_SECONDS + 600)
+def run_hotel_lottery(run_id, lottery_group, lottery_type, cutoff=''):
+    run = LotteryRun(run_id)
+    run.update(status='building')
+    try:
+        with Session() as session:
+            summary = run_lottery(session, lottery_group, lottery_type, cutoff, run=run)
+    except Exception as e:
+        log.exception(f"Error running the {lottery_group} {lottery_type} lottery")
+        run.finish(status='error', error=f"The lottery failed: {e}")
+        return
+
+    if summary is None:
+        run.finish(status='error', error="The solver could not find a set of room assignments.")
+    else:
+        run.finish(status='done', **summary)
@@ -1,9 +1,4 @@
-import json
-import re
-
-from collections import defaultdict
-from datetime import timedelta, datetime
-from dateutil import parser as dateparser
+from datetime import timedelta
 from sqlalchemy import or_
 
 from uber.automated_emails import PanelAppEmailFixture
@@ -11,7 +6,7 @@ from uber.config import c
 from uber.custom_tags import email_only
 from uber.decorators import render
 from uber.email import EmailService
-from uber.models import Email, Session, Tracking, Department, EventLocation, AutomatedEmail
+from uber.models import Email, Session, Department, EventLocation, AutomatedEmail
 from uber.tasks import celery
 from uber.utils import GuidebookUtils, localized_now, slugify
 
@@ -20,60 +15,15 @@ __all__ = ['panels_waitlist_unaccepted_panels', 'sync_guidebook_models', 'setup_
            'check_deleted_guidebook_models', 'check_stale_guidebook_models']
 
 
-def _get_deleted_models(session, deleted_since=None):
-    deleted_synced = session.query(Tracking).filter(Tracking.action == c.DELETED,
-                                                    Tracking.snapshot.contains('"last_synced": {"data": {"guidebook"'))
-    if deleted_since:
-        deleted_synced = deleted_synced.filter(Tracking.when > deleted_since)
-
-    deleted_models = defaultdict(list)
-    model_names = {}
-
-    for key, label in c.GUIDEBOOK_MODELS:
-        model_names[key] = label
-
-    for tracking_entry in deleted_synced:
-        snapshot = json.loads(tracking_entry.snapshot)
-        guidebook_data = snapshot['last_synced']['data']['guidebook']
-
-        model = snapshot['_model']
-        if model == 'GuestGroup':
-            model += '_band' if snapshot['group_type'] == c.BAND else '_guest'
-        elif model == 'Group':
-            model += '_dealer'
-
-        if model == 'Event':
-            model_name = 'Schedule Item'
-            start_day = datetime.strptime(guidebook_data['start_date'], '%M/%d/%Y').strftime('%A (%-m/%-d/%Y)')
-            end_day = datetime.strptime(guidebook_data['end_date'], '%M/%d/%Y').strftime('%A (%-m/%-d/%Y)')
-            if start_day != end_day:
-                item_name = f"{guidebook_data['name']} on {start_day} {guidebook_data['start_time']} to {end_day} {guidebook_data['end_time']}"
-            else:
-                item_name = f"{guidebook_data['name']} on {start_day} {guidebook_data['start_time']} to {guidebook_data['end_time']}"
-        else:
-            model_name = model_names[model]
-            item_name = guidebook_data.get('name', '???')
-
-        deleted_models[model_name].append(item_name)
-    return deleted_models
-
-
 @celery.task
 def sync_guidebook_models(selected_model, sync_time, id_list):
     with Session() as session:
         query, _ = GuidebookUtils.get_guidebook_models(session, selected_model)
         model = GuidebookUtils.parse_guidebook_model(selected_model)
-        query = query.filter(model.id.in_(id_list), model.last_updated < dateparser.parse(sync_time))
-
-        for model in query:
-            model.update_last_synced('guidebook', sync_time)
-            if not model.last_synced.get('data', {}):
-                model.last_synced['data'] = {}
-            model.last_synced['data']['guidebook'] = model.guidebook_data
-            model.skip_last_updated = True
+        query = query.filter(model.id.in_(id_list), model.last_updated < GuidebookUtils.parse_sync_time(sync_time))
 
-            session.add(model)
-            session.commit()
+        GuidebookUtils.mark_synced(session, selected_model, query.all(), sync_time)
+        session.commit()
 
 
 @celery.schedule(timedelta(hours=1))
@@ -86,7 +36,7 @@ def check_deleted_guidebook_models():
         last_email = session.query(Email).filter(Email.subject.contains("Deleted Guidebook Items")
                                                  ).first()
 
-        deleted_models = _get_deleted_models(session, deleted_since=last_email.generated) if last_email else _get_deleted_models(session)
+        deleted_models = GuidebookUtils.get_deleted_models(session, deleted_since=last_email.generated if last_email else None)
 
         if deleted_models:
             EmailService.queue_email(session, 'guidebook_deletes', to=c.GUIDEBOOK_UPDATES_EMAIL,
@@ -110,7 +60,7 @@ def check_stale_guidebook_models():
             Email.subject.contains("Deleted Guidebook Items"))
             ).first()
 
-        deleted_models = _get_deleted_models(session, deleted_since=last_email.generated) if last_email else _get_deleted_models(session)
+        deleted_models = GuidebookUtils.get_deleted_models(session, deleted_since=last_email.generated if last_email else None)
 
         if stale_models or deleted_models:
             EmailService.queue_email(session, 'guidebook_updates', to=c.GUIDEBOOK_UPDATES_EMAIL,
@@ -0,0 +1,22 @@
+import logging
+
+from uber.models import Session
+from uber.pdfs import PdfJob
+from uber.tasks import celery
+
+
+log = logging.getLogger(__name__)
+
+
+__all__ = ['render_pdf_job']
+
+
+@celery.task
+def render_pdf_job(job_id):
+    job = PdfJob(job_id)
+    try:
+        with Session() as session:
+            job.run(session)
+    except Exception as e:
+        log.exception(f"Error rendering PDF job {job_id}")
+        job.update(status='error', error=f"The PDF could not be rendered: {e}")
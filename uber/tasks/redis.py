@@ -12,7 +12,8 @@ from uber.tasks import celery
 log = logging.getLogger(__name__)
 
 
-__all__ = ['expire_processed_saml_assertions', 'set_signnow_key', 'update_shirt_counts', 'update_problem_names']
+__all__ = ['expire_processed_saml_assertions', 'reconcile_badge_counters', 'replay_tracking_journal', 'set_signnow_key',
+           'update_shirt_counts', 'update_problem_names']
 
 
 @celery.schedule(timedelta(minutes=30))
@@ -29,6 +30,38 @@ def expire_processed_saml_assertions():
     rsession.execute()
 
 
+@celery.schedule(timedelta(seconds=c.BADGE_COUNTER_RECONCILE_SECONDS))
+def reconcile_badge_counters():
+    """
+    Recounts the badge, kick-in and shirt counters from the database, correcting any
+    drift from changes that weren't captured as attendees were saved.
+    """
+    from uber.models import Session
+    from uber.models.counters import badge_counters
+
+    if not c.REDIS_BADGE_COUNTERS:
+        return
+
+    with Session() as session:
+        badge_counters.reconcile(session)
+
+
+@celery.schedule(timedelta(minutes=5))
+def replay_tracking_journal():
+    """
+    Writes any journaled tracking rows that a web or worker process didn't get
+    around to writing, e.g., because it crashed or was killed mid-batch.
+    """
+    from uber.models.tracking import tracking_writer
+
+    if not c.ASYNC_TRACKING:
+        return
+
+    replayed = tracking_writer.replay()
+    if replayed:
+        log.warning(f"Replayed {replayed} tracking rows from the journal.")
+
+
 @celery.schedule(timedelta(15))
 def set_signnow_key():
     if not c.AWS_SIGNNOW_SECRET_NAME or not c.SIGNNOW_DEALER_TEMPLATE_ID:
@@ -1,9 +1,6 @@
-from collections import defaultdict
 from datetime import datetime, timedelta
 from itertools import chain
 
-import stripe
-import time
 import logging
 import pytz
 import math
@@ -17,10 +14,13 @@ from uber.config import c
 from uber.custom_tags import readable_join
 from uber.decorators import render
 from uber.models import (ApiJob, Attendee, AttendeeAccount, BadgeInfo, BadgePickupGroup, Email, Group, ModelReceipt,
-                         ReceiptInfo, ReceiptItem, ReceiptTransaction, Session, TerminalSettlement)
+                         ReceiptInfo, ReceiptItem, ReceiptTransaction, Session, TerminalSettlement,
+                         receipt_balances)
 from uber.tasks import celery
 from uber.utils import localized_now, TaskUtils, normalize_email, groupify
+from uber.payment_events import PaymentEventStore
 from uber.payments import ReceiptManager, TransactionRequest
+import uber.spin_rest_utils as spin_rest_utils
 
 log = logging.getLogger(__name__)
 
@@ -31,7 +31,8 @@ if c.AUTHORIZENET_LOGIN_ID:
 
 __all__ = ['check_duplicate_registrations', 'check_placeholder_registrations', 'check_pending_badges',
            'check_unassigned_volunteers', 'check_near_cap', 'check_missed_stripe_payments', 'process_api_queue',
-           'process_terminal_sale', 'send_receipt_email', 'create_badge_nums', 'create_badge_pickup_groups', 'update_receipt']
+           'process_terminal_sale', 'send_receipt_email', 'create_badge_nums', 'create_badge_pickup_groups', 'update_receipt',
+           'reconcile_receipt_balances', 'record_terminal_sale']
 
 
 @celery.schedule(timedelta(days=1))
@@ -94,14 +95,12 @@ def check_duplicate_registrations():
         subject = c.EVENT_NAME + ' Duplicates Report for ' + localized_now().strftime('%Y-%m-%d')
         with Session() as session:
             if session.no_email(subject):
-                grouped = defaultdict(list)
-                for a in session.query(Attendee).filter(Attendee.first_name != '') \
-                        .filter(Attendee.badge_status == c.COMPLETED_STATUS).options(joinedload(Attendee.group)) \
-                        .order_by(Attendee.registered):
-                    if not a.group or (not a.group.is_dealer or a.group.status not in [c.WAITLISTED, c.UNAPPROVED]):
-                        grouped[a.full_name, a.email.lower()].append(a)
-
-                dupes = {k: v for k, v in grouped.items() if len(v) > 1}
+                dupes = session.duplicate_registrations(
+                    Attendee.first_name != '',
+                    Attendee.badge_status == c.COMPLETED_STATUS,
+                    or_(Attendee.group_id == None,  # noqa: E711
+                        Group.is_dealer == False,  # noqa: E712
+                        Group.status.notin_([c.WAITLISTED, c.UNAPPROVED])))
 
                 for who, attendees in dupes.items():
                     paid = [a for a in attendees if a.paid == c.HAS_PAID]
@@ -211,6 +210,13 @@ def check_near_cap():
                                              subject=subject, data={'badges_left': actual_badges_left})
 
 
+@celery.schedule(timedelta(days=1))
+def reconcile_receipt_balances():
+    with Session() as session:
+        receipt_balances.reconcile(session)
+        session.commit()
+
+
 @celery.schedule(timedelta(days=1))
 def invalidate_at_door_badges():
     if not c.POST_CON:
@@ -316,32 +322,39 @@ def send_receipt_email(receipt_id):
 
 @celery.task
 def close_out_terminals(workstation_and_terminal_ids, who):
-    from uber.payments import SpinTerminalRequest
+    from uber.terminal_gateway import TerminalGateway
 
     request_timestamp = datetime.now().timestamp()
 
     with Session() as session:
-        for workstation_num, terminal_id in workstation_and_terminal_ids:
-            settlement = TerminalSettlement(
-                batch_timestamp=request_timestamp,
-                batch_who=who,
-                workstation_num=workstation_num,
-                terminal_id=terminal_id,
-            )
-            session.add(settlement)
-            session.commit()
+        settlements = [TerminalSettlement(batch_timestamp=request_timestamp,
+                                          batch_who=who,
+                                          workstation_num=workstation_num,
+                                          terminal_id=terminal_id)
+                       for workstation_num, terminal_id in workstation_and_terminal_ids]
+        session.add_all(settlements)
+        session.commit()
 
-            settle_request = SpinTerminalRequest(session, terminal_id)
-            settle_response = settle_request.close_out_terminal()
-            if settle_response:
-                settle_response_json = settle_response.json()
-                settlement.response = settle_response_json
-                if not settle_request.api_response_successful(settle_response_json):
-                    settlement.error = settle_request.error_message_from_response(settle_response_json)
+        results = TerminalGateway().settle_all([settlement.terminal_id for settlement in settlements])
+        for settlement, (response_json, error) in zip(settlements, results):
+            if response_json:
+                settlement.response = response_json
+                if not spin_rest_utils.api_response_successful(response_json):
+                    settlement.error = spin_rest_utils.error_message_from_response(response_json)
             else:
-                settlement.error = "No response!"
-            session.add(settlement)
-            session.commit()
+                settlement.error = error or "No response!"
+        session.commit()
+
+
+def _record_terminal_sale(session, payment_request, response):
+    if response:
+        payment_request.process_sale_response(session, response)
+    else:
+        error = payment_request.error_message or 'Terminal request timed out or was interrupted'
+        c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + payment_request.terminal_id,
+                           'last_error', error)
+        payment_request.tracker.internal_error = error
+        session.commit()
 
 
 @celery.task
@@ -403,7 +416,7 @@ def process_terminal_sale(workstation_num, terminal_id, model_id=None, pickup_gr
             # Pickup groups get a custom payment description defined here, so get rid of whatever was passed in
             kwargs.pop("description", None)
 
-            payment_request = SpinTerminalRequest(terminal_id=terminal_id,
+            payment_request = SpinTerminalRequest(session, terminal_id=terminal_id,
                                                   receipt_email=account_email,
                                                   description="At-door registration for "
                                                   f"{readable_join(attendee_names_list)}",
@@ -452,41 +465,48 @@ def process_terminal_sale(workstation_num, terminal_id, model_id=None, pickup_gr
                 return
         c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id, 'intent_id', payment_request.intent.id)
 
-        response = payment_request.send_sale_txn()
+        if c.SPIN_TERMINAL_GATEWAY:
+            session.add_all(payment_request.get_receipt_items_to_add())
+            session.commit()
+            payment_request.queue_sale_txn()
+            return
 
-        if response:
-            payment_request.process_sale_response(session, response)
-        else:
-            error = payment_request.error_message or 'Terminal request timed out or was interrupted'
-            c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id,
-                               'last_error', error)
-            txn_tracker.internal_error = error
+        _record_terminal_sale(session, payment_request, payment_request.send_sale_txn())
+
+
+@celery.task
+def record_terminal_sale(sale, response_json, error):
+    """
+    Records the terminal's response to a sale that process_terminal_sale handed to the terminal gateway.
+    """
+    from uber.payments import SpinTerminalRequest
+    from uber.models import TxnRequestTracking
+
+    with Session() as session:
+        txn_tracker = session.get(TxnRequestTracking, sale['tracking_id'])
+        if not txn_tracker:
+            log.error(f"Terminal sale {sale['intent_id']} finished, but its request tracking is gone")
+            return
+
+        payment_request = SpinTerminalRequest.from_gateway_sale(session, sale, txn_tracker)
+        payment_request.error_message = error
+        _record_terminal_sale(session, payment_request, response_json)
 
 
 @celery.schedule(timedelta(minutes=30))
 def check_missed_stripe_payments():
+    """
+    Catches up on any Stripe events since the last run, in case their webhooks never arrived, and
+    marks paid whatever pending transactions they (or earlier, unprocessed events) cover.
+    """
     if c.AUTHORIZENET_LOGIN_ID:
         return
 
-    pending_ids = []
-    paid_ids = []
+    store = PaymentEventStore()
     with Session() as session:
-        pending_payments = session.query(ReceiptTransaction).filter(ReceiptTransaction.intent_id != '',
-                                                                    ReceiptTransaction.charge_id == '')
-        for payment in pending_payments:
-            pending_ids.append(payment.intent_id)
-
-        events = stripe.Event.list(type='payment_intent.succeeded', created={
-            # Check for events created in the last hour.
-            'gte': int(time.time() - 60 * 60),
-        })
-
-        for event in events.auto_paging_iter():
-            payment_intent = event.data.object
-            if payment_intent.id in pending_ids:
-                paid_ids.append(payment_intent.id)
-                ReceiptManager.mark_paid_from_stripe_intent(session, payment_intent)
-    return paid_ids
+        store.poll(session)
+        session.commit()
+        return store.reconcile(session)
 
 
 @celery.schedule(timedelta(hours=3))
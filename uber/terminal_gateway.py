@@ -0,0 +1,160 @@
+"""
+A gateway for SPIn payment terminals that waits on every terminal at once from one asyncio loop.
+
+A card sale can keep a terminal request open for minutes while the attendee fumbles with their card,
+so rather than tying up a Celery worker (and a database session) for each one, workers prepare the
+sale, queue it in Redis with `queue_sale`, and move on. The gateway process (`sep run_terminal_gateway`)
+sends each queued sale to its terminal, and once the terminal answers, queues `record_terminal_sale`
+to record the result the same way `process_terminal_sale` always has.
+
+Terminal state stays in the spin_terminal_txns:<terminal_id> Redis hash that the registration pages poll.
+Sales the gateway was waiting on when it stopped are kept in a separate hash and recorded as failed
+when it starts back up, so they can be checked against the terminal's status like any other error.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import redis.asyncio
+import requests
+
+import uber.spin_rest_utils as spin_rest_utils
+from uber.config import c
+
+log = logging.getLogger(__name__)
+
+QUEUE_KEY = c.REDIS_PREFIX + 'spin_terminal_gateway:queue'
+IN_FLIGHT_KEY = c.REDIS_PREFIX + 'spin_terminal_gateway:in_flight'
+STALE_ERROR = "The terminal gateway didn't get to this request in time"
+
+
+def terminal_key(terminal_id):
+    return c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id
+
+
+def queue_sale(sale, request_data):
+    """
+    Hands a prepared sale to the gateway. `sale` holds what `record_terminal_sale` needs to record the
+    result, and `request_data` is the sale request, minus the terminal ID and auth key.
+    """
+    job = dict(sale, request=request_data, queued=time.time())
+    c.REDIS_STORE.hset(terminal_key(sale['terminal_id']), 'gateway_status', 'queued')
+    c.REDIS_STORE.rpush(QUEUE_KEY, json.dumps(job))
+
+
+def record_sale_result(job, response_json, error):
+    from uber.tasks.registration import record_terminal_sale
+
+    job = {key: val for key, val in job.items() if key != 'request'}
+    record_terminal_sale.delay(job, response_json, error)
+
+
+class TerminalGateway:
+    def __init__(self, api_url=None, auth_key=None, redis_store=None, on_sale_result=record_sale_result):
+        self.api_url = api_url or c.SPIN_TERMINAL_URL
+        self.auth_key = auth_key or c.SPIN_TERMINAL_AUTH_KEY
+        self.redis = redis_store
+        self.on_sale_result = on_sale_result
+        # requests has no async API, so each open terminal request waits on one of these threads
+        self.executor = ThreadPoolExecutor(max_workers=c.SPIN_TERMINAL_GATEWAY_CONNECTIONS,
+                                           thread_name_prefix='terminal_gateway')
+        self.terminal_locks = defaultdict(asyncio.Lock)
+        self.tasks = set()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def post(self, call_type, data, timeout):
+        """Sends one request to the SPIn proxy and returns a (response_json, error_message) tuple."""
+        url = spin_rest_utils.get_call_url(self.api_url, call_type)
+        loop = asyncio.get_running_loop()
+        try:
+            response = await asyncio.wait_for(
+                loop.run_in_executor(self.executor, partial(requests.post, url, data=data, timeout=timeout)),
+                timeout + 5)
+            return response.json(), ''
+        except (asyncio.TimeoutError, requests.exceptions.Timeout):
+            return {}, "The request timed out"
+        except requests.exceptions.ConnectionError as e:
+            log.error(f"Terminal gateway could not connect to SPIn Proxy: {str(e)}")
+            return {}, "Could not connect to SPIn Proxy"
+        except (requests.exceptions.RequestException, ValueError) as e:
+            log.error(f"Terminal gateway got an error from SPIn Proxy: {str(e)}")
+            return {}, "Unexpected error"
+
+    async def call(self, terminal_id, call_type, data, timeout, deadline=None):
+        """
+        Sends a request to a terminal, retrying while the terminal says it's busy. Requests to the
+        same terminal are sent one at a time; requests to different terminals all run at once.
+        If `deadline` (a Unix timestamp) passes while we wait our turn, the request isn't sent.
+        """
+        data = dict(data, **spin_rest_utils.base_request(terminal_id, self.auth_key))
+        async with self.terminal_locks[terminal_id]:
+            if deadline and time.time() > deadline:
+                return {}, STALE_ERROR
+            give_up = time.monotonic() + c.SPIN_TERMINAL_BUSY_TIMEOUT
+            while True:
+                response_json, error = await self.post(call_type, data, timeout)
+                if error or not spin_rest_utils.terminal_busy(response_json) or time.monotonic() > give_up:
+                    return response_json, error
+                await asyncio.sleep(1)
+
+    async def settle(self, terminal_ids):
+        """Settles all of the given terminals at once; returns a (response_json, error_message) per terminal."""
+        return await asyncio.gather(*[
+            self.call(terminal_id, 'settle', {}, c.SPIN_TERMINAL_REQUEST_TIMEOUT) for terminal_id in terminal_ids])
+
+    def settle_all(self, terminal_ids):
+        """Runs `settle` to completion; for use outside the gateway process, e.g., from Celery tasks."""
+        try:
+            return asyncio.run(self.settle(terminal_ids))
+        finally:
+            self.close()
+
+    async def sale(self, job):
+        terminal_id = job['terminal_id']
+        deadline = job['queued'] + c.SPIN_TERMINAL_SALE_TIMEOUT
+        if time.time() > deadline:
+            response_json, error = {}, STALE_ERROR
+        else:
+            await self.redis.hset(IN_FLIGHT_KEY, job['tracking_id'], json.dumps(job))
+            await self.redis.hset(terminal_key(terminal_id), 'gateway_status', 'waiting')
+            # The sale can also go stale while it waits behind other requests to the same terminal,
+            # so `call` checks the deadline again once it's this sale's turn
+            response_json, error = await self.call(terminal_id, 'sale', job['request'],
+                                                   c.SPIN_TERMINAL_SALE_TIMEOUT, deadline=deadline)
+
+        await self.redis.hset(terminal_key(terminal_id), 'gateway_status', 'recording')
+        await asyncio.get_running_loop().run_in_executor(None, self.on_sale_result, job, response_json, error)
+        await self.redis.hdel(IN_FLIGHT_KEY, job['tracking_id'])
+
+    async def handle(self, job):
+        try:
+            await self.sale(job)
+        except Exception:
+            log.exception(f"Terminal gateway failed to process a sale on terminal {job.get('terminal_id')}")
+
+    async def recover_in_flight(self):
+        for tracking_id, job in (await self.redis.hgetall(IN_FLIGHT_KEY)).items():
+            job = json.loads(job)
+            log.warning(f"Recording the sale on terminal {job['terminal_id']} that was in progress when the "
+                        "gateway stopped")
+            self.on_sale_result(job, {}, "The terminal gateway restarted before the terminal responded")
+            await self.redis.hdel(IN_FLIGHT_KEY, tracking_id)
+
+    async def run(self):
+        if self.redis is None:
+            self.redis = redis.asyncio.Redis(host=c.REDISCONF['host'], port=c.REDISCONF['port'],
+                                             db=c.REDISCONF['db'], decode_responses=True)
+        await self.recover_in_flight()
+        log.info("Terminal gateway waiting for sales")
+        while True:
+            queued = await self.redis.blpop([QUEUE_KEY], timeout=5)
+            if queued:
+                task = asyncio.create_task(self.handle(json.loads(queued[1])))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
@@ -16,17 +16,20 @@ import logging
 import warnings
 import six
 
+from bisect import bisect_left, bisect_right
 from collections import defaultdict, OrderedDict
 from collections.abc import Iterable, Mapping, Sized
 from datetime import date, datetime, timedelta, timezone
+from dateutil import parser as dateparser
 from glob import glob
+from itertools import chain, islice
 from os.path import basename
 from rpctools.jsonrpc import ServerProxy
 from urllib.parse import urlparse, urljoin
 from uuid import uuid4
 from phonenumbers import PhoneNumberFormat
 from pytz import UTC
-from sqlalchemy import func, or_, cast, literal, DateTime
+from sqlalchemy import func, or_, literal
 from sqlalchemy.orm import make_transient
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
@@ -755,6 +758,111 @@ def load_locations_from_config(session):
     session.commit()
 
 
+def epoch_minute(dt):
+    """
+    Returns the number of whole minutes between the Unix epoch and `dt`,
+    which must be timezone-aware. Shift times are always on minute
+    boundaries, so this is a lossless way to compare them as integers.
+    """
+    return int(dt.timestamp()) // 60
+
+
+class ShiftIntervals:
+    """
+    A sorted list of half-open [start, end) intervals, measured in minutes
+    since the epoch, each tagged with the job it came from. This replaces
+    building a set with one datetime per minute of every shift: overlap and
+    "what's being worked at this minute" checks are binary searches, and
+    consecutive runs of work are precomputed as merged blocks.
+
+    Intervals may overlap each other (admins can assign overlapping shifts),
+    so we keep a running maximum of the end times to make overlap queries
+    correct without assuming the intervals are disjoint.
+    """
+    def __init__(self, jobs=()):
+        intervals = sorted(
+            ((epoch_minute(job.start_time), epoch_minute(job.start_time) + int(job.duration), job)
+             for job in jobs if job.duration), key=lambda interval: interval[:2])
+        self.starts = [start for start, end, job in intervals]
+        self.ends = [end for start, end, job in intervals]
+        self.jobs = [job for start, end, job in intervals]
+
+        self.max_ends = []
+        for end in self.ends:
+            self.max_ends.append(max(end, self.max_ends[-1]) if self.max_ends else end)
+
+        # Merge touching or overlapping intervals into blocks of consecutive work
+        self.block_starts, self.block_ends, self.block_indexes = [], [], []
+        for index, (start, end) in enumerate(zip(self.starts, self.ends)):
+            if self.block_ends and start <= self.block_ends[-1]:
+                self.block_ends[-1] = max(end, self.block_ends[-1])
+                self.block_indexes[-1].append(index)
+            else:
+                self.block_starts.append(start)
+                self.block_ends.append(end)
+                self.block_indexes.append([index])
+
+    @classmethod
+    def from_shifts(cls, shifts):
+        return cls(shift.job for shift in shifts)
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __bool__(self):
+        return bool(self.jobs)
+
+    @property
+    def total_minutes(self):
+        """
+        The number of distinct minutes covered, i.e., wall-clock time worked.
+        """
+        return sum(end - start for start, end in zip(self.block_starts, self.block_ends))
+
+    def overlaps(self, start, end):
+        """
+        Returns True if any interval intersects the half-open range [start, end).
+        """
+        index = bisect_left(self.starts, end)
+        return index > 0 and self.max_ends[index - 1] > start
+
+    def jobs_between(self, start, end):
+        """
+        Returns the jobs whose intervals intersect [start, end), in start order.
+        """
+        index = bisect_left(self.starts, end)
+        return [self.jobs[i] for i in range(index) if self.ends[i] > start]
+
+    def job_at(self, minute):
+        """
+        Returns the job being worked during `minute`, or None. If more than
+        one job covers that minute, the one starting latest wins.
+        """
+        index = bisect_right(self.starts, minute) - 1
+        while index >= 0 and self.max_ends[index] > minute:
+            if self.ends[index] > minute:
+                return self.jobs[index]
+            index -= 1
+        return None
+
+    def block_at(self, minute):
+        """
+        Returns the (start, end) of the block of consecutive work covering
+        `minute`, or None if nothing is being worked then.
+        """
+        index = bisect_right(self.block_starts, minute) - 1
+        if index >= 0 and self.block_ends[index] > minute:
+            return self.block_starts[index], self.block_ends[index]
+        return None
+
+    def blocks(self):
+        """
+        Yields (start, end, jobs) for every block of consecutive work.
+        """
+        for start, end, indexes in zip(self.block_starts, self.block_ends, self.block_indexes):
+            yield start, end, [self.jobs[i] for i in indexes]
+
+
 class DateBase:
     _when_dateformat = '%m/%d'
 
@@ -1066,10 +1174,12 @@ class GuidebookUtils():
 
     @classmethod
     def get_guidebook_models(cls, session, selected_model=''):
+        from uber.models import guidebook_sync_state
+
         model_cls = cls.parse_guidebook_model(selected_model)
         model_query = session.query(model_cls)
-        stale_filters = [model_cls.last_synced['guidebook'] == None,
-                        cls.cast_jsonb_to_datetime(model_cls.last_synced['guidebook']) < model_cls.last_updated]
+        stale_filters = [guidebook_sync_state.never_synced(model_cls),
+                         guidebook_sync_state.updated_since_sync(model_cls)]
 
         if '_band' in selected_model:
             model_query = model_query.filter_by(group_type=c.BAND)
@@ -1089,15 +1199,56 @@ class GuidebookUtils():
         return model_query, stale_filters
 
     @classmethod
-    def cast_jsonb_to_datetime(cls, jsonb_col):
-        return cast(jsonb_col.astext, DateTime)
-    
+    def parse_sync_time(cls, sync_time):
+        sync_time = dateparser.parse(sync_time) if isinstance(sync_time, str) else sync_time
+        # Matches MagModel.last_synced_dt, which treats naive sync times as UTC
+        return sync_time if sync_time.tzinfo else sync_time.replace(tzinfo=UTC)
+
     @classmethod
-    def get_guidebook_images(cls, session, model):
+    def mark_synced(cls, session, selected_model, models, sync_time, sync_data=None):
+        """
+        Records that we exported models to Guidebook at sync_time, along with either the given
+        sync_data or each model's current guidebook_data.
+        """
+        from uber.models import guidebook_sync_state
+
+        rows = []
+        for model in models:
+            model.update_last_synced('guidebook', str(sync_time))
+            model.skip_last_updated = True
+            session.add(model)
+            rows.append(guidebook_sync_state.row(selected_model, model, sync_data or model.guidebook_data,
+                                                 cls.parse_sync_time(sync_time)))
+        guidebook_sync_state.mark_synced_rows(session, rows)
+
+    @classmethod
+    def guidebook_files(cls, session, models):
+        """
+        Returns a dictionary of each model's id to a dictionary of its Guidebook image flag
+        ("guidebook_header" or "guidebook_thumbnail") to its File, using one query.
+        """
         from uber.files import FileService
 
-        header_file = FileService.get_existing_files(session, model, and_flags=['guidebook_header'])
-        thumbnail_file = FileService.get_existing_files(session, model, and_flags=['guidebook_thumbnail'])
+        images = defaultdict(dict)
+        files_by_fk_id = FileService.files_by_fk_id(session, [model.id for model in models],
+                                                    or_flags=['guidebook_header', 'guidebook_thumbnail'])
+        for fk_id, files in files_by_fk_id.items():
+            for file in files:
+                for flag in ['guidebook_header', 'guidebook_thumbnail']:
+                    if file.flags.get(flag):
+                        images[fk_id].setdefault(flag, file)
+        return images
+
+    @classmethod
+    def get_guidebook_images(cls, session, model, images=None):
+        """
+        Returns a list of (export filename, File) for the model's header and thumbnail, with
+        ('', '') for missing images. Pass images from guidebook_files to avoid querying.
+        """
+        if images is None:
+            images = cls.guidebook_files(session, [model])
+        header_file = images.get(model.id, {}).get('guidebook_header')
+        thumbnail_file = images.get(model.id, {}).get('guidebook_thumbnail')
 
         files_list = []
 
@@ -1109,37 +1260,58 @@ class GuidebookUtils():
     @classmethod
     def get_changed_models(cls, session):
         """
-        Returns a dictionary of changed "custom list" models and a list of changed "sessions" (Events)
+        Returns a dictionary of changed "custom list" models, a list of changed "sessions" (Events),
+        and a dictionary of model ids to the Guidebook images that changed for each.
+
+        Only models that have never been synced or were updated since they were synced are
+        checked, using the guidebook_sync table, and each one is compared against the hash
+        of the data we last exported.
         """
-        from uber.models import Event
+        from uber.models import Event, guidebook_sync_state
 
         cl_updates, image_updates = defaultdict(list), defaultdict(list)
         for key, label in c.GUIDEBOOK_MODELS:
             model_query, filters = GuidebookUtils.get_guidebook_models(session, key)
-            model_query = model_query.filter(or_(*filters))
-            for model in model_query:
-                if model.guidebook_data != model.last_synced.get('data', {}).get('guidebook', {}):
+            models = model_query.filter(or_(*filters)).all()
+            sync_rows = guidebook_sync_state.sync_rows(session, [model.id for model in models])
+            images = cls.guidebook_files(session, models)
+
+            for model in models:
+                sync_row = sync_rows.get(model.id)
+                changed = not sync_row or guidebook_sync_state.data_hash(model.guidebook_data) != sync_row.data_hash
+                for flag, file in images.get(model.id, {}).items():
+                    if not sync_row or file.last_updated > sync_row.synced:
+                        changed = True
+                        image_updates[model.id].append(flag)
+                if changed:
                     cl_updates[label].append(model)
-                header_file, thumbnail_file = GuidebookUtils.get_guidebook_images(session, model)
-                if header_file[1] and header_file[1].last_updated > model.last_synced_dt('guidebook'):
-                    cl_updates[label].append(model)
-                    image_updates[model.id].append('guidebook_header')
-                if thumbnail_file[1] and thumbnail_file[1].last_updated > model.last_synced_dt('guidebook'):
-                    cl_updates[label].append(model)
-                    image_updates[model.id].append('guidebook_thumbnail')
 
         schedule_updates = []
-        schedule_query = session.query(Event).filter(
-            or_(Event.last_synced['guidebook'] == None,
-                GuidebookUtils.cast_jsonb_to_datetime(Event.last_synced['guidebook']) < Event.last_updated,
-            ))
-
-        for event in schedule_query:
-            if event.guidebook_data != event.last_synced.get('data', {}).get('guidebook', {}):
+        schedule_query = session.query(Event).filter(or_(guidebook_sync_state.never_synced(Event),
+                                                         guidebook_sync_state.updated_since_sync(Event)))
+        events = schedule_query.all()
+        sync_rows = guidebook_sync_state.sync_rows(session, [event.id for event in events])
+
+        for event in events:
+            sync_row = sync_rows.get(event.id)
+            if not sync_row or guidebook_sync_state.data_hash(event.guidebook_data) != sync_row.data_hash:
                 schedule_updates.append(event)
         
         return cl_updates, schedule_updates, image_updates
 
+    @classmethod
+    def get_deleted_models(cls, session, deleted_since=None):
+        """
+        Returns a dictionary of Guidebook list labels to the names of synced items that have
+        been deleted since deleted_since, from the guidebook_sync table's tombstones.
+        """
+        from uber.models import guidebook_sync_state
+
+        deleted_models = defaultdict(list)
+        for row in guidebook_sync_state.deleted_rows(session, deleted_since):
+            deleted_models[guidebook_sync_state.model_label(row.model)].append(row.name)
+        return deleted_models
+
 
 def validate_model(session, forms, model, create_preview_model=True, is_admin=False):
     # Create_preview_model should only be false if we're re-checking a model with no changes
@@ -1782,16 +1954,22 @@ class ExcelWorksheetStreamWriter:
             self.worksheet.set_column(i, i, width)
 
     def writerows(self, header_row, rows, header_format={'bold': True}):
-        rows = [list(map(str, row)) for row in rows]
+        """
+        Writes a header row and any iterable of rows. Column widths are sized to fit the
+        header and the first c.EXPORT_WIDTH_SAMPLE_ROWS rows, so we never hold more than
+        that many rows at once and rows can come straight from a yield_per query.
+        """
+        rows = (list(map(str, row)) for row in rows)
+        sample = list(islice(rows, c.EXPORT_WIDTH_SAMPLE_ROWS))
 
         if header_row:
-            self.set_column_widths([header_row] + rows)
+            self.set_column_widths([header_row] + sample)
             if header_format:
                 header_format = self.workbook.add_format(header_format)
             self.writerow(header_row, header_format)
         else:
-            self.set_column_widths(rows)
-        for row in rows:
+            self.set_column_widths(sample)
+        for row in chain(sample, rows):
             self.writerow(row)
 
     def writerow(self, row_items, row_format=None):
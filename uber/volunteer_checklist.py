@@ -0,0 +1,169 @@
+"""
+Works out which volunteer checklist items apply to each volunteer and which ones they've completed.
+
+Each item on the volunteer checklist is a template listed in c.VOLUNTEER_CHECKLIST, and those templates
+decide for themselves whether to show the item and whether to check its box. Rather than rendering every
+template for every volunteer to find out, the rules behind each template are declared here as a
+VolunteerChecklistItem, which lets us check every volunteer in a single query. Plugins that add their
+own checklist templates can declare items for them the same way; any template without a declared item
+is still rendered and scanned for its checkbox image.
+"""
+import os
+import re
+from collections import OrderedDict
+
+from sqlalchemy import and_, false, or_, select, true
+
+from uber.config import c
+from uber.decorators import render
+from uber.models import Attendee, Department
+
+
+def _flag(value):
+    return true() if value else false()
+
+
+class VolunteerChecklistItem:
+    """
+    Declares when the checklist item rendered by `template` applies to a volunteer (`applies`, which
+    defaults to always) and when they've completed it (`complete`). These should match the conditions
+    the template itself uses to show the item and to check its box.
+
+    By default, `applies` and `complete` take no arguments and return SQL criteria on Attendee; they're
+    called each time statuses are worked out, so they can depend on config values that change over time.
+    Items whose rules can't sensibly be written in SQL can pass in_sql=False, in which case `applies`
+    and `complete` take an Attendee and return whether the item applies or is complete.
+    """
+    _items = {}
+
+    def __init__(self, template, complete, applies=None, *, name='', in_sql=True):
+        self.template = template
+        self.complete = complete
+        self.applies = applies or ((lambda: true()) if in_sql else (lambda attendee: True))
+        self.name = name or self.name_from_template(template)
+        self.in_sql = in_sql
+        VolunteerChecklistItem._items[template] = self
+
+    @staticmethod
+    def name_from_template(template):
+        name = os.path.splitext(os.path.basename(template))[0]
+        if name.endswith('_item'):
+            name = name[:-5]
+        return name.replace('_', ' ').title()
+
+    @classmethod
+    def checklist_items(cls):
+        """Returns an OrderedDict of item names and templates for the configured volunteer checklist."""
+        return OrderedDict((cls._items[template].name if template in cls._items
+                            else cls.name_from_template(template), template) for template in c.VOLUNTEER_CHECKLIST)
+
+    @classmethod
+    def statuses(cls, session, attendees):
+        """
+        Returns a dictionary of attendee IDs to an OrderedDict of each checklist item's name and status,
+        where each status is a dictionary with 'is_applicable' and 'is_complete' keys.
+        """
+        statuses = {attendee.id: OrderedDict() for attendee in attendees}
+        if not attendees:
+            return statuses
+
+        items = [(name, template, cls._items.get(template)) for name, template in cls.checklist_items().items()]
+        sql_items = [(name, item) for name, template, item in items if item and item.in_sql]
+        sql_statuses = {}
+        if sql_items:
+            columns = []
+            for name, item in sql_items:
+                applies = item.applies()
+                columns.extend([applies, and_(applies, item.complete())])
+            for row in session.execute(select(Attendee.id, *columns).where(
+                    Attendee.id.in_(list(statuses.keys())))):
+                sql_statuses[row[0]] = row[1:]
+
+        re_checkbox = re.compile(r'<img src="\.\./static/images/checkbox_.*?/>')
+        for attendee in attendees:
+            sql_row = iter(sql_statuses.get(attendee.id, []))
+            for name, template, item in items:
+                if item and item.in_sql:
+                    is_applicable, is_complete = bool(next(sql_row, False)), bool(next(sql_row, False))
+                elif item:
+                    is_applicable = bool(item.applies(attendee))
+                    is_complete = is_applicable and bool(item.complete(attendee))
+                else:
+                    match = re_checkbox.search(render(template, {'attendee': attendee}, encoding=None))
+                    is_applicable = bool(match)
+                    is_complete = is_applicable and 'checkbox_checked' in match.group(0)
+
+                statuses[attendee.id][name] = {
+                    'is_applicable': is_applicable,
+                    'is_complete': is_complete,
+                }
+        return statuses
+
+
+def _hotel_item_applies():
+    # Follows the branches of hotel_item.html, except that the ones which show an external hotel
+    # request site's own image (when c.HOTEL_REQUESTS_URL is set) have no checkbox to count
+    if not (c.HOTELS_ENABLED and c.PRE_CON):
+        return false()
+
+    eligible = Attendee.hotel_eligible == True  # noqa: E712
+    admin_editing = eligible if c.AFTER_ROOM_DEADLINE and c.HAS_STAFFING_ADMIN_ACCESS else false()
+    if not c.ROOM_DEADLINE:
+        requesting = false()
+    else:
+        requesting = and_(eligible, Attendee.registered < c.ROOM_DEADLINE)
+        if c.HOTEL_REQUESTS_URL:
+            requesting = and_(requesting, _flag(c.BEFORE_ROOM_DEADLINE),
+                              or_(Attendee.placeholder == True, Attendee.hotel_requests.has()))  # noqa: E712
+
+    if c.HOTEL_REQUESTS_URL:
+        return and_(~admin_editing, requesting)
+    return or_(admin_editing, requesting)
+
+
+VolunteerChecklistItem(
+    'staffing/placeholder_item.html',
+    lambda: Attendee.placeholder == False)  # noqa: E712
+
+VolunteerChecklistItem(
+    'staffing/shirt_item.html',
+    lambda attendee: attendee.shirt_info_marked,
+    lambda attendee: c.PRE_CON and (c.HOURS_FOR_SHIRT and attendee.num_potential_free_event_shirts)
+    or attendee.could_get_staff_shirt,
+    in_sql=False)
+
+VolunteerChecklistItem(
+    'staffing/food_item.html',
+    lambda: Attendee.food_restrictions.has(),
+    lambda: _flag(c.HOURS_FOR_FOOD and c.PRE_CON))
+
+VolunteerChecklistItem(
+    'staffing/shifts_item.html',
+    lambda: Attendee.shifts.any(),
+    lambda: and_(Attendee.staffing == True, Attendee.badge_type != c.CONTRACTOR_BADGE))  # noqa: E712
+
+VolunteerChecklistItem(
+    'staffing/hotel_item.html',
+    lambda: Attendee.hotel_requests.has(),
+    _hotel_item_applies)
+
+VolunteerChecklistItem(
+    'staffing/volunteer_agreement_item.html',
+    lambda: Attendee.agreed_to_volunteer_agreement == True,  # noqa: E712
+    lambda: _flag(c.VOLUNTEER_AGREEMENT_ENABLED))
+
+VolunteerChecklistItem(
+    'staffing/emergency_procedures_item.html',
+    lambda: Attendee.reviewed_emergency_procedures == True,  # noqa: E712
+    lambda: _flag(c.EMERGENCY_PROCEDURES_ENABLED))
+
+VolunteerChecklistItem(
+    'staffing/credits_item.html',
+    lambda: Attendee.name_in_credits != None,  # noqa: E711
+    lambda: _flag(c.VOLUNTEER_CREDITS_ROLL and c.PRE_CON))
+
+VolunteerChecklistItem(
+    'staffing/cash_handling_item.html',
+    lambda: Attendee.reviewed_cash_handling != None,  # noqa: E711
+    lambda: and_(_flag(c.CASH_HANDLING_URL), Attendee.staffing == True,  # noqa: E712
+                 Attendee.assigned_depts.any(Department.handles_cash == True)))  # noqa: E712
@@ -0,0 +1,150 @@
+import functools
+import logging
+import os
+import re
+import sqlite3
+from collections import namedtuple
+
+import numpy as np
+
+from uber.config import c
+
+log = logging.getLogger(__name__)
+
+__all__ = ['ZipCode', 'ZipCodeIndex', 'haversine_miles', 'normalize_zip_code', 'zip_code_index']
+
+EARTH_RADIUS_MILES = 3958.8
+
+# Miles per degree of latitude, and of longitude at the equator
+MILES_PER_DEGREE = 69.17
+
+ZipCode = namedtuple('ZipCode', ['zipcode', 'city', 'state', 'lat', 'lng'])
+
+
+def normalize_zip_code(zip_code):
+    """Returns the five-digit zip code at the start of a zip code like "02134-1234", or ''."""
+    match = re.match(r'\s*(\d{3,5})', str(zip_code or ''))
+    return match.group(1).zfill(5) if match else ''
+
+
+def haversine_miles(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance in miles. Takes scalars or NumPy arrays, which are broadcast against
+    each other. This treats the Earth as a sphere, which is within half a percent of geopy's
+    geodesic distance and orders of magnitude faster.
+    """
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+class ZipCodeIndex:
+    """
+    Every US zip code's city, state and coordinates, held in NumPy arrays sorted by zip code
+    so that lookups are a binary search. Radius searches use a grid of cell_degrees-square
+    cells, so we only measure the distance to zip codes in cells that overlap the radius.
+    """
+    cell_degrees = 1.0
+
+    def __init__(self, zipcodes, cities, states, lats, lngs):
+        order = np.argsort(np.asarray(zipcodes, dtype='U5'), kind='stable')
+        self.zipcodes = np.asarray(zipcodes, dtype='U5')[order]
+        self.cities = np.asarray(cities, dtype=object)[order]
+        self.states = np.asarray(states, dtype=object)[order]
+        self.lats = np.asarray(lats, dtype=np.float64)[order]
+        self.lngs = np.asarray(lngs, dtype=np.float64)[order]
+
+        cells = self._cell(self.lats, self.lngs)
+        cell_order = np.argsort(cells, kind='stable')
+        cell_ids, starts = np.unique(cells[cell_order], return_index=True)
+        self.cells = dict(zip(cell_ids.tolist(), np.split(cell_order, starts[1:])))
+
+    def __len__(self):
+        return len(self.zipcodes)
+
+    def _cell(self, lat, lng):
+        # Latitudes and longitudes are offset so that every cell coordinate is non-negative
+        lat_cell = np.floor((np.asarray(lat) + 90) / self.cell_degrees).astype(np.int64)
+        lng_cell = np.floor((np.asarray(lng) + 180) / self.cell_degrees).astype(np.int64)
+        return lat_cell * 1000 + lng_cell
+
+    @classmethod
+    def from_sqlite(cls, path):
+        """Loads the simple_zipcode table from uszipcode's database file."""
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            rows = connection.execute(
+                'SELECT zipcode, major_city, state, lat, lng FROM simple_zipcode '
+                'WHERE lat IS NOT NULL AND lng IS NOT NULL').fetchall()
+        finally:
+            connection.close()
+        zipcodes, cities, states, lats, lngs = zip(*rows) if rows else ([], [], [], [], [])
+        return cls(zipcodes, cities, states, lats, lngs)
+
+    def _positions(self, zip_codes):
+        zip_codes = np.asarray([normalize_zip_code(zip_code) for zip_code in zip_codes], dtype='U5')
+        positions = np.searchsorted(self.zipcodes, zip_codes)
+        positions[positions >= len(self.zipcodes)] = 0
+        found = (self.zipcodes[positions] == zip_codes) if len(self.zipcodes) else np.zeros(len(zip_codes), bool)
+        return np.where(found, positions, -1)
+
+    def _zip_code(self, position):
+        return ZipCode(str(self.zipcodes[position]), self.cities[position], self.states[position],
+                       float(self.lats[position]), float(self.lngs[position]))
+
+    def lookup(self, zip_code):
+        """Returns the ZipCode for a zip code, or None if we don't know it."""
+        position = self._positions([zip_code])[0]
+        return None if position < 0 else self._zip_code(position)
+
+    def lookup_many(self, zip_codes):
+        """Returns a dictionary of each known five-digit zip code in zip_codes to its ZipCode."""
+        positions = self._positions(zip_codes)
+        return {str(self.zipcodes[position]): self._zip_code(position) for position in set(positions[positions >= 0])}
+
+    def states_of(self, zip_codes):
+        """Returns an array with the state of each zip code, or None for unknown zip codes."""
+        positions = self._positions(zip_codes)
+        return np.where(positions >= 0, self.states[positions], None)
+
+    def within(self, lat, lng, radius_miles):
+        """
+        Returns a list of (ZipCode, miles) for every zip code within radius_miles of the
+        given point, closest first.
+        """
+        lat_pad = radius_miles / MILES_PER_DEGREE
+        lng_pad = radius_miles / (MILES_PER_DEGREE * max(np.cos(np.radians(lat)), 0.01))
+        lat_cells = range(int((lat - lat_pad + 90) // self.cell_degrees),
+                          int((lat + lat_pad + 90) // self.cell_degrees) + 1)
+        lng_cells = range(int((lng - lng_pad + 180) // self.cell_degrees),
+                          int((lng + lng_pad + 180) // self.cell_degrees) + 1)
+        candidates = [self.cells[cell] for cell in (lat_cell * 1000 + lng_cell
+                                                    for lat_cell in lat_cells for lng_cell in lng_cells)
+                      if cell in self.cells]
+        if not candidates:
+            return []
+
+        positions = np.concatenate(candidates)
+        miles = haversine_miles(lat, lng, self.lats[positions], self.lngs[positions])
+        inside = miles <= radius_miles
+        positions, miles = positions[inside], miles[inside]
+        order = np.argsort(miles, kind='stable')
+        return [(self._zip_code(position), float(distance))
+                for position, distance in zip(positions[order], miles[order])]
+
+
+@functools.cache
+def zip_code_index():
+    """
+    Returns the zip code index, loading it the first time we're called. We use the database
+    file that uszipcode downloads, and download it into c.MAPS_DIR if it isn't there yet.
+    """
+    path = os.path.join(c.MAPS_DIR, 'simple_db.sqlite')
+    if not os.path.exists(path):
+        from uszipcode.db import SIMPLE_DB_FILE_DOWNLOAD_URL, download_db_file
+        download_db_file(db_file_path=path, download_url=SIMPLE_DB_FILE_DOWNLOAD_URL,
+                         chunk_size=1024 * 1024, progress_size=1024 * 1024)
+
+    index = ZipCodeIndex.from_sqlite(path)
+    log.info(f"Loaded {len(index)} zip codes from {path}")
+    return index